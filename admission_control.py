@@ -0,0 +1,146 @@
+"""
+Admission Control
+Decides whether /process may queue another generation. Two checks, both shared across
+every gunicorn worker:
+
+- Token buckets per user (free and paid tiers, hourly and daily) and site-wide (per minute),
+  kept as atomic INCR counters in the shared state store
+- A queue-wait target: the current queue depth divided by the throughput the GPU backends
+  actually achieve gives the wait a new job would see; jobs beyond the tier's target are
+  turned away with a Retry-After for when the queue will have drained to it
+"""
+
+import math
+import time
+import logging
+from config import (MAX_GENERATIONS_PER_HOUR, MAX_GENERATIONS_PER_DAY, FREE_MAX_GENERATIONS_PER_HOUR,
+                    FREE_MAX_GENERATIONS_PER_DAY, GLOBAL_MAX_GENERATIONS_PER_MINUTE, ADMISSION_MAX_WAIT_FREE,
+                    ADMISSION_MAX_WAIT_PAID, COMFYUI_DEFAULT_EXEC_SECONDS)
+from shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+# (window seconds, generations allowed per window, label) per tier
+USER_LIMITS = {
+    'free': [(3600, FREE_MAX_GENERATIONS_PER_HOUR, 'hourly'), (86400, FREE_MAX_GENERATIONS_PER_DAY, 'daily')],
+    'paid': [(3600, MAX_GENERATIONS_PER_HOUR, 'hourly'), (86400, MAX_GENERATIONS_PER_DAY, 'daily')]
+}
+GLOBAL_LIMITS = [(60, GLOBAL_MAX_GENERATIONS_PER_MINUTE, 'site-wide')]
+MAX_WAIT = {'free': ADMISSION_MAX_WAIT_FREE, 'paid': ADMISSION_MAX_WAIT_PAID}
+
+
+def estimate_wait(depth, backend_load, backend_count=1, default_seconds=COMFYUI_DEFAULT_EXEC_SECONDS):
+    """
+    Seconds until a job queued now would finish, at the observed throughput
+
+    Args:
+        depth: Jobs ahead of it (queued + in flight)
+        backend_load: get_backend_load() result (avg_seconds per backend)
+        backend_count: Backends serving jobs, for ones without history yet
+        default_seconds: Assumed execution time of a backend without history
+
+    Returns:
+        (eta_seconds, jobs_per_second)
+    """
+    observed = [entry['avg_seconds'] for entry in backend_load.values() if entry.get('avg_seconds')]
+    rate = sum(1.0 / seconds for seconds in observed)
+    rate += max(0, backend_count - len(observed)) / default_seconds
+    if rate <= 0:
+        rate = 1.0 / default_seconds
+    return (depth + 1) / rate, rate
+
+
+class AdmissionController:
+    """Token buckets and queue-wait target for new generations"""
+
+    def __init__(self, store=shared_state, user_limits=USER_LIMITS, global_limits=GLOBAL_LIMITS, max_wait=MAX_WAIT):
+        """
+        Args:
+            store: Shared state store the counters live in
+            user_limits: Tier -> [(window seconds, limit, label)]
+            global_limits: [(window seconds, limit, label)] across all users (limit 0 disables)
+            max_wait: Tier -> longest acceptable estimated queue wait in seconds
+        """
+        self.store = store
+        self.user_limits = user_limits
+        self.global_limits = global_limits
+        self.max_wait = max_wait
+
+    def _buckets(self, user_id, tier, now):
+        """(key, limit, label, seconds until refill) for every bucket a request draws from"""
+        buckets = []
+        for scope, limits in ((f"user:{user_id}", self.user_limits.get(tier, [])), ('global', self.global_limits)):
+            for window, limit, label in limits:
+                if limit <= 0:
+                    continue
+                index = int(now // window)
+                refill = (index + 1) * window - now
+                buckets.append((f"rate:{scope}:{window}:{index}", limit, label, refill))
+        return buckets
+
+    def take_tokens(self, user_id, tier, now=None):
+        """
+        Draw one token from each of the user's buckets and the site-wide bucket
+
+        Nothing is drawn if any bucket is empty.
+
+        Returns:
+            (rejection, keys): rejection dict or None, and the keys to pass to refund() if the
+            job ends up not being queued
+        """
+        now = time.time() if now is None else now
+        taken = []
+        for key, limit, label, refill in self._buckets(user_id, tier, now):
+            count = self.store.incr(key, ex=math.ceil(refill) + 1)
+            taken.append(key)
+            if count > limit:
+                self.refund(taken)
+                retry_after = max(1, math.ceil(refill))
+                if label == 'site-wide':
+                    message = f'GPU is overloaded, please wait {retry_after} seconds before generating again.'
+                else:
+                    message = f'You have reached your {label} limit of {limit} generations. Try again in {retry_after} seconds.'
+                return {'reason': f'{label}_limit', 'limit': limit, 'retry_after': retry_after, 'message': message}, []
+        return None, taken
+
+    def refund(self, keys):
+        """Return tokens drawn by take_tokens()"""
+        for key in keys:
+            try:
+                self.store.incr(key, -1)
+            except Exception as e:
+                logger.warning(f"Failed to refund rate limit token {key}: {e}")
+
+    def check_queue(self, tier, queue_depth, backend_load, backend_count=1):
+        """
+        Turn the job away if the queue is longer than the tier's wait target
+
+        Args:
+            tier: 'free' or 'paid'
+            queue_depth: get_queue_depth() result
+            backend_load: get_backend_load() result
+            backend_count: Backends serving jobs
+
+        Returns:
+            dict: Rejection with retry_after and an ETA-based message, or None to admit
+        """
+        depth = queue_depth['queued'] + queue_depth['in_flight']
+        eta, rate = estimate_wait(depth, backend_load, backend_count)
+        max_wait = self.max_wait.get(tier, ADMISSION_MAX_WAIT_FREE)
+        if eta <= max_wait:
+            return None
+
+        # Time for the queue to drain until a new job would meet the target
+        retry_after = max(1, math.ceil(eta - max_wait))
+        return {
+            'reason': 'queue_full',
+            'retry_after': retry_after,
+            'queue_depth': depth,
+            'eta_seconds': math.ceil(eta),
+            'jobs_per_minute': round(rate * 60, 1),
+            'message': (f'GPU is overloaded, please wait {retry_after} seconds before generating again. '
+                        f'{depth} jobs are ahead of you (about {math.ceil(eta / 60)} min at the current pace).')
+        }
+
+
+admission_controller = AdmissionController()
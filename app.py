@@ -1,10 +1,12 @@
 import os
+import sys
 import json
 import uuid
 import requests
 import shutil
 import time
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash
+import queue
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, Response, stream_with_context
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from PIL import Image
@@ -13,10 +15,27 @@ import io
 import logging
 from datetime import datetime, timedelta
 from config import *
-from tunnel_registry import set_tunnel_url
+from tunnel_registry import add_tunnel_url
+from shared_state import shared_state
+from db_engine import get_engine_options, register_engine, get_pool_stats
 from models import db, User, Generation, Transaction, FacialEvaluation, RatiosMorph, SystemPrompt, AutomatedFacialAnalysis, init_db
+from job_queue import enqueue_generation, assign_backend, mark_processing, mark_completed, mark_failed, get_queue_position, find_generation, get_backend_load, get_queue_depth, get_gpu_backend_usage, count_pending_generations, count_outstanding_prompts, claim_finalization, release_finalization, prompt_is_settled, QUEUED_STATUSES
+from comfyui_progress import get_progress_subscriber, format_sse
+from comfyui_transport import comfyui_get, comfyui_post, get_transport_stats
+from backend_health import health_monitor, gpu_backend_name, COMFYUI_BACKEND
+from comfyui_pool import ComfyUIPool, ComfyUIPoolBackend
+from gpu_backends import GpuBackend, GpuJob
+from gpu_router import GpuRouter
+from workflow_registry import workflow_registry
+from comfyui_uploads import upload_cache, preseed_reference_images
+from image_ingest import ingest_upload, ingest_stats
+from result_delivery import send_result_file, stream_to_file, save_result
+from status_reconciler import StatusReconciler, gpu_status_map
+from admission_control import admission_controller, estimate_wait
+from credit_ledger import debit_credits, credit_credits, adjust_credits
 from auth import auth_bp, init_login_manager
 from payments import payments_bp
+from runpod_webhooks import runpod_bp, webhooks_enabled
 import mistune
 from openrouter_client import OpenRouterClient # Import the new OpenRouterClient
 
@@ -30,8 +49,10 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['USE_X_SENDFILE'] = RESULT_SENDFILE == 'x-sendfile'
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(DATABASE_URL)
 
 # --- FIX: Absolute Paths for Deployment ---
 # Make folder paths absolute to the app's root directory. This is crucial for
@@ -40,6 +61,7 @@ APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(APP_ROOT, UPLOAD_FOLDER)
 OUTPUT_FOLDER = os.path.join(APP_ROOT, OUTPUT_FOLDER)
 WORKFLOW_FOLDER = os.path.join(APP_ROOT, WORKFLOW_FOLDER)
+app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 
 # CRITICAL FIX: Don't override FACIAL_EVALUATION_FOLDER from config.py
 # The config.py already handles Railway volume detection properly
@@ -51,69 +73,181 @@ if not os.path.isabs(FACIAL_EVALUATION_FOLDER):
 
 # Initialize database and authentication
 init_db(app)
+with app.app_context():
+    register_engine('database', db.engine)
 login_manager = init_login_manager(app)
 
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(payments_bp)
+app.register_blueprint(runpod_bp)
 
-# GPU rate limiting - track last generation time per user
-user_last_generation = {}
+# GPU rate limiting - last generation time per user, in the shared store so every gunicorn worker agrees
 GENERATION_COOLDOWN = 60  # 60 seconds between generations
 
-# Initialize GPU client with error handling
-gpu_client = None
-try:
+def get_cooldown_remaining(user_id):
+    """Seconds until the user may queue another generation (0 if they may now)"""
+    started_at = shared_state.get(f"cooldown:{user_id}")
+    if not started_at:
+        return 0
+    return max(0, int(GENERATION_COOLDOWN - (time.time() - float(started_at))))
+
+def claim_generation_cooldown(user_id):
+    """Atomically start the user's cooldown; False if another request already holds it"""
+    return shared_state.set(f"cooldown:{user_id}", time.time(), ex=GENERATION_COOLDOWN, nx=True)
+
+def release_generation_cooldown(user_id):
+    """Give the cooldown back when the generation was not queued after all"""
+    shared_state.delete(f"cooldown:{user_id}")
+
+# Parse and validate every ComfyUI workflow template once (hot-reloaded on file change)
+workflow_registry.load_all()
+
+def default_gpu_backends():
+    """The single provider the legacy USE_* flags select (used when GPU_BACKENDS is empty)"""
     if USE_LOCAL_COMFYUI:
+        return ['local']
+    if USE_MODAL:
+        return ['modal']
+    if USE_CLOUD_GPU:
+        if USE_RUNPOD_SERVERLESS:
+            return ['runpod']
+        return ['vast'] if VAST_ON_DEMAND_MODE else ['vast_instance']
+    return ['comfyui']
+
+def create_gpu_backend(name):
+    """Build one GpuBackend by its GPU_BACKENDS name"""
+    if name == 'local':
         # Use Local ComfyUI for processing with automatic tunnel detection
         from local_comfyui_client import LocalComfyUIClient
-        from cloudflare_tunnel_detector import get_dynamic_comfyui_url, tunnel_detector
+        from cloudflare_tunnel_detector import get_dynamic_comfyui_url
         
-        # Get dynamic URL (will auto-detect Cloudflare tunnel or fallback to local)
+        # Get dynamic URL (first health probe - will auto-detect Cloudflare tunnel or fallback to local)
         dynamic_url = get_dynamic_comfyui_url()
         
-        gpu_client = LocalComfyUIClient(
+        client = LocalComfyUIClient(
             base_url=dynamic_url,
             workflow_path=LOCAL_COMFYUI_WORKFLOW,
             timeout=COMFYUI_TIMEOUT
         )
         
         # Log tunnel detection info
-        tunnel_info = tunnel_detector.get_tunnel_info()
-        if tunnel_info['status'] == 'connected':
-            logger.info(f"🚀 Auto-detected Cloudflare tunnel: {tunnel_info['url']}")
-            logger.info(f"ComfyUI Version: {tunnel_info.get('comfyui_version', 'unknown')}")
-            logger.info(f"GPU Devices: {len(tunnel_info.get('devices', []))} detected")
+        comfyui_health = health_monitor.get(COMFYUI_BACKEND)
+        if comfyui_health.available:
+            logger.info(f"🚀 ComfyUI backend {comfyui_health.status}: {comfyui_health.url} ({comfyui_health.latency_ms}ms)")
         else:
             logger.info(f"Using fallback URL: {dynamic_url}")
-            logger.info(f"Tunnel detection: {tunnel_info['message']}")
+            logger.info(f"Tunnel detection: ComfyUI backend {comfyui_health.status}")
         
         logger.info(f"Initialized Local ComfyUI client: {dynamic_url}")
         logger.info(f"Using workflow: {LOCAL_COMFYUI_WORKFLOW}")
-    elif USE_MODAL:
-        # Use Modal.com for processing
+        
+        # Every registered tunnel / COMFYUI_BACKEND_URLS entry gets its own pinned client
+        pool = ComfyUIPool(
+            client_factory=lambda url: LocalComfyUIClient(
+                base_url=url,
+                workflow_path=LOCAL_COMFYUI_WORKFLOW,
+                timeout=COMFYUI_TIMEOUT,
+                pinned=True
+            ),
+            static_urls=COMFYUI_BACKEND_URLS,
+            on_backend_added=preseed_reference_images
+        )
+        return ComfyUIPoolBackend(pool, client, get_backend_load)
+    if name == 'modal':
         from modal_client import ModalMorphClient
-        gpu_client = ModalMorphClient()
         logger.info("Initialized Modal.com client - 95% cost savings vs RunPod!")
-    elif USE_CLOUD_GPU:
-        # Check if on-demand mode is enabled
-        if VAST_ON_DEMAND_MODE:
-            from vast_on_demand_client import VastOnDemandClient
-            gpu_client = VastOnDemandClient(VAST_API_KEY)
-            logger.info("Initialized Vast.ai On-Demand client - 98-99% cost savings vs RunPod!")
-        else:
-            # Use regular Vast.ai client
-            from vast_client import VastMorphClient
-            gpu_client = VastMorphClient()
-            logger.info("Initialized Vast.ai client - 90% cost savings vs RunPod!")
-    else:
+        return ModalMorphClient()
+    if name == 'runpod':
+        # Jobs complete through the signed webhook (runpod_webhooks.py), polling as fallback
+        from runpod_client import RunPodClient
+        logger.info(f"Initialized RunPod Serverless client (webhooks {'on' if webhooks_enabled() else 'off'})")
+        return RunPodClient(RUNPOD_API_KEY, RUNPOD_ENDPOINT_ID)
+    if name == 'vast':
+        from vast_on_demand_client import VastOnDemandClient
+        client = VastOnDemandClient(VAST_API_KEY)
+        if VAST_WARM_MAX_INSTANCES > 0:
+            # Instances stay up between images; a dedicated generation_worker.py process scales
+            # the pool (in-process workers detach it - nothing there would reap idle instances)
+            from vast_warm_pool import VastWarmPool
+            client.warm_pool = VastWarmPool(client)
+        logger.info("Initialized Vast.ai On-Demand client - 98-99% cost savings vs RunPod!")
+        return client
+    if name == 'vast_instance':
+        from vast_client import VastMorphClient
+        logger.info("Initialized Vast.ai client - 90% cost savings vs RunPod!")
+        return VastMorphClient()
+    if name == 'replicate':
+        from morph_replicate_client import MorphReplicateClient
+        logger.info("Initialized Replicate client")
+        return MorphReplicateClient(REPLICATE_API_TOKEN or None)
+    if name == 'comfyui':
         from comfyui_client import ComfyUIClient
-        gpu_client = ComfyUIClient(COMFYUI_URL)
         logger.info(f"Initialized ComfyUI client: {COMFYUI_URL}")
-except Exception as e:
-    logger.error(f"Failed to initialize GPU client: {e}")
+        return ComfyUIClient(COMFYUI_URL)
+    raise ValueError(f"Unknown GPU backend: {name}")
+
+def probe_gpu_backend(backend):
+    """Health probe for GPU backends reached without the tunnel (Modal, Vast.ai, RunPod, Replicate, direct ComfyUI)"""
+    return lambda: (backend.test_connection(), None)
+
+def gpu_backend_available(backend):
+    """Cached health of a routed backend (never probes inline once the first result exists)"""
+    if backend is local_backend:
+        return local_backend.is_available()
+    return health_monitor.get(gpu_backend_name(backend.backend_name)).available
+
+# Initialize GPU backends with error handling - one failing provider does not take the others down
+gpu_backends = []
+for backend_name in GPU_BACKENDS or default_gpu_backends():
+    try:
+        gpu_backends.append(create_gpu_backend(backend_name))
+    except Exception as e:
+        logger.error(f"Failed to initialize GPU backend {backend_name}: {e}")
+
+local_backend = next((backend for backend in gpu_backends if backend.backend_name == 'local'), None)
+comfyui_pool = local_backend.pool if local_backend else None  # Registered ComfyUI backends; empty pool means single-backend mode via gpu_client
+for backend in gpu_backends:
+    if backend is not local_backend:
+        health_monitor.register(gpu_backend_name(backend.backend_name), probe_gpu_backend(backend))
+
+# Every generation goes through the router; gpu_client is the first configured provider's client
+gpu_router = GpuRouter(gpu_backends, is_available=gpu_backend_available)
+gpu_client = None
+if gpu_backends:
+    gpu_client = local_backend.client if gpu_backends[0] is local_backend else gpu_backends[0]
+else:
     logger.info("App will continue without GPU client - it will be initialized when needed")
 
+def get_generation_client(generation):
+    """GPU client for a generation - the pool backend its prompt is pinned to, else the provider that took it"""
+    if generation is None:
+        return gpu_client
+    if generation.backend_url and local_backend:
+        return local_backend.client_for(generation.backend_url)
+    backend = gpu_router.get(generation.gpu_backend) if generation.gpu_backend else None
+    if backend is None:
+        return gpu_client
+    return local_backend.client_for(None) if backend is local_backend else backend
+
+def acquire_comfyui_client():
+    """
+    ComfyUI client for a new prompt
+    
+    Returns:
+        (client, backend_url): backend_url is the reserved pool backend (release it once
+        dispatched) or None in single-backend mode; client is None when no backend is available
+    """
+    if local_backend:
+        return local_backend.acquire()
+    return gpu_client, None
+
+def get_gpu_backend_health():
+    """Cached health of the primary GPU backend"""
+    if not gpu_backends or gpu_backends[0] is local_backend:
+        return health_monitor.get(COMFYUI_BACKEND)
+    return health_monitor.get(gpu_backend_name(gpu_backends[0].backend_name))
+
 # Create directories if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -228,18 +362,12 @@ def validate_image(file_path):
         return False, f"Invalid image file: {str(e)}"
 
 def load_workflow_template():
-    """Load the ComfyUI workflow template"""
+    """The current ComfyUI workflow template from the workflow registry"""
     try:
-        # Get current workflow configuration
         current_workflow = WORKFLOW_OPTIONS[CURRENT_WORKFLOW]
-        workflow_file = current_workflow['file']
-        workflow_path = os.path.join(WORKFLOW_FOLDER, workflow_file)
-        
-        with open(workflow_path, 'r') as f:
-            workflow = json.load(f)
-        
-        logger.info(f"Loaded workflow: {current_workflow['name']} ({workflow_file})")
-        return workflow
+        template = workflow_registry.get(current_workflow['file'])
+        logger.info(f"Loaded workflow: {current_workflow['name']} ({template.name})")
+        return template
     except Exception as e:
         logger.error(f"Failed to load workflow template: {e}")
         return None
@@ -248,101 +376,42 @@ def prepare_workflow(image_filename, preset_key):
     """Prepare workflow with specific image and preset"""
     import random
     
-    workflow = load_workflow_template()
-    if not workflow:
+    template = load_workflow_template()
+    if not template:
         return None
     
     preset = PRESETS[preset_key]
-    current_workflow_type = CURRENT_WORKFLOW
     
     # Generate unique seed for each run to prevent caching
     unique_seed = random.randint(1, 2**32 - 1)
     timestamp = int(time.time())
     
-    # Update common parameters for all workflow types
-    # Update LoadImage node (usually node 5)
-    if "5" in workflow:
-        workflow["5"]["inputs"]["image"] = image_filename
-    
-    # Update LoraLoader parameters (usually node 2)
-    if "2" in workflow:
-        if 'lora_strength_model' in WORKFLOW_PARAMETERS:
-            workflow["2"]["inputs"]["strength_model"] = WORKFLOW_PARAMETERS['lora_strength_model']
-        if 'lora_strength_clip' in WORKFLOW_PARAMETERS:
-            workflow["2"]["inputs"]["strength_clip"] = WORKFLOW_PARAMETERS['lora_strength_clip']
-    
-    # Update generation parameters based on workflow type
-    if current_workflow_type == 'reactor':
-        # ReActor workflow - KSampler is node 7
-        if "7" in workflow:
-            workflow["7"]["inputs"]["denoise"] = preset['denoise']
-            workflow["7"]["inputs"]["seed"] = unique_seed
-            if 'steps' in WORKFLOW_PARAMETERS:
-                workflow["7"]["inputs"]["steps"] = WORKFLOW_PARAMETERS['steps']
-            if 'cfg' in WORKFLOW_PARAMETERS:
-                workflow["7"]["inputs"]["cfg"] = WORKFLOW_PARAMETERS['cfg']
-        
-        # SaveImage node for ReActor (node 10)
-        if "10" in workflow:
-            workflow["10"]["inputs"]["filename_prefix"] = f"morph_{preset_key}_{timestamp}"
-    
-    elif current_workflow_type == 'facedetailer':
-        # FaceDetailer workflow - FaceDetailer node is node 8
-        if "8" in workflow:
-            workflow["8"]["inputs"]["denoise"] = preset['denoise']
-            workflow["8"]["inputs"]["seed"] = unique_seed
-            if 'steps' in WORKFLOW_PARAMETERS:
-                workflow["8"]["inputs"]["steps"] = WORKFLOW_PARAMETERS['steps']
-            if 'cfg' in WORKFLOW_PARAMETERS:
-                workflow["8"]["inputs"]["cfg"] = WORKFLOW_PARAMETERS['cfg']
-        
-        # SaveImage node for FaceDetailer (node 9)
-        if "9" in workflow:
-            workflow["9"]["inputs"]["filename_prefix"] = f"morph_{preset_key}_{timestamp}"
-    
-    elif current_workflow_type == 'inpaint':
-        # Face inpainting workflow - KSampler is node 7 (simplified version)
-        if "7" in workflow:
-            workflow["7"]["inputs"]["denoise"] = preset['denoise']
-            workflow["7"]["inputs"]["seed"] = unique_seed
-            if 'steps' in WORKFLOW_PARAMETERS:
-                workflow["7"]["inputs"]["steps"] = WORKFLOW_PARAMETERS['steps']
-            if 'cfg' in WORKFLOW_PARAMETERS:
-                workflow["7"]["inputs"]["cfg"] = WORKFLOW_PARAMETERS['cfg']
-        
-        # SaveImage node for inpainting (node 9)
-        if "9" in workflow:
-            workflow["9"]["inputs"]["filename_prefix"] = f"morph_{preset_key}_{timestamp}"
-    
-    elif current_workflow_type in ['composite', 'advanced']:
-        # Face composite workflows - KSampler is node 7
-        if "7" in workflow:
-            workflow["7"]["inputs"]["denoise"] = preset['denoise']
-            workflow["7"]["inputs"]["seed"] = unique_seed
-            if 'steps' in WORKFLOW_PARAMETERS:
-                workflow["7"]["inputs"]["steps"] = WORKFLOW_PARAMETERS['steps']
-            if 'cfg' in WORKFLOW_PARAMETERS:
-                workflow["7"]["inputs"]["cfg"] = WORKFLOW_PARAMETERS['cfg']
-        
-        # SaveImage node varies by workflow
-        save_node = "11" if current_workflow_type == 'composite' else "13"
-        if save_node in workflow:
-            workflow[save_node]["inputs"]["filename_prefix"] = f"morph_{preset_key}_{timestamp}"
-    
-    logger.info(f"Prepared {WORKFLOW_OPTIONS[current_workflow_type]['name']} workflow for {preset_key} preset with {preset['denoise']} denoise and seed {unique_seed}")
+    # Each template declares where these go (see workflow_registry.TEMPLATE_SLOTS)
+    workflow = template.bind(
+        input_image=image_filename,
+        denoise=preset['denoise'],
+        seed=unique_seed,
+        steps=WORKFLOW_PARAMETERS.get('steps'),
+        cfg=WORKFLOW_PARAMETERS.get('cfg'),
+        lora_strength_model=WORKFLOW_PARAMETERS.get('lora_strength_model'),
+        lora_strength_clip=WORKFLOW_PARAMETERS.get('lora_strength_clip'),
+        save_prefix=f"morph_{preset_key}_{timestamp}"
+    )
+    
+    logger.info(f"Prepared {WORKFLOW_OPTIONS[CURRENT_WORKFLOW]['name']} workflow for {preset_key} preset with {preset['denoise']} denoise and seed {unique_seed}")
     return workflow
 
 def clear_comfyui_cache():
     """Clear ComfyUI cache to ensure fresh generation"""
     try:
         # Clear the queue first
-        response = requests.post(f"{COMFYUI_URL}/queue", json={"clear": True}, timeout=10)
+        response = comfyui_post(f"{COMFYUI_URL}/queue", 'probe', json={"clear": True})
         if response.status_code == 200:
             logger.info("Cleared ComfyUI queue")
         
         # Try to clear history (if endpoint exists)
         try:
-            response = requests.post(f"{COMFYUI_URL}/history", json={"clear": True}, timeout=10)
+            response = comfyui_post(f"{COMFYUI_URL}/history", 'probe', json={"clear": True})
             if response.status_code == 200:
                 logger.info("Cleared ComfyUI history")
         except:
@@ -367,10 +436,9 @@ def queue_workflow(workflow):
             "client_id": prompt_id
         }
         
-        response = requests.post(
+        response = comfyui_post(
             f"{COMFYUI_URL}/prompt",
-            json=payload,
-            timeout=COMFYUI_TIMEOUT
+            json=payload
         )
         response.raise_for_status()
         
@@ -387,7 +455,7 @@ def queue_workflow(workflow):
 def check_workflow_status(prompt_id):
     """Check if workflow is complete"""
     try:
-        response = requests.get(f"{COMFYUI_URL}/history/{prompt_id}")
+        response = comfyui_get(f"{COMFYUI_URL}/history/{prompt_id}")
         response.raise_for_status()
         
         history = response.json()
@@ -418,7 +486,7 @@ def get_output_image(prompt_id, history_data):
                         'type': 'output'
                     }
                     
-                    response = requests.get(f"{COMFYUI_URL}/view", params=params)
+                    response = comfyui_get(f"{COMFYUI_URL}/view", 'transfer', params=params)
                     response.raise_for_status()
                     
                     return response.content
@@ -513,8 +581,12 @@ def analyze_facial_features():
                 'buy_credits_url': '/payments/buy-credits'
             }), 402
         
-        current_user.credits -= 1
-        db.session.commit()
+        if debit_credits(current_user.id, 1, 'automated_analysis', reference_id=generation_id) is None:
+            return jsonify({
+                'error': 'Insufficient credits. You need 1 credit for automated facial analysis.',
+                'need_credits': True,
+                'buy_credits_url': '/payments/buy-credits'
+            }), 402
         logger.info(f"Deducted 1 credit from {current_user.email} for automated facial analysis.")
 
         # Get image paths
@@ -655,12 +727,21 @@ def upload_file():
                 logger.warning(f"Invalid image rejected: {message}")
                 return jsonify({'error': message}), 400
             
+            # Orient, downscale and recompress once - every backend reads the normalized file
+            original_bytes = os.path.getsize(file_path)
+            normalized = ingest_upload(file_path)
+            if normalized:
+                unique_filename = normalized['filename']
+                file_path = normalized['path']
+            
             # Copy to ComfyUI input folder if needed
             copy_image_to_comfyui(file_path, unique_filename)
             
             return jsonify({
                 'success': True,
                 'filename': unique_filename,
+                'original_bytes': original_bytes,
+                'normalized_bytes': normalized['normalized_bytes'] if normalized else original_bytes,
                 'denoise': denoise_value,
                 'can_use_free': can_free,
                 'can_use_paid': can_paid,
@@ -677,26 +758,28 @@ def upload_file():
 @app.route('/process', methods=['POST'])
 @login_required
 def process_image():
-    """Process image with GPU client (RunPod or ComfyUI)"""
+    """Queue image for GPU processing (dispatched by generation_worker.py)"""
     try:
         # Check if user is blocked
         if current_user.is_blocked:
             return jsonify({'error': 'Your account has been blocked. Please contact support at ascendbase@gmail.com.'}), 403
         
         # Check generation cooldown to prevent GPU overload
-        current_time = time.time()
         user_id = current_user.id
         
-        if user_id in user_last_generation:
-            time_since_last = current_time - user_last_generation[user_id]
-            if time_since_last < GENERATION_COOLDOWN:
-                remaining_time = int(GENERATION_COOLDOWN - time_since_last)
-                return jsonify({
-                    'error': f'GPU is overloaded, please wait {remaining_time} seconds before generating again.',
-                    'cooldown': True,
-                    'remaining_seconds': remaining_time,
-                    'message': f'Please wait {remaining_time} seconds to prevent GPU overload.'
-                }), 429
+        def cooldown_response():
+            remaining_time = max(1, get_cooldown_remaining(user_id))
+            response = jsonify({
+                'error': f'GPU is overloaded, please wait {remaining_time} seconds before generating again.',
+                'cooldown': True,
+                'remaining_seconds': remaining_time,
+                'message': f'Please wait {remaining_time} seconds to prevent GPU overload.'
+            })
+            response.headers['Retry-After'] = str(remaining_time)
+            return response, 429
+        
+        if get_cooldown_remaining(user_id):
+            return cooldown_response()
         
         data = request.get_json()
         filename = data.get('filename')
@@ -724,6 +807,29 @@ def process_image():
         elif transform_mode != 'chad_2_0' and (denoise_value < 0.10 or denoise_value > 0.25):
             return jsonify({'error': 'Invalid denoise value. Must be between 0.10 and 0.25'}), 400
         
+        # Reject unknown reference chads before charging credits
+        if transform_mode == 'reference' and selected_chad:
+            reference_image_path = os.path.join(REFERENCE_CHADS_FOLDER, f'{selected_chad}.png')
+            if not os.path.exists(reference_image_path):
+                return jsonify({'error': f'Reference chad image not found: {selected_chad}'}), 400
+        
+        # Admission control: keep the GPU queue within the tier's wait target, then draw rate tokens
+        tier = 'paid' if current_user.can_generate_paid() else 'free'
+        rejection = check_admission(tier)
+        if rejection:
+            logger.info(f"Admission rejected for {current_user.email} ({tier}): {rejection['reason']}, retry in {rejection['retry_after']}s")
+            return admission_response(rejection)
+        
+        # Start the cooldown before charging - concurrent requests on other workers lose the claim
+        if not claim_generation_cooldown(user_id):
+            return cooldown_response()
+        
+        rejection, rate_tokens = admission_controller.take_tokens(user_id, tier)
+        if rejection:
+            release_generation_cooldown(user_id)
+            logger.info(f"Rate limit hit for {current_user.email} ({tier}): {rejection['reason']}")
+            return admission_response(rejection)
+        
         # Check and deduct credits - prioritize paid credits first
         used_free = False
         used_paid = False
@@ -733,12 +839,16 @@ def process_image():
             if current_user.use_paid_credit():
                 used_paid = True
             else:
+                release_generation_cooldown(user_id)
+                admission_controller.refund(rate_tokens)
                 return jsonify({'error': 'Failed to deduct credit'}), 402
         # If no paid credits, try daily free credit
         elif current_user.can_generate_free():
             current_user.use_free_generation()
             used_free = True
         else:
+            release_generation_cooldown(user_id)
+            admission_controller.refund(rate_tokens)
             return jsonify({
                 'error': 'No credits available. Purchase more credits or wait until tomorrow for your free generation.',
                 'need_credits': True,
@@ -754,382 +864,365 @@ def process_image():
         elif denoise_value == 0.25:
             tier_name = 'Chad'
         
-        # Create generation record
-        generation = Generation(
+        # Store transformation mode and features in the generation record
+        if transform_mode == 'custom' and selected_features and not USE_MODAL and not USE_CLOUD_GPU:
+            tier_name = f"custom_{','.join(selected_features)}"
+        
+        # Queue the generation - the worker process owns the GPU round trips
+        generation = enqueue_generation(
             user_id=current_user.id,
+            input_filename=filename,
             preset=tier_name,  # Store tier name for compatibility
             workflow_type='modal' if USE_MODAL else ('runpod' if USE_CLOUD_GPU else CURRENT_WORKFLOW),
-            input_filename=filename,
+            job_params={
+                'transform_mode': transform_mode,
+                'denoise': denoise_value,
+                'selected_features': selected_features,
+                'selected_chad': selected_chad,
+                'face_swap_intensity': face_swap_intensity
+            },
             used_free_credit=used_free,
             used_paid_credit=used_paid,
-            status='pending'
+            priority_class='admin' if current_user.is_admin else ('paid' if used_paid else 'free')
         )
         
-        db.session.add(generation)
-        db.session.commit()
+        # Create appropriate message based on mode
+        if transform_mode == 'custom':
+            feature_names = ', '.join(selected_features)
+            message = f'Custom transformation queued for {feature_names} with 30% intensity...'
+        else:
+            message = f'Queued {tier_name.replace("_", " ")} tier for processing...'
         
-        if USE_MODAL:
-            # Use Modal.com for processing
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            
-            # Check if Modal client is properly initialized
-            if not gpu_client or not hasattr(gpu_client, 'token_configured') or not gpu_client.token_configured:
-                generation.status = 'failed'
-                generation.error_message = 'Modal.com not configured. Please set up authentication token.'
-                db.session.commit()
-                return jsonify({
-                    'error': 'Modal.com not configured. Please contact support to enable GPU processing.',
-                    'setup_required': True,
-                    'instructions': 'Modal.com authentication required. Please run: modal token new'
-                }), 503
-            
-            if not gpu_client.app:
-                generation.status = 'failed'
-                generation.error_message = 'Modal.com app not deployed.'
-                db.session.commit()
-                return jsonify({
-                    'error': 'Modal.com app not deployed. Please contact support to enable GPU processing.',
-                    'setup_required': True,
-                    'instructions': 'Modal.com app deployment required.'
-                }), 503
-            
-            try:
-                # Map denoise value to preset and intensity
-                if denoise_value == 0.10:
-                    preset_key = 'tier1'
-                    denoise_intensity = 4
-                elif denoise_value == 0.15:
-                    preset_key = 'tier2'
-                    denoise_intensity = 6
-                elif denoise_value == 0.25:
-                    preset_key = 'chad'
-                    denoise_intensity = 8
-                else:
-                    # Default mapping for custom values
-                    preset_key = 'tier1'
-                    denoise_intensity = int((denoise_value - 0.10) / 0.15 * 10) + 1
-                    denoise_intensity = max(1, min(10, denoise_intensity))
-                
-                # Start Modal.com generation
-                result_image, error = gpu_client.generate_image(
-                    image_path=file_path,
-                    preset_key=preset_key,
-                    denoise_intensity=denoise_intensity
-                )
-                
-                if error or not result_image:
-                    generation.status = 'failed'
-                    generation.error_message = error or 'Failed to generate image'
-                    db.session.commit()
-                    return jsonify({'error': error or 'Failed to generate image'}), 500
-                
-                # Save result image immediately (Modal returns the image directly)
-                result_filename = f"result_{generation.id}_{int(time.time())}.png"
-                result_path = os.path.join(OUTPUT_FOLDER, result_filename)
-                
-                with open(result_path, 'wb') as f:
-                    f.write(result_image)
-                
-                # Update generation record
-                generation.prompt_id = f"modal_{generation.id}"
-                generation.status = 'completed'
-                generation.started_at = datetime.utcnow()
-                generation.completed_at = datetime.utcnow()
-                generation.output_filename = result_filename
-                db.session.commit()
-                
-                logger.info(f"Modal.com generation completed for {current_user.email}: {generation.id} (free: {used_free}, paid: {used_paid})")
-                
-                return jsonify({
-                    'success': True,
-                    'prompt_id': generation.prompt_id,
-                    'generation_id': generation.id,
-                    'denoise': denoise_value,
-                    'tier_name': tier_name,
-                    'used_free_credit': used_free,
-                    'used_paid_credit': used_paid,
-                    'remaining_credits': current_user.credits,
-                    'completed': True,  # Modal completes immediately
-                    'download_url': f'/result/{generation.prompt_id}',
-                    'message': f'Generation completed with {tier_name.replace("_", " ")} tier! 95% cost savings achieved!'
-                })
-                
-            except Exception as e:
-                generation.status = 'failed'
-                generation.error_message = str(e)
-                db.session.commit()
-                logger.error(f"Modal.com processing error: {e}")
-                return jsonify({'error': f'Modal.com processing failed: {str(e)}'}), 500
+        logger.info(f"Generation queued for {current_user.email}: {generation.id} (mode: {transform_mode}, free: {used_free}, paid: {used_paid})")
         
-        elif USE_CLOUD_GPU:
-            # Use Cloud GPU for processing (Vast.ai or RunPod)
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            
-            try:
-                if VAST_ON_DEMAND_MODE:
-                    # Use Vast.ai On-Demand mode
-                    # Map denoise value to preset and intensity
-                    if denoise_value == 0.10:
-                        preset_key = 'tier1'
-                        denoise_intensity = 4
-                    elif denoise_value == 0.15:
-                        preset_key = 'tier2'
-                        denoise_intensity = 6
-                    elif denoise_value == 0.25:
-                        preset_key = 'chad'
-                        denoise_intensity = 8
-                    else:
-                        # Default mapping for custom values
-                        preset_key = 'tier1'
-                        denoise_intensity = int((denoise_value - 0.10) / 0.15 * 10) + 1
-                        denoise_intensity = max(1, min(10, denoise_intensity))
-                    
-                    # Start Vast.ai On-Demand generation
-                    result_image, error = gpu_client.generate_image(
-                        image_path=file_path,
-                        preset_key=preset_key,
-                        denoise_intensity=denoise_intensity
-                    )
-                    
-                    if error or not result_image:
-                        generation.status = 'failed'
-                        generation.error_message = error or 'Failed to generate image'
-                        db.session.commit()
-                        return jsonify({'error': error or 'Failed to generate image'}), 500
-                    
-                    # Save result image immediately (on-demand returns the image directly)
-                    result_filename = f"result_{generation.id}_{int(time.time())}.png"
-                    result_path = os.path.join(OUTPUT_FOLDER, result_filename)
-                    
-                    with open(result_path, 'wb') as f:
-                        f.write(result_image)
-                    
-                    # Update generation record
-                    generation.prompt_id = f"vast_ondemand_{generation.id}"
-                    generation.status = 'completed'
-                    generation.started_at = datetime.utcnow()
-                    generation.completed_at = datetime.utcnow()
-                    generation.output_filename = result_filename
-                    db.session.commit()
-                    
-                    logger.info(f"Vast.ai On-Demand generation completed for {current_user.email}: {generation.id} (free: {used_free}, paid: {used_paid})")
-                    
-                    return jsonify({
-                        'success': True,
-                        'prompt_id': generation.prompt_id,
-                        'generation_id': generation.id,
-                        'denoise': denoise_value,
-                        'tier_name': tier_name,
-                        'used_free_credit': used_free,
-                        'used_paid_credit': used_paid,
-                        'remaining_credits': current_user.credits,
-                        'completed': True,  # On-demand completes immediately
-                        'download_url': f'/result/{generation.prompt_id}',
-                        'message': f'Generation completed with {tier_name.replace("_", " ")} tier! 98% cost savings achieved!'
-                    })
-                
-                else:
-                    # Use regular cloud GPU (RunPod/Vast.ai)
-                    # Map denoise value to preset and intensity
-                    if denoise_value == 0.10:
-                        preset_key = 'HTN'
-                        denoise_intensity = 4
-                    elif denoise_value == 0.15:
-                        preset_key = 'Chadlite'
-                        denoise_intensity = 6
-                    elif denoise_value == 0.25:
-                        preset_key = 'Chad'
-                        denoise_intensity = 8
-                    else:
-                        # Default mapping for custom values
-                        preset_key = 'HTN'
-                        denoise_intensity = int((denoise_value - 0.10) / 0.15 * 10) + 1
-                        denoise_intensity = max(1, min(10, denoise_intensity))
-                    
-                    # Start cloud GPU generation
-                    job_result = gpu_client.generate_image(
-                        image_path=file_path,
-                        preset_key=preset_key,
-                        denoise_intensity=denoise_intensity
-                    )
-                    
-                    # Handle tuple return (job_id, error)
-                    if isinstance(job_result, tuple):
-                        job_id, error = job_result
-                        if error or not job_id:
-                            generation.status = 'failed'
-                            generation.error_message = error or 'Failed to start cloud GPU generation'
-                            db.session.commit()
-                            return jsonify({'error': error or 'Failed to start generation'}), 500
-                    else:
-                        job_id = job_result
-                        if not job_id:
-                            generation.status = 'failed'
-                            generation.error_message = 'Failed to start cloud GPU generation'
-                            db.session.commit()
-                            return jsonify({'error': 'Failed to start generation'}), 500
-                    
-                    # Update generation with job ID
-                    generation.prompt_id = str(job_id)  # Ensure it's a string
-                    generation.status = 'processing'
-                    generation.started_at = datetime.utcnow()
-                    db.session.commit()
-                    
-                    logger.info(f"Cloud GPU processing started for {current_user.email}: {job_id} (free: {used_free}, paid: {used_paid})")
-                    
-                    return jsonify({
-                        'success': True,
-                        'prompt_id': job_id,
-                        'generation_id': generation.id,
-                        'denoise': denoise_value,
-                        'tier_name': tier_name,
-                        'used_free_credit': used_free,
-                        'used_paid_credit': used_paid,
-                        'remaining_credits': current_user.credits,
-                        'message': f'Processing started with {tier_name.replace("_", " ")} tier...'
-                    })
-                
-            except Exception as e:
-                generation.status = 'failed'
-                generation.error_message = str(e)
-                db.session.commit()
-                logger.error(f"Cloud GPU processing error: {e}")
-                return jsonify({'error': f'Cloud GPU processing failed: {str(e)}'}), 500
-        
-        else:
-            # Use ComfyUI for processing
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            
-            try:
-                # Handle different transformation modes
-                if transform_mode == 'chad_2_0':
-                    # CHAD 2.0 mode - use SD XL + custom LoRA workflow
-                    tier_name = 'CHAD_2_0'
-                    
-                    prompt_id = gpu_client.generate_image(
-                        image_path=file_path,
-                        preset_name="CHAD_2_0",
-                        denoise_strength=denoise_value
-                    )
-                    
-                    logger.info(f"CHAD 2.0 generation started with {denoise_value} denoise")
-                    
-                elif transform_mode == 'reference' and selected_chad:
-                    # Reference Chad mode - use face swap workflow
-                    tier_name = f'reference_{selected_chad}'
-                    
-                    # Map face swap intensity (0.0 to 1.0) to percentage string for workflow
-                    intensity_percent = f"{int(face_swap_intensity * 100)}%"
-                    
-                    # Get reference chad image path
-                    reference_image_path = os.path.join('reference_chads', f'{selected_chad}.png')
-                    
-                    if not os.path.exists(reference_image_path):
-                        generation.status = 'failed'
-                        generation.error_message = f'Reference chad image not found: {selected_chad}'
-                        db.session.commit()
-                        return jsonify({'error': f'Reference chad image not found: {selected_chad}'}), 400
-                    
-                    prompt_id = gpu_client.generate_image_with_face_swap(
-                        original_image_path=file_path,
-                        reference_image_path=reference_image_path,
-                        swap_intensity=intensity_percent
-                    )
-                    
-                    logger.info(f"Reference chad generation started: {selected_chad} with {intensity_percent} intensity")
-                    
-                elif transform_mode == 'custom' and selected_features:
-                    # Custom features mode - use universal workflow with feature selection
-                    features_str = '_'.join(selected_features)
-                    tier_name = f'custom_{features_str}'
-                    
-                    # Use fixed 30% intensity for custom features as mentioned in UI
-                    custom_denoise = 0.3  # 30% intensity
-                    
-                    prompt_id = gpu_client.generate_image_with_features(
-                        image_path=file_path,
-                        selected_features=selected_features,
-                        denoise_strength=custom_denoise
-                    )
-                    
-                    logger.info(f"Custom features generation started: {features_str} with {custom_denoise} denoise")
-                    
-                else:
-                    # Full face transformation mode
-                    prompt_id = gpu_client.generate_image(
-                        image_path=file_path,
-                        preset_name=tier_name,
-                        denoise_strength=denoise_value
-                    )
-                
-                if not prompt_id:
-                    generation.status = 'failed'
-                    generation.error_message = 'Failed to start ComfyUI generation'
-                    db.session.commit()
-                    return jsonify({'error': 'Failed to start generation'}), 500
-                
-                # Update generation with prompt ID and mode info
-                generation.prompt_id = prompt_id
-                generation.status = 'processing'
-                generation.started_at = datetime.utcnow()
-                
-                # Store transformation mode and features in the generation record
-                if transform_mode == 'custom':
-                    generation.preset = f"custom_{','.join(selected_features)}"
-                
-                db.session.commit()
-                
-                # Update last generation time for rate limiting
-                user_last_generation[user_id] = current_time
-                
-                # Create appropriate message based on mode
-                if transform_mode == 'custom':
-                    feature_names = ', '.join(selected_features)
-                    message = f'Custom transformation started for {feature_names} with 30% intensity...'
-                else:
-                    message = f'Processing started with {tier_name.replace("_", " ")} tier on local ComfyUI...'
-                
-                logger.info(f"ComfyUI processing started for {current_user.email}: {prompt_id} (mode: {transform_mode}, free: {used_free}, paid: {used_paid})")
-                
-                return jsonify({
-                    'success': True,
-                    'prompt_id': prompt_id,
-                    'generation_id': generation.id,
-                    'denoise': denoise_value if transform_mode == 'full' else 0.3,
-                    'tier_name': tier_name,
-                    'transform_mode': transform_mode,
-                    'selected_features': selected_features if transform_mode == 'custom' else [],
-                    'used_free_credit': used_free,
-                    'used_paid_credit': used_paid,
-                    'remaining_credits': current_user.credits,
-                    'message': message
-                })
-                
-            except Exception as e:
-                generation.status = 'failed'
-                generation.error_message = str(e)
-                db.session.commit()
-                logger.error(f"ComfyUI processing error: {e}")
-                return jsonify({'error': f'ComfyUI processing failed: {str(e)}'}), 500
+        return jsonify({
+            'success': True,
+            'queued': True,
+            'generation_id': generation.id,
+            'queue_position': get_queue_position(generation),
+            'status_url': f'/status/{generation.id}',
+            'denoise': denoise_value if transform_mode == 'full' else 0.3,
+            'tier_name': tier_name,
+            'transform_mode': transform_mode,
+            'selected_features': selected_features if transform_mode == 'custom' else [],
+            'used_free_credit': used_free,
+            'used_paid_credit': used_paid,
+            'remaining_credits': current_user.credits,
+            'message': message
+        })
     
     except Exception as e:
         logger.error(f"Process error: {e}")
         return jsonify({'error': 'Processing failed. Please try again.'}), 500
 
+def local_queue_eta():
+    """Expected wait (seconds) for a new job on the free backends - the spillover signal"""
+    depth = get_queue_depth()
+    backend_count = len(comfyui_pool.backends()) if comfyui_pool and comfyui_pool.has_backends() else 1
+    eta, _ = estimate_wait(depth['queued'] + depth['in_flight'], get_backend_load(), backend_count)
+    return eta
+
+def run_generation_job(generation):
+    """
+    Dispatch a claimed Generation through the GPU router
+    
+    Runs inside generation_worker.py, never in a request thread. Synchronous providers
+    (Modal, Vast.ai) block for the whole generation and finish the job here; ComfyUI,
+    RunPod and Replicate jobs are left in 'processing' with their prompt ID for
+    finalize_generation() to pick up. A provider that fails to take the job fails over to
+    the next one in GPU_BACKENDS.
+    
+    Returns:
+        bool: True if the job was dispatched (or completed), False if it failed
+    """
+    user_email = generation.user.email if generation.user else generation.user_id
+    
+    if not generation.job_params:
+        mark_failed(generation, 'Missing job parameters')
+        return False
+    
+    if not gpu_router.has_backends():
+        mark_failed(generation, 'GPU client not initialized')
+        return False
+    
+    job = GpuJob.from_generation(generation, UPLOAD_FOLDER, REFERENCE_CHADS_FOLDER)
+    if not os.path.exists(job.image_path):
+        mark_failed(generation, 'Input image no longer available')
+        return False
+    
+    backend_name, submission = gpu_router.dispatch(
+        job,
+        free_eta=local_queue_eta,
+        on_attempt=lambda name: assign_backend(generation, name)
+    )
+    if not backend_name:
+        mark_failed(generation, submission.error or 'Failed to start generation')
+        return False
+    
+    try:
+        generation.backend_url = submission.backend_url
+        if submission.completed:
+            # Synchronous providers return the image directly - save it right away
+            result_filename = f"result_{generation.id}_{int(time.time())}.png"
+            save_result(submission.image_data, os.path.join(OUTPUT_FOLDER, result_filename))
+            mark_completed(generation, result_filename, prompt_id=f"{backend_name}_{generation.id}")
+            logger.info(f"{backend_name} generation completed for {user_email}: {generation.id}")
+        else:
+            mark_processing(generation, submission.job_id)
+            logger.info(f"{backend_name} processing started for {user_email}: {submission.job_id} "
+                        f"(mode: {job.transform_mode}, backend: {submission.backend_url})")
+        return True
+    except Exception as e:
+        logger.error(f"{backend_name} processing error: {e}")
+        mark_failed(generation, str(e))
+        return False
+
+def get_batch_key(generation):
+    """
+    Micro-batching key - generations with equal keys can share one FaceDetailer prompt
+
+    Only full-face jobs on local ComfyUI batch: they all run workflow_facedetailer.json,
+    so they share the checkpoint and LoRA and differ only in image, denoise and seed.
+    Nothing batches while the local backend is down.
+
+    Returns:
+        Hashable key, or None if the generation must run on its own
+    """
+    if not local_backend or GENERATION_BATCH_MAX_SIZE < 2 or not local_backend.is_available():
+        return None  # Jobs run one by one, so the router can fail them over
+
+    params = generation.job_params or {}
+    if params.get('transform_mode', 'full') != 'full':
+        return None
+    return (generation.workflow_type, 'full')
+
+def check_admission(tier):
+    """Queue-wait rejection for a new job of this tier, or None to admit it"""
+    backend_count = len(comfyui_pool.backends()) if comfyui_pool and comfyui_pool.has_backends() else 1
+    return admission_controller.check_queue(tier, get_queue_depth(), get_backend_load(), backend_count)
+
+def admission_response(rejection):
+    """429 carrying the rejection's Retry-After (same shape as the cooldown response)"""
+    response = jsonify({
+        'error': rejection['message'],
+        'cooldown': True,
+        'remaining_seconds': rejection['retry_after'],
+        **{key: value for key, value in rejection.items() if key not in ('message', 'retry_after')}
+    })
+    response.headers['Retry-After'] = str(rejection['retry_after'])
+    return response, 429
+
+def has_dispatch_slot():
+    """
+    True when a ComfyUI backend has room for another prompt, or a paid backend should take it
+    
+    Jobs stay pending in our table until a backend holds fewer than GENERATION_MAX_OUTSTANDING
+    prompts, so ComfyUI's own FIFO queue stays short and our claim order (paid first, with
+    aging) decides what runs next. With no backend available, dispatch goes ahead and the
+    router fails the job over (or fails it) instead of holding it indefinitely.
+    """
+    if not local_backend or GENERATION_MAX_OUTSTANDING <= 0:
+        return True
+    if comfyui_pool and comfyui_pool.has_backends():
+        slots = comfyui_pool.open_slots(GENERATION_MAX_OUTSTANDING, get_backend_load())
+        if slots is None or slots > 0:
+            return True
+    elif count_outstanding_prompts() < GENERATION_MAX_OUTSTANDING:
+        return True
+    # Local ComfyUI is full - a paid backend takes the job if the local wait is past the SLO
+    return should_spill_over()
+
+def should_spill_over():
+    """True when new jobs go to paid cloud backends ahead of local ComfyUI (GPU_SPILLOVER_SLO_SECONDS)"""
+    return local_backend is not None and gpu_router.should_spill(local_queue_eta)
+
+def gpu_is_saturated():
+    """True when jobs are piling up faster than the GPU drains them"""
+    if comfyui_pool and comfyui_pool.has_backends():
+        depths = [backend.queue_depth for backend in comfyui_pool.backends()]
+        if min(depths) >= GENERATION_BATCH_QUEUE_DEPTH:
+            return True
+    return count_pending_generations() >= GENERATION_BATCH_QUEUE_DEPTH
+
+def run_generation_batch(generations):
+    """
+    Dispatch several claimed full-face generations as one ComfyUI prompt
+
+    Each generation is marked processing with the shared prompt ID and its own
+    SaveImage node, which the finalizer uses to pick its image out of the prompt outputs.
+
+    Returns:
+        bool: True if the batch was dispatched, False if it failed
+    """
+    jobs = []
+    for generation in generations:
+        params = generation.job_params or {}
+        file_path = os.path.join(UPLOAD_FOLDER, generation.input_filename)
+        if not params:
+            mark_failed(generation, 'Missing job parameters')
+        elif not os.path.exists(file_path):
+            mark_failed(generation, 'Input image no longer available')
+        else:
+            jobs.append((generation, {
+                'image_path': file_path,
+                'preset_name': generation.preset,
+                'denoise_strength': params.get('denoise', 0.10)
+            }))
+
+    if not jobs:
+        return False
+    if len(jobs) == 1:
+        return run_generation_job(jobs[0][0])
+
+    client, backend_url = acquire_comfyui_client()
+    if not client:
+        for generation, _ in jobs:
+            mark_failed(generation, 'No ComfyUI backend available')
+        return False
+
+    try:
+        prompt_id, output_nodes = client.generate_batch([job for _, job in jobs])
+        if not prompt_id:
+            for generation, _ in jobs:
+                mark_failed(generation, 'Failed to start ComfyUI generation')
+            return False
+
+        for (generation, _), output_node in zip(jobs, output_nodes):
+            generation.backend_url = backend_url
+            assign_backend(generation, local_backend.backend_name)
+            mark_processing(generation, prompt_id, output_node=output_node)
+
+        logger.info(f"ComfyUI batch started: {prompt_id} ({len(jobs)} generations, backend: {getattr(client, 'base_url', None)})")
+        return True
+
+    except Exception as e:
+        logger.error(f"ComfyUI batch processing error: {e}")
+        for generation, _ in jobs:
+            mark_failed(generation, str(e))
+        return False
+    finally:
+        if backend_url:
+            comfyui_pool.release(backend_url)
+
+# One /queue + /history fetch per backend for every in-flight prompt; feeds /status, /events and the finalizer
+status_reconciler = StatusReconciler(app, get_generation_client)
+
+def finalize_generation(generation, worker_id):
+    """
+    Save a finished prompt's output and mark the generation completed
+    
+    Runs in generation_worker.py's finalizer (for prompts the status reconciler reported
+    COMPLETED), never in a request thread. Idempotent: only the caller that moves the row from
+    'processing' to 'finalizing' fetches the output, so each result is pulled from the GPU
+    exactly once. Once every generation sharing the prompt is settled, the prompt is pruned
+    from ComfyUI's history.
+    
+    Returns:
+        bool: True if this call completed the generation
+    """
+    client = get_generation_client(generation)
+    if not client or not claim_finalization(generation, worker_id):
+        return False
+    
+    prompt_id = generation.prompt_id
+    result_filename = f"result_{prompt_id}_{generation.output_node}.png" if generation.output_node else f"result_{prompt_id}.png"
+    result_path = os.path.join(OUTPUT_FOLDER, result_filename)
+    
+    try:
+        if hasattr(client, 'open_job_output'):
+            # ComfyUI: stream /view straight to disk (batched prompts hold one image per generation)
+            upstream = client.open_job_output(prompt_id, output_node=generation.output_node)
+            if upstream is not None:
+                for _ in stream_to_file(upstream, result_path):
+                    pass
+            saved = upstream is not None
+        else:
+            image_data = client.fetch(prompt_id) if isinstance(client, GpuBackend) else client.get_job_output(prompt_id)
+            if image_data:
+                save_result(image_data, result_path)
+            saved = bool(image_data)
+    except Exception as e:
+        # Network trouble mid-download - let the next finalizer pass try again
+        logger.error(f"Failed to save result for generation {generation.id}: {e}")
+        release_finalization(generation)
+        return False
+    
+    if not saved:
+        mark_failed(generation, 'Failed to retrieve result image from the GPU')
+        return False
+    
+    mark_completed(generation, result_filename)
+    logger.info(f"Generation {generation.id} finalized: {result_filename}")
+    
+    if FINALIZER_PRUNE_HISTORY and hasattr(client, 'delete_history') and prompt_is_settled(prompt_id):
+        client.delete_history(prompt_id)
+    return True
+
+def finalize_in_flight_generations(worker_id):
+    """One reconciliation pass, then save every completed prompt; returns the number completed"""
+    generations, statuses = status_reconciler.reconcile()
+    finalized = 0
+    for generation in generations:
+        if statuses.get(generation.prompt_id) != 'COMPLETED':
+            continue
+        try:
+            if finalize_generation(generation, worker_id):
+                finalized += 1
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Finalizer error for generation {generation.id}: {e}")
+    return finalized
+
 @app.route('/status/<prompt_id>')
+@login_required
 def check_status(prompt_id):
-    """Check processing status"""
+    """Check processing status of one of the user's generations (accepts a generation ID or a GPU prompt ID)"""
     try:
-        # This logic is the same for all GPU clients
-        status = gpu_client.get_job_status(prompt_id)
+        generation = find_generation(prompt_id, user_id=current_user.id)
         
-        if status == 'COMPLETED':
-            # Find the generation record to pass its ID to the frontend
-            generation = Generation.query.filter_by(prompt_id=prompt_id).first()
+        if not generation:
+            return jsonify({'error': 'Generation not found'}), 404
+        
+        if generation.status in QUEUED_STATUSES:
+            position = get_queue_position(generation)
+            return jsonify({
+                'complete': False,
+                'queued': True,
+                'queue_position': position,
+                'generation_id': generation.id,
+                'message': f'Waiting for a GPU slot ({position} ahead of you)...' if position else 'Starting on GPU...'
+            })
+        elif generation.status == 'failed':
+            return jsonify({
+                'complete': False,
+                'error': True,
+                'generation_id': generation.id,
+                'message': generation.error_message or 'Processing failed'
+            })
+        elif generation.status == 'completed':
             return jsonify({
                 'complete': True,
                 'message': 'Processing complete!',
-                'generation_id': generation.id if generation else None
+                'generation_id': generation.id
+            })
+        elif generation.status == 'finalizing':
+            return jsonify({
+                'complete': False,
+                'generation_id': generation.id,
+                'message': 'Saving result...'
+            })
+        prompt_id = generation.prompt_id
+        
+        # Reconciled in the background for every in-flight prompt; ask the GPU only if it has no answer yet
+        status_reconciler.start()
+        status = gpu_status_map.get(prompt_id) or get_generation_client(generation).get_job_status(prompt_id)
+        
+        if status == 'COMPLETED':
+            # Complete once the finalizer has saved the output - /result only serves saved files
+            return jsonify({
+                'complete': False,
+                'generation_id': generation.id,
+                'message': 'Saving result...'
             })
         elif status == 'FAILED':
             return jsonify({
@@ -1147,81 +1240,172 @@ def check_status(prompt_id):
         logger.error(f"Status check error: {e}")
         return jsonify({'error': 'Failed to check status'}), 500
 
+@app.route('/events/<generation_id>')
+@login_required
+def generation_events(generation_id):
+    """
+    Server-Sent Events stream of generation progress
+    
+    Queue position and completion come from the database (a generation is complete once the
+    finalizer has saved its output); step-level progress comes from the shared ComfyUI
+    websocket subscriber, so waiting browsers cost no tunnel round trips.
+    """
+    generation = Generation.query.filter_by(id=generation_id, user_id=current_user.id).first()
+    if not generation:
+        return jsonify({'error': 'Generation not found'}), 404
+    
+    uses_comfyui = not USE_MODAL and not USE_CLOUD_GPU
+    status_reconciler.start()
+    
+    def load_snapshot():
+        """Read the generation's current state without holding a DB connection"""
+        db.session.expire_all()
+        current = Generation.query.get(generation_id)
+        snapshot = {
+            'status': current.status,
+            'prompt_id': current.prompt_id,
+            'backend_url': current.backend_url,
+            'error_message': current.error_message,
+            'queue_position': get_queue_position(current)
+        }
+        db.session.close()
+        return snapshot
+    
+    @stream_with_context
+    def stream():
+        deadline = time.time() + GENERATION_CLAIM_TIMEOUT + COMFYUI_TIMEOUT
+        subscriber = None
+        listener = None
+        listened_prompt_id = None
+        last_queue_event = None
+        last_keepalive = time.time()
+        last_gpu_check = time.time()
+        gpu_done = False
+        
+        try:
+            while time.time() < deadline:
+                snapshot = load_snapshot()
+                status = snapshot['status']
+                
+                if status in QUEUED_STATUSES:
+                    queue_event = {'status': status, 'queue_position': snapshot['queue_position']}
+                    if queue_event != last_queue_event:
+                        yield format_sse('queued', queue_event)
+                        last_queue_event = queue_event
+                        last_keepalive = time.time()
+                    elif time.time() - last_keepalive > SSE_KEEPALIVE_INTERVAL:
+                        yield ': keepalive\n\n'
+                        last_keepalive = time.time()
+                    time.sleep(SSE_QUEUE_POLL_INTERVAL)
+                    continue
+                
+                if status == 'failed':
+                    yield format_sse('failed', {'generation_id': generation_id, 'message': snapshot['error_message'] or 'Processing failed'})
+                    return
+                
+                if status == 'completed':
+                    yield format_sse('complete', {'generation_id': generation_id})
+                    return
+                
+                # GPU finished - wait for the finalizer to save the output
+                if gpu_done or status == 'finalizing':
+                    if not gpu_done:
+                        yield format_sse('finalizing', {'generation_id': generation_id})
+                        gpu_done = True
+                    elif time.time() - last_keepalive > SSE_KEEPALIVE_INTERVAL:
+                        yield ': keepalive\n\n'
+                        last_keepalive = time.time()
+                    time.sleep(SSE_QUEUE_POLL_INTERVAL)
+                    continue
+                
+                prompt_id = snapshot['prompt_id']
+                backend_url = snapshot['backend_url'] or getattr(gpu_client, 'base_url', None)
+                client = comfyui_pool.get_client(snapshot['backend_url']) if snapshot['backend_url'] and comfyui_pool else gpu_client
+                
+                # Processing - follow the prompt on its backend's shared websocket subscriber
+                if uses_comfyui and client and listener is None:
+                    subscriber = get_progress_subscriber(backend_url)
+                    if subscriber:
+                        listener = subscriber.listen(prompt_id)
+                        listened_prompt_id = prompt_id
+                        yield format_sse('processing', {'generation_id': generation_id})
+                
+                event = None
+                if listener is not None:
+                    try:
+                        event = listener.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                    except queue.Empty:
+                        event = None
+                else:
+                    time.sleep(min(SSE_KEEPALIVE_INTERVAL, SSE_FALLBACK_POLL_INTERVAL))
+                
+                if event:
+                    if event['type'] == 'complete':
+                        yield format_sse('finalizing', {'generation_id': generation_id})
+                        gpu_done = True
+                        last_keepalive = time.time()
+                        continue
+                    if event['type'] == 'failed':
+                        yield format_sse('failed', {'generation_id': generation_id, 'message': event.get('message', 'Processing failed')})
+                        return
+                    yield format_sse(event['type'], event)
+                    last_keepalive = time.time()
+                    last_gpu_check = time.time()
+                    continue
+                
+                # No websocket events for a while (or no subscriber) - ask the GPU directly
+                if time.time() - last_gpu_check >= SSE_FALLBACK_POLL_INTERVAL or (listener is None and client):
+                    last_gpu_check = time.time()
+                    gpu_job_status = gpu_status_map.get(prompt_id) or (client.get_job_status(prompt_id) if client else 'FAILED')
+                    if gpu_job_status == 'COMPLETED':
+                        yield format_sse('finalizing', {'generation_id': generation_id})
+                        gpu_done = True
+                        last_keepalive = time.time()
+                        continue
+                    if gpu_job_status == 'FAILED':
+                        yield format_sse('failed', {'generation_id': generation_id, 'message': 'Processing failed'})
+                        return
+                
+                yield ': keepalive\n\n'
+                last_keepalive = time.time()
+            
+            yield format_sse('failed', {'generation_id': generation_id, 'message': 'Timed out waiting for the GPU'})
+        finally:
+            if subscriber and listener is not None:
+                subscriber.unlisten(listened_prompt_id, listener)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/result/<prompt_id>')
 @login_required
 def get_result(prompt_id):
-    """Get processed result"""
+    """
+    Download a processed result (accepts a generation ID or a GPU prompt ID)
+    
+    Pure static serve: the worker's finalizer saves outputs and marks generations completed,
+    so a download never talks to the GPU.
+    """
     try:
         # Find generation record
-        generation = Generation.query.filter_by(
-            prompt_id=prompt_id,
-            user_id=current_user.id
-        ).first()
+        generation = find_generation(prompt_id, user_id=current_user.id)
         
         if not generation:
             return jsonify({'error': 'Generation not found'}), 404
         
-        if USE_CLOUD_GPU:
-            # Get RunPod result
-            status = gpu_client.get_job_status(prompt_id)
-            
-            if status != 'COMPLETED':
-                return jsonify({'error': 'Processing not complete'}), 400
-            
-            # Get output image from RunPod
-            image_data = gpu_client.get_job_output(prompt_id)
-            if not image_data:
-                generation.status = 'failed'
-                generation.error_message = 'Failed to retrieve result image from RunPod'
-                db.session.commit()
-                return jsonify({'error': 'Failed to retrieve result image'}), 500
-            
-            # Save result image
-            result_filename = f"result_{prompt_id}.png"
-            result_path = os.path.join(OUTPUT_FOLDER, result_filename)
-            
-            with open(result_path, 'wb') as f:
-                f.write(image_data)
-            
-            # Update generation record
-            generation.status = 'completed'
-            generation.completed_at = datetime.utcnow()
-            generation.output_filename = result_filename
-            db.session.commit()
-            
-            logger.info(f"RunPod generation completed for {current_user.email}: {prompt_id}")
-            
-        else:
-            # Get ComfyUI result
-            status = gpu_client.get_job_status(prompt_id)
-            
-            if status != 'COMPLETED':
-                return jsonify({'error': 'Processing not complete'}), 400
-            
-            # Get output image from ComfyUI
-            image_data = gpu_client.get_job_output(prompt_id)
-            if not image_data:
-                generation.status = 'failed'
-                generation.error_message = 'Failed to retrieve result image from ComfyUI'
-                db.session.commit()
-                return jsonify({'error': 'Failed to retrieve result image'}), 500
-            
-            # Save result image
-            result_filename = f"result_{prompt_id}.png"
-            result_path = os.path.join(OUTPUT_FOLDER, result_filename)
-            
-            with open(result_path, 'wb') as f:
-                f.write(image_data)
-            
-            # Update generation record
-            generation.status = 'completed'
-            generation.completed_at = datetime.utcnow()
-            generation.output_filename = result_filename
-            db.session.commit()
-            
-            logger.info(f"ComfyUI generation completed for {current_user.email}: {prompt_id}")
+        if generation.status == 'failed':
+            return jsonify({'error': generation.error_message or 'Processing failed'}), 500
+        
+        if generation.status != 'completed' or not generation.output_filename:
+            return jsonify({'error': 'Processing not complete'}), 400
         
-        return send_file(result_path, as_attachment=True, download_name=f"morphed_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png")
+        result_path = os.path.join(OUTPUT_FOLDER, generation.output_filename)
+        if not os.path.exists(result_path):
+            return jsonify({'error': 'Result is no longer available'}), 410
+        
+        return send_result_file(result_path, f"morphed_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png")
     
     except Exception as e:
         logger.error(f"Result retrieval error: {e}")
@@ -1232,20 +1416,18 @@ def gpu_status():
     """GPU status endpoint for real-time status checking"""
     try:
         if USE_LOCAL_COMFYUI:
-            # Check Local ComfyUI connection
-            is_available = False
-            if gpu_client:
-                try:
-                    is_available = gpu_client.test_connection()
-                except:
-                    is_available = False
+            # Cached by the background health monitor - polled by every open page
+            backend_health = get_gpu_backend_health()
+            is_available = gpu_client is not None and backend_health.available
             
             return jsonify({
                 'available': is_available,
                 'status': 'ready' if is_available else 'unavailable',
                 'message': 'GPU ready for generation' if is_available else 'I need more money to afford cloud GPU rent for yall so please buy some credits lmao 😅',
                 'gpu_type': 'local_comfyui',
-                'url': LOCAL_COMFYUI_URL if is_available else None
+                'url': backend_health.url if is_available else None,
+                'health': backend_health.status,
+                'latency_ms': backend_health.latency_ms
             })
         else:
             # For other GPU types, assume available if client exists
@@ -1267,48 +1449,24 @@ def gpu_status():
 
 @app.route('/health')
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (reads cached backend health - never probes inline)"""
     try:
+        backend_health = get_gpu_backend_health()
+        gpu_status = "connected" if backend_health.available else "disconnected"
+        
         if USE_LOCAL_COMFYUI:
-            # Check Local ComfyUI connection
-            gpu_status = "disconnected"
-            if gpu_client:
-                try:
-                    gpu_status = "connected" if gpu_client.test_connection() else "disconnected"
-                except:
-                    gpu_status = "disconnected"
-            
             gpu_type = "local_comfyui"
-            gpu_info = f"Local ComfyUI: {LOCAL_COMFYUI_URL} (Using {LOCAL_COMFYUI_WORKFLOW})"
+            gpu_info = f"Local ComfyUI: {backend_health.url or LOCAL_COMFYUI_URL} (Using {LOCAL_COMFYUI_WORKFLOW})"
         elif USE_MODAL:
-            # Check Modal.com connection
-            gpu_status = "disconnected"
-            if gpu_client:
-                try:
-                    gpu_status = "connected" if gpu_client.test_connection() else "disconnected"
-                except:
-                    gpu_status = "disconnected"
-            
             gpu_type = "modal.com"
             gpu_info = "Modal.com API (95% cost savings vs RunPod!)"
+        elif USE_CLOUD_GPU and USE_RUNPOD_SERVERLESS:
+            gpu_type = "runpod"
+            gpu_info = f"RunPod Serverless (webhooks {'on' if webhooks_enabled() else 'off'})"
         elif USE_CLOUD_GPU:
-            # Check Vast.ai connection
-            gpu_status = "disconnected"
-            if gpu_client:
-                try:
-                    gpu_status = "connected" if gpu_client.test_connection() else "disconnected"
-                except:
-                    gpu_status = "disconnected"
-            
             gpu_type = "vast.ai"
             gpu_info = "Vast.ai API (99% cost savings vs RunPod!)"
         else:
-            # Check ComfyUI connection
-            try:
-                response = requests.get(f"{COMFYUI_URL}/system_stats", timeout=5)
-                gpu_status = "connected" if response.status_code == 200 else "disconnected"
-            except:
-                gpu_status = "disconnected"
             gpu_type = "comfyui"
             gpu_info = f"Local: {COMFYUI_URL}"
     except Exception as e:
@@ -1326,12 +1484,18 @@ def health_check():
         'cloud_gpu_enabled': USE_CLOUD_GPU,
         'modal_enabled': USE_MODAL,
         'local_comfyui_enabled': USE_LOCAL_COMFYUI,
+        'backends': health_monitor.snapshot(),
+        'comfyui_pool': comfyui_pool.snapshot() if comfyui_pool else [],
+        'gpu_backends': {**gpu_router.snapshot(), 'usage_24h': get_gpu_backend_usage()},
+        'http_pools': get_transport_stats(),
+        'upload_dedup': upload_cache.snapshot(),
+        'upload_ingest': ingest_stats.snapshot(),
+        'gpu_status': gpu_status_map.snapshot(),
+        'shared_state': type(shared_state).__name__,
+        'db_pools': get_pool_stats(),
         'app_version': '4.1.0-local-comfyui'
     })
 
-# Global variable to store the registered tunnel URL
-registered_tunnel_url = None
-
 # Webhook endpoint to accept registered quick-tunnel URLs from a trusted registrar (your local machine).
 # The registrar should POST JSON: {"url": "https://xxxxx.trycloudflare.com"} with header X-TUNNEL-SECRET set.
 # Set REGISTER_TUNNEL_SECRET in Railway environment to a shared secret before enabling this.
@@ -1340,9 +1504,10 @@ def register_tunnel_webhook():
     """
     Accept a tunnel URL from an external registrar and persist it for automatic detection.
     This endpoint requires a shared secret header to prevent abuse.
-    """
-    global registered_tunnel_url
     
+    The URL goes into the shared tunnel registry, so the other gunicorn workers and replicas
+    switch to it on their next health probe / pool sync, not just the worker that took the call.
+    """
     try:
         expected_secret = os.getenv('REGISTER_TUNNEL_SECRET', 'morphpas')  # Default secret
         provided_secret = request.headers.get('X-TUNNEL-SECRET', '')
@@ -1360,7 +1525,7 @@ def register_tunnel_webhook():
 
         # Quick sanity check: ensure ComfyUI responds on the supplied URL
         try:
-            resp = requests.get(f"{url.rstrip('/')}/system_stats", timeout=5)
+            resp = comfyui_get(f"{url.rstrip('/')}/system_stats", 'probe')
             if resp.status_code != 200:
                 logger.warning(f"Register-tunnel received non-200 from candidate URL: {url} -> {resp.status_code}")
                 return jsonify({'error': 'ComfyUI not responding at provided URL'}), 400
@@ -1368,23 +1533,30 @@ def register_tunnel_webhook():
             logger.warning(f"Register-tunnel connectivity test failed for {url}: {e}")
             return jsonify({'error': 'Connection to provided URL failed', 'details': str(e)}), 400
 
-        # Store the URL globally and in the registry
-        registered_tunnel_url = url
+        # Store the URL in the shared registry
+        health_monitor.report(COMFYUI_BACKEND, True, url=url)
         
         try:
-            ok = set_tunnel_url(url)
+            ok = add_tunnel_url(url)
             if ok:
                 logger.info(f"✅ Registered tunnel URL via webhook: {url}")
                 
-                # Update the GPU client to use the new URL
-                global gpu_client
-                if USE_LOCAL_COMFYUI and gpu_client:
-                    gpu_client.base_url = url.rstrip('/')
+                # A (re)started ComfyUI may have an empty input folder - re-check uploads, re-seed reference chads
+                upload_cache.forget(url.rstrip('/'))
+                
+                # Join the backend pool alongside any other registered GPUs
+                if comfyui_pool:
+                    comfyui_pool.add_backend(url)
+                preseed_reference_images(url)
+                
+                # Update this worker's GPU client right away (the others follow via the registry)
+                if local_backend:
+                    local_backend.client.base_url = url.rstrip('/')
                     logger.info(f"🔄 Updated Local ComfyUI client to use: {url}")
                     
                     # Test the connection immediately
                     try:
-                        if gpu_client.test_connection():
+                        if local_backend.client.test_connection():
                             logger.info(f"✅ Successfully connected to ComfyUI at: {url}")
                         else:
                             logger.warning(f"⚠️ Connection test failed for: {url}")
@@ -1453,9 +1625,6 @@ def request_facial_evaluation():
         if existing_evaluation:
             return jsonify({'error': 'Facial evaluation already requested for this generation'}), 400
         
-        # Deduct credits
-        current_user.credits -= 20
-        
         # Copy images to facial evaluation folder for persistent storage
         # Copy original image from uploads to facial_evaluations
         original_source_path = os.path.join(UPLOAD_FOLDER, generation.input_filename)
@@ -1498,6 +1667,17 @@ def request_facial_evaluation():
             logger.error(f"Error copying images for facial evaluation: {e}")
             return jsonify({'error': 'Failed to prepare images for evaluation'}), 500
 
+        # Deduct credits in the same transaction as the evaluation request
+        if debit_credits(current_user.id, 20, 'facial_evaluation', reference_id=generation_id, commit=False) is None:
+            for path in (original_eval_path, morphed_eval_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return jsonify({
+                'error': 'Insufficient credits. You need 20 credits for facial evaluation.',
+                'need_credits': True,
+                'buy_credits_url': '/payments/buy-credits'
+            }), 402
+        
         # Create facial evaluation request with copied images
         evaluation = FacialEvaluation(
             user_id=current_user.id,
@@ -1589,6 +1769,11 @@ def request_facial_evaluation_standalone():
                             pass
                     return jsonify({'error': f'{file_key}: {message}'}), 400
                 
+                normalized = ingest_upload(file_path)
+                if normalized:
+                    unique_filename = normalized['filename']
+                    file_path = normalized['path']
+                
                 saved_files.append({
                     'key': file_key,
                     'filename': unique_filename,
@@ -1606,8 +1791,18 @@ def request_facial_evaluation_standalone():
         if not saved_files:
             return jsonify({'error': 'No valid files uploaded'}), 400
         
-        # Deduct credits
-        current_user.credits -= 20
+        # Deduct credits in the same transaction as the evaluation request
+        if debit_credits(current_user.id, 20, 'facial_evaluation', commit=False) is None:
+            for saved_file in saved_files:
+                try:
+                    os.remove(saved_file['path'])
+                except:
+                    pass
+            return jsonify({
+                'error': 'Insufficient credits. You need 20 credits for facial evaluation.',
+                'need_credits': True,
+                'buy_credits_url': '/payments/buy-credits'
+            }), 402
         
         # Create facial evaluation request with primary image
         primary_file = saved_files[0]
@@ -1836,7 +2031,14 @@ def request_ratios_morph():
                 os.remove(file_path)
                 return jsonify({'error': message}), 400
             
-            current_user.credits -= 40
+            # Deduct credits in the same transaction as the morph request
+            if debit_credits(current_user.id, 40, 'ratios_morph', commit=False) is None:
+                os.remove(file_path)
+                return jsonify({
+                    'error': 'Insufficient credits. You need 40 credits for a Ratios Morph.',
+                    'need_credits': True,
+                    'buy_credits_url': '/payments/buy-credits'
+                }), 402
             
             morph = RatiosMorph(
                 user_id=current_user.id,
@@ -2013,15 +2215,16 @@ def admin_update_credits():
             return jsonify({'error': 'User not found'}), 404
         
         if action == 'add':
-            user.credits += amount
+            balance = credit_credits(user.id, amount, 'admin_add', reference_id=current_user.id)
         elif action == 'set':
-            user.credits = amount
+            balance = adjust_credits(user.id, lambda current: amount, 'admin_set', reference_id=current_user.id)
         elif action == 'subtract':
-            user.credits = max(0, user.credits - amount)
+            balance = adjust_credits(user.id, lambda current: max(0, current - amount), 'admin_subtract', reference_id=current_user.id)
         else:
             return jsonify({'error': 'Invalid action'}), 400
         
-        db.session.commit()
+        if balance is None:
+            return jsonify({'error': 'Failed to update credits'}), 500
         
         logger.info(f"Admin {current_user.email} updated credits for {user.email}: {action} {amount}")
         
@@ -2620,5 +2823,11 @@ if __name__ == '__main__':
     host = os.environ.get('HOST', '0.0.0.0')
     port = int(os.environ.get('PORT', PORT))
     
+    if GENERATION_WORKER_IN_PROCESS:
+        # generation_worker imports `app` - let it reuse this module instead of loading a second copy
+        sys.modules.setdefault('app', sys.modules[__name__])
+        from generation_worker import start_in_process
+        start_in_process()
+    
     print(f"Starting server on {host}:{port}")
     app.run(debug=DEBUG, host=host, port=port, threaded=THREADED)
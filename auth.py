@@ -252,7 +252,7 @@ def api_check_credits():
         'can_generate_free': can_free,
         'can_generate_paid': can_paid,
         'credits': current_user.credits,
-        'free_generations_remaining': 1 - current_user.free_generations_used_today if can_free else 0,
+        'free_generations_remaining': current_user.free_generations_remaining(),
         'message': get_credit_message(can_free, can_paid, current_user.credits)
     })
 
@@ -0,0 +1,230 @@
+"""
+Backend Health Monitor
+A background prober keeps a cached healthy / degraded / down state (with last-seen latency)
+for each GPU backend, so generations, /gpu-status and /health read the state in O(1)
+instead of probing the tunnel inline on every request.
+"""
+
+import time
+import logging
+import threading
+from config import BACKEND_PROBE_INTERVAL, BACKEND_DEGRADED_LATENCY_MS, BACKEND_DOWN_AFTER_FAILURES
+from tunnel_registry import get_tunnel_url
+from comfyui_transport import comfyui_get
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+DOWN = 'down'
+UNKNOWN = 'unknown'
+
+COMFYUI_BACKEND = 'comfyui'
+GPU_CLIENT_BACKEND = 'gpu_client'  # Modal / Vast.ai / direct ComfyUI clients, probed via test_connection()
+FALLBACK_COMFYUI_URL = 'http://127.0.0.1:8188'
+
+
+def pool_backend_name(url):
+    """Health monitor name for a ComfyUIPool backend"""
+    return f"{COMFYUI_BACKEND}:{url.rstrip('/')}"
+
+
+def gpu_backend_name(name):
+    """Health monitor name for a routed GPU backend (gpu_router.py) other than local ComfyUI"""
+    return f"{GPU_CLIENT_BACKEND}:{name}"
+
+
+class BackendHealth:
+    """Last known health of one backend"""
+
+    def __init__(self, name, url=None):
+        self.name = name
+        self.url = url
+        self.status = UNKNOWN
+        self.latency_ms = None
+        self.last_checked = None
+        self.last_seen = None  # Last successful probe
+        self.consecutive_failures = 0
+        self.error = None
+
+    @property
+    def available(self):
+        return self.status in (HEALTHY, DEGRADED)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'status': self.status,
+            'available': self.available,
+            'latency_ms': self.latency_ms,
+            'last_checked': self.last_checked,
+            'last_seen': self.last_seen,
+            'consecutive_failures': self.consecutive_failures,
+            'error': self.error
+        }
+
+
+class BackendHealthMonitor:
+    """Runs registered probes in a background thread and caches their results"""
+
+    def __init__(self, interval=BACKEND_PROBE_INTERVAL, degraded_latency_ms=BACKEND_DEGRADED_LATENCY_MS,
+                 down_after_failures=BACKEND_DOWN_AFTER_FAILURES):
+        self.interval = interval
+        self.degraded_latency_ms = degraded_latency_ms
+        self.down_after_failures = max(1, down_after_failures)
+
+        self._probes = {}  # name -> callable returning (ok, url)
+        self._states = {}  # name -> BackendHealth
+        self._lock = threading.Lock()
+        self._probe_locks = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def register(self, name, probe, url=None):
+        """
+        Register a backend probe
+
+        Args:
+            name: Backend name (e.g. 'comfyui')
+            probe: Callable returning (ok, url); raising counts as a failure
+            url: Initial URL, if known
+        """
+        with self._lock:
+            self._probes[name] = probe
+            self._probe_locks.setdefault(name, threading.Lock())
+            self._states.setdefault(name, BackendHealth(name, url))
+
+    def unregister(self, name):
+        """Stop probing a backend and forget its state"""
+        with self._lock:
+            self._probes.pop(name, None)
+            self._states.pop(name, None)
+
+    def start(self):
+        """Start the background prober (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="backend-health", daemon=True)
+            self._thread.start()
+        logger.info(f"🩺 Backend health monitor started (every {self.interval}s)")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            for name in list(self._probes):
+                self.refresh(name)
+            self._stop_event.wait(self.interval)
+
+    def refresh(self, name):
+        """Run one probe now and update the cached state"""
+        probe = self._probes.get(name)
+        if probe is None:
+            return None
+
+        with self._probe_locks[name]:
+            started = time.time()
+            try:
+                ok, url = probe()
+                error = None if ok else 'Probe returned unhealthy'
+            except Exception as e:
+                ok, url, error = False, None, str(e)
+            latency_ms = int((time.time() - started) * 1000)
+            return self.report(name, ok, url=url, latency_ms=latency_ms, error=error)
+
+    def report(self, name, ok, url=None, latency_ms=None, error=None):
+        """Record a probe result (also used for passive observations, e.g. /register-tunnel)"""
+        with self._lock:
+            state = self._states.setdefault(name, BackendHealth(name))
+            previous = state.status
+            now = time.time()
+
+            state.last_checked = now
+            if url:
+                state.url = url.rstrip('/')
+
+            if ok:
+                state.consecutive_failures = 0
+                state.last_seen = now
+                state.latency_ms = latency_ms
+                state.error = None
+                slow = latency_ms is not None and latency_ms > self.degraded_latency_ms
+                state.status = DEGRADED if slow else HEALTHY
+            else:
+                state.consecutive_failures += 1
+                state.error = error
+                if state.consecutive_failures >= self.down_after_failures or previous in (UNKNOWN, DOWN):
+                    state.status = DOWN
+                else:
+                    state.status = DEGRADED
+
+            if state.status != previous:
+                logger.info(f"Backend {name} is now {state.status} ({state.url}, {state.latency_ms}ms)")
+            return state
+
+    def get(self, name):
+        """Cached state for a backend; probes synchronously only before the first result exists"""
+        self.start()
+        with self._lock:
+            state = self._states.get(name)
+            if state is None:
+                return BackendHealth(name)
+            needs_first_probe = state.last_checked is None and name in self._probes
+
+        if needs_first_probe:
+            state = self.refresh(name)
+        return state
+
+    def peek(self, name):
+        """Cached state without starting the prober or probing"""
+        with self._lock:
+            return self._states.get(name)
+
+    def is_available(self, name):
+        return self.get(name).available
+
+    def snapshot(self):
+        """Health of every backend as plain dicts"""
+        with self._lock:
+            return {name: state.to_dict() for name, state in self._states.items()}
+
+
+def probe_comfyui():
+    """Probe the registered tunnel (or last known URL), falling back to tunnel detection"""
+    state = health_monitor.peek(COMFYUI_BACKEND)
+    candidates = [get_tunnel_url(), state.url if state else None]
+
+    for url in candidates:
+        if not url:
+            continue
+        url = url.rstrip('/')
+        try:
+            response = comfyui_get(f"{url}/system_stats", 'probe')
+            if response.status_code == 200:
+                return True, url
+        except Exception as e:
+            logger.debug(f"ComfyUI probe failed for {url}: {e}")
+
+    # Rate limited internally; scans logs and known tunnel names
+    from cloudflare_tunnel_detector import tunnel_detector
+    detected_url = tunnel_detector.detect_tunnel_url()
+    if detected_url:
+        return True, detected_url
+
+    return False, None
+
+
+health_monitor = BackendHealthMonitor()
+
+
+def get_comfyui_url():
+    """Last known-good ComfyUI URL (O(1) after the first probe)"""
+    # Registered on first use so deployments without the tunnel never probe it
+    if health_monitor.peek(COMFYUI_BACKEND) is None:
+        health_monitor.register(COMFYUI_BACKEND, probe_comfyui)
+    state = health_monitor.get(COMFYUI_BACKEND)
+    return state.url or FALLBACK_COMFYUI_URL
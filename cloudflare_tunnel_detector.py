@@ -4,7 +4,6 @@ Automatic Cloudflare Tunnel Detection for ComfyUI
 This module automatically detects running Cloudflare tunnels and updates the configuration
 """
 
-import requests
 import json
 import re
 import subprocess
@@ -13,6 +12,7 @@ import logging
 import os
 from typing import Optional, List, Dict
 from tunnel_registry import get_tunnel_url
+from comfyui_transport import comfyui_get
 
 logger = logging.getLogger(__name__)
 
@@ -112,7 +112,7 @@ class CloudflareTunnelDetector:
     def _test_comfyui_connection(self, url: str) -> bool:
         """Test if URL is a working ComfyUI instance"""
         try:
-            response = requests.get(f"{url}/system_stats", timeout=5)
+            response = comfyui_get(f"{url}/system_stats", 'probe')
             if response.status_code == 200:
                 data = response.json()
                 # Check if it's actually ComfyUI
@@ -182,7 +182,7 @@ class CloudflareTunnelDetector:
             }
         
         try:
-            response = requests.get(f"{url}/system_stats", timeout=5)
+            response = comfyui_get(f"{url}/system_stats", 'probe')
             if response.status_code == 200:
                 stats = response.json()
                 return {
@@ -210,33 +210,13 @@ class CloudflareTunnelDetector:
 tunnel_detector = CloudflareTunnelDetector()
 
 def get_dynamic_comfyui_url() -> str:
-    """Get the current ComfyUI URL (either tunnel or local)"""
-    # First check for registered tunnel URL from the registry
-    try:
-        reg_url = get_tunnel_url()
-        if reg_url:
-            # Test if the registered URL is still working
-            try:
-                response = requests.get(f"{reg_url.rstrip('/')}/system_stats", timeout=5)
-                if response.status_code == 200:
-                    logger.info(f"Using registered tunnel URL: {reg_url}")
-                    return reg_url
-                else:
-                    logger.warning(f"Registered tunnel URL not responding: {reg_url}")
-            except Exception as e:
-                logger.warning(f"Failed to test registered tunnel URL {reg_url}: {e}")
-    except Exception as e:
-        logger.debug(f"Failed to get registered tunnel URL: {e}")
-    
-    # Try to detect tunnel automatically
-    tunnel_url = tunnel_detector.detect_tunnel_url()
-    if tunnel_url:
-        logger.info(f"Using auto-detected tunnel URL: {tunnel_url}")
-        return tunnel_url
-    
-    # Fallback to local
-    logger.info("Using fallback local URL: http://127.0.0.1:8188")
-    return 'http://127.0.0.1:8188'
+    """Get the current ComfyUI URL (either tunnel or local)
+
+    Reads the state cached by the background health monitor instead of probing inline;
+    the monitor re-checks the registered tunnel and falls back to detection.
+    """
+    from backend_health import get_comfyui_url
+    return get_comfyui_url()
 
 def test_tunnel_detection():
     """Test the tunnel detection system"""
@@ -3,7 +3,6 @@ ComfyUI Client for Face Morphing App
 Handles communication with ComfyUI API
 """
 
-import requests
 import json
 import time
 import uuid
@@ -11,10 +10,16 @@ import logging
 from io import BytesIO
 from PIL import Image
 import base64
+from comfyui_transport import comfyui_get, comfyui_post
+from workflow_registry import workflow_registry
+from gpu_backends import GpuBackend, Submission
 
 logger = logging.getLogger(__name__)
 
-class ComfyUIClient:
+class ComfyUIClient(GpuBackend):
+    backend_name = 'comfyui'
+    transform_modes = ('full', 'reference', 'chad_2_0')
+    
     def __init__(self, base_url="http://127.0.0.1:8188", timeout=300):
         """Initialize ComfyUI client"""
         self.base_url = base_url.rstrip('/')
@@ -24,7 +29,7 @@ class ComfyUIClient:
     def test_connection(self):
         """Test connection to ComfyUI"""
         try:
-            response = requests.get(f"{self.base_url}/system_stats", timeout=10)
+            response = comfyui_get(f"{self.base_url}/system_stats", 'probe')
             return response.status_code == 200
         except:
             return False
@@ -70,15 +75,15 @@ class ComfyUIClient:
         """Queue a workflow in ComfyUI"""
         try:
             prompt_id = str(uuid.uuid4())
+            # No client_id: ComfyUI then broadcasts progress to every /ws subscriber
+            # (see comfyui_progress.py), not just to the socket that queued the prompt
             payload = {
-                "prompt": workflow,
-                "client_id": prompt_id
+                "prompt": workflow
             }
             
-            response = requests.post(
+            response = comfyui_post(
                 f"{self.base_url}/prompt",
-                json=payload,
-                timeout=self.timeout
+                json=payload
             )
             response.raise_for_status()
             
@@ -92,7 +97,7 @@ class ComfyUIClient:
     def get_job_status(self, prompt_id):
         """Get job status"""
         try:
-            response = requests.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
+            response = comfyui_get(f"{self.base_url}/history/{prompt_id}")
             response.raise_for_status()
             
             history = response.json()
@@ -108,7 +113,7 @@ class ComfyUIClient:
     def get_job_output(self, prompt_id):
         """Get job output"""
         try:
-            response = requests.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
+            response = comfyui_get(f"{self.base_url}/history/{prompt_id}")
             response.raise_for_status()
             
             history = response.json()
@@ -131,7 +136,7 @@ class ComfyUIClient:
                             'type': 'output'
                         }
                         
-                        img_response = requests.get(f"{self.base_url}/view", params=params, timeout=30)
+                        img_response = comfyui_get(f"{self.base_url}/view", 'transfer', params=params)
                         img_response.raise_for_status()
                         
                         return img_response.content
@@ -153,7 +158,7 @@ class ComfyUIClient:
                     'image': (filename, f, 'image/jpeg'),
                     'overwrite': (None, 'true')
                 }
-                response = requests.post(f"{self.base_url}/upload/image", files=files, timeout=30)
+                response = comfyui_post(f"{self.base_url}/upload/image", 'transfer', files=files)
                 response.raise_for_status()
                 
                 result = response.json()
@@ -165,50 +170,46 @@ class ComfyUIClient:
             return False
     
     def _prepare_workflow(self, image_path, denoise_strength, preset_name):
-        """Load and prepare the actual workflow_facedetailer.json with correct parameters"""
+        """Bind workflow_facedetailer.json from the workflow registry with correct parameters"""
         try:
             import os
             import random
             
-            # Get image filename
-            image_filename = os.path.basename(image_path)
-            
             # Generate unique seed for each run
             unique_seed = random.randint(1, 2**32 - 1)
             timestamp = int(time.time())
             
-            # Load the actual workflow file
-            workflow_path = os.path.join(os.path.dirname(__file__), 'comfyui_workflows', 'workflow_facedetailer.json')
-            
-            if not os.path.exists(workflow_path):
-                logger.error(f"Workflow file not found: {workflow_path}")
-                return None
-            
-            with open(workflow_path, 'r') as f:
-                workflow = json.load(f)
-            
-            # Update the workflow with our parameters
-            
-            # Update image filename (node 5)
-            if "5" in workflow:
-                workflow["5"]["inputs"]["image"] = image_filename
-            
-            # Update seed and denoise strength (node 8 - FaceDetailer)
-            if "8" in workflow:
-                workflow["8"]["inputs"]["seed"] = unique_seed
-                workflow["8"]["inputs"]["denoise"] = denoise_strength
-            
-            # Update output filename (node 9)
-            if "9" in workflow:
-                workflow["9"]["inputs"]["filename_prefix"] = f"morph_{preset_name}_{timestamp}"
+            workflow = workflow_registry.bind(
+                'workflow_facedetailer.json',
+                input_image=os.path.basename(image_path),
+                seed=unique_seed,
+                denoise=denoise_strength,
+                save_prefix=f"morph_{preset_name}_{timestamp}"
+            )
             
-            logger.info(f"Loaded workflow_facedetailer.json for {preset_name} with denoise {denoise_strength} and seed {unique_seed}")
+            logger.info(f"Prepared workflow_facedetailer.json for {preset_name} with denoise {denoise_strength} and seed {unique_seed}")
             return workflow
             
         except Exception as e:
             logger.error(f"Failed to prepare workflow: {e}")
             return None
     
+    def submit(self, job):
+        """Queue a GpuJob (face swap for reference mode, the preset workflow otherwise)"""
+        if job.transform_mode == 'reference' and job.reference_image_path:
+            prompt_id = self.generate_image_with_face_swap(
+                original_image_path=job.image_path,
+                reference_image_path=job.reference_image_path,
+                swap_intensity=f"{int(job.face_swap_intensity * 100)}%"
+            )
+        else:
+            preset_name = "CHAD_2_0" if job.transform_mode == 'chad_2_0' else job.preset
+            prompt_id = self.generate_image(image_path=job.image_path, preset_name=preset_name, denoise_strength=job.denoise)
+        
+        if not prompt_id:
+            return Submission(error='Failed to start ComfyUI generation')
+        return Submission(job_id=prompt_id)
+    
     def generate_image_with_face_swap(self, original_image_path, reference_image_path, swap_intensity="50%"):
         """
         Generate image using face swap workflow
@@ -0,0 +1,293 @@
+"""
+ComfyUI Backend Pool
+Several ComfyUI boxes (the home GPU behind a quick tunnel, rented pods) behind one site.
+New prompts go to the backend with the lowest expected completion time, and each prompt
+stays pinned to its backend (Generation.backend_url) for status, progress and result calls.
+"""
+
+import time
+import logging
+import threading
+from config import COMFYUI_DEFAULT_EXEC_SECONDS, COMFYUI_BACKEND_EXPIRY
+from backend_health import health_monitor, pool_backend_name, COMFYUI_BACKEND, DOWN
+from gpu_backends import GpuBackend, Submission, TRANSFORM_MODES
+from comfyui_transport import comfyui_get
+from tunnel_registry import get_tunnel_urls, remove_tunnel_url
+
+logger = logging.getLogger(__name__)
+
+
+class ComfyUIBackend:
+    """One ComfyUI server and its last observed /queue"""
+
+    def __init__(self, url, static=False):
+        self.url = url.rstrip('/')
+        self.static = static  # Configured via COMFYUI_BACKEND_URLS - never pruned
+        self.queue_running = 0
+        self.queue_pending = 0
+        self.reserved = 0  # Chosen for dispatch but not yet marked processing
+        self.down_since = None
+
+    @property
+    def queue_depth(self):
+        return self.queue_running + self.queue_pending
+
+
+class ComfyUIPool:
+    """Registered ComfyUI backends with queue-depth-aware routing"""
+
+    def __init__(self, client_factory, static_urls=(), monitor=health_monitor,
+                 default_exec_seconds=COMFYUI_DEFAULT_EXEC_SECONDS, expiry=COMFYUI_BACKEND_EXPIRY,
+                 on_backend_added=None):
+        """
+        Args:
+            client_factory: Callable building a client pinned to one backend URL
+            static_urls: Backends that are always part of the pool
+            monitor: BackendHealthMonitor that probes each backend's /queue
+            default_exec_seconds: Execution time assumed before a backend has history
+            expiry: Seconds a registered (non-static) backend may stay down before it is dropped
+            on_backend_added: Optional callable(url) run when a backend joins the pool
+        """
+        self.client_factory = client_factory
+        self.static_urls = [url.rstrip('/') for url in static_urls if url]
+        self.monitor = monitor
+        self.default_exec_seconds = default_exec_seconds
+        self.expiry = expiry
+        self.on_backend_added = on_backend_added
+
+        self._backends = {}  # url -> ComfyUIBackend
+        self._clients = {}  # url -> pinned client
+        self._lock = threading.Lock()
+
+    def sync(self):
+        """Match the pool to COMFYUI_BACKEND_URLS plus the tunnel registry"""
+        registered = [url.rstrip('/') for url in get_tunnel_urls()]
+        wanted = set(self.static_urls) | set(registered)
+
+        for url in self.static_urls:
+            self.add_backend(url, static=True)
+        for url in registered:
+            self.add_backend(url)
+
+        with self._lock:
+            stale = [url for url in self._backends if url not in wanted]
+        for url in stale:
+            self.remove_backend(url)
+
+    def add_backend(self, url, static=False):
+        url = url.rstrip('/')
+        with self._lock:
+            if url in self._backends:
+                return self._backends[url]
+            backend = ComfyUIBackend(url, static=static)
+            self._backends[url] = backend
+
+        self.monitor.register(pool_backend_name(url), lambda: self._probe(backend), url=url)
+        logger.info(f"Added ComfyUI backend to pool: {url}")
+        if self.on_backend_added:
+            self.on_backend_added(url)
+        return backend
+
+    def remove_backend(self, url):
+        url = url.rstrip('/')
+        with self._lock:
+            backend = self._backends.pop(url, None)
+            self._clients.pop(url, None)
+        if backend:
+            self.monitor.unregister(pool_backend_name(url))
+            logger.info(f"Removed ComfyUI backend from pool: {url}")
+
+    def has_backends(self):
+        with self._lock:
+            return bool(self._backends)
+
+    def backends(self):
+        with self._lock:
+            return list(self._backends.values())
+
+    def _probe(self, backend):
+        """Health probe doubling as the queue-depth refresh"""
+        response = comfyui_get(f"{backend.url}/queue", 'probe')
+        if response.status_code != 200:
+            return False, backend.url
+
+        queue_data = response.json()
+        backend.queue_running = len(queue_data.get('queue_running', []))
+        backend.queue_pending = len(queue_data.get('queue_pending', []))
+        return True, backend.url
+
+    def outstanding(self, backend, load=None):
+        """Prompts queued or running on this backend, including dispatches in progress"""
+        stats = (load or {}).get(backend.url, {})
+        # /queue may lag our own dispatches by a probe interval
+        return max(backend.queue_depth, stats.get('in_flight', 0)) + backend.reserved
+
+    def expected_completion(self, backend, load=None):
+        """Seconds until a new prompt on this backend would finish"""
+        stats = (load or {}).get(backend.url, {})
+        avg_seconds = stats.get('avg_seconds') or self.default_exec_seconds
+        return (self.outstanding(backend, load) + 1) * avg_seconds
+
+    def open_slots(self, max_outstanding, load=None):
+        """
+        Prompts that can still be dispatched before every available backend holds max_outstanding
+
+        Returns:
+            int, or None when no backend is available at all
+        """
+        available = [backend for backend in self.backends()
+                     if self.monitor.get(pool_backend_name(backend.url)).available]
+        if not available:
+            return None
+        return sum(max(0, max_outstanding - self.outstanding(backend, load)) for backend in available)
+
+    def choose_backend(self, load=None):
+        """
+        Reserve the available backend with the lowest expected completion time
+
+        Args:
+            load: job_queue.get_backend_load() result (in-flight prompts, average execution time)
+
+        Returns:
+            Backend URL, or None when no backend is available. Call release() once dispatched.
+        """
+        self.sync()
+        self.prune()
+
+        candidates = []
+        for backend in self.backends():
+            health = self.monitor.get(pool_backend_name(backend.url))
+            if not health.available:
+                continue
+            candidates.append((self.expected_completion(backend, load), health.latency_ms or 0, backend))
+
+        if not candidates:
+            return None
+
+        expected, _, backend = min(candidates, key=lambda candidate: candidate[:2])
+        with self._lock:
+            backend.reserved += 1
+        logger.info(f"Routing prompt to {backend.url} (expected completion {expected:.0f}s, queue {backend.queue_depth})")
+        return backend.url
+
+    def release(self, url):
+        """Drop the reservation taken by choose_backend()"""
+        with self._lock:
+            backend = self._backends.get(url.rstrip('/'))
+            if backend and backend.reserved > 0:
+                backend.reserved -= 1
+
+    def get_client(self, url):
+        """Client pinned to one backend (created on first use)"""
+        url = url.rstrip('/')
+        with self._lock:
+            client = self._clients.get(url)
+            if client is None:
+                client = self.client_factory(url)
+                self._clients[url] = client
+            return client
+
+    def prune(self):
+        """Forget registered backends that have been down longer than the expiry"""
+        now = time.time()
+        for backend in self.backends():
+            health = self.monitor.peek(pool_backend_name(backend.url))
+            if health is None or health.status != DOWN:
+                backend.down_since = None
+                continue
+
+            backend.down_since = backend.down_since or now
+            if not backend.static and now - backend.down_since > self.expiry:
+                logger.warning(f"ComfyUI backend down for {int(now - backend.down_since)}s, dropping: {backend.url}")
+                remove_tunnel_url(backend.url)
+                self.remove_backend(backend.url)
+
+    def snapshot(self, load=None):
+        """Pool state for /health"""
+        result = []
+        for backend in self.backends():
+            health = self.monitor.peek(pool_backend_name(backend.url))
+            result.append({
+                'url': backend.url,
+                'status': health.status if health else 'unknown',
+                'latency_ms': health.latency_ms if health else None,
+                'queue_depth': backend.queue_depth,
+                'reserved': backend.reserved,
+                'expected_completion_seconds': round(self.expected_completion(backend, load), 1)
+            })
+        return result
+
+
+class ComfyUIPoolBackend(GpuBackend):
+    """
+    Local ComfyUI as one GpuBackend for the router
+
+    Each job goes to the pool backend with the lowest expected completion time, or to the
+    tunnel-following client when no pool backend is registered.
+    """
+
+    backend_name = 'local'
+    transform_modes = TRANSFORM_MODES
+
+    def __init__(self, pool, client, get_load, monitor=health_monitor):
+        """
+        Args:
+            pool: ComfyUIPool, or None for single-backend mode
+            client: Tunnel-following LocalComfyUIClient
+            get_load: Callable returning job_queue.get_backend_load()
+            monitor: Health monitor holding the tunnel's state
+        """
+        self.pool = pool
+        self.client = client
+        self.get_load = get_load
+        self.monitor = monitor
+
+    def acquire(self):
+        """
+        Client for a new prompt
+
+        Returns:
+            (client, backend_url): backend_url is the reserved pool backend (release it once
+            dispatched) or None in single-backend mode; client is None when no backend is available
+        """
+        backend_url = self.pool.choose_backend(self.get_load()) if self.pool else None
+        if backend_url:
+            return self.pool.get_client(backend_url), backend_url
+        if self.pool and self.pool.has_backends():
+            return None, None
+        return self.client, None
+
+    def release(self, backend_url):
+        if backend_url:
+            self.pool.release(backend_url)
+
+    def client_for(self, backend_url):
+        """Client for a dispatched prompt - the pool backend it is pinned to, else the tunnel-following client"""
+        if backend_url and self.pool:
+            return self.pool.get_client(backend_url)
+        return self.client
+
+    def is_available(self):
+        if self.pool and self.pool.has_backends():
+            return any(self.monitor.get(pool_backend_name(backend.url)).available for backend in self.pool.backends())
+        return self.client is not None and self.monitor.get(COMFYUI_BACKEND).available
+
+    def submit(self, job):
+        client, backend_url = self.acquire()
+        if not client:
+            return Submission(error='No ComfyUI backend available')
+        try:
+            submission = client.submit(job)
+            submission.backend_url = backend_url
+            return submission
+        finally:
+            self.release(backend_url)
+
+    def status(self, job_id, backend_url=None):
+        return self.client_for(backend_url).status(job_id)
+
+    def fetch(self, job_id, backend_url=None):
+        return self.client_for(backend_url).fetch(job_id)
+
+    def cancel(self, job_id, backend_url=None):
+        return self.client_for(backend_url).cancel(job_id)
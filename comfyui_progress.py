@@ -0,0 +1,230 @@
+"""
+ComfyUI Progress Subscriber
+One websocket connection per ComfyUI backend (its /ws endpoint) fanned out to every
+browser waiting on a prompt, so tunnel traffic no longer grows with the number of viewers.
+
+ComfyUI only broadcasts execution messages to every socket when the prompt was queued
+without a client_id, so clients queue prompts without one.
+"""
+
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_PROMPTS = 500  # Recent prompt states kept for late subscribers
+RECONNECT_DELAY = 5  # seconds between reconnect attempts
+RECV_TIMEOUT = 5  # seconds - how often the receive loop checks for shutdown
+
+
+def to_websocket_url(base_url, client_id):
+    """Convert a ComfyUI http(s) base URL into its /ws URL"""
+    base_url = base_url.rstrip('/')
+    if base_url.startswith('https://'):
+        ws_base = 'wss://' + base_url[len('https://'):]
+    elif base_url.startswith('http://'):
+        ws_base = 'ws://' + base_url[len('http://'):]
+    else:
+        ws_base = base_url
+    return f"{ws_base}/ws?clientId={client_id}"
+
+
+def format_sse(event, data):
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ComfyUIProgressSubscriber:
+    """Listens on a ComfyUI /ws websocket and fans out per-prompt progress events"""
+
+    def __init__(self, base_url, idle_timeout=300):
+        self.base_url = base_url.rstrip('/')
+        self.client_id = str(uuid.uuid4())
+        self.ws_url = to_websocket_url(self.base_url, self.client_id)
+        self.idle_timeout = idle_timeout
+        self.connected = False
+        self.current_prompt_id = None
+
+        self._listeners = {}  # prompt_id -> list of queue.Queue
+        self._prompt_states = OrderedDict()  # prompt_id -> last terminal/progress event
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_activity = time.time()
+
+    def start(self):
+        """Start the background websocket thread"""
+        if websocket is None:
+            logger.warning("websocket-client not installed - ComfyUI progress streaming disabled")
+            return False
+
+        self._thread = threading.Thread(target=self._run, name=f"comfyui-ws-{self.base_url}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Ask the background thread to exit"""
+        self._stop_event.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def listen(self, prompt_id):
+        """
+        Subscribe to events for a prompt
+
+        Returns:
+            queue.Queue receiving event dicts; pre-seeded with the last known state
+        """
+        listener = queue.Queue()
+        with self._lock:
+            self._listeners.setdefault(prompt_id, []).append(listener)
+            last_state = self._prompt_states.get(prompt_id)
+            self._last_activity = time.time()
+
+        if last_state:
+            listener.put(last_state)
+        return listener
+
+    def unlisten(self, prompt_id, listener):
+        """Remove a listener added with listen()"""
+        with self._lock:
+            listeners = self._listeners.get(prompt_id, [])
+            if listener in listeners:
+                listeners.remove(listener)
+            if not listeners:
+                self._listeners.pop(prompt_id, None)
+            self._last_activity = time.time()
+
+    def get_prompt_state(self, prompt_id):
+        """Last event seen for a prompt, or None"""
+        with self._lock:
+            return self._prompt_states.get(prompt_id)
+
+    def _is_idle(self):
+        with self._lock:
+            return not self._listeners and time.time() - self._last_activity > self.idle_timeout
+
+    def _run(self):
+        """Connect, receive and reconnect until stopped or idle"""
+        while not self._stop_event.is_set() and not self._is_idle():
+            ws = None
+            try:
+                ws = websocket.create_connection(self.ws_url, timeout=RECV_TIMEOUT)
+                self.connected = True
+                logger.info(f"Subscribed to ComfyUI progress: {self.base_url}")
+
+                while not self._stop_event.is_set() and not self._is_idle():
+                    try:
+                        message = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        continue
+
+                    # Binary frames are latent previews - not needed
+                    if isinstance(message, str):
+                        self.handle_message(message)
+
+            except Exception as e:
+                logger.warning(f"ComfyUI progress websocket error ({self.base_url}): {e}")
+            finally:
+                self.connected = False
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+
+            self._stop_event.wait(RECONNECT_DELAY)
+
+        logger.info(f"ComfyUI progress subscriber stopped: {self.base_url}")
+
+    def handle_message(self, message):
+        """Translate a ComfyUI websocket message into a progress event"""
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+
+        msg_type = payload.get('type')
+        data = payload.get('data') or {}
+        prompt_id = data.get('prompt_id') or self.current_prompt_id
+
+        if msg_type == 'execution_start':
+            self.current_prompt_id = data.get('prompt_id')
+            self._publish(self.current_prompt_id, {'type': 'started'})
+
+        elif msg_type == 'executing':
+            if data.get('node') is None:
+                # node == None means the prompt finished
+                if prompt_id:
+                    self._publish(prompt_id, {'type': 'complete'})
+                self.current_prompt_id = None
+            else:
+                self.current_prompt_id = prompt_id
+                self._publish(prompt_id, {'type': 'executing', 'node': data.get('node')})
+
+        elif msg_type == 'progress':
+            self._publish(prompt_id, {
+                'type': 'progress',
+                'node': data.get('node'),
+                'value': data.get('value', 0),
+                'max': data.get('max', 0)
+            })
+
+        elif msg_type == 'executed':
+            self._publish(prompt_id, {'type': 'executed', 'node': data.get('node')})
+
+        elif msg_type == 'execution_success':
+            self._publish(prompt_id, {'type': 'complete'})
+
+        elif msg_type in ('execution_error', 'execution_interrupted'):
+            self._publish(prompt_id, {
+                'type': 'failed',
+                'message': data.get('exception_message') or 'Generation was interrupted'
+            })
+
+    def _publish(self, prompt_id, event):
+        if not prompt_id:
+            return
+
+        with self._lock:
+            self._prompt_states[prompt_id] = event
+            self._prompt_states.move_to_end(prompt_id)
+            while len(self._prompt_states) > MAX_TRACKED_PROMPTS:
+                self._prompt_states.popitem(last=False)
+            listeners = list(self._listeners.get(prompt_id, []))
+            self._last_activity = time.time()
+
+        for listener in listeners:
+            listener.put(event)
+
+
+# One subscriber per ComfyUI backend (per web process)
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+
+def get_progress_subscriber(base_url):
+    """Get (starting if needed) the shared progress subscriber for a backend"""
+    if websocket is None or not base_url:
+        return None
+
+    base_url = base_url.rstrip('/')
+    with _subscribers_lock:
+        subscriber = _subscribers.get(base_url)
+        if subscriber is None or not subscriber.is_alive():
+            subscriber = ComfyUIProgressSubscriber(base_url)
+            if not subscriber.start():
+                return None
+            _subscribers[base_url] = subscriber
+        return subscriber
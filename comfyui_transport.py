@@ -0,0 +1,148 @@
+"""
+ComfyUI HTTP Transport
+Pooled keep-alive requests.Session per backend base URL, shared by every ComfyUI client,
+so /system_stats, /upload/image, /prompt, /history and /view calls reuse one TCP + TLS
+connection to the tunnel instead of paying a fresh handshake each time.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (COMFYUI_TIMEOUT, COMFYUI_POOL_MAXSIZE, COMFYUI_HTTP_RETRIES,
+                    COMFYUI_HTTP_BACKOFF, COMFYUI_CONNECT_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+# Read timeouts (seconds) per endpoint class
+ENDPOINT_TIMEOUTS = {
+    'probe': 10,               # /system_stats, /queue
+    'poll': 10,                # /history/<prompt_id>
+    'submit': COMFYUI_TIMEOUT,  # /prompt
+    'transfer': 60,            # /upload/image, /view
+    'api': 30,                 # Provider control-plane APIs (Vast.ai, ...)
+}
+
+MAX_SESSIONS = 16  # Tunnel URLs rotate; close sessions for backends no longer in use
+
+RETRY_STATUS_CODES = (502, 503, 504)  # Cloudflare tunnel hiccups
+
+
+def get_timeout(endpoint='poll'):
+    """(connect, read) timeout tuple for an endpoint class"""
+    return (COMFYUI_CONNECT_TIMEOUT, ENDPOINT_TIMEOUTS.get(endpoint, ENDPOINT_TIMEOUTS['poll']))
+
+
+def _origin(url):
+    """scheme://host[:port] of a URL - the key sessions are pooled by"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class ComfyUITransport:
+    """Keep-alive session for one backend, with retry/backoff and connection counters"""
+
+    def __init__(self, base_url, pool_maxsize=COMFYUI_POOL_MAXSIZE, retries=COMFYUI_HTTP_RETRIES,
+                 backoff=COMFYUI_HTTP_BACKOFF):
+        self.base_url = _origin(base_url)
+        self.session = requests.Session()
+
+        # Connect errors are retried for every method (nothing reached the server);
+        # read errors and 5xx only for idempotent GETs so a /prompt is never queued twice
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def request(self, method, url, endpoint='poll', **kwargs):
+        """Send a request through the pooled session"""
+        kwargs.setdefault('timeout', get_timeout(endpoint))
+        with self._lock:
+            self._requests += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get_stats(self):
+        """Requests sent, new connections opened (handshakes) and pool hits"""
+        handshakes = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            handshakes += pool.num_connections
+            pool_requests += pool.num_requests
+
+        with self._lock:
+            requests_sent = self._requests
+
+        return {
+            'base_url': self.base_url,
+            'requests': requests_sent,
+            'handshakes': handshakes,
+            'pool_hits': max(0, pool_requests - handshakes)
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_transports = OrderedDict()
+_transports_lock = threading.Lock()
+
+
+def get_transport(url):
+    """Get (creating if needed) the shared transport for the backend serving url"""
+    origin = _origin(url)
+    with _transports_lock:
+        transport = _transports.get(origin)
+        if transport is None:
+            transport = ComfyUITransport(origin)
+            _transports[origin] = transport
+            logger.info(f"Created pooled HTTP session for {origin}")
+
+            while len(_transports) > MAX_SESSIONS:
+                _, evicted = _transports.popitem(last=False)
+                evicted.close()
+        else:
+            _transports.move_to_end(origin)
+        return transport
+
+
+def comfyui_get(url, endpoint='poll', **kwargs):
+    """GET through the pooled session for url's backend"""
+    return get_transport(url).request('GET', url, endpoint=endpoint, **kwargs)
+
+
+def comfyui_post(url, endpoint='submit', **kwargs):
+    """POST through the pooled session for url's backend"""
+    return get_transport(url).request('POST', url, endpoint=endpoint, **kwargs)
+
+
+def comfyui_request(method, url, endpoint='api', **kwargs):
+    """Any method through the pooled session for url's backend"""
+    return get_transport(url).request(method, url, endpoint=endpoint, **kwargs)
+
+
+def get_transport_stats():
+    """Connection reuse counters for every pooled backend"""
+    with _transports_lock:
+        transports = list(_transports.values())
+    return [transport.get_stats() for transport in transports]
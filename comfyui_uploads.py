@@ -0,0 +1,174 @@
+"""
+ComfyUI Upload Dedup
+Uploads are named by the SHA-256 of their bytes and each backend keeps a set of names it is
+known to hold, so re-running a photo or reusing a reference chad skips the multi-megabyte
+POST through the tunnel. Unknown or stale names are checked with a bodiless HEAD /view first.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import mimetypes
+import threading
+from config import UPLOAD_VERIFY_INTERVAL, REFERENCE_CHADS_FOLDER
+from comfyui_transport import comfyui_post, comfyui_request
+
+logger = logging.getLogger(__name__)
+
+MAX_HASH_CACHE = 1024  # Hashed files remembered per process
+
+_hash_cache = {}  # (path, size, mtime) -> content name
+_hash_lock = threading.Lock()
+
+
+def content_name(path):
+    """Content-addressed upload name (<sha256>.<ext>) for a local file"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _hash_lock:
+        name = _hash_cache.get(key)
+    if name:
+        return name
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    extension = os.path.splitext(path)[1].lower() or '.png'
+    name = f"{digest.hexdigest()}{extension}"
+
+    with _hash_lock:
+        if len(_hash_cache) >= MAX_HASH_CACHE:
+            _hash_cache.clear()
+        _hash_cache[key] = name
+    return name
+
+
+class UploadCache:
+    """Upload names each backend is known to hold, with when that was last confirmed"""
+
+    def __init__(self, verify_interval=UPLOAD_VERIFY_INTERVAL):
+        self.verify_interval = verify_interval
+        self._known = {}  # base_url -> {name: confirmed_at}
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.skipped = 0
+
+    def is_fresh(self, base_url, name):
+        """Known to be on the backend and confirmed within the verify interval"""
+        with self._lock:
+            confirmed_at = self._known.get(base_url, {}).get(name)
+        return confirmed_at is not None and time.time() - confirmed_at < self.verify_interval
+
+    def mark(self, base_url, name):
+        with self._lock:
+            self._known.setdefault(base_url, {})[name] = time.time()
+
+    def forget(self, base_url, name=None):
+        """Drop one name, or everything known about a backend (e.g. after it restarts)"""
+        with self._lock:
+            if name is None:
+                self._known.pop(base_url, None)
+            else:
+                self._known.get(base_url, {}).pop(name, None)
+
+    def record(self, uploaded):
+        with self._lock:
+            if uploaded:
+                self.uploads += 1
+            else:
+                self.skipped += 1
+
+    def snapshot(self):
+        """Counters for /health"""
+        with self._lock:
+            return {
+                'uploads': self.uploads,
+                'skipped': self.skipped,
+                'known': {base_url: len(names) for base_url, names in self._known.items()}
+            }
+
+
+upload_cache = UploadCache()
+
+
+def remote_has(base_url, name):
+    """HEAD /view - is the file already in the backend's input folder?"""
+    try:
+        response = comfyui_request('HEAD', f"{base_url}/view", 'probe', params={'filename': name, 'type': 'input'})
+        return response.status_code == 200
+    except Exception as e:
+        logger.debug(f"Upload existence check failed for {name} on {base_url}: {e}")
+        return False
+
+
+def ensure_uploaded(base_url, path, cache=upload_cache):
+    """
+    Make sure a backend holds a file's bytes, uploading only when it does not
+
+    Returns:
+        str: Name to reference from LoadImage nodes
+
+    Raises:
+        requests.RequestException: The upload itself failed
+    """
+    base_url = base_url.rstrip('/')
+    name = content_name(path)
+
+    if cache.is_fresh(base_url, name) or remote_has(base_url, name):
+        cache.mark(base_url, name)
+        cache.record(uploaded=False)
+        logger.info(f"ComfyUI already has {os.path.basename(path)} as {name}, skipping upload")
+        return name
+
+    content_type = mimetypes.guess_type(path)[0] or 'image/png'
+    with open(path, 'rb') as f:
+        files = {
+            'image': (name, f, content_type),
+            'overwrite': (None, 'true')
+        }
+        response = comfyui_post(f"{base_url}/upload/image", 'transfer', files=files)
+        response.raise_for_status()
+
+    stored_name = response.json().get('name', name)
+    cache.mark(base_url, stored_name)
+    cache.record(uploaded=True)
+    logger.info(f"Uploaded {os.path.basename(path)} to ComfyUI as {stored_name}")
+    return stored_name
+
+
+_seeding = set()
+_seeding_lock = threading.Lock()
+
+
+def preseed_reference_images(base_url, folder=REFERENCE_CHADS_FOLDER, cache=upload_cache):
+    """
+    Upload the static reference chads to a newly registered backend in the background
+
+    Returns:
+        threading.Thread, or None if this backend is already being seeded
+    """
+    base_url = base_url.rstrip('/')
+    with _seeding_lock:
+        if base_url in _seeding:
+            return None
+        _seeding.add(base_url)
+
+    def seed():
+        seeded = 0
+        try:
+            for filename in sorted(os.listdir(folder)):
+                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
+                    ensure_uploaded(base_url, os.path.join(folder, filename), cache)
+                    seeded += 1
+            logger.info(f"Pre-seeded {seeded} reference images on {base_url}")
+        except Exception as e:
+            logger.warning(f"Reference image pre-seed failed for {base_url}: {e}")
+        finally:
+            with _seeding_lock:
+                _seeding.discard(base_url)
+
+    thread = threading.Thread(target=seed, name='comfyui-preseed', daemon=True)
+    thread.start()
+    return thread
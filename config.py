@@ -17,6 +17,7 @@ DEBUG = True
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 WORKFLOW_FOLDER = 'comfyui_workflows'
+REFERENCE_CHADS_FOLDER = 'reference_chads'
 
 # Facial Evaluation Folder - Use Railway volume path in production
 # Check multiple Railway indicators for better detection
@@ -45,6 +46,16 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 MAX_IMAGE_SIZE = (2048, 2048)  # Maximum image dimensions
 MIN_IMAGE_SIZE = (256, 256)    # Minimum image dimensions
 
+# Upload Ingest (uploads are EXIF-oriented, downscaled and re-encoded once before anything else reads them)
+INGEST_MAX_DIMENSION = int(os.getenv('INGEST_MAX_DIMENSION', '1024'))  # Longest side after downscaling (FaceDetailer works well below this)
+INGEST_FORMAT = os.getenv('INGEST_FORMAT', 'JPEG').upper()  # JPEG or WEBP - metadata is never written
+INGEST_QUALITY = int(os.getenv('INGEST_QUALITY', '92'))  # Starting encoder quality
+INGEST_MIN_QUALITY = int(os.getenv('INGEST_MIN_QUALITY', '70'))  # Lowest quality tried while fitting INGEST_MAX_BYTES
+INGEST_MAX_BYTES = int(os.getenv('INGEST_MAX_BYTES', str(1024 * 1024)))  # Size bound for the normalized file
+INGEST_KEEP_ORIGINALS = os.getenv('INGEST_KEEP_ORIGINALS', 'false').lower() == 'true'  # Retention: keep the raw upload in uploads/originals
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))  # Threads decoding/encoding uploads off the request thread
+INGEST_TIMEOUT = int(os.getenv('INGEST_TIMEOUT', '30'))  # Seconds an upload waits for its normalization
+
 # Transformation Tier System (10% to 25% denoise range)
 TIER_SYSTEM = {
     'min_denoise': 0.10,  # 10% minimum
@@ -120,6 +131,7 @@ WORKFLOW_PARAMETERS = {
     'lora_strength_model': 0.8,
     'lora_strength_clip': 0.85
 }
+WORKFLOW_RELOAD_INTERVAL = int(os.getenv('WORKFLOW_RELOAD_INTERVAL', '5'))  # Seconds between template file change checks
 
 # Security Configuration
 SECURE_FILENAME_ENABLED = True
@@ -148,6 +160,21 @@ else:
     # Local development - use SQLite
     DATABASE_URL = 'sqlite:///instance/app.db'
 
+# Database Connection Pool (per process; size it so workers x (pool + overflow) stays under Postgres max_connections)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))  # Connections kept open per process
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))  # Extra connections opened during bursts, closed when returned
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '10'))  # Seconds a request waits for a free connection before failing
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # Reopen connections older than this (proxies drop idle ones)
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true'  # Test connections on checkout, replace dead ones
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))  # Postgres statement_timeout (0 disables)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))  # Seconds to establish a new connection
+DB_SLOW_CHECKOUT_MS = int(os.getenv('DB_SLOW_CHECKOUT_MS', '100'))  # Checkout waits counted as slow in /health
+
+# Shared State (cooldowns, backend registry and ephemeral job state shared by every gunicorn worker / replica)
+# memory:// (single process), redis://..., or any SQLAlchemy URL - defaults to the Postgres database, else a WAL-mode SQLite file
+SHARED_STATE_URL = os.getenv('SHARED_STATE_URL') or os.getenv('REDIS_URL') or (
+    DATABASE_URL if DATABASE_URL.startswith('postgresql://') else 'sqlite:///instance/shared_state.db')
+
 # Authentication Configuration
 LOGIN_DISABLED = os.getenv('LOGIN_DISABLED', 'False').lower() == 'true'  # For development
 SESSION_PERMANENT = False
@@ -167,10 +194,15 @@ CREDIT_PACKAGES = {
     '250': {'credits': 250, 'price': 80.00, 'bonus': 50}  # 20% bonus
 }
 
-# Rate Limiting
+# Rate Limiting (enforced by admission_control.py on /process)
 FREE_GENERATIONS_PER_DAY = 1
-MAX_GENERATIONS_PER_HOUR = 10  # For paid users
-MAX_GENERATIONS_PER_DAY = 100  # For paid users
+MAX_GENERATIONS_PER_HOUR = int(os.getenv('MAX_GENERATIONS_PER_HOUR', '10'))  # For paid users
+MAX_GENERATIONS_PER_DAY = int(os.getenv('MAX_GENERATIONS_PER_DAY', '100'))  # For paid users
+FREE_MAX_GENERATIONS_PER_HOUR = int(os.getenv('FREE_MAX_GENERATIONS_PER_HOUR', '3'))  # For users without paid credits
+FREE_MAX_GENERATIONS_PER_DAY = int(os.getenv('FREE_MAX_GENERATIONS_PER_DAY', '5'))  # For users without paid credits
+GLOBAL_MAX_GENERATIONS_PER_MINUTE = int(os.getenv('GLOBAL_MAX_GENERATIONS_PER_MINUTE', '30'))  # Site-wide admissions (0 disables)
+ADMISSION_MAX_WAIT_FREE = int(os.getenv('ADMISSION_MAX_WAIT_FREE', '180'))  # Turn away free jobs whose estimated queue wait is longer (seconds)
+ADMISSION_MAX_WAIT_PAID = int(os.getenv('ADMISSION_MAX_WAIT_PAID', '600'))  # Turn away paid jobs whose estimated queue wait is longer (seconds)
 
 # Cloud GPU Configuration (RunPod)
 # For serverless endpoints (recommended for cost efficiency - 95-99% cost savings!)
@@ -178,15 +210,55 @@ RUNPOD_API_KEY = os.getenv('RUNPOD_API_KEY', '')
 RUNPOD_ENDPOINT_ID = os.getenv('RUNPOD_ENDPOINT_ID', '')
 RUNPOD_SERVERLESS_ENDPOINT = os.getenv('RUNPOD_SERVERLESS_ENDPOINT', '')
 RUNPOD_SERVERLESS_URL = os.getenv('RUNPOD_SERVERLESS_URL', '')
+USE_RUNPOD_SERVERLESS = os.getenv('USE_RUNPOD_SERVERLESS', 'false').lower() == 'true'  # With USE_CLOUD_GPU, dispatch jobs to RUNPOD_ENDPOINT_ID
+RUNPOD_API_BASE = os.getenv('RUNPOD_API_BASE', 'https://api.runpod.ai/v2').rstrip('/')
+
+# RunPod Job Completion (jobs are submitted with a signed webhook; status polling is only the fallback)
+RUNPOD_WEBHOOK_BASE_URL = os.getenv('RUNPOD_WEBHOOK_BASE_URL', '').rstrip('/')  # Public URL of this app (empty = poll only)
+RUNPOD_WEBHOOK_SECRET = os.getenv('RUNPOD_WEBHOOK_SECRET', '')  # Signs the per-generation webhook tokens (empty = webhooks off, poll only)
+RUNPOD_RUNSYNC_WAIT = int(os.getenv('RUNPOD_RUNSYNC_WAIT', '10'))  # Seconds /runsync may wait for a short job before it continues async (0 = always /run)
+RUNPOD_POLL_MIN_INTERVAL = float(os.getenv('RUNPOD_POLL_MIN_INTERVAL', '1'))  # First status poll after submission (seconds)
+RUNPOD_POLL_MAX_INTERVAL = float(os.getenv('RUNPOD_POLL_MAX_INTERVAL', '15'))  # Poll interval grows 1.5x per poll up to this
+RUNPOD_WEBHOOK_POLL_INTERVAL = float(os.getenv('RUNPOD_WEBHOOK_POLL_INTERVAL', '60'))  # Safety-net poll interval while a webhook is expected
+RUNPOD_JOB_STATUS_TTL = int(os.getenv('RUNPOD_JOB_STATUS_TTL', '3600'))  # Seconds a webhook-reported job status is kept in the shared store
+
+# GPU Backend Routing (gpu_router.py: ordered failover across providers, paid cloud only past the wait target)
+GPU_BACKENDS = [name.strip() for name in os.getenv('GPU_BACKENDS', '').split(',') if name.strip()]  # Priority order, e.g. "local,runpod,modal" (empty = the one provider the USE_* flags select)
+GPU_SPILLOVER_SLO_SECONDS = int(os.getenv('GPU_SPILLOVER_SLO_SECONDS', '120'))  # Paid backends take jobs ahead of free ones once the free queue's ETA exceeds this
+GPU_COST_PER_SECOND = {  # Estimated USD per GPU second, recorded per job as Generation.gpu_cost
+    'local': float(os.getenv('GPU_COST_PER_SECOND_LOCAL', '0')),
+    'comfyui': float(os.getenv('GPU_COST_PER_SECOND_COMFYUI', '0')),
+    'modal': float(os.getenv('GPU_COST_PER_SECOND_MODAL', '0.0004')),  # T4
+    'runpod': float(os.getenv('GPU_COST_PER_SECOND_RUNPOD', '0.00044')),
+    'vast': float(os.getenv('GPU_COST_PER_SECOND_VAST', '0.0001')),
+    'vast_instance': float(os.getenv('GPU_COST_PER_SECOND_VAST_INSTANCE', '0.0001')),
+    'replicate': float(os.getenv('GPU_COST_PER_SECOND_REPLICATE', '0.001')),
+}
 
 # Vast.ai Configuration (Pay-Per-Use - 98-99% cost savings!)
 VAST_API_KEY = os.getenv('VAST_API_KEY', 'eaa3a310030819c8de5e1826678266244a6f761efacbc948aca66ca880f071db')
 VAST_ON_DEMAND_MODE = os.getenv('VAST_ON_DEMAND_MODE', 'true').lower() == 'true'
 VAST_AUTO_STOP_INSTANCES = os.getenv('VAST_AUTO_STOP_INSTANCES', 'true').lower() == 'true'
-VAST_MAX_INSTANCE_LIFETIME = int(os.getenv('VAST_MAX_INSTANCE_LIFETIME', '300'))  # 5 minutes max
+VAST_MAX_INSTANCE_LIFETIME = int(os.getenv('VAST_MAX_INSTANCE_LIFETIME', '300'))  # Seconds an unneeded warm instance may sit idle before it is destroyed
 VAST_MIN_GPU_RAM = int(os.getenv('VAST_MIN_GPU_RAM', '8'))  # Minimum 8GB GPU RAM
 VAST_MAX_HOURLY_COST = float(os.getenv('VAST_MAX_HOURLY_COST', '1.0'))  # Max $1/hour
 
+# Vast.ai Warm Pool (on-demand instances stay up between jobs instead of booting per image; scaled by generation_worker.py)
+VAST_WARM_MAX_INSTANCES = int(os.getenv('VAST_WARM_MAX_INSTANCES', '2'))  # Rented instances at most (0 = boot and destroy one per image)
+VAST_WARM_MIN_INSTANCES = int(os.getenv('VAST_WARM_MIN_INSTANCES', '0'))  # Instances kept up even when idle
+VAST_WARM_JOBS_PER_INSTANCE = int(os.getenv('VAST_WARM_JOBS_PER_INSTANCE', '2'))  # Queued + running jobs per instance before another boots
+VAST_WARM_ACQUIRE_TIMEOUT = int(os.getenv('VAST_WARM_ACQUIRE_TIMEOUT', '600'))  # Seconds a job waits for a ready instance
+VAST_WARM_SCALE_INTERVAL = float(os.getenv('VAST_WARM_SCALE_INTERVAL', '15'))  # Seconds between scaling passes
+VAST_PREWARM_HISTORY_DAYS = int(os.getenv('VAST_PREWARM_HISTORY_DAYS', '14'))  # Days of hourly history used to pre-warm (0 disables)
+VAST_PREWARM_MIN_JOBS_PER_HOUR = float(os.getenv('VAST_PREWARM_MIN_JOBS_PER_HOUR', '4'))  # Usual hourly demand below which nothing is pre-warmed
+
+# Vast.ai Offer Selection (cached offer catalog ranked by price, reliability and each host's measured boot time)
+VAST_OFFER_CACHE_TTL = int(os.getenv('VAST_OFFER_CACHE_TTL', '60'))  # Seconds before offers are searched again (refreshed in the background at half that)
+VAST_DEFAULT_BOOT_SECONDS = int(os.getenv('VAST_DEFAULT_BOOT_SECONDS', '240'))  # Assumed setup time of a host we have not used, before its image download
+VAST_SECONDS_PER_DOLLAR = int(os.getenv('VAST_SECONDS_PER_DOLLAR', '900'))  # Boot seconds worth $1/hour of price when ranking offers
+VAST_HOST_BLOCK_SECONDS = int(os.getenv('VAST_HOST_BLOCK_SECONDS', '86400'))  # Hosts that never became ready are skipped this long
+VAST_HOST_STATS_DAYS = int(os.getenv('VAST_HOST_STATS_DAYS', '30'))  # Days a host's boot history is kept
+
 # For RunPod pods (direct connection) - DEPRECATED, use serverless instead
 RUNPOD_POD_URL = os.getenv('RUNPOD_POD_URL', 'https://i01ikv3a648vzu-8188.proxy.runpod.net')  # Your RTX 5090 GPU
 RUNPOD_POD_PORT = int(os.getenv('RUNPOD_POD_PORT', '8188'))  # ComfyUI port
@@ -212,6 +284,61 @@ USE_LOCAL_COMFYUI = os.getenv('USE_LOCAL_COMFYUI', 'true').lower() == 'true'  #
 LOCAL_COMFYUI_URL = os.getenv('LOCAL_COMFYUI_URL', 'https://statute-pas-org-southeast.trycloudflare.com')  # Cloudflare tunnel URL
 LOCAL_COMFYUI_WORKFLOW = os.getenv('LOCAL_COMFYUI_WORKFLOW', 'comfyui_workflows/workflow_facedetailer.json')
 
+# Generation Job Queue (Generation rows are the queue, drained by generation_worker.py)
+GENERATION_WORKER_THREADS = int(os.getenv('GENERATION_WORKER_THREADS', '2'))  # Concurrent dispatches per worker process
+GENERATION_WORKER_IN_PROCESS = os.getenv('GENERATION_WORKER_IN_PROCESS', 'false').lower() == 'true'  # Run the worker as threads of each web process (no separate worker service)
+GENERATION_WORKER_POLL_INTERVAL = float(os.getenv('GENERATION_WORKER_POLL_INTERVAL', '1.0'))  # Seconds between empty-queue polls
+GENERATION_CLAIM_TIMEOUT = int(os.getenv('GENERATION_CLAIM_TIMEOUT', '300'))  # Seconds without a dispatch heartbeat before a claim counts as abandoned
+GENERATION_CLAIM_HEARTBEAT = int(os.getenv('GENERATION_CLAIM_HEARTBEAT', '30'))  # Seconds between claimed_at refreshes while a dispatch runs (well below the timeout)
+GENERATION_MAX_ATTEMPTS = int(os.getenv('GENERATION_MAX_ATTEMPTS', '2'))  # Re-queue a crashed dispatch once
+GENERATION_MAX_OUTSTANDING = int(os.getenv('GENERATION_MAX_OUTSTANDING', '2'))  # Prompts held on each ComfyUI backend; the rest wait in our table in priority order (0 = no limit)
+GENERATION_PRIORITY_AGING = int(os.getenv('GENERATION_PRIORITY_AGING', '120'))  # Seconds of waiting that lift a job over the next class up
+GENERATION_FINALIZE_INTERVAL = float(os.getenv('GENERATION_FINALIZE_INTERVAL', '2.0'))  # Seconds between finalizer passes over processing jobs
+FINALIZER_PRUNE_HISTORY = os.getenv('FINALIZER_PRUNE_HISTORY', 'true').lower() == 'true'  # Delete saved prompts from ComfyUI's /history
+
+# Generation Micro-Batching (full-face jobs share one FaceDetailer prompt while the GPU is saturated)
+GENERATION_BATCH_MAX_SIZE = int(os.getenv('GENERATION_BATCH_MAX_SIZE', '4'))  # Jobs per batched prompt (1 disables batching)
+GENERATION_BATCH_WINDOW = float(os.getenv('GENERATION_BATCH_WINDOW', '2.0'))  # Seconds to collect compatible jobs before dispatch
+GENERATION_BATCH_QUEUE_DEPTH = int(os.getenv('GENERATION_BATCH_QUEUE_DEPTH', '2'))  # Queued jobs / ComfyUI queue depth that counts as saturated
+
+# Generation Progress Streaming (/events SSE fed by one ComfyUI /ws subscriber per backend)
+SSE_KEEPALIVE_INTERVAL = int(os.getenv('SSE_KEEPALIVE_INTERVAL', '15'))  # Seconds between keep-alive comments
+SSE_QUEUE_POLL_INTERVAL = int(os.getenv('SSE_QUEUE_POLL_INTERVAL', '2'))  # Seconds between queue-position checks (database only)
+SSE_FALLBACK_POLL_INTERVAL = int(os.getenv('SSE_FALLBACK_POLL_INTERVAL', '30'))  # Seconds between GPU status checks when no websocket events arrive
+
+# GPU Status Reconciliation (one /queue + /history fetch per backend covers every in-flight prompt)
+STATUS_RECONCILE_INTERVAL = float(os.getenv('STATUS_RECONCILE_INTERVAL', '3.0'))  # Seconds between reconciliation passes in the web process
+STATUS_HISTORY_MAX_ITEMS = int(os.getenv('STATUS_HISTORY_MAX_ITEMS', '64'))  # Recent /history entries fetched per backend
+STATUS_MAP_MAX_AGE = float(os.getenv('STATUS_MAP_MAX_AGE', '15'))  # Older reconciled statuses are ignored by /status and /events
+
+# Credit Ledger (atomic balance updates plus an append-only ledger, compacted by generation_worker.py)
+CREDIT_LEDGER_RETENTION_DAYS = int(os.getenv('CREDIT_LEDGER_RETENTION_DAYS', '90'))  # Older entries fold into one carried-forward total per user (0 keeps all)
+CREDIT_LEDGER_COMPACT_INTERVAL = int(os.getenv('CREDIT_LEDGER_COMPACT_INTERVAL', '86400'))  # Seconds between compaction passes
+
+# Dashboard / profile stats (one aggregated query, cached per user and dropped when counted rows change)
+USER_STATS_CACHE_SECONDS = int(os.getenv('USER_STATS_CACHE_SECONDS', '300'))  # 0 disables the cache
+
+# ComfyUI HTTP Transport (pooled keep-alive sessions shared by every ComfyUI client)
+COMFYUI_POOL_MAXSIZE = int(os.getenv('COMFYUI_POOL_MAXSIZE', '10'))  # Keep-alive connections per backend
+COMFYUI_HTTP_RETRIES = int(os.getenv('COMFYUI_HTTP_RETRIES', '3'))  # Retries for connect errors / 502-504 from the tunnel
+COMFYUI_HTTP_BACKOFF = float(os.getenv('COMFYUI_HTTP_BACKOFF', '0.5'))  # Exponential backoff factor between retries
+COMFYUI_CONNECT_TIMEOUT = float(os.getenv('COMFYUI_CONNECT_TIMEOUT', '5'))  # Seconds to establish TCP + TLS
+UPLOAD_VERIFY_INTERVAL = int(os.getenv('UPLOAD_VERIFY_INTERVAL', '300'))  # Seconds before a known upload is re-checked with HEAD /view
+
+# Result Delivery (results are streamed from ComfyUI once, then served from outputs/)
+RESULT_SENDFILE = os.getenv('RESULT_SENDFILE', '').lower()  # '' (Flask streams), 'x-sendfile' (Apache/lighttpd) or 'x-accel' (nginx)
+RESULT_ACCEL_PREFIX = os.getenv('RESULT_ACCEL_PREFIX', '/protected-outputs/')  # nginx internal location aliased to OUTPUT_FOLDER
+
+# Backend Health Monitoring (background prober; request paths read the cached state)
+BACKEND_PROBE_INTERVAL = int(os.getenv('BACKEND_PROBE_INTERVAL', '15'))  # Seconds between background probes
+BACKEND_DEGRADED_LATENCY_MS = int(os.getenv('BACKEND_DEGRADED_LATENCY_MS', '2000'))  # Slower probes mark a backend degraded
+BACKEND_DOWN_AFTER_FAILURES = int(os.getenv('BACKEND_DOWN_AFTER_FAILURES', '2'))  # Consecutive failed probes before marking down
+
+# ComfyUI Backend Pool (several GPU boxes behind one site; tunnels register via /register-tunnel)
+COMFYUI_BACKEND_URLS = [url.strip() for url in os.getenv('COMFYUI_BACKEND_URLS', '').split(',') if url.strip()]  # Always-on backends (e.g. rented pods)
+COMFYUI_DEFAULT_EXEC_SECONDS = float(os.getenv('COMFYUI_DEFAULT_EXEC_SECONDS', '30'))  # Assumed prompt time before a backend has history
+COMFYUI_BACKEND_EXPIRY = int(os.getenv('COMFYUI_BACKEND_EXPIRY', '3600'))  # Drop registered backends down longer than this (seconds)
+
 # RunPod Settings
 RUNPOD_TIMEOUT = 300  # 5 minutes timeout for generation
 RUNPOD_CHECK_INTERVAL = 5  # Check status every 5 seconds
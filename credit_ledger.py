@@ -0,0 +1,202 @@
+"""
+Credit Ledger
+User.credits is only changed by single conditional UPDATE statements, so concurrent requests on
+different gunicorn workers can never double-spend or lose an update:
+
+    UPDATE user SET credits = credits - :n WHERE id = :id AND credits >= :n RETURNING credits
+
+Every change also appends a CreditLedgerEntry in the same transaction. compact_ledger() runs
+periodically in generation_worker.py: it checks balances against the ledger and folds old
+entries into one carried-forward total per user.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, select, delete, insert, func, literal
+from models import db, User, CreditLedgerEntry
+from config import CREDIT_LEDGER_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+def _record(user_id, delta, balance_after, reason, reference_id=None):
+    db.session.execute(insert(CreditLedgerEntry).values(
+        user_id=user_id,
+        delta=delta,
+        balance_after=balance_after,
+        reason=reason,
+        reference_id=reference_id,
+        created_at=datetime.utcnow()
+    ))
+
+
+def debit_credits(user_id, amount, reason, reference_id=None, commit=True):
+    """
+    Spend credits if the balance covers them
+
+    The balance check and the decrement are one statement, so two requests racing for the
+    last credits cannot both succeed. With commit=False the debit joins the caller's
+    transaction (e.g. together with the FacialEvaluation it pays for).
+
+    Returns:
+        int: New balance, or None if the balance was too low (nothing is changed)
+    """
+    try:
+        balance = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.credits >= amount)
+            .values(credits=User.credits - amount)
+            .returning(User.credits)
+            .execution_options(synchronize_session='fetch')
+        ).scalar()
+        if balance is None:
+            return None
+
+        _record(user_id, -amount, balance, reason, reference_id)
+        if commit:
+            db.session.commit()
+        return balance
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to debit {amount} credit(s) from user {user_id}: {e}")
+        return None
+
+
+def credit_credits(user_id, amount, reason, reference_id=None, commit=True):
+    """
+    Add credits (purchases, refunds, admin grants)
+
+    Returns:
+        int: New balance, or None if the user does not exist
+    """
+    try:
+        balance = db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(credits=User.credits + amount)
+            .returning(User.credits)
+            .execution_options(synchronize_session='fetch')
+        ).scalar()
+        if balance is None:
+            return None
+
+        _record(user_id, amount, balance, reason, reference_id)
+        if commit:
+            db.session.commit()
+        return balance
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to add {amount} credit(s) to user {user_id}: {e}")
+        return None
+
+
+def adjust_credits(user_id, compute, reason, reference_id=None):
+    """
+    Set a balance derived from the current one (admin set / subtract), under a row lock
+
+    Args:
+        compute: Callable(current balance) -> new balance
+
+    Returns:
+        int: New balance, or None if the user does not exist
+    """
+    try:
+        current = db.session.execute(
+            select(User.credits).where(User.id == user_id).with_for_update()
+        ).scalar()
+        if current is None:
+            return None
+
+        balance = compute(current)
+        db.session.execute(
+            update(User).where(User.id == user_id).values(credits=balance).execution_options(synchronize_session='fetch')
+        )
+        _record(user_id, balance - current, balance, reason, reference_id)
+        db.session.commit()
+        return balance
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to adjust credits of user {user_id}: {e}")
+        return None
+
+
+def get_ledger_drift(user_ids=None):
+    """
+    Users whose balance differs from the sum of their ledger entries
+
+    Returns:
+        dict: user_id -> (balance, ledger sum)
+    """
+    ledger_sum = func.coalesce(func.sum(CreditLedgerEntry.delta), 0)
+    query = select(User.id, User.credits, ledger_sum)\
+        .select_from(User)\
+        .outerjoin(CreditLedgerEntry, CreditLedgerEntry.user_id == User.id)\
+        .group_by(User.id, User.credits)\
+        .having(User.credits != ledger_sum)
+    if user_ids is not None:
+        query = query.where(User.id.in_(user_ids))
+    return {user_id: (balance, total) for user_id, balance, total in db.session.execute(query)}
+
+
+def compact_ledger(retention_days=CREDIT_LEDGER_RETENTION_DAYS, restore_balances=False):
+    """
+    Reconcile balances with the ledger and fold old entries into carried-forward totals
+
+    Balances that drifted (changed outside this module, e.g. by a maintenance script) get a
+    'reconcile' entry so the ledger sums match again. With restore_balances the balance is
+    set back to the ledger sum instead. Entries older than retention_days are replaced by a
+    single 'carried_forward' entry per user. Run from one process at a time.
+
+    Returns:
+        dict: {'reconciled': users fixed, 'folded': entries folded}
+    """
+    result = {'reconciled': 0, 'folded': 0}
+    try:
+        for user_id, (balance, total) in get_ledger_drift().items():
+            # Recheck under the row lock - a debit may have committed since the scan
+            balance = db.session.execute(select(User.credits).where(User.id == user_id).with_for_update()).scalar()
+            total = db.session.execute(
+                select(func.coalesce(func.sum(CreditLedgerEntry.delta), 0)).where(CreditLedgerEntry.user_id == user_id)
+            ).scalar()
+            if balance is None or balance == total:
+                continue
+
+            if restore_balances:
+                logger.warning(f"Credit balance of user {user_id} was {balance}, restoring ledger total {total}")
+                db.session.execute(update(User).where(User.id == user_id).values(credits=total))
+            else:
+                logger.warning(f"Credit balance of user {user_id} drifted from the ledger by {balance - total}")
+                _record(user_id, balance - total, balance, 'reconcile')
+            result['reconciled'] += 1
+        db.session.commit()
+
+        if retention_days:
+            cutoff = datetime.utcnow() - timedelta(days=retention_days)
+            old = CreditLedgerEntry.created_at < cutoff
+            # Only users with several old entries - a lone carried-forward total stays as it is
+            foldable = select(CreditLedgerEntry.user_id).where(old)\
+                .group_by(CreditLedgerEntry.user_id)\
+                .having(func.count() > 1)
+            # Carried-forward rows are stamped with the cutoff itself, so the DELETE below keeps them
+            db.session.execute(insert(CreditLedgerEntry).from_select(
+                ['user_id', 'delta', 'reason', 'created_at'],
+                select(CreditLedgerEntry.user_id, func.sum(CreditLedgerEntry.delta), literal('carried_forward'), literal(cutoff))
+                .where(old, CreditLedgerEntry.user_id.in_(foldable))
+                .group_by(CreditLedgerEntry.user_id)
+            ))
+            result['folded'] = db.session.execute(
+                delete(CreditLedgerEntry).where(old, CreditLedgerEntry.user_id.in_(foldable))
+            ).rowcount
+            db.session.commit()
+
+        if result['reconciled'] or result['folded']:
+            logger.info(f"Credit ledger compacted: {result['reconciled']} balance(s) reconciled, {result['folded']} entries folded")
+        return result
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Credit ledger compaction failed: {e}")
+        return result
@@ -0,0 +1,151 @@
+"""
+Database Engine Layer
+Engine options for the app database (and the shared state store) plus connection pool
+metrics. Postgres connections are pre-pinged and recycled before Railway's proxy drops them,
+statements are capped by a server-side timeout, and the pool times every checkout so /health
+can tell a database stall (requests waiting for a connection) from a GPU stall.
+
+Engines are disposed in forked children (gunicorn post_fork, see gunicorn.conf.py) so workers
+never share a socket opened before the fork.
+"""
+
+import os
+import time
+import logging
+import threading
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+from config import (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+                    DB_STATEMENT_TIMEOUT_MS, DB_CONNECT_TIMEOUT, DB_SLOW_CHECKOUT_MS)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Checkout counters for one engine's pool"""
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.checkouts = 0
+        self.slow_checkouts = 0  # Waited longer than DB_SLOW_CHECKOUT_MS for a connection
+        self.timeouts = 0  # Gave up after DB_POOL_TIMEOUT
+        self.invalidated = 0  # Dropped as dead (pre-ping failures, disconnects)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if seconds * 1000 >= DB_SLOW_CHECKOUT_MS:
+                self.slow_checkouts += 1
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def snapshot(self):
+        pool = self.engine.pool
+        with self._lock:
+            stats = {
+                'name': self.name,
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow_checkouts,
+                'timeouts': self.timeouts,
+                'invalidated': self.invalidated,
+                'wait_ms_avg': round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.wait_max * 1000, 2)
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': pool.overflow()})
+        return stats
+
+
+_pools = {}  # id(pool) -> PoolStats
+_pools_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        stats = _pools.get(id(self))
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            if stats:
+                stats.record_wait(time.monotonic() - started, timed_out=True)
+            raise
+        if stats:
+            stats.record_wait(time.monotonic() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool - keep reporting under the same name
+        new_pool = super().recreate()
+        with _pools_lock:
+            stats = _pools.pop(id(self), None)
+            if stats:
+                _pools[id(new_pool)] = stats
+        return new_pool
+
+
+def get_engine_options(url):
+    """create_engine() keyword arguments for a database URL"""
+    if not url.startswith('postgresql'):
+        return {'pool_pre_ping': DB_POOL_PRE_PING}
+
+    connect_args = {'connect_timeout': DB_CONNECT_TIMEOUT}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args['options'] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'connect_args': connect_args
+    }
+
+
+def register_engine(name, engine):
+    """Track an engine's pool for /health and dispose it after a fork"""
+    with _pools_lock:
+        if any(stats.engine is engine for stats in _pools.values()):
+            return
+        stats = PoolStats(name, engine)
+        _pools[id(engine.pool)] = stats
+    event.listen(engine, 'invalidate', lambda *args: stats.record_invalidated())
+
+
+def get_pool_stats():
+    """Checkout and wait statistics for every registered engine"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [stats.snapshot() for stats in pools]
+
+
+def dispose_engines():
+    """
+    Drop pooled connections inherited from a parent process
+
+    close=False leaves the parent's sockets alone; the child just opens its own.
+    """
+    with _pools_lock:
+        engines = [stats.engine for stats in _pools.values()]
+    for engine in engines:
+        engine.dispose(close=False)
+    if engines:
+        logger.info(f"Disposed {len(engines)} database engine(s) after fork (pid {os.getpid()})")
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_engines)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Generation Worker - drains the Generation job queue
+Runs as its own process (Procfile `worker:`) next to the web app, sharing its uploads/ and outputs/,
+so GPU latency never ties up web requests. Railway and Docker run it inside the web workers
+instead (GENERATION_WORKER_IN_PROCESS=true, see start_in_process()).
+A finalizer thread saves finished outputs, so results land even if the browser tab is closed.
+With the Vast.ai warm pool enabled, a scaler thread sizes the pool and destroys its instances on exit.
+The main thread recovers stale claims and compacts the credit ledger.
+
+Usage:
+    python generation_worker.py
+"""
+
+import time
+import signal
+import logging
+import threading
+from contextlib import contextmanager
+from config import (GENERATION_WORKER_THREADS, GENERATION_WORKER_POLL_INTERVAL, GENERATION_BATCH_MAX_SIZE,
+                    GENERATION_BATCH_WINDOW, GENERATION_FINALIZE_INTERVAL, CREDIT_LEDGER_COMPACT_INTERVAL,
+                    GENERATION_CLAIM_HEARTBEAT, VAST_WARM_SCALE_INTERVAL, VAST_PREWARM_HISTORY_DAYS)
+from app import (app, gpu_router, run_generation_job, run_generation_batch, get_batch_key, gpu_is_saturated,
+                 has_dispatch_slot, should_spill_over, finalize_in_flight_generations)
+from job_queue import (claim_next_generation, claim_matching_generations, requeue_stale_claims, touch_claims, make_worker_id,
+                       get_queue_depth, get_hourly_demand)
+from credit_ledger import compact_ledger
+from shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+STALE_CLAIM_CHECK_INTERVAL = 60  # seconds
+
+
+def collect_batch(worker_id, leader, max_size=GENERATION_BATCH_MAX_SIZE, window=GENERATION_BATCH_WINDOW,
+                  poll_interval=0.25):
+    """Claim jobs that can share the leader's prompt, for at most `window` seconds"""
+    key = get_batch_key(leader)
+    batch = [leader]
+    deadline = time.time() + window
+
+    while len(batch) < max_size:
+        batch.extend(claim_matching_generations(
+            worker_id,
+            lambda generation: get_batch_key(generation) == key,
+            max_size - len(batch)
+        ))
+        if len(batch) >= max_size or time.time() >= deadline:
+            break
+        time.sleep(poll_interval)
+
+    return batch
+
+
+@contextmanager
+def claim_heartbeat(generations, worker_id, interval=GENERATION_CLAIM_HEARTBEAT):
+    """Keep the claims fresh while their dispatch runs, so the stale sweep never re-queues a live job"""
+    generation_ids = [generation.id for generation in generations]
+    stop_event = threading.Event()
+
+    def beat():
+        while not stop_event.wait(interval):
+            with app.app_context():
+                touch_claims(generation_ids, worker_id)
+
+    heartbeat = threading.Thread(target=beat, name=f"claim-heartbeat-{worker_id}", daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        stop_event.set()
+        heartbeat.join(timeout=5)
+
+
+def worker_loop(worker_id, stop_event, poll_interval=GENERATION_WORKER_POLL_INTERVAL):
+    """Claim and dispatch jobs until stop_event is set"""
+    logger.info(f"Generation worker {worker_id} started")
+
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                # Leave jobs in the table (in priority order) until a backend has a free slot
+                generation = claim_next_generation(worker_id) if has_dispatch_slot() else None
+                if generation:
+                    # GPU saturated - pack compatible full-face jobs into one prompt
+                    if get_batch_key(generation) and gpu_is_saturated() and not should_spill_over():
+                        batch = collect_batch(worker_id, generation)
+                        with claim_heartbeat(batch, worker_id):
+                            run_generation_batch(batch)
+                    else:
+                        with claim_heartbeat([generation], worker_id):
+                            run_generation_job(generation)
+                    continue  # Check for more work immediately
+        except Exception as e:
+            logger.error(f"Generation worker {worker_id} error: {e}")
+
+        stop_event.wait(poll_interval)
+
+    logger.info(f"Generation worker {worker_id} stopped")
+
+
+def finalizer_loop(worker_id, stop_event, poll_interval=GENERATION_FINALIZE_INTERVAL):
+    """Save outputs of finished prompts until stop_event is set"""
+    logger.info(f"Generation finalizer {worker_id} started")
+
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                if finalize_in_flight_generations(worker_id):
+                    continue  # More may have finished meanwhile
+        except Exception as e:
+            logger.error(f"Generation finalizer {worker_id} error: {e}")
+
+        stop_event.wait(poll_interval)
+
+    logger.info(f"Generation finalizer {worker_id} stopped")
+
+
+def warm_pool_loop(pool, stop_event, interval=VAST_WARM_SCALE_INTERVAL, history_days=VAST_PREWARM_HISTORY_DAYS):
+    """Scale the Vast.ai warm pool until stop_event is set"""
+    logger.info("Vast.ai warm pool scaler started")
+    demand, demand_loaded_at = {}, 0
+
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                if time.time() - demand_loaded_at >= 3600:
+                    demand, demand_loaded_at = get_hourly_demand(history_days), time.time()
+                depth = get_queue_depth()
+            pool.scale(depth['queued'] + depth['in_flight'], demand)
+        except Exception as e:
+            logger.error(f"Vast.ai warm pool scaling error: {e}")
+
+        stop_event.wait(interval)
+
+    logger.info("Vast.ai warm pool scaler stopped")
+
+
+def handle_sigterm(signum, frame):
+    # Railway stops the worker with SIGTERM - shut down like Ctrl+C so rented instances are destroyed
+    raise KeyboardInterrupt
+
+
+def maybe_compact_ledger(worker_id, interval=CREDIT_LEDGER_COMPACT_INTERVAL):
+    """Compact the credit ledger once per interval across all worker processes"""
+    if interval > 0 and shared_state.set('lock:credit_ledger_compaction', worker_id, ex=interval, nx=True):
+        compact_ledger()
+
+
+def maintenance_loop(stop_event, interval=STALE_CLAIM_CHECK_INTERVAL):
+    """Recover stale claims and compact the credit ledger until stop_event is set"""
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                requeue_stale_claims()
+                maybe_compact_ledger(make_worker_id())
+        except Exception as e:
+            logger.error(f"Generation worker maintenance error: {e}")
+        stop_event.wait(interval)
+
+
+def start_worker(stop_event, threads=GENERATION_WORKER_THREADS, scale_warm_pool=True):
+    """
+    Start the worker and finalizer threads (and the Vast.ai warm pool scaler)
+
+    Without scale_warm_pool the Vast.ai client's warm pool is detached: nothing in this process
+    would destroy idle instances, so Vast.ai jobs rent and destroy one instance per image.
+
+    Returns:
+        (list of Thread, VastWarmPool or None): the threads, and the warm pool to shut down on exit
+    """
+    workers = []
+
+    for i in range(max(1, threads)):
+        worker = threading.Thread(
+            target=worker_loop,
+            args=(make_worker_id(i), stop_event),
+            name=f"generation-worker-{i}",
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+
+    finalizer = threading.Thread(
+        target=finalizer_loop,
+        args=(make_worker_id('finalizer'), stop_event),
+        name="generation-finalizer",
+        daemon=True
+    )
+    finalizer.start()
+    workers.append(finalizer)
+
+    vast_client = gpu_router.get('vast')
+    offer_catalog = getattr(vast_client, 'offer_catalog', None)
+    if offer_catalog is not None:
+        offer_catalog.start()  # Boots pick from cached Vast.ai offers instead of searching first
+
+    warm_pool = getattr(vast_client, 'warm_pool', None)
+    if warm_pool is not None and not scale_warm_pool:
+        logger.info("Vast.ai warm pool disabled in this process (no scaler to reap idle instances)")
+        vast_client.warm_pool = warm_pool = None
+    if warm_pool is not None:
+        scaler = threading.Thread(target=warm_pool_loop, args=(warm_pool, stop_event), name="vast-warm-pool", daemon=True)
+        scaler.start()
+        workers.append(scaler)
+
+    logger.info(f"🚀 Generation worker running with {max(1, threads)} thread(s) and a finalizer")
+    return workers, warm_pool
+
+
+def start_in_process(threads=GENERATION_WORKER_THREADS):
+    """
+    Run the worker as daemon threads of a web process (GENERATION_WORKER_IN_PROCESS)
+
+    Fallback for deploys without a separate worker service. Every web process that calls this
+    runs its own copy - claims and finalization are safe to share. The Vast.ai warm pool only
+    runs in a dedicated worker process (where the scaler reaps idle instances and shutdown()
+    destroys the rest on exit); here it is detached, so each Vast.ai image rents and destroys
+    its own instance.
+    """
+    stop_event = threading.Event()
+    start_worker(stop_event, threads, scale_warm_pool=False)
+    threading.Thread(target=maintenance_loop, args=(stop_event,), name="generation-maintenance", daemon=True).start()
+    return stop_event
+
+
+def run_worker(threads=GENERATION_WORKER_THREADS):
+    """Start worker threads and periodically recover stale claims"""
+    stop_event = threading.Event()
+    workers, warm_pool = start_worker(stop_event, threads)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    try:
+        maintenance_loop(stop_event)
+    except KeyboardInterrupt:
+        logger.info("Shutting down generation worker...")
+        stop_event.set()
+        for worker in workers:
+            worker.join(timeout=5)
+        if warm_pool is not None:
+            warm_pool.shutdown()
+
+
+if __name__ == '__main__':
+    run_worker()
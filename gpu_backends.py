@@ -0,0 +1,133 @@
+"""
+GPU Backend Interface
+Every GPU provider client (local ComfyUI, Modal, Vast.ai, RunPod, Replicate) implements
+GpuBackend, so the dispatcher runs a generation the same way whichever provider takes it:
+
+    submit(job)      Start a GpuJob. Synchronous providers (Modal, Vast.ai) return the image
+                     in the Submission, the others a job ID for the finalizer
+    status(job_id)   COMPLETED / FAILED / IN_PROGRESS (backends with authoritative_status never
+                     report a network error as FAILED, so the reconciler fails rows on it)
+    fetch(job_id)    Result image bytes, or None
+    cancel(job_id)   Best effort; False if the provider cannot cancel
+    capabilities()   Transform modes supported, synchronous or not, paid or not
+    cost(seconds)    Estimated USD for that much GPU time (GPU_COST_PER_SECOND)
+
+gpu_router.py picks a backend per job on top of this interface.
+"""
+
+import os
+from config import GPU_COST_PER_SECOND
+
+TRANSFORM_MODES = ('full', 'custom', 'reference', 'chad_2_0')
+
+
+def map_denoise_to_preset(denoise_value, preset_keys=('tier1', 'tier2', 'chad')):
+    """
+    (preset_key, denoise_intensity) for the preset-based clients
+
+    The three tiers map to fixed intensities; custom denoise values are scaled onto 1-10.
+    """
+    if denoise_value == 0.10:
+        return preset_keys[0], 4
+    if denoise_value == 0.15:
+        return preset_keys[1], 6
+    if denoise_value == 0.25:
+        return preset_keys[2], 8
+    denoise_intensity = int((denoise_value - 0.10) / 0.15 * 10) + 1
+    return preset_keys[0], max(1, min(10, denoise_intensity))
+
+
+class GpuJob:
+    """Everything a backend needs to run one generation"""
+
+    def __init__(self, image_path, transform_mode='full', denoise=0.10, preset=None, selected_features=None,
+                 reference_image_path=None, face_swap_intensity=0.5, generation_id=None):
+        self.image_path = image_path
+        self.transform_mode = transform_mode
+        self.denoise = denoise
+        self.preset = preset  # Tier name stored on the generation (ComfyUI workflows)
+        self.selected_features = selected_features or []
+        self.reference_image_path = reference_image_path
+        self.face_swap_intensity = face_swap_intensity
+        self.generation_id = generation_id
+
+    @classmethod
+    def from_generation(cls, generation, upload_folder, reference_folder):
+        """Job for a claimed Generation row"""
+        params = generation.job_params or {}
+        selected_chad = params.get('selected_chad')
+        return cls(
+            image_path=os.path.join(upload_folder, generation.input_filename),
+            transform_mode=params.get('transform_mode', 'full'),
+            denoise=params.get('denoise', 0.10),
+            preset=generation.preset,
+            selected_features=params.get('selected_features'),
+            reference_image_path=os.path.join(reference_folder, f'{selected_chad}.png') if selected_chad else None,
+            face_swap_intensity=params.get('face_swap_intensity', 0.5),
+            generation_id=generation.id
+        )
+
+
+class Submission:
+    """Outcome of submit(): a job ID to follow up, the finished image, or an error"""
+
+    def __init__(self, job_id=None, image_data=None, error=None, backend_url=None):
+        self.job_id = job_id
+        self.image_data = image_data
+        self.error = error
+        self.backend_url = backend_url  # ComfyUI pool backend the prompt is pinned to
+
+    @property
+    def ok(self):
+        return self.error is None and (self.job_id is not None or self.image_data is not None)
+
+    @property
+    def completed(self):
+        return self.image_data is not None
+
+
+class GpuBackend:
+    """
+    Mixin implementing the shared parts of the interface
+
+    Clients set backend_name (the GPU_BACKENDS / GPU_COST_PER_SECOND key), and override
+    submit(). status() and fetch() default to the clients' get_job_status() / get_job_output().
+    """
+
+    backend_name = 'gpu'
+    transform_modes = ('full',)  # Others ignore the transform mode and morph the full face
+    preset_keys = ('tier1', 'tier2', 'chad')
+    synchronous = False
+    authoritative_status = False  # status() only says FAILED when the provider reports the job failed
+
+    def submit(self, job):
+        raise NotImplementedError
+
+    def status(self, job_id):
+        return self.get_job_status(job_id)
+
+    def fetch(self, job_id):
+        return self.get_job_output(job_id)
+
+    def cancel(self, job_id):
+        return False
+
+    def capabilities(self):
+        return {
+            'name': self.backend_name,
+            'transform_modes': list(self.transform_modes),
+            'synchronous': self.synchronous,
+            'paid': self.cost(1) > 0
+        }
+
+    def cost(self, seconds):
+        return seconds * GPU_COST_PER_SECOND.get(self.backend_name, 0.0)
+
+    def submit_preset(self, job, **kwargs):
+        """submit() for clients with generate_image(image_path, preset_key, denoise_intensity) -> (result, error)"""
+        preset_key, denoise_intensity = map_denoise_to_preset(job.denoise, self.preset_keys)
+        result, error = self.generate_image(image_path=job.image_path, preset_key=preset_key,
+                                            denoise_intensity=denoise_intensity, **kwargs)
+        if error or not result:
+            return Submission(error=error or f'Failed to start {self.backend_name} generation')
+        return Submission(image_data=result) if self.synchronous else Submission(job_id=result)
@@ -0,0 +1,149 @@
+"""
+GPU Backend Router
+Sends each generation to one of the configured GpuBackends (GPU_BACKENDS, in priority order):
+
+- Backends that cannot run the job's transform mode are skipped, unless none can
+- Free backends (local ComfyUI) go first; paid cloud backends only take a job first when the
+  free queue's expected wait is above GPU_SPILLOVER_SLO_SECONDS, or when no free backend is up
+- A backend that errors or refuses the job fails over to the next one, so a dead home tunnel
+  no longer fails every generation
+
+Per-backend counters are kept for /health; per-job provider, latency and cost are recorded on
+the Generation row (job_queue.assign_backend() / mark_completed()).
+"""
+
+import logging
+import threading
+from config import GPU_SPILLOVER_SLO_SECONDS
+from gpu_backends import Submission
+
+logger = logging.getLogger(__name__)
+
+
+class GpuRouter:
+    """Priority failover and paid spillover across GpuBackends"""
+
+    def __init__(self, backends, slo_seconds=GPU_SPILLOVER_SLO_SECONDS, is_available=None):
+        """
+        Args:
+            backends: GpuBackends in priority order (named by their backend_name)
+            slo_seconds: Free-queue wait above which paid backends are tried first
+            is_available: Callable(backend) -> bool from the health monitor; all available if None
+        """
+        self._backends = list(backends)
+        self.slo_seconds = slo_seconds
+        self.is_available = is_available or (lambda backend: True)
+        self._lock = threading.Lock()
+        self._stats = {backend.backend_name: {'submitted': 0, 'failed': 0} for backend in self._backends}
+        self.failovers = 0
+        self.spillovers = 0
+
+    def has_backends(self):
+        return bool(self._backends)
+
+    def names(self):
+        return [backend.backend_name for backend in self._backends]
+
+    def get(self, name):
+        """Backend by name, or None if it is not configured"""
+        return next((backend for backend in self._backends if backend.backend_name == name), None)
+
+    def is_paid(self, backend):
+        return backend.capabilities()['paid']
+
+    def candidates(self, job, free_eta=None):
+        """
+        Backends to try for a job, in order
+
+        Args:
+            job: GpuJob
+            free_eta: Callable returning the free queue's expected wait in seconds; only called
+                when both a free and a paid backend are up
+
+        Returns:
+            (list of GpuBackend, bool): order, and whether paid backends were put first for the SLO
+        """
+        backends = [backend for backend in self._backends if job.transform_mode in backend.capabilities()['transform_modes']]
+        if not backends:
+            # Nothing supports the mode - run it as a full-face morph, as before routing existed
+            backends = list(self._backends)
+
+        up = [backend for backend in backends if self.is_available(backend)]
+        down = [backend for backend in backends if backend not in up]
+        free = [backend for backend in up if not self.is_paid(backend)]
+        paid = [backend for backend in up if self.is_paid(backend)]
+
+        spill = bool(free and paid and free_eta is not None and free_eta() > self.slo_seconds)
+        ordered = paid + free if spill else free + paid
+        # Backends the monitor reports down are still tried last - their state may be stale
+        return ordered + down, spill
+
+    def should_spill(self, free_eta):
+        """
+        True when the free queue's wait is above the SLO and a paid backend could take the job
+
+        Args:
+            free_eta: See candidates(); only called when a paid backend is up
+        """
+        if not any(self.is_paid(backend) and self.is_available(backend) for backend in self._backends):
+            return False
+        return free_eta() > self.slo_seconds
+
+    def dispatch(self, job, free_eta=None, on_attempt=None):
+        """
+        Submit a job to the first backend that accepts it
+
+        Args:
+            job: GpuJob
+            free_eta: See candidates()
+            on_attempt: Callable(backend_name) run before each attempt (records the provider on the row)
+
+        Returns:
+            (str, Submission): name of the backend that took the job, or None with the last error
+        """
+        backends, spill = self.candidates(job, free_eta)
+        submission = Submission(error='No GPU backend configured')
+
+        for attempt, backend in enumerate(backends):
+            name = backend.backend_name
+            if on_attempt:
+                on_attempt(name)
+            try:
+                submission = backend.submit(job)
+            except Exception as e:
+                logger.error(f"GPU backend {name} error for generation {job.generation_id}: {e}")
+                submission = Submission(error=str(e))
+
+            if submission.ok:
+                with self._lock:
+                    self._stats[name]['submitted'] += 1
+                    if attempt > 0:
+                        self.failovers += 1
+                    elif spill:
+                        self.spillovers += 1
+                if spill and attempt == 0:
+                    logger.info(f"Generation {job.generation_id} spilled over to {name} (free queue above {self.slo_seconds}s)")
+                return name, submission
+
+            with self._lock:
+                self._stats[name]['failed'] += 1
+            if attempt + 1 < len(backends):
+                logger.warning(f"GPU backend {name} failed for generation {job.generation_id} ({submission.error}), "
+                               f"failing over to {backends[attempt + 1].backend_name}")
+
+        return None, submission
+
+    def snapshot(self):
+        """Routing order, capabilities, availability and counters for /health"""
+        available = {backend.backend_name: self.is_available(backend) for backend in self._backends}
+        with self._lock:
+            return {
+                'slo_seconds': self.slo_seconds,
+                'failovers': self.failovers,
+                'spillovers': self.spillovers,
+                'backends': [{
+                    **backend.capabilities(),
+                    'available': available[backend.backend_name],
+                    **self._stats[backend.backend_name]
+                } for backend in self._backends]
+            }
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings (passed with --config gunicorn.conf.py - see Procfile, nixpacks.toml, Dockerfile)
+
+Workers are forked from the master. Any database engine the master created (e.g. with
+--preload) is disposed in each child so no two processes share a pooled connection.
+With GENERATION_WORKER_IN_PROCESS=true each worker also runs the generation worker threads.
+"""
+
+
+def post_fork(server, worker):
+    from db_engine import dispose_engines
+
+    dispose_engines()
+
+
+def post_worker_init(worker):
+    from config import GENERATION_WORKER_IN_PROCESS
+
+    if GENERATION_WORKER_IN_PROCESS:
+        from generation_worker import start_in_process
+
+        start_in_process()
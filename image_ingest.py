@@ -0,0 +1,163 @@
+"""
+Upload Ingest Pipeline
+Every upload is decoded once, rotated by its EXIF orientation, downscaled to the working
+resolution and re-encoded without metadata under a byte bound. ComfyUI uploads, base64
+payloads for RunPod / Modal / OpenRouter and facial evaluation copies all read the smaller
+file. Decoding runs on a small thread pool so large photos don't pin request threads.
+"""
+
+import io
+import os
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from config import (
+    INGEST_MAX_DIMENSION, INGEST_FORMAT, INGEST_QUALITY, INGEST_MIN_QUALITY,
+    INGEST_MAX_BYTES, INGEST_KEEP_ORIGINALS, INGEST_WORKERS, INGEST_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+QUALITY_STEP = 5
+ORIGINALS_SUBFOLDER = 'originals'
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='image-ingest')
+
+
+def _flatten(img):
+    """RGB image, with any transparency composited onto white"""
+    if img.mode == 'P' and 'transparency' in img.info:
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def _encode(img, fmt, quality, min_quality, max_bytes):
+    """Encode at the highest quality that fits max_bytes (or min_quality if nothing fits)"""
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, quality=quality, optimize=fmt == 'JPEG')
+        if buffer.tell() <= max_bytes or quality <= min_quality:
+            return buffer.getvalue(), quality
+        quality = max(min_quality, quality - QUALITY_STEP)
+
+
+def normalize_image(source_path, dest_path, max_dimension=INGEST_MAX_DIMENSION, fmt=INGEST_FORMAT,
+                    quality=INGEST_QUALITY, min_quality=INGEST_MIN_QUALITY, max_bytes=INGEST_MAX_BYTES):
+    """
+    Decode, orient, downscale and re-encode one image (no EXIF/ICC/text chunks are written)
+
+    Returns:
+        dict: width, height, quality and bytes of the written file
+    """
+    with Image.open(source_path) as img:
+        # JPEG decoders can skip straight to a reduced scale - avoids decoding all 16 MP
+        img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        img = _flatten(img)
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        data, used_quality = _encode(img, fmt, quality, min_quality, max_bytes)
+
+    with open(dest_path, 'wb') as f:
+        f.write(data)
+    return {'width': img.width, 'height': img.height, 'quality': used_quality, 'bytes': len(data)}
+
+
+class IngestStats:
+    """Running totals of bytes in vs. bytes kept, for /health"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.original_bytes = 0
+        self.normalized_bytes = 0
+
+    def record(self, original_bytes=0, normalized_bytes=0, failed=False):
+        with self._lock:
+            if failed:
+                self.failed += 1
+                return
+            self.processed += 1
+            self.original_bytes += original_bytes
+            self.normalized_bytes += normalized_bytes
+
+    def snapshot(self):
+        with self._lock:
+            saved = self.original_bytes - self.normalized_bytes
+            return {
+                'processed': self.processed,
+                'failed': self.failed,
+                'original_bytes': self.original_bytes,
+                'normalized_bytes': self.normalized_bytes,
+                'saved_percent': round(100 * saved / self.original_bytes, 1) if self.original_bytes else 0.0
+            }
+
+
+ingest_stats = IngestStats()
+
+
+def ingest_upload(file_path, keep_original=INGEST_KEEP_ORIGINALS, timeout=INGEST_TIMEOUT, **options):
+    """
+    Replace a saved upload with its normalized version
+
+    The normalized file sits next to the upload with the target format's extension. The raw
+    upload is moved to originals/ when the retention policy keeps it and deleted otherwise.
+
+    Args:
+        file_path: Saved (already validated) upload
+        keep_original: Retain the raw upload
+        timeout: Seconds to wait for the ingest pool
+        **options: Overrides for normalize_image (max_dimension, fmt, quality, ...)
+
+    Returns:
+        dict: filename, path, original_bytes, normalized_bytes, width, height - or None on failure
+        (the raw upload is left in place so the caller can fall back to it)
+    """
+    fmt = options.get('fmt', INGEST_FORMAT)
+    if fmt not in FORMAT_EXTENSIONS:
+        logger.error(f"Unsupported ingest format: {fmt}")
+        return None
+
+    folder = os.path.dirname(file_path)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    filename = f"{stem}.{FORMAT_EXTENSIONS[fmt]}"
+    dest_path = os.path.join(folder, filename)
+    temp_path = f"{dest_path}.ingest"
+
+    try:
+        original_bytes = os.path.getsize(file_path)
+        result = _executor.submit(normalize_image, file_path, temp_path, **options).result(timeout=timeout)
+
+        if keep_original:
+            originals_folder = os.path.join(folder, ORIGINALS_SUBFOLDER)
+            os.makedirs(originals_folder, exist_ok=True)
+            shutil.move(file_path, os.path.join(originals_folder, os.path.basename(file_path)))
+        elif os.path.abspath(file_path) != os.path.abspath(dest_path):
+            os.remove(file_path)
+        os.replace(temp_path, dest_path)
+    except Exception as e:
+        logger.error(f"Image ingest failed for {file_path}: {e}")
+        ingest_stats.record(failed=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+    ingest_stats.record(original_bytes, result['bytes'])
+    logger.info(f"Normalized {os.path.basename(file_path)} -> {filename}: "
+                f"{original_bytes // 1024} KB -> {result['bytes'] // 1024} KB, "
+                f"{result['width']}x{result['height']} q{result['quality']}")
+    return {
+        'filename': filename,
+        'path': dest_path,
+        'original_bytes': original_bytes,
+        'normalized_bytes': result['bytes'],
+        'width': result['width'],
+        'height': result['height']
+    }
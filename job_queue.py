@@ -0,0 +1,483 @@
+"""
+Database-backed generation job queue
+Generation rows are the queue: /process inserts a pending row and returns immediately,
+generation_worker.py claims rows with SELECT ... FOR UPDATE SKIP LOCKED and drives the GPU client,
+then its finalizer saves each finished prompt's output and marks the row completed
+"""
+
+import os
+import socket
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, and_, case
+from models import db, Generation
+from config import GENERATION_CLAIM_TIMEOUT, GENERATION_MAX_ATTEMPTS, GENERATION_PRIORITY_AGING, GPU_COST_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+# Statuses a job passes through before it reaches the GPU
+QUEUED_STATUSES = ('pending', 'dispatching')
+
+# Statuses of a job whose prompt is on the GPU and whose output is not saved yet
+IN_FLIGHT_STATUSES = ('processing', 'finalizing')
+
+# Scheduling classes, best first. Each class down starts GENERATION_PRIORITY_AGING seconds
+# behind the one above, so a waiting job eventually outranks newer jobs of better classes.
+PRIORITY_CLASSES = ('paid', 'free', 'admin')
+
+
+def make_worker_id(suffix=None):
+    """Build a worker identifier (host-pid[-suffix]) recorded on claimed rows"""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    if suffix is not None:
+        worker_id = f"{worker_id}-{suffix}"
+    return worker_id
+
+
+def claim_order():
+    """ORDER BY for pending rows: aged priority, then arrival"""
+    return (Generation.scheduled_at.asc(), Generation.created_at.asc())
+
+
+def enqueue_generation(user_id, input_filename, preset, workflow_type, job_params,
+                       used_free_credit=False, used_paid_credit=False, priority_class='free',
+                       aging=GENERATION_PRIORITY_AGING):
+    """Insert a pending Generation row for the worker to pick up"""
+    priority = PRIORITY_CLASSES.index(priority_class)
+    now = datetime.utcnow()
+    generation = Generation(
+        user_id=user_id,
+        preset=preset,
+        workflow_type=workflow_type,
+        input_filename=input_filename,
+        used_free_credit=used_free_credit,
+        used_paid_credit=used_paid_credit,
+        status='pending',
+        job_params=job_params,
+        attempts=0,
+        priority=priority,
+        created_at=now,
+        scheduled_at=now + timedelta(seconds=priority * aging)
+    )
+    db.session.add(generation)
+    db.session.commit()
+    logger.info(f"Queued generation {generation.id} ({preset}, mode: {job_params.get('transform_mode')}, class: {priority_class})")
+    return generation
+
+
+def claim_next_generation(worker_id):
+    """
+    Claim the next pending generation for this worker (best aged priority first)
+
+    Uses FOR UPDATE SKIP LOCKED so concurrent workers never block on or double-claim
+    the same row (SQLite ignores the locking clause; it serializes writers anyway).
+
+    Returns:
+        Generation or None if the queue is empty
+    """
+    try:
+        generation = Generation.query.filter_by(status='pending')\
+            .order_by(*claim_order())\
+            .with_for_update(skip_locked=True)\
+            .first()
+
+        if not generation:
+            db.session.commit()  # Release the transaction
+            return None
+
+        generation.status = 'dispatching'
+        generation.claimed_by = worker_id
+        generation.claimed_at = datetime.utcnow()
+        generation.attempts = (generation.attempts or 0) + 1
+        db.session.commit()
+
+        logger.info(f"Worker {worker_id} claimed generation {generation.id} (attempt {generation.attempts})")
+        return generation
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to claim generation: {e}")
+        return None
+
+
+def claim_matching_generations(worker_id, matches, limit):
+    """
+    Claim up to `limit` more pending generations accepted by `matches` (micro-batching)
+
+    Args:
+        worker_id: Worker recorded on the claimed rows
+        matches: Callable(Generation) -> bool selecting jobs compatible with the batch
+        limit: Maximum number of rows to claim
+
+    Returns:
+        list of claimed Generation rows, in claim order
+    """
+    if limit <= 0:
+        return []
+
+    try:
+        candidates = Generation.query.filter_by(status='pending')\
+            .order_by(*claim_order())\
+            .with_for_update(skip_locked=True)\
+            .limit(limit * 5)\
+            .all()
+
+        claimed = [generation for generation in candidates if matches(generation)][:limit]
+        now = datetime.utcnow()
+        for generation in claimed:
+            generation.status = 'dispatching'
+            generation.claimed_by = worker_id
+            generation.claimed_at = now
+            generation.attempts = (generation.attempts or 0) + 1
+        db.session.commit()
+
+        if claimed:
+            logger.info(f"Worker {worker_id} claimed {len(claimed)} generation(s) for batching")
+        return claimed
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to claim batch generations: {e}")
+        return []
+
+
+def count_pending_generations():
+    """Number of jobs waiting for a worker"""
+    return Generation.query.filter_by(status='pending').count()
+
+
+def get_queue_depth():
+    """
+    Jobs waiting for dispatch and jobs on the GPU, in one grouped query
+
+    Returns:
+        dict: {'queued': int, 'in_flight': int}
+    """
+    counts = dict(
+        db.session.query(Generation.status, func.count(Generation.id))
+        .filter(Generation.status.in_(QUEUED_STATUSES + IN_FLIGHT_STATUSES))
+        .group_by(Generation.status)
+        .all()
+    )
+    return {
+        'queued': sum(counts.get(status, 0) for status in QUEUED_STATUSES),
+        'in_flight': sum(counts.get(status, 0) for status in IN_FLIGHT_STATUSES)
+    }
+
+
+def count_outstanding_prompts():
+    """Prompts on the GPU plus jobs being dispatched right now (single-backend mode)"""
+    processing = db.session.query(func.count(func.distinct(func.coalesce(Generation.prompt_id, Generation.id))))\
+        .filter(Generation.status == 'processing')\
+        .scalar()
+    dispatching = Generation.query.filter_by(status='dispatching').count()
+    return (processing or 0) + dispatching
+
+
+def assign_backend(generation, backend_name):
+    """Record which GPU provider is taking the job (committed by the next mark_* call)"""
+    generation.gpu_backend = backend_name
+    generation.started_at = datetime.utcnow()
+
+
+def mark_processing(generation, prompt_id, output_node=None):
+    """Record that the GPU accepted the job and is working on it"""
+    generation.prompt_id = str(prompt_id)
+    generation.output_node = output_node
+    generation.status = 'processing'
+    generation.started_at = datetime.utcnow()
+    db.session.commit()
+
+
+def get_in_flight_generations(limit=200):
+    """Processing generations with a GPU prompt, oldest first (one query per finalizer pass)"""
+    return Generation.query.filter(
+        Generation.status == 'processing',
+        Generation.prompt_id.isnot(None)
+    ).order_by(Generation.started_at.asc()).limit(limit).all()
+
+
+def claim_finalization(generation, worker_id):
+    """
+    Take the exclusive right to fetch a generation's output (idempotency guard)
+
+    A conditional UPDATE ... WHERE status = 'processing' moves the row to 'finalizing', so only
+    one finalizer pass, thread or process ever pulls a given output from the GPU.
+
+    Returns:
+        bool: True if this caller now owns the finalization
+    """
+    try:
+        claimed = Generation.query.filter_by(id=generation.id, status='processing').update({
+            'status': 'finalizing',
+            'claimed_by': worker_id,
+            'claimed_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(generation)
+        return claimed == 1
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to claim finalization of generation {generation.id}: {e}")
+        return False
+
+
+def release_finalization(generation):
+    """Hand a generation back to the finalizer after a transient failure"""
+    generation.status = 'processing'
+    db.session.commit()
+
+
+def prompt_is_settled(prompt_id):
+    """True once no generation sharing this prompt still needs its output from the GPU"""
+    return Generation.query.filter(
+        Generation.prompt_id == str(prompt_id),
+        Generation.status.in_(IN_FLIGHT_STATUSES)
+    ).count() == 0
+
+
+def mark_completed(generation, output_filename, prompt_id=None):
+    """Record a finished generation whose output is already on disk"""
+    if prompt_id:
+        generation.prompt_id = str(prompt_id)
+    now = datetime.utcnow()
+    generation.status = 'completed'
+    generation.started_at = generation.started_at or now
+    generation.completed_at = now
+    generation.output_filename = output_filename
+    if generation.gpu_backend:
+        generation.gpu_seconds = (now - generation.started_at).total_seconds()
+        generation.gpu_cost = generation.gpu_seconds * GPU_COST_PER_SECOND.get(generation.gpu_backend, 0.0)
+    db.session.commit()
+
+
+def mark_failed(generation, error_message):
+    """Record a failed generation"""
+    generation.status = 'failed'
+    generation.error_message = error_message
+    db.session.commit()
+    logger.error(f"Generation {generation.id} failed: {error_message}")
+
+
+def fail_generations(generation_ids, error_message):
+    """
+    Fail many processing generations in one transaction (status reconciliation)
+
+    Only rows still in 'processing' are touched, so a row finalized meanwhile is left alone.
+
+    Returns:
+        int: Number of rows failed
+    """
+    if not generation_ids:
+        return 0
+    try:
+        failed = Generation.query.filter(
+            Generation.id.in_(list(generation_ids)),
+            Generation.status == 'processing'
+        ).update({'status': 'failed', 'error_message': error_message}, synchronize_session=False)
+        db.session.commit()
+        if failed:
+            logger.error(f"{failed} generation(s) failed: {error_message}")
+        return failed
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to mark generations failed: {e}")
+        return 0
+
+
+def touch_claims(generation_ids, worker_id):
+    """
+    Heartbeat for a running dispatch - refresh claimed_at on rows this worker still holds
+
+    Synchronous providers keep a row in 'dispatching' for the whole generation (cold boots,
+    failover across several providers), so the stale sweep judges claims by their last
+    heartbeat rather than by when they were claimed.
+
+    Returns:
+        int: Rows refreshed
+    """
+    try:
+        touched = Generation.query.filter(
+            Generation.id.in_(generation_ids),
+            Generation.status == 'dispatching',
+            Generation.claimed_by == worker_id
+        ).update({'claimed_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        return touched
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to refresh claims of worker {worker_id}: {e}")
+        return 0
+
+
+def requeue_stale_claims(timeout=GENERATION_CLAIM_TIMEOUT, max_attempts=GENERATION_MAX_ATTEMPTS):
+    """
+    Recover jobs whose worker died between claim and dispatch
+
+    Rows in 'dispatching' whose claim has not been refreshed (touch_claims()) within the
+    claim timeout go back to 'pending',
+    or are failed once they have used up their attempts. Rows stuck in 'finalizing'
+    (finalizer died mid-download) go back to 'processing' to be finalized again.
+
+    Returns:
+        (requeued_count, failed_count)
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    requeued = 0
+    failed = 0
+
+    try:
+        stale = Generation.query.filter(
+            Generation.status == 'dispatching',
+            Generation.claimed_at < cutoff
+        ).with_for_update(skip_locked=True).all()
+
+        for generation in stale:
+            if (generation.attempts or 0) >= max_attempts:
+                generation.status = 'failed'
+                generation.error_message = f'Dispatch abandoned by worker {generation.claimed_by}'
+                failed += 1
+            else:
+                generation.status = 'pending'
+                generation.claimed_by = None
+                generation.claimed_at = None
+                requeued += 1
+
+        stale_finalizations = Generation.query.filter(
+            Generation.status == 'finalizing',
+            Generation.claimed_at < cutoff
+        ).with_for_update(skip_locked=True).all()
+
+        for generation in stale_finalizations:
+            generation.status = 'processing'
+            requeued += 1
+
+        db.session.commit()
+
+        if requeued or failed:
+            logger.warning(f"Recovered stale claims: {requeued} re-queued, {failed} failed")
+        return requeued, failed
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to recover stale claims: {e}")
+        return 0, 0
+
+
+def get_queue_position(generation):
+    """Number of queued jobs ahead of this one in claim order (0 = next to be dispatched)"""
+    if generation.status not in QUEUED_STATUSES:
+        return 0
+    if generation.scheduled_at is None:
+        ahead = Generation.created_at < generation.created_at
+    else:
+        ahead = or_(
+            Generation.scheduled_at < generation.scheduled_at,
+            and_(Generation.scheduled_at == generation.scheduled_at, Generation.created_at < generation.created_at)
+        )
+    return Generation.query.filter(Generation.status == 'pending', ahead).count()
+
+
+def find_generation(key, user_id=None):
+    """Look up a generation by its id or by its GPU prompt id"""
+    query = Generation.query
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+
+    generation = query.filter_by(id=key).first()
+    if not generation:
+        generation = query.filter_by(prompt_id=key).first()
+    return generation
+
+
+def get_backend_load(sample_size=20):
+    """
+    In-flight prompts (a batched prompt counts once) and rolling average execution time per ComfyUI backend
+
+    Read from the database so the numbers agree across web and worker processes.
+
+    Returns:
+        dict: backend_url -> {'in_flight': int, 'avg_seconds': float or None}
+    """
+    load = {}
+
+    in_flight = db.session.query(Generation.backend_url, func.count(func.distinct(func.coalesce(Generation.prompt_id, Generation.id))))\
+        .filter(Generation.status == 'processing', Generation.backend_url.isnot(None))\
+        .group_by(Generation.backend_url)\
+        .all()
+    for backend_url, count in in_flight:
+        load[backend_url] = {'in_flight': count, 'avg_seconds': None}
+
+    recent = db.session.query(Generation.backend_url, Generation.started_at, Generation.completed_at)\
+        .filter(
+            Generation.status == 'completed',
+            Generation.backend_url.isnot(None),
+            Generation.started_at.isnot(None),
+            Generation.completed_at.isnot(None)
+        )\
+        .order_by(Generation.completed_at.desc())\
+        .limit(sample_size * 10)\
+        .all()
+
+    durations = {}
+    for backend_url, started_at, completed_at in recent:
+        samples = durations.setdefault(backend_url, [])
+        if len(samples) < sample_size:
+            samples.append((completed_at - started_at).total_seconds())
+
+    for backend_url, samples in durations.items():
+        entry = load.setdefault(backend_url, {'in_flight': 0, 'avg_seconds': None})
+        entry['avg_seconds'] = sum(samples) / len(samples)
+
+    return load
+
+
+def get_gpu_backend_usage(hours=24):
+    """
+    Jobs, failures, average latency and estimated cost per GPU provider over the last `hours` hours
+
+    Returns:
+        dict: gpu_backend -> {'jobs', 'failed', 'avg_seconds', 'cost'}
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+    try:
+        rows = db.session.query(
+            Generation.gpu_backend,
+            func.count(Generation.id),
+            func.sum(case((Generation.status == 'failed', 1), else_=0)),
+            func.avg(Generation.gpu_seconds),
+            func.sum(Generation.gpu_cost)
+        ).filter(Generation.gpu_backend.isnot(None), Generation.created_at >= since)\
+            .group_by(Generation.gpu_backend)\
+            .all()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to read GPU backend usage: {e}")
+        return {}
+    return {
+        backend: {
+            'jobs': jobs,
+            'failed': int(failed or 0),
+            'avg_seconds': round(avg_seconds, 1) if avg_seconds is not None else None,
+            'cost': round(cost or 0.0, 4)
+        }
+        for backend, jobs, failed, avg_seconds, cost in rows
+    }
+
+
+def get_hourly_demand(days):
+    """
+    Average generations created per hour of day (UTC) over the last `days` days
+
+    Returns:
+        dict: hour (0-23) -> average generations in that hour
+    """
+    if days <= 0:
+        return {}
+    since = datetime.utcnow() - timedelta(days=days)
+    hour = func.extract('hour', Generation.created_at)
+    counts = db.session.query(hour, func.count(Generation.id))\
+        .filter(Generation.created_at >= since)\
+        .group_by(hour)\
+        .all()
+    return {int(h): count / days for h, count in counts}
@@ -3,7 +3,6 @@ Local ComfyUI Client for Face Morphing App
 Uses the specific workflow_facedetailer.json workflow
 """
 
-import requests
 import json
 import time
 import uuid
@@ -13,12 +12,26 @@ import random
 from io import BytesIO
 from PIL import Image
 from cloudflare_tunnel_detector import get_dynamic_comfyui_url
+from backend_health import health_monitor, COMFYUI_BACKEND, pool_backend_name
+from comfyui_transport import comfyui_get, comfyui_post
+from comfyui_uploads import ensure_uploaded
+from workflow_composer import compose_workflows
+from workflow_registry import workflow_registry
+from gpu_backends import GpuBackend, Submission, TRANSFORM_MODES
+from config import STATUS_HISTORY_MAX_ITEMS
 
 logger = logging.getLogger(__name__)
 
-class LocalComfyUIClient:
-    def __init__(self, base_url=None, workflow_path="comfyui_workflows/workflow_facedetailer.json", timeout=300):
-        """Initialize Local ComfyUI client"""
+CHAD_2_0_WORKFLOW = "comfyui_workflows/workflow_chad_2_0.json"
+FACE_SWAP_WORKFLOW = "comfyui_workflows/face_swap_with_intensity_clean.json"
+
+class LocalComfyUIClient(GpuBackend):
+    backend_name = 'local'
+    transform_modes = TRANSFORM_MODES
+
+    def __init__(self, base_url=None, workflow_path="comfyui_workflows/workflow_facedetailer.json", timeout=300, pinned=False):
+        """Initialize Local ComfyUI client (pinned clients belong to one ComfyUIPool backend and never follow the tunnel URL)"""
+        self.pinned = pinned
         # Use dynamic URL detection if no base_url provided
         if base_url is None:
             self.base_url = get_dynamic_comfyui_url().rstrip('/')
@@ -26,8 +39,6 @@ class LocalComfyUIClient:
             self.base_url = base_url.rstrip('/')
         self.workflow_path = workflow_path
         self.timeout = timeout
-        self.workflow_template = None
-        self.feature_workflows = {}
         self.supported_features = {
             'eyes': {
                 'workflow': 'comfyui_workflows/workflow_custom_eyes.json',
@@ -72,44 +83,55 @@ class LocalComfyUIClient:
         logger.info(f"Default workflow: {self.workflow_path}")
         logger.info(f"Supported features: {', '.join(self.supported_features.keys())}")
     
-    def load_workflow_template(self):
-        """Load the workflow template from file"""
+    @property
+    def workflow_template(self):
+        """Default workflow nodes from the registry (read-only), or None if missing/invalid"""
         try:
-            with open(self.workflow_path, 'r') as f:
-                self.workflow_template = json.load(f)
+            return workflow_registry.get(self.workflow_path).nodes
+        except KeyError:
+            return None
+    
+    @property
+    def feature_workflows(self):
+        """Feature -> workflow nodes from the registry (read-only) for every available feature"""
+        workflows = {}
+        for feature, config in self.supported_features.items():
+            try:
+                workflows[feature] = workflow_registry.get(config['workflow']).nodes
+            except KeyError:
+                pass
+        return workflows
+    
+    def load_workflow_template(self):
+        """Check the default workflow template is in the registry"""
+        if self.workflow_template:
             logger.info(f"Loaded workflow template from {self.workflow_path}")
-        except Exception as e:
-            logger.error(f"Failed to load workflow template: {e}")
-            self.workflow_template = None
+        else:
+            logger.error(f"Failed to load workflow template: {self.workflow_path}")
     
     def load_feature_workflows(self):
-        """Load feature-specific workflows"""
+        """Check feature-specific workflows are in the registry"""
+        feature_workflows = self.feature_workflows
         for feature, config in self.supported_features.items():
-            file_path = config['workflow']
-            try:
-                if os.path.exists(file_path):
-                    with open(file_path, 'r') as f:
-                        self.feature_workflows[feature] = json.load(f)
-                    logger.info(f"Loaded {feature} workflow from {file_path}")
-                else:
-                    logger.warning(f"Feature workflow not found: {file_path}")
-            except Exception as e:
-                logger.error(f"Failed to load {feature} workflow: {e}")
+            if feature not in feature_workflows:
+                logger.warning(f"Feature workflow not found: {config['workflow']}")
         
-        logger.info(f"Loaded {len(self.feature_workflows)} feature-specific workflows")
+        logger.info(f"Loaded {len(feature_workflows)} feature-specific workflows")
     
     def test_connection(self):
-        """Test connection to ComfyUI"""
+        """Check ComfyUI availability from the cached backend health (no inline probe)"""
         try:
-            # Update base_url with latest detected URL
-            self.base_url = get_dynamic_comfyui_url().rstrip('/')
+            if self.pinned:
+                health = health_monitor.get(pool_backend_name(self.base_url))
+            else:
+                # Update base_url with latest known-good URL
+                self.base_url = get_dynamic_comfyui_url().rstrip('/')
+                health = health_monitor.get(COMFYUI_BACKEND)
             
-            response = requests.get(f"{self.base_url}/system_stats", timeout=10)
-            if response.status_code == 200:
-                logger.info(f"ComfyUI connection successful: {self.base_url}")
+            if health.available:
                 return True
             else:
-                logger.warning(f"ComfyUI connection failed with status: {response.status_code} at {self.base_url}")
+                logger.warning(f"ComfyUI backend is {health.status} at {self.base_url}: {health.error}")
                 return False
         except Exception as e:
             logger.error(f"ComfyUI connection test failed: {e} (URL: {self.base_url})")
@@ -129,19 +151,19 @@ class LocalComfyUIClient:
             prompt_id: ComfyUI prompt ID for tracking
         """
         try:
-            # Update URL and test connection first
-            self.base_url = get_dynamic_comfyui_url().rstrip('/')
+            # Check cached backend health (also refreshes base_url)
             if not self.test_connection():
                 logger.error(f"Cannot connect to ComfyUI at {self.base_url}")
                 return None
             
-            # Upload the image to ComfyUI
-            if not self.upload_image(image_path):
+            # Upload the image to ComfyUI (skipped if the backend already has these bytes)
+            image_name = self.upload_image(image_path)
+            if not image_name:
                 logger.error("Failed to upload image to ComfyUI")
                 return None
             
             # Prepare the workflow with the uploaded image
-            workflow = self._prepare_workflow(image_path, denoise_strength, preset_name, selected_features)
+            workflow = self._prepare_workflow(image_name, denoise_strength, preset_name, selected_features)
             if not workflow:
                 logger.error("Failed to prepare workflow")
                 return None
@@ -163,15 +185,15 @@ class LocalComfyUIClient:
         """Queue a workflow in ComfyUI"""
         try:
             prompt_id = str(uuid.uuid4())
+            # No client_id: ComfyUI then broadcasts progress to every /ws subscriber
+            # (see comfyui_progress.py), not just to the socket that queued the prompt
             payload = {
-                "prompt": workflow,
-                "client_id": prompt_id
+                "prompt": workflow
             }
             
-            response = requests.post(
+            response = comfyui_post(
                 f"{self.base_url}/prompt",
-                json=payload,
-                timeout=self.timeout
+                json=payload
             )
             response.raise_for_status()
             
@@ -184,25 +206,31 @@ class LocalComfyUIClient:
             logger.error(f"Failed to queue workflow: {e}")
             return None
     
+    @staticmethod
+    def _history_status(job_data):
+        """COMPLETED / FAILED for a prompt found in /history"""
+        if job_data.get('outputs'):
+            return "COMPLETED"
+        return "FAILED"
+    
     def get_job_status(self, prompt_id):
         """Get job status"""
         try:
-            response = requests.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
+            response = comfyui_get(f"{self.base_url}/history/{prompt_id}")
             response.raise_for_status()
             
             history = response.json()
             if prompt_id in history:
                 # Check if the job completed successfully
-                job_data = history[prompt_id]
-                if 'outputs' in job_data and job_data['outputs']:
+                status = self._history_status(history[prompt_id])
+                if status == "COMPLETED":
                     logger.info(f"Job {prompt_id} completed successfully")
-                    return "COMPLETED"
                 else:
                     logger.warning(f"Job {prompt_id} completed but no outputs found")
-                    return "FAILED"
+                return status
             else:
                 # Check queue status
-                queue_response = requests.get(f"{self.base_url}/queue", timeout=10)
+                queue_response = comfyui_get(f"{self.base_url}/queue", 'probe')
                 if queue_response.status_code == 200:
                     queue_data = queue_response.json()
                     
@@ -225,179 +253,313 @@ class LocalComfyUIClient:
             logger.error(f"Status check failed for {prompt_id}: {e}")
             return "FAILED"
     
-    def get_job_output(self, prompt_id):
-        """Get job output - prioritizes final result nodes"""
+    def get_bulk_status(self, prompt_ids, max_items=STATUS_HISTORY_MAX_ITEMS):
+        """
+        Status of many prompts from one /queue and one /history?max_items=K fetch
+        
+        /queue is read first so a prompt finishing in between shows up in one of the two.
+        Prompts in neither (older than the history window) are looked up individually.
+        
+        Returns:
+            dict: prompt_id -> COMPLETED / FAILED / IN_PROGRESS, or None if the backend could not be read
+        """
         try:
-            response = requests.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
-            response.raise_for_status()
+            queue_response = comfyui_get(f"{self.base_url}/queue", 'probe')
+            queue_response.raise_for_status()
+            queue_data = queue_response.json()
             
-            history = response.json()
-            if prompt_id not in history:
-                logger.error(f"Job {prompt_id} not found in history")
+            history_response = comfyui_get(f"{self.base_url}/history", 'poll', params={'max_items': max_items})
+            history_response.raise_for_status()
+            history = history_response.json()
+        except Exception as e:
+            logger.warning(f"Bulk status check failed for {self.base_url}: {e}")
+            return None
+        
+        queued = {item[1] for item in queue_data.get('queue_running', []) + queue_data.get('queue_pending', [])}
+        statuses = {}
+        
+        for prompt_id in prompt_ids:
+            if prompt_id in history:
+                statuses[prompt_id] = self._history_status(history[prompt_id])
+            elif prompt_id in queued:
+                statuses[prompt_id] = "IN_PROGRESS"
+            else:
+                try:
+                    response = comfyui_get(f"{self.base_url}/history/{prompt_id}")
+                    response.raise_for_status()
+                    job_data = response.json().get(prompt_id)
+                except Exception as e:
+                    logger.warning(f"Status check failed for {prompt_id}: {e}")
+                    continue
+                # Not in the queue or history - same assumption as get_job_status()
+                statuses[prompt_id] = self._history_status(job_data) if job_data else "IN_PROGRESS"
+        
+        return statuses
+    
+    def _find_output_image(self, prompt_id, output_node=None):
+        """/view params of a job's result image - prioritizes final result nodes (only output_node for batched prompts)"""
+        response = comfyui_get(f"{self.base_url}/history/{prompt_id}")
+        response.raise_for_status()
+        
+        history = response.json()
+        if prompt_id not in history:
+            logger.error(f"Job {prompt_id} not found in history")
+            return None
+        
+        # Find output images
+        outputs = history[prompt_id].get('outputs', {})
+        
+        # Priority order for output nodes:
+        # 1. Node 10 - "Save final result" (custom features with compositing)
+        # 2. Node 9 - "Save Image" (default workflow)
+        # 3. Any other node with images (fallback)
+        
+        priority_nodes = [output_node] if output_node else ["10", "9"]
+        
+        # First, try priority nodes
+        for priority_node in priority_nodes:
+            if priority_node in outputs and outputs[priority_node].get('images'):
+                image_info = outputs[priority_node]['images'][0]
+                logger.info(f"Found output image in node {priority_node} for {prompt_id}: {image_info['filename']}")
+                return {
+                    'filename': image_info['filename'],
+                    'subfolder': image_info.get('subfolder', ''),
+                    'type': 'output'
+                }
+        
+        # Batched prompts hold other generations' images in their other nodes
+        if output_node:
+            logger.error(f"No output image in node {output_node} for job {prompt_id}")
+            return None
+        
+        # Fallback: try any node with images
+        for node_id, node_output in outputs.items():
+            if node_output.get('images'):
+                image_info = node_output['images'][0]
+                logger.info(f"Found output image in fallback node {node_id} for {prompt_id}: {image_info['filename']}")
+                return {
+                    'filename': image_info['filename'],
+                    'subfolder': image_info.get('subfolder', ''),
+                    'type': 'output'
+                }
+        
+        logger.error(f"No output images found for job {prompt_id}")
+        return None
+    
+    def open_job_output(self, prompt_id, output_node=None):
+        """
+        Start downloading a job's result image without buffering it
+        
+        Returns:
+            requests.Response opened with stream=True (caller must iterate and close it), or None
+        """
+        try:
+            params = self._find_output_image(prompt_id, output_node)
+            if not params:
                 return None
             
-            # Find output images
-            outputs = history[prompt_id].get('outputs', {})
-            
-            # Priority order for output nodes:
-            # 1. Node 10 - "Save final result" (custom features with compositing)
-            # 2. Node 9 - "Save Image" (default workflow)
-            # 3. Any other node with images (fallback)
-            
-            priority_nodes = ["10", "9"]
-            
-            # First, try priority nodes
-            for priority_node in priority_nodes:
-                if priority_node in outputs and 'images' in outputs[priority_node]:
-                    for image_info in outputs[priority_node]['images']:
-                        filename = image_info['filename']
-                        subfolder = image_info.get('subfolder', '')
-                        
-                        # Download the image
-                        params = {
-                            'filename': filename,
-                            'subfolder': subfolder,
-                            'type': 'output'
-                        }
-                        
-                        img_response = requests.get(f"{self.base_url}/view", params=params, timeout=30)
-                        img_response.raise_for_status()
-                        
-                        logger.info(f"Successfully retrieved output image from node {priority_node} for {prompt_id}: {filename}")
-                        return img_response.content
-            
-            # Fallback: try any node with images
-            for node_id, node_output in outputs.items():
-                if 'images' in node_output:
-                    for image_info in node_output['images']:
-                        filename = image_info['filename']
-                        subfolder = image_info.get('subfolder', '')
-                        
-                        # Download the image
-                        params = {
-                            'filename': filename,
-                            'subfolder': subfolder,
-                            'type': 'output'
-                        }
-                        
-                        img_response = requests.get(f"{self.base_url}/view", params=params, timeout=30)
-                        img_response.raise_for_status()
-                        
-                        logger.info(f"Successfully retrieved output image from fallback node {node_id} for {prompt_id}: {filename}")
-                        return img_response.content
-            
-            logger.error(f"No output images found for job {prompt_id}")
-            return None
+            img_response = comfyui_get(f"{self.base_url}/view", 'transfer', params=params, stream=True)
+            img_response.raise_for_status()
+            return img_response
             
         except Exception as e:
             logger.error(f"Failed to get job output for {prompt_id}: {e}")
             return None
     
+    def get_job_output(self, prompt_id, output_node=None):
+        """Get job output image bytes (see open_job_output for the streaming variant)"""
+        img_response = self.open_job_output(prompt_id, output_node)
+        if img_response is None:
+            return None
+        try:
+            return img_response.content
+        except Exception as e:
+            logger.error(f"Failed to download job output for {prompt_id}: {e}")
+            return None
+        finally:
+            img_response.close()
+    
+    def delete_history(self, prompt_id):
+        """Drop a finished prompt from ComfyUI's /history once its output is saved"""
+        try:
+            response = comfyui_post(f"{self.base_url}/history", 'poll', json={'delete': [prompt_id]})
+            response.raise_for_status()
+            logger.info(f"Pruned {prompt_id} from ComfyUI history")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to prune {prompt_id} from ComfyUI history: {e}")
+            return False
+    
     def upload_image(self, image_path):
-        """Upload image to ComfyUI input folder"""
+        """
+        Upload image to ComfyUI input folder under its content hash
+        
+        Returns:
+            str: Uploaded file name to reference from LoadImage, or None on failure
+        """
         try:
-            filename = os.path.basename(image_path)
-            
-            with open(image_path, 'rb') as f:
-                files = {
-                    'image': (filename, f, 'image/jpeg'),
-                    'overwrite': (None, 'true')
-                }
-                response = requests.post(f"{self.base_url}/upload/image", files=files, timeout=30)
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"Uploaded image to ComfyUI: {filename}")
-                return True
-                
+            return ensure_uploaded(self.base_url, image_path)
         except Exception as e:
             logger.error(f"Failed to upload image: {e}")
-            return False
+            return None
     
     def _prepare_workflow(self, image_path, denoise_strength, preset_name, selected_features=None):
         """Prepare ComfyUI workflow using feature-specific workflows"""
         try:
-            # Get image filename
-            image_filename = os.path.basename(image_path)
-            
             # Generate unique seed for each run
             unique_seed = random.randint(1, 2**32 - 1)
             timestamp = int(time.time())
+            slot_values = {
+                'input_image': os.path.basename(image_path),
+                'seed': unique_seed
+            }
             
             # Check for CHAD 2.0 mode first
             if preset_name == "CHAD_2_0":
-                chad_2_0_workflow_path = "comfyui_workflows/workflow_chad_2_0.json"
-                if os.path.exists(chad_2_0_workflow_path):
-                    with open(chad_2_0_workflow_path, 'r') as f:
-                        workflow = json.load(f)
-                    actual_denoise = denoise_strength
-                    logger.info(f"Using CHAD 2.0 workflow with SD XL + custom LoRA, denoise {denoise_strength}")
-                else:
-                    logger.error(f"CHAD 2.0 workflow not found: {chad_2_0_workflow_path}")
-                    return None
+                template_path = CHAD_2_0_WORKFLOW
+                actual_denoise = denoise_strength
+                slot_values['save_prefix'] = f"morph_{preset_name}_{timestamp}"
+                logger.info(f"Using CHAD 2.0 workflow with SD XL + custom LoRA, denoise {denoise_strength}")
             # For selected features, use feature-specific workflows
             elif selected_features and len(selected_features) == 1:
                 feature = selected_features[0]
-                if feature in self.feature_workflows:
-                    workflow = json.loads(json.dumps(self.feature_workflows[feature]))
-                    # Use per-feature denoise if provided, default to 0.3 for backward compatibility
-                    actual_denoise = self.supported_features.get(feature, {}).get('denoise', 0.3)
-                    logger.info(f"Using feature-specific workflow for {feature} with denoise {actual_denoise}")
-                else:
+                if feature not in self.supported_features:
                     logger.error(f"No workflow found for feature: {feature}")
                     return None
+                feature_config = self.supported_features[feature]
+                template_path = feature_config['workflow']
+                # Use per-feature denoise if provided, default to 0.3 for backward compatibility
+                actual_denoise = feature_config.get('denoise', 0.3)
+                slot_values['save_prefix'] = f"morph_{feature}_{timestamp}"
+                # Masked feature templates take the FaceSegmentation parameters
+                if workflow_registry.get(template_path).has_slot('area'):
+                    slot_values.update(area=feature_config['area'], grow=feature_config['grow'], blur=feature_config['blur'])
+                logger.info(f"Using feature-specific workflow for {feature} with denoise {actual_denoise}")
+            # Several features - chain their workflows into one graph (one GPU pass)
+            elif selected_features:
+                return self._prepare_multi_feature_workflow(image_path, preset_name, selected_features)
             else:
-                # Use default workflow for full face or multiple features
-                if not self.workflow_template:
-                    logger.error("No default workflow template loaded")
-                    return None
-                workflow = json.loads(json.dumps(self.workflow_template))
+                # Use default workflow for full face
+                template_path = self.workflow_path
                 actual_denoise = denoise_strength
+                slot_values['save_prefix'] = f"morph_{preset_name}_{timestamp}"
                 logger.info(f"Using default workflow with denoise {denoise_strength}")
             
-            # Update LoadImage node (node 5) with the uploaded image
-            if "5" in workflow:
-                workflow["5"]["inputs"]["image"] = image_filename
-                logger.info(f"Set input image to: {image_filename}")
-            
-            # Update FaceSegmentation node (node 6) with feature-specific parameters
-            if selected_features and len(selected_features) == 1:
-                feature = selected_features[0]
-                if feature in self.supported_features and "6" in workflow:
-                    feature_config = self.supported_features[feature]
-                    workflow["6"]["inputs"]["area"] = feature_config["area"]
-                    workflow["6"]["inputs"]["grow"] = feature_config["grow"]
-                    workflow["6"]["inputs"]["blur"] = feature_config["blur"]
-                    logger.info(f"Updated FaceSegmentation for {feature}: area={feature_config['area']}, grow={feature_config['grow']}, blur={feature_config['blur']}")
-            
-            # Update FaceDetailer node (node 8) with denoise strength and seed
-            if "8" in workflow:
-                workflow["8"]["inputs"]["denoise"] = actual_denoise
-                workflow["8"]["inputs"]["seed"] = unique_seed
-                logger.info(f"Set FaceDetailer denoise to {actual_denoise} and seed to {unique_seed}")
-            
-            # Update SaveImage node with custom filename
-            # For custom features (node 10), for default workflow (node 9)
-            save_node = "10" if selected_features and len(selected_features) == 1 else "9"
-            if save_node in workflow:
-                if selected_features:
-                    features_str = '_'.join(selected_features)
-                    workflow[save_node]["inputs"]["filename_prefix"] = f"morph_{features_str}_{timestamp}"
-                    logger.info(f"Set output filename prefix in node {save_node} to: morph_{features_str}_{timestamp}")
-                else:
-                    workflow[save_node]["inputs"]["filename_prefix"] = f"morph_{preset_name}_{timestamp}"
-                    logger.info(f"Set output filename prefix in node {save_node} to: morph_{preset_name}_{timestamp}")
+            workflow = workflow_registry.bind(template_path, denoise=actual_denoise, **slot_values)
             
             if selected_features:
-                logger.info(f"Prepared workflow for features {', '.join(selected_features)} with denoise {actual_denoise}")
+                logger.info(f"Prepared workflow for features {', '.join(selected_features)} with denoise {actual_denoise} and seed {unique_seed}")
             else:
-                logger.info(f"Prepared workflow for {preset_name} with denoise {actual_denoise}")
+                logger.info(f"Prepared workflow for {preset_name} with denoise {actual_denoise} and seed {unique_seed}")
             return workflow
             
+        except KeyError as e:
+            logger.error(f"Workflow template unavailable: {e}")
+            return None
         except Exception as e:
             logger.error(f"Failed to prepare workflow: {e}")
             return None
     
+    def _prepare_multi_feature_workflow(self, image_path, preset_name, selected_features):
+        """Bind each feature's workflow, then compose them into a single prompt graph"""
+        available = self.feature_workflows
+        missing = [feature for feature in selected_features if feature not in available]
+        if missing:
+            logger.error(f"No workflow found for features: {', '.join(missing)}")
+            return None
+        
+        # Skull is a whole-face pass that restores the original eyes/nose/mouth - run it first
+        ordered_features = sorted(selected_features, key=lambda feature: feature != 'skull')
+        stages = []
+        for feature in ordered_features:
+            stage = self._prepare_workflow(image_path, None, preset_name, [feature])
+            if not stage:
+                return None
+            stages.append(stage)
+        
+        features_str = '_'.join(selected_features)
+        workflow = compose_workflows(stages, f"morph_{features_str}_{int(time.time())}")
+        logger.info(f"Prepared single-pass workflow for features {', '.join(ordered_features)}")
+        return workflow
+    
+    def generate_batch(self, jobs):
+        """
+        Queue several full-face jobs as one prompt that shares the model nodes
+
+        Args:
+            jobs: List of dicts with image_path, preset_name and denoise_strength
+
+        Returns:
+            (prompt_id, output_nodes): output_nodes[i] is the SaveImage node for jobs[i];
+            (None, []) on failure
+        """
+        try:
+            if not self.test_connection():
+                logger.error(f"Cannot connect to ComfyUI at {self.base_url}")
+                return None, []
+
+            uploaded_jobs = []
+            for job in jobs:
+                image_name = self.upload_image(job['image_path'])
+                if not image_name:
+                    logger.error(f"Failed to upload batch image to ComfyUI: {job['image_path']}")
+                    return None, []
+                uploaded_jobs.append(dict(job, image_path=image_name))
+
+            workflow, output_nodes = self._prepare_batch_workflow(uploaded_jobs)
+            if not workflow:
+                logger.error("Failed to prepare batch workflow")
+                return None, []
+
+            prompt_id = self.queue_workflow(workflow)
+            if prompt_id:
+                logger.info(f"Started batched local ComfyUI generation: {prompt_id} ({len(jobs)} images)")
+                return prompt_id, output_nodes
+            else:
+                logger.error("Failed to queue batch workflow")
+                return None, []
+
+        except Exception as e:
+            logger.error(f"Local ComfyUI batch generation failed: {e}")
+            return None, []
+
+    def _prepare_batch_workflow(self, jobs):
+        """
+        Merge per-job default workflows into one graph
+
+        Checkpoint, LoRA, prompt, detector and SAM nodes are shared; every job gets its own
+        LoadImage -> FaceDetailer -> SaveImage branch with its image, denoise and seed.
+        """
+        template = workflow_registry.get(self.workflow_path)
+        branch_nodes = template.slot_nodes('input_image', 'denoise', 'save_prefix')
+        branch_output, = template.slot_nodes('save_prefix')
+        workflow = None
+        output_nodes = []
+
+        for job in jobs:
+            job_workflow = self._prepare_workflow(job['image_path'], job['denoise_strength'], job['preset_name'])
+            if not job_workflow:
+                return None, []
+
+            if workflow is None:
+                workflow = job_workflow
+                output_nodes.append(branch_output)
+                continue
+
+            # Copy this job's branch under fresh node ids and point its links at the copies
+            next_id = max(int(node_id) for node_id in workflow if node_id.isdigit()) + 1
+            renamed = {node_id: str(next_id + offset) for offset, node_id in enumerate(branch_nodes)}
+            for node_id, new_id in renamed.items():
+                node = json.loads(json.dumps(job_workflow[node_id]))
+                for name, value in node['inputs'].items():
+                    if isinstance(value, list) and value and value[0] in renamed:
+                        node['inputs'][name] = [renamed[value[0]]] + value[1:]
+                workflow[new_id] = node
+            output_nodes.append(renamed[branch_output])
+
+        logger.info(f"Prepared batch workflow with {len(jobs)} FaceDetailer branches")
+        return workflow, output_nodes
+
     def generate_image_with_features(self, image_path, selected_features, denoise_strength=0.3):
         """
         Generate image with specific features selected
@@ -431,53 +593,32 @@ class LocalComfyUIClient:
             prompt_id: ComfyUI prompt ID for tracking
         """
         try:
-            # Update URL and test connection first
-            self.base_url = get_dynamic_comfyui_url().rstrip('/')
+            # Check cached backend health (also refreshes base_url)
             if not self.test_connection():
                 logger.error(f"Cannot connect to ComfyUI at {self.base_url}")
                 return None
             
-            # Load clean face swap workflow
-            face_swap_workflow_path = "comfyui_workflows/face_swap_with_intensity_clean.json"
-            if not os.path.exists(face_swap_workflow_path):
-                logger.error(f"Face swap workflow not found: {face_swap_workflow_path}")
-                return None
-            
-            with open(face_swap_workflow_path, 'r') as f:
-                workflow = json.load(f)
-            
-            # Upload both images to ComfyUI
-            if not self.upload_image(original_image_path):
+            # Upload both images to ComfyUI (reference chads are normally pre-seeded)
+            original_name = self.upload_image(original_image_path)
+            if not original_name:
                 logger.error("Failed to upload original image to ComfyUI")
                 return None
             
-            if not self.upload_image(reference_image_path):
+            reference_name = self.upload_image(reference_image_path)
+            if not reference_name:
                 logger.error("Failed to upload reference image to ComfyUI")
                 return None
             
-            # Get filenames
-            original_filename = os.path.basename(original_image_path)
-            reference_filename = os.path.basename(reference_image_path)
-            
-            # Generate unique timestamp
+            # Bind the clean face swap workflow: original image, source face, ReActor weight, output prefix
             timestamp = int(time.time())
-            
-            # Update the clean workflow with our images and settings
-            # Node 1: Original image (Load Original Image)
-            workflow["1"]["inputs"]["image"] = original_filename
-            logger.info(f"Set original image in node 1: {original_filename}")
-            
-            # Node 2: Source image (Load Source Face Image)  
-            workflow["2"]["inputs"]["image"] = reference_filename
-            logger.info(f"Set reference image in node 2: {reference_filename}")
-            
-            # Node 3: Set face swap intensity (ReActorSetWeight)
-            workflow["3"]["inputs"]["faceswap_weight"] = swap_intensity
-            logger.info(f"Set face swap intensity in node 3: {swap_intensity}")
-            
-            # Node 5: Set output filename (SaveImage)
-            workflow["5"]["inputs"]["filename_prefix"] = f"face_swap_{timestamp}"
-            logger.info(f"Set output filename prefix in node 5: face_swap_{timestamp}")
+            workflow = workflow_registry.bind(
+                FACE_SWAP_WORKFLOW,
+                input_image=original_name,
+                reference_image=reference_name,
+                swap_weight=swap_intensity,
+                save_prefix=f"face_swap_{timestamp}"
+            )
+            logger.info(f"Prepared face swap workflow (intensity: {swap_intensity}, prefix: face_swap_{timestamp})")
             
             # Queue the workflow
             prompt_id = self.queue_workflow(workflow)
@@ -492,10 +633,55 @@ class LocalComfyUIClient:
             logger.error(f"Face swap generation failed: {e}")
             return None
     
+    def submit(self, job):
+        """Queue a GpuJob with the workflow for its transform mode"""
+        if job.transform_mode == 'chad_2_0':
+            # CHAD 2.0 mode - use SD XL + custom LoRA workflow
+            prompt_id = self.generate_image(image_path=job.image_path, preset_name="CHAD_2_0", denoise_strength=job.denoise)
+            logger.info(f"CHAD 2.0 generation started with {job.denoise} denoise")
+        
+        elif job.transform_mode == 'reference' and job.reference_image_path:
+            # Reference Chad mode - face swap, intensity (0.0 to 1.0) as a percentage string
+            if not os.path.exists(job.reference_image_path):
+                return Submission(error=f'Reference chad image not found: {os.path.basename(job.reference_image_path)}')
+            intensity_percent = f"{int(job.face_swap_intensity * 100)}%"
+            prompt_id = self.generate_image_with_face_swap(
+                original_image_path=job.image_path,
+                reference_image_path=job.reference_image_path,
+                swap_intensity=intensity_percent
+            )
+            logger.info(f"Reference chad generation started: {job.reference_image_path} with {intensity_percent} intensity")
+        
+        elif job.transform_mode == 'custom' and job.selected_features:
+            # Custom features mode - fixed 30% intensity, as the UI says
+            prompt_id = self.generate_image_with_features(
+                image_path=job.image_path,
+                selected_features=job.selected_features,
+                denoise_strength=0.3
+            )
+            logger.info(f"Custom features generation started: {'_'.join(job.selected_features)} with 0.3 denoise")
+        
+        else:
+            # Full face transformation mode
+            prompt_id = self.generate_image(image_path=job.image_path, preset_name=job.preset, denoise_strength=job.denoise)
+        
+        if not prompt_id:
+            return Submission(error='Failed to start ComfyUI generation')
+        return Submission(job_id=prompt_id)
+    
+    def cancel(self, prompt_id):
+        """Drop a prompt that is still waiting in ComfyUI's queue"""
+        try:
+            response = comfyui_post(f"{self.base_url}/queue", 'probe', json={"delete": [prompt_id]})
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning(f"Could not cancel ComfyUI prompt {prompt_id}: {e}")
+            return False
+    
     def clear_queue(self):
         """Clear ComfyUI queue"""
         try:
-            response = requests.post(f"{self.base_url}/queue", json={"clear": True}, timeout=10)
+            response = comfyui_post(f"{self.base_url}/queue", 'probe', json={"clear": True})
             if response.status_code == 200:
                 logger.info("Cleared ComfyUI queue")
                 return True
@@ -10,16 +10,20 @@ import time
 import logging
 from PIL import Image
 from typing import Tuple, Optional
+from gpu_backends import GpuBackend, GpuJob, Submission
 
 logger = logging.getLogger(__name__)
 
-class ModalMorphClient:
+class ModalMorphClient(GpuBackend):
     """Client for Modal.com face morphing service"""
     
+    backend_name = 'modal'
+    synchronous = True
+    
     def __init__(self):
         """Initialize Modal client"""
         self.app_name = "face-morph-simple"
-        self.function_name = "generate_face_morph"
+        self.class_name = "ComfyUIMorph"  # Keeps ComfyUI running in warm containers between calls
         self.modal = None
         self.app = None
         self.token_configured = False
@@ -42,10 +46,10 @@ class ModalMorphClient:
             # Only try to lookup function if token is configured
             if self.token_configured:
                 try:
-                    self.generate_func = modal.Function.lookup(self.app_name, self.function_name)
+                    self.generate_func = modal.Cls.lookup(self.app_name, self.class_name)().generate
                     logger.info("Modal client initialized successfully")
                 except Exception as e:
-                    logger.warning(f"Modal function '{self.function_name}' not found. Please deploy it first: {e}")
+                    logger.warning(f"Modal class '{self.class_name}' not found. Please deploy it first: {e}")
                     self.generate_func = None
             else:
                 logger.info("Modal client initialized but not authenticated")
@@ -132,6 +136,14 @@ class ModalMorphClient:
             logger.error(f"Modal generation error: {e}")
             return None, str(e)
     
+    def submit(self, job: GpuJob) -> Submission:
+        """Run a GpuJob (blocks until Modal returns the image)"""
+        if not self.token_configured:
+            return Submission(error='Modal.com not configured. Please set up authentication token.')
+        if not self.app:
+            return Submission(error='Modal.com app not deployed.')
+        return self.submit_preset(job)
+    
     def get_job_status(self, job_id: str) -> str:
         """
         Get job status (Modal completes synchronously, so always return COMPLETED)
@@ -169,8 +181,8 @@ class ModalMorphClient:
             dict: Cost information
         """
         # Modal T4 pricing: ~$0.0004/second
-        # Estimated generation time: 60-120 seconds
-        estimated_time = 90  # seconds
+        # Estimated generation time: 20-40 seconds on a warm container (first call adds the ComfyUI boot)
+        estimated_time = 30  # seconds
         cost_per_second = 0.0004
         estimated_cost = estimated_time * cost_per_second
         
@@ -0,0 +1,149 @@
+"""
+Persistent ComfyUI server for the Modal apps (modal_face_morph.py, modal_face_morph_simple.py)
+Runs inside the Modal container. The app class starts it once in its @modal.enter hook and
+every prompt the warm container serves reuses it - only the container's first request waits
+for ComfyUI to boot and load models.
+
+Models are read in place from the mounted volume through extra_model_paths.yaml instead of
+being copied into ComfyUI on every call.
+"""
+
+import os
+import time
+import threading
+import subprocess
+import requests
+
+COMFYUI_DIR = "/root/ComfyUI"
+COMFYUI_URL = "http://127.0.0.1:8188"
+
+# ComfyUI model folder -> directory inside the models volume (see upload_models_to_modal.py)
+VOLUME_MODEL_PATHS = {
+    "checkpoints": "base_models",
+    "loras": "lora",
+    "vae": "vae",
+}
+
+
+def write_extra_model_paths(models_root="/models", comfyui_dir=COMFYUI_DIR, model_paths=VOLUME_MODEL_PATHS):
+    """Point ComfyUI at the volume's model folders (read in place, nothing copied)"""
+    lines = ["volume:", f"    base_path: {models_root}"]
+    lines += [f"    {folder}: {subdir}" for folder, subdir in model_paths.items()]
+    path = os.path.join(comfyui_dir, "extra_model_paths.yaml")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def link_workflows(source="/models/comfyui_workflows", comfyui_dir=COMFYUI_DIR):
+    """Symlink workflow templates from the volume into the ComfyUI folder"""
+    if not os.path.isdir(source):
+        return 0
+    linked = 0
+    for name in os.listdir(source):
+        target = os.path.join(comfyui_dir, name)
+        if not os.path.lexists(target):
+            os.symlink(os.path.join(source, name), target)
+            linked += 1
+    return linked
+
+
+def execution_error(status):
+    """Exception message from a failed prompt's /history status"""
+    for message_type, data in status.get("messages") or []:
+        if message_type == "execution_error":
+            return f"{data.get('node_type', 'node')}: {data.get('exception_message', 'unknown error')}".strip()
+    return "execution error"
+
+
+class ComfyUIServer:
+    """One ComfyUI process on localhost, kept running for the container's lifetime"""
+
+    def __init__(self, comfyui_dir=COMFYUI_DIR, url=COMFYUI_URL):
+        self.comfyui_dir = comfyui_dir
+        self.url = url
+        self.process = None
+        self.session = requests.Session()  # Keep-alive to localhost across prompts
+        self._lock = threading.Lock()  # Concurrent inputs must not each launch their own ComfyUI
+
+    def is_ready(self):
+        try:
+            return self.session.get(f"{self.url}/system_stats", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def start(self, timeout=180):
+        """Launch ComfyUI and wait until it answers; raises RuntimeError if it does not"""
+        with self._lock:
+            self._start(timeout)
+
+    def _start(self, timeout):
+        started = time.time()
+        self.process = subprocess.Popen([
+            "python", os.path.join(self.comfyui_dir, "main.py"),
+            "--listen", "127.0.0.1",
+            "--port", self.url.rsplit(":", 1)[-1],
+            "--disable-auto-launch"
+        ], cwd=self.comfyui_dir, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+        while time.time() - started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"ComfyUI exited during startup (code {self.process.returncode})")
+            if self.is_ready():
+                print(f"✅ ComfyUI server ready after {time.time() - started:.1f}s")
+                return
+            time.sleep(1)
+
+        self._stop()
+        raise RuntimeError(f"ComfyUI server failed to start within {timeout}s")
+
+    def ensure_running(self):
+        """Restart ComfyUI if the process died between prompts (once, however many inputs notice)"""
+        with self._lock:
+            if self.process is None or self.process.poll() is not None:
+                print("⚠️ ComfyUI server is not running, restarting...")
+                self._start(timeout=180)
+
+    def run_prompt(self, workflow, client_id, timeout=300, poll_interval=1):
+        """
+        Queue a workflow and wait for it to finish
+
+        Returns:
+            dict: The prompt's /history entry
+
+        Raises:
+            RuntimeError: Queueing failed, the prompt failed in ComfyUI or did not finish within timeout
+        """
+        self.ensure_running()
+        response = self.session.post(f"{self.url}/prompt", json={"prompt": workflow, "client_id": client_id}, timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to queue workflow: {response.text}")
+        prompt_id = response.json().get("prompt_id", client_id)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            response = self.session.get(f"{self.url}/history/{prompt_id}", timeout=10)
+            if response.status_code == 200 and prompt_id in response.json():
+                history = response.json()[prompt_id]
+                # Keep /history small on a container that serves many prompts
+                self.session.post(f"{self.url}/history", json={"delete": [prompt_id]}, timeout=10)
+                status = history.get("status") or {}
+                if status.get("status_str") == "error":
+                    raise RuntimeError(f"ComfyUI prompt failed: {execution_error(status)}")
+                return history
+            time.sleep(poll_interval)
+        raise RuntimeError("Generation timed out")
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+        except Exception:
+            self.process.kill()
+        self.process = None
@@ -70,158 +70,104 @@ comfyui_image = (
     ])
 )
 
-@app.function(
+# Containers stay up this long after their last prompt, so back-to-back generations skip
+# the ComfyUI boot entirely
+CONTAINER_IDLE_TIMEOUT = 300
+# Prompts one container accepts at once (ComfyUI queues them on its single GPU)
+CONCURRENT_PROMPTS = 4
+
+@app.cls(
     image=comfyui_image,
     volumes={"/models": models_volume},
+    mounts=[modal.Mount.from_local_python_packages("modal_comfyui_server")],
     gpu="T4",  # T4 for cost efficiency, can upgrade to A10G for speed
     timeout=600,  # 10 minutes max
     memory=16384,  # 16GB RAM
-    cpu=4
+    cpu=4,
+    container_idle_timeout=CONTAINER_IDLE_TIMEOUT,
+    allow_concurrent_inputs=CONCURRENT_PROMPTS
 )
-def generate_face_morph(image_b64: str, preset_key: str, denoise_strength: float = 0.15):
-    """
-    Generate face morph using ComfyUI with custom models
-    
-    Args:
-        image_b64: Base64 encoded input image
-        preset_key: Preset key (tier1, tier2, chad)
-        denoise_strength: Denoise strength (0.10-0.25)
-    
-    Returns:
-        tuple: (result_image_b64, error_message)
-    """
-    import subprocess
-    import threading
-    import queue
-    import uuid
-    
-    try:
-        print(f"🚀 Starting face morph generation with preset: {preset_key}")
-        
-        # Decode input image
-        image_data = base64.b64decode(image_b64)
-        input_image = Image.open(io.BytesIO(image_data))
-        
-        # Save input image
-        input_filename = f"input_{uuid.uuid4().hex}.png"
-        input_path = f"/root/ComfyUI/input/{input_filename}"
-        input_image.save(input_path)
-        
-        print(f"✅ Input image saved: {input_path}")
-        
-        # Copy models from persistent volume to ComfyUI
-        print("📁 Copying models from persistent storage...")
-        os.system("cp -r /models/lora/* /root/ComfyUI/models/loras/ 2>/dev/null || true")
-        os.system("cp -r /models/base_models/* /root/ComfyUI/models/checkpoints/ 2>/dev/null || true")
-        os.system("cp -r /models/comfyui_workflows/* /root/ComfyUI/ 2>/dev/null || true")
-        
-        # Start ComfyUI server
-        print("🔧 Starting ComfyUI server...")
-        comfyui_process = subprocess.Popen([
-            "python", "/root/ComfyUI/main.py", 
-            "--listen", "127.0.0.1", 
-            "--port", "8188",
-            "--disable-auto-launch"
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        # Wait for server to start
-        max_wait = 60  # 60 seconds max wait
-        wait_time = 0
-        server_ready = False
-        
-        while wait_time < max_wait:
-            try:
-                response = requests.get("http://127.0.0.1:8188/system_stats", timeout=2)
-                if response.status_code == 200:
-                    server_ready = True
-                    break
-            except:
-                pass
-            time.sleep(2)
-            wait_time += 2
-            print(f"⏳ Waiting for ComfyUI server... ({wait_time}s)")
+class ComfyUIMorph:
+    """Face morphing with custom models - one ComfyUI server per container, reused for every prompt"""
+
+    @modal.enter()
+    def start_comfyui(self):
+        """Runs once per container: models are read from the volume in place, then ComfyUI boots"""
+        from modal_comfyui_server import ComfyUIServer, write_extra_model_paths, link_workflows
+
+        write_extra_model_paths()
+        link_workflows()
+        self.server = ComfyUIServer()
+        self.server.start()
+
+    @modal.exit()
+    def stop_comfyui(self):
+        self.server.stop()
+
+    @modal.method()
+    def generate(self, image_b64: str, preset_key: str, denoise_strength: float = 0.15):
+        """
+        Generate face morph using ComfyUI with custom models
         
-        if not server_ready:
-            return None, "ComfyUI server failed to start"
+        Args:
+            image_b64: Base64 encoded input image
+            preset_key: Preset key (tier1, tier2, chad)
+            denoise_strength: Denoise strength (0.10-0.25)
         
-        print("✅ ComfyUI server ready!")
+        Returns:
+            tuple: (result_image_b64, error_message)
+        """
+        import uuid
         
-        # Load workflow template
-        workflow_file = "workflow_facedetailer.json"  # Use FaceDetailer workflow
+        input_path = None
         try:
-            with open(f"/root/ComfyUI/{workflow_file}", 'r') as f:
-                workflow = json.load(f)
-        except:
-            # Fallback to basic workflow
-            workflow = create_basic_workflow(input_filename, preset_key, denoise_strength)
-        
-        # Update workflow parameters
-        workflow = update_workflow_parameters(workflow, input_filename, preset_key, denoise_strength)
-        
-        # Queue workflow
-        print("🎯 Queuing workflow...")
-        prompt_id = str(uuid.uuid4())
-        payload = {
-            "prompt": workflow,
-            "client_id": prompt_id
-        }
-        
-        response = requests.post("http://127.0.0.1:8188/prompt", json=payload, timeout=30)
-        if response.status_code != 200:
-            return None, f"Failed to queue workflow: {response.text}"
-        
-        result = response.json()
-        actual_prompt_id = result.get('prompt_id', prompt_id)
-        
-        print(f"✅ Workflow queued with ID: {actual_prompt_id}")
-        
-        # Wait for completion
-        max_generation_time = 300  # 5 minutes max
-        start_time = time.time()
-        
-        while time.time() - start_time < max_generation_time:
-            try:
-                response = requests.get(f"http://127.0.0.1:8188/history/{actual_prompt_id}", timeout=10)
-                if response.status_code == 200:
-                    history = response.json()
-                    if actual_prompt_id in history:
-                        print("✅ Generation completed!")
-                        
-                        # Get output image
-                        result_image = get_output_image(history[actual_prompt_id])
-                        if result_image:
-                            # Convert to base64
-                            buffered = io.BytesIO()
-                            result_image.save(buffered, format="PNG")
-                            result_b64 = base64.b64encode(buffered.getvalue()).decode()
-                            
-                            print("🎉 Face morph generation successful!")
-                            return result_b64, None
-                        else:
-                            return None, "Failed to retrieve output image"
-            except Exception as e:
-                print(f"⚠️ Error checking status: {e}")
+            print(f"🚀 Starting face morph generation with preset: {preset_key}")
             
-            time.sleep(5)
-            elapsed = int(time.time() - start_time)
-            print(f"⏳ Generation in progress... ({elapsed}s)")
-        
-        return None, "Generation timed out"
-        
-    except Exception as e:
-        print(f"❌ Error in face morph generation: {e}")
-        return None, str(e)
-    
-    finally:
-        # Cleanup
-        try:
-            comfyui_process.terminate()
-            comfyui_process.wait(timeout=10)
-        except:
+            # Decode input image
+            image_data = base64.b64decode(image_b64)
+            input_image = Image.open(io.BytesIO(image_data))
+            
+            # Save input image
+            input_filename = f"input_{uuid.uuid4().hex}.png"
+            input_path = f"/root/ComfyUI/input/{input_filename}"
+            input_image.save(input_path)
+            
+            # Load workflow template
+            workflow_file = "workflow_facedetailer.json"  # Use FaceDetailer workflow
             try:
-                comfyui_process.kill()
+                with open(f"/root/ComfyUI/{workflow_file}", 'r') as f:
+                    workflow = json.load(f)
             except:
-                pass
+                # Fallback to basic workflow
+                workflow = create_basic_workflow(input_filename, preset_key, denoise_strength)
+            
+            # Update workflow parameters
+            workflow = update_workflow_parameters(workflow, input_filename, preset_key, denoise_strength)
+            
+            print("🎯 Running workflow...")
+            history = self.server.run_prompt(workflow, client_id=str(uuid.uuid4()))
+            
+            # Get output image
+            result_image = get_output_image(history)
+            if not result_image:
+                return None, "Failed to retrieve output image"
+            
+            # Convert to base64
+            buffered = io.BytesIO()
+            result_image.save(buffered, format="PNG")
+            result_b64 = base64.b64encode(buffered.getvalue()).decode()
+            
+            print("🎉 Face morph generation successful!")
+            return result_b64, None
+            
+        except Exception as e:
+            print(f"❌ Error in face morph generation: {e}")
+            return None, str(e)
+        
+        finally:
+            # The container outlives this prompt - don't let inputs pile up
+            if input_path and os.path.exists(input_path):
+                os.remove(input_path)
 
 def create_basic_workflow(input_filename: str, preset_key: str, denoise_strength: float):
     """Create a basic img2img workflow if no custom workflow is found"""
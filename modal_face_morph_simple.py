@@ -56,148 +56,94 @@ comfyui_image = (
     ])
 )
 
-@app.function(
+# Containers stay up this long after their last prompt, so back-to-back generations skip
+# the ComfyUI boot entirely
+CONTAINER_IDLE_TIMEOUT = 300
+# Prompts one container accepts at once (ComfyUI queues them on its single GPU)
+CONCURRENT_PROMPTS = 4
+
+@app.cls(
     image=comfyui_image,
     volumes={"/models": models_volume},
+    mounts=[modal.Mount.from_local_python_packages("modal_comfyui_server")],
     gpu="T4",  # T4 for cost efficiency
     timeout=600,  # 10 minutes max
     memory=16384,  # 16GB RAM
-    cpu=4
+    cpu=4,
+    container_idle_timeout=CONTAINER_IDLE_TIMEOUT,
+    allow_concurrent_inputs=CONCURRENT_PROMPTS
 )
-def generate_face_morph(image_b64: str, preset_key: str, denoise_strength: float = 0.15):
-    """
-    Generate face morph using basic ComfyUI with SD 1.5 and LoRA
-    
-    Args:
-        image_b64: Base64 encoded input image
-        preset_key: Preset key (tier1, tier2, chad)
-        denoise_strength: Denoise strength (0.10-0.25)
-    
-    Returns:
-        tuple: (result_image_b64, error_message)
-    """
-    import subprocess
-    import uuid
-    
-    try:
-        print(f"🚀 Starting face morph generation with preset: {preset_key}")
-        
-        # Decode input image
-        image_data = base64.b64decode(image_b64)
-        input_image = Image.open(io.BytesIO(image_data))
-        
-        # Save input image
-        input_filename = f"input_{uuid.uuid4().hex}.png"
-        input_path = f"/root/ComfyUI/input/{input_filename}"
-        input_image.save(input_path)
-        
-        print(f"✅ Input image saved: {input_path}")
-        
-        # Copy models from persistent volume to ComfyUI
-        print("📁 Copying models from persistent storage...")
-        os.system("cp -r /models/lora/* /root/ComfyUI/models/loras/ 2>/dev/null || true")
-        os.system("cp -r /models/base_models/* /root/ComfyUI/models/checkpoints/ 2>/dev/null || true")
-        
-        # Start ComfyUI server
-        print("🔧 Starting ComfyUI server...")
-        comfyui_process = subprocess.Popen([
-            "python", "/root/ComfyUI/main.py", 
-            "--listen", "127.0.0.1", 
-            "--port", "8188",
-            "--disable-auto-launch"
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        # Wait for server to start
-        max_wait = 120  # 120 seconds max wait
-        wait_time = 0
-        server_ready = False
-        
-        while wait_time < max_wait:
-            try:
-                response = requests.get("http://127.0.0.1:8188/system_stats", timeout=5)
-                if response.status_code == 200:
-                    server_ready = True
-                    break
-            except requests.exceptions.RequestException as e:
-                print(f"⏳ Waiting for ComfyUI server... ({wait_time}s) - {e}")
+class ComfyUIMorph:
+    """Basic ComfyUI with SD 1.5 and LoRA - one ComfyUI server per container, reused for every prompt"""
 
-            time.sleep(5)
-            wait_time += 5
-        
-        if not server_ready:
-            stdout, stderr = comfyui_process.communicate()
-            print(f"❌ ComfyUI server failed to start. STDOUT: {stdout.decode()}, STDERR: {stderr.decode()}")
-            return None, "ComfyUI server failed to start"
-        
-        print("✅ ComfyUI server ready!")
-        
-        # Create basic img2img workflow
-        workflow = create_basic_workflow(input_filename, preset_key, denoise_strength)
-        
-        # Queue workflow
-        print("🎯 Queuing workflow...")
-        prompt_id = str(uuid.uuid4())
-        payload = {
-            "prompt": workflow,
-            "client_id": prompt_id
-        }
-        
-        response = requests.post("http://127.0.0.1:8188/prompt", json=payload, timeout=30)
-        if response.status_code != 200:
-            return None, f"Failed to queue workflow: {response.text}"
-        
-        result = response.json()
-        actual_prompt_id = result.get('prompt_id', prompt_id)
+    @modal.enter()
+    def start_comfyui(self):
+        """Runs once per container: models are read from the volume in place, then ComfyUI boots"""
+        from modal_comfyui_server import ComfyUIServer, write_extra_model_paths
+
+        write_extra_model_paths()
+        self.server = ComfyUIServer()
+        self.server.start()
+
+    @modal.exit()
+    def stop_comfyui(self):
+        self.server.stop()
+
+    @modal.method()
+    def generate(self, image_b64: str, preset_key: str, denoise_strength: float = 0.15):
+        """
+        Generate face morph using basic ComfyUI with SD 1.5 and LoRA
         
-        print(f"✅ Workflow queued with ID: {actual_prompt_id}")
+        Args:
+            image_b64: Base64 encoded input image
+            preset_key: Preset key (tier1, tier2, chad)
+            denoise_strength: Denoise strength (0.10-0.25)
         
-        # Wait for completion
-        max_generation_time = 300  # 5 minutes max
-        start_time = time.time()
+        Returns:
+            tuple: (result_image_b64, error_message)
+        """
+        import uuid
         
-        while time.time() - start_time < max_generation_time:
-            try:
-                response = requests.get(f"http://127.0.0.1:8188/history/{actual_prompt_id}", timeout=10)
-                if response.status_code == 200:
-                    history = response.json()
-                    if actual_prompt_id in history:
-                        print("✅ Generation completed!")
-                        
-                        # Get output image
-                        result_image = get_output_image(history[actual_prompt_id])
-                        if result_image:
-                            # Convert to base64
-                            buffered = io.BytesIO()
-                            result_image.save(buffered, format="PNG")
-                            result_b64 = base64.b64encode(buffered.getvalue()).decode()
-                            
-                            print("🎉 Face morph generation successful!")
-                            return result_b64, None
-                        else:
-                            return None, "Failed to retrieve output image"
-            except Exception as e:
-                print(f"⚠️ Error checking status: {e}")
+        input_path = None
+        try:
+            print(f"🚀 Starting face morph generation with preset: {preset_key}")
             
-            time.sleep(5)
-            elapsed = int(time.time() - start_time)
-            print(f"⏳ Generation in progress... ({elapsed}s)")
-        
-        return None, "Generation timed out"
+            # Decode input image
+            image_data = base64.b64decode(image_b64)
+            input_image = Image.open(io.BytesIO(image_data))
+            
+            # Save input image
+            input_filename = f"input_{uuid.uuid4().hex}.png"
+            input_path = f"/root/ComfyUI/input/{input_filename}"
+            input_image.save(input_path)
+            
+            # Create basic img2img workflow
+            workflow = create_basic_workflow(input_filename, preset_key, denoise_strength)
+            
+            print("🎯 Running workflow...")
+            history = self.server.run_prompt(workflow, client_id=str(uuid.uuid4()))
+            
+            # Get output image
+            result_image = get_output_image(history)
+            if not result_image:
+                return None, "Failed to retrieve output image"
+            
+            # Convert to base64
+            buffered = io.BytesIO()
+            result_image.save(buffered, format="PNG")
+            result_b64 = base64.b64encode(buffered.getvalue()).decode()
+            
+            print("🎉 Face morph generation successful!")
+            return result_b64, None
+            
+        except Exception as e:
+            print(f"❌ Error in face morph generation: {e}")
+            return None, str(e)
         
-    except Exception as e:
-        print(f"❌ Error in face morph generation: {e}")
-        return None, str(e)
-    
-    finally:
-        # Cleanup
-        try:
-            comfyui_process.terminate()
-            comfyui_process.wait(timeout=10)
-        except:
-            try:
-                comfyui_process.kill()
-            except:
-                pass
+        finally:
+            # The container outlives this prompt - don't let inputs pile up
+            if input_path and os.path.exists(input_path):
+                os.remove(input_path)
 
 def create_basic_workflow(input_filename: str, preset_key: str, denoise_strength: float):
     """Create a basic img2img workflow with LoRA support"""
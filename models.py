@@ -4,11 +4,18 @@ Database models for user authentication and credit system
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime, timedelta
+from datetime import datetime
+from sqlalchemy import event, inspect, func, case, literal, select, union_all
+from sqlalchemy.orm import Session, object_session
 import bcrypt
 import uuid
+import json
+import logging
+from config import USER_STATS_CACHE_SECONDS
+from shared_state import shared_state
 
 db = SQLAlchemy()
+logger = logging.getLogger(__name__)
 
 class User(UserMixin, db.Model):
     """User model for authentication and credit tracking"""
@@ -35,6 +42,7 @@ class User(UserMixin, db.Model):
     # Relationships
     generations = db.relationship('Generation', backref='user', lazy=True, cascade='all, delete-orphan')
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
+    credit_entries = db.relationship('CreditLedgerEntry', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         """Hash and set password"""
@@ -44,17 +52,15 @@ class User(UserMixin, db.Model):
         """Check if provided password matches hash"""
         return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
     
+    def free_generations_remaining(self):
+        """Free generations left today (read-only - the daily reset happens in use_free_generation)"""
+        if self.last_free_generation_date != datetime.utcnow().date():
+            return 1
+        return max(0, 1 - (self.free_generations_used_today or 0))
+    
     def can_generate_free(self):
         """Check if user can use free generation today"""
-        today = datetime.utcnow().date()
-        
-        # Reset counter if it's a new day
-        if self.last_free_generation_date != today:
-            self.free_generations_used_today = 0
-            self.last_free_generation_date = today
-            db.session.commit()
-        
-        return self.free_generations_used_today < 1
+        return self.free_generations_remaining() > 0
     
     def use_free_generation(self):
         """Use one free generation for today"""
@@ -71,53 +77,88 @@ class User(UserMixin, db.Model):
         """Check if user has paid credits"""
         return self.credits > 0
     
-    def use_paid_credit(self):
-        """Use one paid credit"""
-        if self.credits > 0:
-            self.credits -= 1
-            db.session.commit()
-            return True
-        return False
+    def use_paid_credit(self, reason='generation'):
+        """Use one paid credit (atomic conditional UPDATE - see credit_ledger.py)"""
+        from credit_ledger import debit_credits
+        return debit_credits(self.id, 1, reason) is not None
     
-    def add_credits(self, amount):
+    def add_credits(self, amount, reason='purchase', reference_id=None, commit=True):
         """Add credits to user account"""
-        self.credits += amount
-        db.session.commit()
+        from credit_ledger import credit_credits
+        return credit_credits(self.id, amount, reason, reference_id=reference_id, commit=commit)
     
-    def get_generation_stats(self):
-        """Get user's generation statistics"""
-        total_generations = Generation.query.filter_by(user_id=self.id).count()
-        
-        # Get today's date range for proper datetime filtering
+    def _activity_counts(self):
+        """Generation, facial evaluation and ratios morph counts in one round trip (SUM(CASE ...) per table)"""
         today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = today_start + timedelta(days=1)
         
-        today_generations = Generation.query.filter_by(user_id=self.id).filter(
-            Generation.created_at >= today_start,
-            Generation.created_at < today_end
-        ).count()
+        def count_if(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
         
-        successful_generations = Generation.query.filter_by(user_id=self.id, status='completed').count()
-        credits_used = Generation.query.filter_by(user_id=self.id, used_paid_credit=True).count()
+        queries = [
+            select(
+                literal('generations').label('kind'),
+                func.count().label('total'),
+                count_if(Generation.created_at >= today_start).label('today'),
+                count_if(Generation.status == 'completed').label('completed'),
+                count_if(Generation.status == 'pending').label('pending'),
+                count_if(Generation.used_paid_credit.is_(True)).label('paid')
+            ).where(Generation.user_id == self.id)
+        ]
+        for kind, model in (('evaluations', FacialEvaluation), ('ratios_morphs', RatiosMorph)):
+            queries.append(
+                select(
+                    literal(kind),
+                    func.count(),
+                    literal(0),
+                    count_if(model.status == 'completed'),
+                    count_if(model.status == 'pending'),
+                    literal(0)
+                ).where(model.user_id == self.id)
+            )
         
-        # Facial evaluation stats
-        total_evaluations = FacialEvaluation.query.filter_by(user_id=self.id).count()
-        pending_evaluations = FacialEvaluation.query.filter_by(user_id=self.id, status='pending').count()
-        completed_evaluations = FacialEvaluation.query.filter_by(user_id=self.id, status='completed').count()
+        return {row.kind: row._asdict() for row in db.session.execute(union_all(*queries))}
+    
+    def get_generation_stats(self):
+        """
+        Get user's generation statistics
+
+        Counts are cached in the shared store for USER_STATS_CACHE_SECONDS, but never past
+        midnight UTC, where today_generations starts again from zero.
+        """
+        counts = None
+        cache_key = user_stats_cache_key(self.id)
+        if USER_STATS_CACHE_SECONDS > 0:
+            try:
+                cached = shared_state.get(cache_key)
+                counts = json.loads(cached) if cached else None
+            except Exception as e:
+                logger.warning(f"User stats cache read failed: {e}")
         
+        if counts is None:
+            counts = self._activity_counts()
+            if USER_STATS_CACHE_SECONDS > 0:
+                try:
+                    shared_state.set(cache_key, json.dumps(counts),
+                                     ex=min(USER_STATS_CACHE_SECONDS, seconds_until_midnight()))
+                except Exception as e:
+                    logger.warning(f"User stats cache write failed: {e}")
+        
+        generations = counts['generations']
+        evaluations = counts['evaluations']
+        ratios_morphs = counts['ratios_morphs']
         return {
-            'total_generations': total_generations,
-            'today_generations': today_generations,
-            'successful_generations': successful_generations,
-            'credits_used': credits_used,
+            'total_generations': generations['total'],
+            'today_generations': generations['today'],
+            'successful_generations': generations['completed'],
+            'credits_used': generations['paid'],
             'credits_remaining': self.credits,
-            'free_generations_remaining': 1 - self.free_generations_used_today if self.can_generate_free() else 0,
-            'total_evaluations': total_evaluations,
-            'pending_evaluations': pending_evaluations,
-            'completed_evaluations': completed_evaluations,
-            'total_ratios_morphs': RatiosMorph.query.filter_by(user_id=self.id).count(),
-            'pending_ratios_morphs': RatiosMorph.query.filter_by(user_id=self.id, status='pending').count(),
-            'completed_ratios_morphs': RatiosMorph.query.filter_by(user_id=self.id, status='completed').count()
+            'free_generations_remaining': self.free_generations_remaining(),
+            'total_evaluations': evaluations['total'],
+            'pending_evaluations': evaluations['pending'],
+            'completed_evaluations': evaluations['completed'],
+            'total_ratios_morphs': ratios_morphs['total'],
+            'pending_ratios_morphs': ratios_morphs['pending'],
+            'completed_ratios_morphs': ratios_morphs['completed']
         }
     
     def to_dict(self):
@@ -142,8 +183,8 @@ class Generation(db.Model):
     workflow_type = db.Column(db.String(20), nullable=False)  # reactor, facedetailer
     
     # Processing details
-    prompt_id = db.Column(db.String(100))  # ComfyUI prompt ID
-    status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
+    prompt_id = db.Column(db.String(100), index=True)  # ComfyUI prompt ID
+    status = db.Column(db.String(20), default='pending')  # pending, dispatching, processing, finalizing, completed, failed
     
     # File details
     input_filename = db.Column(db.String(255))
@@ -161,6 +202,28 @@ class Generation(db.Model):
     # Error handling
     error_message = db.Column(db.Text)
     
+    # Job queue - pending rows are claimed by generation_worker.py
+    job_params = db.Column(db.JSON)  # transform_mode, denoise, selected_features, selected_chad, ...
+    attempts = db.Column(db.Integer, default=0)
+    claimed_by = db.Column(db.String(100))  # Worker that claimed the job
+    claimed_at = db.Column(db.DateTime)
+    backend_url = db.Column(db.String(255))  # ComfyUI backend the prompt was pinned to
+    output_node = db.Column(db.String(20))  # SaveImage node holding this generation's output (batched prompts)
+    priority = db.Column(db.Integer, default=1)  # Index into job_queue.PRIORITY_CLASSES (0 = paid)
+    scheduled_at = db.Column(db.DateTime)  # created_at plus the class's aging offset - workers claim in this order
+    
+    # GPU provider accounting (gpu_router.py)
+    gpu_backend = db.Column(db.String(32))  # Provider that ran the job (GPU_BACKENDS name)
+    gpu_seconds = db.Column(db.Float)  # Dispatch to completion
+    gpu_cost = db.Column(db.Float)  # Estimated USD (GPU_COST_PER_SECOND)
+    
+    # New indexes also need a migration in schema_migrations.py for existing databases
+    __table_args__ = (
+        db.Index('ix_generation_status_scheduled_at', 'status', 'scheduled_at', 'created_at'),  # Job claim
+        db.Index('ix_generation_status_completed_at', 'status', 'completed_at'),  # Backend load / admin
+        db.Index('ix_generation_user_id_created_at', 'user_id', 'created_at'),  # Dashboard history
+    )
+    
     def to_dict(self):
         """Convert generation to dictionary"""
         return {
@@ -206,6 +269,32 @@ class Transaction(db.Model):
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+class CreditLedgerEntry(db.Model):
+    """Append-only record of every change to a user's credit balance"""
+    __tablename__ = 'credit_ledger'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)  # Credits added (positive) or spent (negative)
+    balance_after = db.Column(db.Integer)  # User.credits right after this entry (None for carried-forward totals)
+    reason = db.Column(db.String(40), nullable=False)  # generation, facial_evaluation, purchase, admin_add, opening_balance, ...
+    reference_id = db.Column(db.String(36))  # Transaction, evaluation or admin behind the change
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_credit_ledger_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'delta': self.delta,
+            'balance_after': self.balance_after,
+            'reason': self.reason,
+            'reference_id': self.reference_id,
+            'created_at': self.created_at.isoformat()
+        }
+
 class FacialEvaluation(db.Model):
     """Model for facial evaluation requests and responses"""
     
@@ -213,10 +302,10 @@ class FacialEvaluation(db.Model):
     user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False, index=True)
     
     # Request details
-    original_image_filename = db.Column(db.String(255), nullable=False)  # User's original photo
-    morphed_image_filename = db.Column(db.String(255))  # Morphed result (if from generation)
-    secondary_image_filename = db.Column(db.String(255))  # Optional secondary photo
-    generation_id = db.Column(db.String(36), db.ForeignKey('generation.id'))  # Link to generation if applicable
+    original_image_filename = db.Column(db.String(255), nullable=False, index=True)  # User's original photo
+    morphed_image_filename = db.Column(db.String(255), index=True)  # Morphed result (if from generation)
+    secondary_image_filename = db.Column(db.String(255), index=True)  # Optional secondary photo
+    generation_id = db.Column(db.String(36), db.ForeignKey('generation.id'), index=True)  # Link to generation if applicable
     
     # Status and timestamps
     status = db.Column(db.String(20), default='Pending')  # Pending, Completed, Cancelled
@@ -235,6 +324,12 @@ class FacialEvaluation(db.Model):
     admin = db.relationship('User', foreign_keys=[admin_id])
     generation = db.relationship('Generation', backref='facial_evaluation')
     
+    __table_args__ = (
+        db.Index('ix_facial_evaluation_status_created_at', 'status', 'created_at'),  # Admin pending queue
+        db.Index('ix_facial_evaluation_status_completed_at', 'status', 'completed_at'),  # Admin completed list
+        db.Index('ix_facial_evaluation_user_id_created_at', 'user_id', 'created_at'),  # User dashboard
+    )
+    
     def to_dict(self):
         """Convert facial evaluation to dictionary"""
         return {
@@ -273,6 +368,12 @@ class RatiosMorph(db.Model):
     user = db.relationship('User', foreign_keys=[user_id], backref='ratios_morphs')
     admin = db.relationship('User', foreign_keys=[admin_id])
     
+    __table_args__ = (
+        db.Index('ix_ratios_morph_status_created_at', 'status', 'created_at'),  # Admin pending queue
+        db.Index('ix_ratios_morph_status_completed_at', 'status', 'completed_at'),  # Admin completed list
+        db.Index('ix_ratios_morph_user_id_created_at', 'user_id', 'created_at'),  # User dashboard
+    )
+    
     def to_dict(self):
         """Convert ratios morph to dictionary"""
         return {
@@ -364,6 +465,59 @@ class ApiKey(db.Model):
         self.last_used = datetime.utcnow()
         db.session.commit()
 
+# Cached user stats - dropped once a transaction that adds, removes or changes the status of
+# a row they count has committed (dropping them at flush would let a concurrent reader cache
+# the pre-commit counts again)
+STATS_COUNTED_ATTRIBUTES = ('status', 'used_paid_credit')
+STATS_PENDING_KEY = 'stale_user_stats'  # Session.info entry: user IDs to invalidate on commit
+
+def user_stats_cache_key(user_id):
+    return f"user_stats:{user_id}"
+
+def seconds_until_midnight(now=None):
+    """Seconds left in the current UTC day (at least 1)"""
+    now = now or datetime.utcnow()
+    elapsed = (now - now.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+    return max(1, int(86400 - elapsed))
+
+def _invalidate_user_stats(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(STATS_PENDING_KEY, set()).add(target.user_id)
+
+def _invalidate_user_stats_on_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(name in attrs and attrs[name].history.has_changes() for name in STATS_COUNTED_ATTRIBUTES):
+        _invalidate_user_stats(mapper, connection, target)
+
+@event.listens_for(Session, 'after_commit')
+def _drop_committed_user_stats(session):
+    for user_id in session.info.pop(STATS_PENDING_KEY, ()):
+        try:
+            shared_state.delete(user_stats_cache_key(user_id))
+        except Exception as e:
+            logger.warning(f"User stats cache invalidation failed: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_user_stats(session):
+    session.info.pop(STATS_PENDING_KEY, None)
+
+for _model in (Generation, FacialEvaluation, RatiosMorph):
+    event.listen(_model, 'after_insert', _invalidate_user_stats)
+    event.listen(_model, 'after_delete', _invalidate_user_stats)
+    event.listen(_model, 'after_update', _invalidate_user_stats_on_update)
+
+@event.listens_for(User, 'after_insert')
+def _record_opening_balance(mapper, connection, target):
+    """Start every new user's ledger at their signup credits, in the same transaction"""
+    connection.execute(CreditLedgerEntry.__table__.insert().values(
+        user_id=target.id,
+        delta=target.credits or 0,
+        balance_after=target.credits or 0,
+        reason='opening_balance',
+        created_at=datetime.utcnow()
+    ))
+
 def init_db(app):
     """Initialize database with app"""
     db.init_app(app)
@@ -377,6 +531,15 @@ def init_db(app):
             print(f"Database tables may already exist: {e}")
             # Tables might already exist, continue with admin user creation
         
+        try:
+            # Columns and indexes added to existing tables since they were created
+            from schema_migrations import run_migrations
+            applied = run_migrations(db.engine)
+            if applied:
+                print(f"Applied schema migrations: {', '.join(applied)}")
+        except Exception as e:
+            print(f"Schema migrations failed: {e}")
+        
         try:
             # Create admin user if it doesn't exist
             admin = User.query.filter_by(email='ascendbase@gmail.com').first()
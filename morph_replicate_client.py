@@ -12,13 +12,14 @@ from PIL import Image
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 import logging
+from gpu_backends import GpuBackend, GpuJob, Submission
 
 # Load environment variables
 load_dotenv('.env.replicate')
 
 logger = logging.getLogger(__name__)
 
-class MorphReplicateClient:
+class MorphReplicateClient(GpuBackend):
     """
     Specialized client that replicates your exact face morphing workflow:
     - DreamBase model (real-dream-15.safetensors)
@@ -26,6 +27,10 @@ class MorphReplicateClient:
     - FaceDetailer workflow for precise face detection and morphing
     """
     
+    backend_name = 'replicate'
+    preset_keys = ('HTN', 'Chadlite', 'Chad')
+    authoritative_status = True
+    
     def __init__(self, api_token: str = None):
         """Initialize the morph client"""
         if api_token:
@@ -53,6 +58,36 @@ class MorphReplicateClient:
             "force_inpaint": True
         }
     
+    def submit(self, job: GpuJob) -> Submission:
+        """Start a Replicate prediction for a GpuJob"""
+        return self.submit_preset(job)
+    
+    def status(self, job_id: str) -> str:
+        """
+        COMPLETED / FAILED / IN_PROGRESS for the reconciler
+
+        Failed and canceled predictions are FAILED; unlike get_job_status(), an unreachable
+        API reads as IN_PROGRESS so the job is checked again on the next pass.
+        """
+        try:
+            prediction = self.client.predictions.get(job_id)
+        except Exception as e:
+            logger.warning(f"Could not check Replicate prediction {job_id}: {e}")
+            return 'IN_PROGRESS'
+        if prediction.status == 'succeeded':
+            return 'COMPLETED'
+        if prediction.status in ('failed', 'canceled'):
+            return 'FAILED'
+        return 'IN_PROGRESS'
+    
+    def cancel(self, job_id: str) -> bool:
+        try:
+            self.client.predictions.cancel(job_id)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not cancel Replicate prediction {job_id}: {e}")
+            return False
+    
     def generate_image(self, image_path: str, preset_key: str, denoise_intensity: int) -> tuple:
         """
         Generate morphed image using your exact ComfyUI workflow
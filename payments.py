@@ -226,7 +226,8 @@ def admin_approve_payment(transaction_id):
     
     # Approve payment and add credits
     user = User.query.get(transaction.user_id)
-    user.add_credits(transaction.credits_purchased)
+    # Credits and the transaction status commit together
+    user.add_credits(transaction.credits_purchased, reference_id=transaction.id, commit=False)
     
     transaction.payment_status = 'completed'
     transaction.completed_at = datetime.utcnow()
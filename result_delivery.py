@@ -0,0 +1,89 @@
+"""
+Result Delivery
+The worker's finalizer streams each finished image from ComfyUI's /view straight into
+outputs/ (appearing only once complete); /result then serves the local file, optionally handed
+off to the front proxy with X-Sendfile / X-Accel-Redirect, so downloads never touch the GPU.
+"""
+
+import os
+import logging
+import tempfile
+from flask import Response, send_file
+from config import RESULT_SENDFILE, RESULT_ACCEL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+RESULT_CHUNK_SIZE = 64 * 1024
+
+
+def stream_to_file(upstream, dest_path, chunk_size=RESULT_CHUNK_SIZE):
+    """
+    Yield an upstream response's body while saving it to dest_path
+
+    The file appears at dest_path only once the whole body has arrived (written to a
+    temporary .part file and renamed). If the consumer stops iterating early the rest
+    of the body is still drained to disk.
+
+    Args:
+        upstream: requests.Response opened with stream=True (closed when done)
+        dest_path: Final location of the result file
+    """
+    folder = os.path.dirname(dest_path) or '.'
+    fd, part_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(dest_path)}.", suffix='.part')
+    chunks = upstream.iter_content(chunk_size=chunk_size)
+    completed = False
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            try:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+                completed = True
+            except GeneratorExit:
+                try:
+                    for chunk in chunks:
+                        f.write(chunk)
+                    completed = True
+                except Exception as e:
+                    logger.warning(f"Failed to finish saving {os.path.basename(dest_path)} after client disconnect: {e}")
+                raise
+    except Exception as e:
+        logger.error(f"Result stream for {os.path.basename(dest_path)} failed: {e}")
+        raise
+    finally:
+        upstream.close()
+        if completed:
+            os.replace(part_path, dest_path)
+            logger.info(f"Saved streamed result {os.path.basename(dest_path)}")
+        elif os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def save_result(data, dest_path):
+    """Write result bytes (RunPod and other buffered clients) so dest_path only ever holds a whole file"""
+    folder = os.path.dirname(dest_path) or '.'
+    fd, part_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(dest_path)}.", suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(part_path, dest_path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def send_result_file(result_path, download_name):
+    """
+    Serve a saved result, letting the front proxy send the bytes when configured
+
+    RESULT_SENDFILE='x-accel' returns an empty response with X-Accel-Redirect pointing at
+    RESULT_ACCEL_PREFIX (an nginx internal location aliased to the outputs folder);
+    'x-sendfile' relies on Flask's USE_X_SENDFILE; anything else streams the file from Python.
+    """
+    if RESULT_SENDFILE == 'x-accel':
+        headers = {'Content-Disposition': f'attachment; filename="{download_name}"'}
+        headers['X-Accel-Redirect'] = f"{RESULT_ACCEL_PREFIX.rstrip('/')}/{os.path.basename(result_path)}"
+        return Response(mimetype='image/png', headers=headers)
+    return send_file(result_path, mimetype='image/png', as_attachment=True, download_name=download_name)
@@ -1,29 +1,117 @@
 """
 RunPod Serverless Client for Simple IMG2IMG with Real Dream + Chad LoRA
 NO CUSTOM NODES - 100% STABLE
+
+Jobs are submitted without holding a thread on a sleep loop: /runsync returns short jobs
+within RUNPOD_RUNSYNC_WAIT seconds, anything longer continues asynchronously and completes
+through the signed webhook (runpod_webhooks.py). get_job_status() is the fallback - each
+job is polled on its own backoff schedule and answers from cache in between.
 """
 
-import requests
 import json
 import base64
+import binascii
 import time
 import os
 import random
+import threading
 from io import BytesIO
 from PIL import Image
 import logging
+from config import (RUNPOD_API_BASE, RUNPOD_RUNSYNC_WAIT, RUNPOD_TIMEOUT, RUNPOD_POLL_MIN_INTERVAL,
+                    RUNPOD_POLL_MAX_INTERVAL, RUNPOD_WEBHOOK_POLL_INTERVAL, RUNPOD_JOB_STATUS_TTL,
+                    COMFYUI_CONNECT_TIMEOUT)
+from comfyui_transport import comfyui_request
+from shared_state import shared_state
+from gpu_backends import GpuBackend, Submission
 
 logger = logging.getLogger(__name__)
 
-class RunPodClient:
-    def __init__(self, api_key, endpoint_id):
+JOB_STATUS_PREFIX = 'runpod_job:'
+FAILED_STATUSES = ('FAILED', 'CANCELLED', 'TIMED_OUT')
+POLL_BACKOFF = 1.5
+
+
+def normalize_status(status):
+    """RunPod job status -> COMPLETED / FAILED / IN_PROGRESS"""
+    if status == 'COMPLETED':
+        return 'COMPLETED'
+    if status in FAILED_STATUSES:
+        return 'FAILED'
+    return 'IN_PROGRESS'
+
+
+def decode_output_image(output):
+    """
+    First image of a job's output as bytes, or None
+
+    Accepts plain base64, data: URLs and {'data'/'image': ...} entries.
+    """
+    images = output.get('images') if isinstance(output, dict) else None
+    if not images:
+        return None
+    image = images[0]
+    if isinstance(image, dict):
+        image = image.get('data') or image.get('image')
+    if not isinstance(image, str):
+        return None
+    if image.startswith('data:'):
+        image = image.split(',', 1)[-1]
+    try:
+        return base64.b64decode(image)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def publish_job_status(job_id, status, store=shared_state):
+    """Record a job status reported by a webhook, so every process's get_job_status() sees it"""
+    try:
+        store.set(f"{JOB_STATUS_PREFIX}{job_id}", normalize_status(status), ex=RUNPOD_JOB_STATUS_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to publish RunPod status of job {job_id}: {e}")
+
+
+class JobPoll:
+    """Adaptive polling state for one submitted job"""
+
+    def __init__(self, interval, max_interval=RUNPOD_POLL_MAX_INTERVAL, fixed=False, first_poll=None):
+        self.status = 'IN_PROGRESS'
+        self.interval = interval
+        self.max_interval = max_interval
+        self.fixed = fixed  # A webhook is expected - poll only as a safety net
+        self.updated_at = time.monotonic()
+        self.next_at = self.updated_at + (interval if first_poll is None else first_poll)
+
+    def polled(self, status):
+        self.status = status
+        if not self.fixed:
+            self.interval = min(self.interval * POLL_BACKOFF, self.max_interval)
+        self.updated_at = time.monotonic()
+        self.next_at = self.updated_at + self.interval
+
+
+class RunPodClient(GpuBackend):
+    backend_name = 'runpod'
+    preset_keys = ('HTN', 'Chadlite', 'Chad')
+    authoritative_status = True
+    
+    def __init__(self, api_key, endpoint_id, api_base=RUNPOD_API_BASE, runsync_wait=RUNPOD_RUNSYNC_WAIT,
+                 poll_min_interval=RUNPOD_POLL_MIN_INTERVAL, poll_max_interval=RUNPOD_POLL_MAX_INTERVAL,
+                 webhook_poll_interval=RUNPOD_WEBHOOK_POLL_INTERVAL):
         self.api_key = api_key
         self.endpoint_id = endpoint_id
-        self.base_url = f"https://api.runpod.ai/v2/{endpoint_id}"
+        self.base_url = f"{api_base}/{endpoint_id}"
+        self.runsync_wait = runsync_wait
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = poll_max_interval
+        self.webhook_poll_interval = webhook_poll_interval
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        self._polls = {}  # job_id -> JobPoll
+        self._outputs = {}  # job_id -> image bytes that arrived with /runsync or a poll
+        self._lock = threading.Lock()
     
     def get_morph_settings(self, preset_key, denoise_intensity):
         """Get morph settings based on preset and denoise intensity"""
@@ -181,8 +269,78 @@ class RunPodClient:
             logger.error(f"Error converting image to base64: {e}")
             return None
     
-    def generate_image(self, image_path, preset_key, denoise_intensity):
-        """Generate face morphing using simple ComfyUI workflow"""
+    def submit_payload(self, payload, webhook_url=None, wait=None):
+        """
+        Submit a job: /runsync if wait > 0 (RunPod answers with the output if the job finishes
+        within `wait` seconds, else with the still-running job), otherwise /run; wait defaults
+        to the client's runsync_wait
+
+        Returns:
+            dict: RunPod's response ('id', 'status' and, for finished jobs, 'output'), or None
+        """
+        if wait is None:
+            wait = self.runsync_wait
+        body = dict(payload)
+        if webhook_url:
+            body['webhook'] = webhook_url
+        
+        if wait and wait > 0:
+            url = f"{self.base_url}/runsync"
+            params = {'wait': int(wait * 1000)}
+            timeout = (COMFYUI_CONNECT_TIMEOUT, wait + 30)
+        else:
+            url = f"{self.base_url}/run"
+            params = None
+            timeout = (COMFYUI_CONNECT_TIMEOUT, 30)
+        
+        response = comfyui_request('POST', url, headers=self.headers, json=body, params=params, timeout=timeout)
+        if response.status_code != 200:
+            logger.error(f"RunPod submission failed: {response.status_code} - {response.text}")
+            return None
+        
+        result = response.json()
+        job_id = result.get('id')
+        if job_id:
+            self.record_result(job_id, result, webhook=bool(webhook_url))
+        return result
+    
+    def record_result(self, job_id, result, webhook=False):
+        """Track a job from a /run, /runsync or /status response (caches a finished job's image)"""
+        status = normalize_status(result.get('status'))
+        with self._lock:
+            poll = self._polls.get(job_id)
+            if poll is None:
+                self._prune()
+                poll = JobPoll(self.webhook_poll_interval if webhook else self.poll_min_interval,
+                               self.poll_max_interval, fixed=webhook)
+                self._polls[job_id] = poll
+            else:
+                poll.polled(status)
+            poll.status = status
+            if status == 'COMPLETED':
+                image_data = decode_output_image(result.get('output'))
+                if image_data:
+                    self._outputs[job_id] = image_data
+                else:
+                    logger.error(f"No images in completed RunPod job {job_id}: {result.get('output')}")
+                    poll.status = 'FAILED'
+            return poll.status
+    
+    def _prune(self):
+        """Forget jobs nobody asked about for RUNPOD_JOB_STATUS_TTL (call with the lock held)"""
+        cutoff = time.monotonic() - RUNPOD_JOB_STATUS_TTL
+        for job_id in [job_id for job_id, poll in self._polls.items() if poll.updated_at < cutoff]:
+            del self._polls[job_id]
+            self._outputs.pop(job_id, None)
+    
+    def generate_image(self, image_path, preset_key, denoise_intensity, webhook_url=None):
+        """
+        Submit a face morph using the simple ComfyUI workflow
+        
+        Returns:
+            (job_id, error): Short jobs are already finished when this returns - their image is
+            cached for get_job_output(); longer ones finish through webhook_url or polling
+        """
         try:
             # Get image filename
             image_filename = os.path.basename(image_path)
@@ -210,98 +368,165 @@ class RunPodClient:
                 }
             }
             
-            # Submit job to serverless endpoint
             logger.info(f"Submitting RunPod job for {preset_key} preset with denoise intensity {denoise_intensity}")
-            response = requests.post(
-                f"{self.base_url}/runsync",  # Use runsync for immediate response
-                json=payload,
-                headers=self.headers,
-                timeout=120  # 2 minute timeout for sync request
-            )
+            result = self.submit_payload(payload, webhook_url=webhook_url)
+            if result is None:
+                return None, "RunPod submission failed"
             
-            if response.status_code != 200:
-                logger.error(f"RunPod submission failed: {response.status_code} - {response.text}")
-                return None, f"RunPod error: {response.status_code}"
+            job_id = result.get('id')
+            if not job_id:
+                logger.error(f"No job ID returned: {result}")
+                return None, "No job ID returned from RunPod"
             
-            result = response.json()
+            if normalize_status(result.get('status')) == 'FAILED':
+                return None, result.get('error') or f"RunPod job {result.get('status')}"
             
-            # Check if we got output directly (sync response)
-            if 'output' in result and result['output']:
-                output = result['output']
-                if 'images' in output and output['images']:
-                    # Return the first image
-                    return output['images'][0], None
-                else:
-                    logger.error(f"No images in output: {output}")
-                    return None, "No images generated"
-            else:
-                # If async, get job ID
-                job_id = result.get('id')
-                if job_id:
-                    logger.info(f"RunPod job submitted: {job_id}")
-                    return job_id, None
-                else:
-                    logger.error(f"No job ID or output returned: {result}")
-                    return None, "No job ID returned from RunPod"
+            logger.info(f"RunPod job submitted: {job_id} ({result.get('status')})")
+            return job_id, None
             
         except Exception as e:
             logger.error(f"RunPod submission error: {e}")
             return None, str(e)
     
-    def check_status(self, job_id):
-        """Check job status on RunPod"""
+    def submit(self, job):
+        """Submit a GpuJob with its generation's signed webhook (when RUNPOD_WEBHOOK_BASE_URL and RUNPOD_WEBHOOK_SECRET are set)"""
+        from runpod_webhooks import webhook_url
+        return self.submit_preset(job, webhook_url=webhook_url(job.generation_id) if job.generation_id else None)
+    
+    def cancel(self, job_id):
         try:
-            response = requests.get(
-                f"{self.base_url}/status/{job_id}",
-                headers=self.headers,
-                timeout=10
-            )
-            
+            response = comfyui_request('POST', f"{self.base_url}/cancel/{job_id}", headers=self.headers)
+            self.forget_job(job_id)
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning(f"Could not cancel RunPod job {job_id}: {e}")
+            return False
+    
+    def fetch_status(self, job_id):
+        """Raw /status/<job_id> response, or None if RunPod could not be reached"""
+        try:
+            response = comfyui_request('GET', f"{self.base_url}/status/{job_id}", 'poll', headers=self.headers)
             if response.status_code != 200:
                 logger.error(f"Status check failed: {response.status_code}")
-                return 'FAILED', None
-            
-            result = response.json()
-            status = result.get('status', 'UNKNOWN')
-            
-            logger.info(f"Job {job_id} status: {status}")
-            
-            if status == 'COMPLETED':
-                output = result.get('output')
-                if output and 'images' in output and output['images']:
-                    return 'COMPLETED', output['images'][0]
-                else:
-                    logger.error(f"No images in completed job output: {output}")
-                    return 'FAILED', None
-            elif status in ['FAILED', 'CANCELLED', 'TIMED_OUT']:
-                error_msg = result.get('error', 'Unknown error')
-                logger.error(f"Job failed: {error_msg}")
-                return 'FAILED', error_msg
-            else:
-                # Still running
-                return status, None
-                
+                return None
+            return response.json()
         except Exception as e:
             logger.error(f"Status check error: {e}")
-            return 'FAILED', str(e)
+            return None
+    
+    def check_status(self, job_id):
+        """Check job status on RunPod"""
+        result = self.fetch_status(job_id)
+        if result is None:
+            return 'FAILED', None
+        
+        status = result.get('status', 'UNKNOWN')
+        logger.info(f"Job {job_id} status: {status}")
+        
+        if status == 'COMPLETED':
+            output = result.get('output')
+            if output and 'images' in output and output['images']:
+                return 'COMPLETED', output['images'][0]
+            else:
+                logger.error(f"No images in completed job output: {output}")
+                return 'FAILED', None
+        elif status in FAILED_STATUSES:
+            error_msg = result.get('error', 'Unknown error')
+            logger.error(f"Job failed: {error_msg}")
+            return 'FAILED', error_msg
+        else:
+            # Still running
+            return status, None
     
-    def wait_for_completion(self, job_id, timeout=300):
-        """Wait for job completion with timeout"""
+    def get_job_status(self, job_id):
+        """
+        COMPLETED / FAILED / IN_PROGRESS without calling RunPod more often than the job's poll schedule
+        
+        Webhook-reported statuses (any process) win; between polls the last known status is
+        returned. Unreachable RunPod never reads as FAILED.
+        """
+        try:
+            reported = shared_state.get(f"{JOB_STATUS_PREFIX}{job_id}")
+        except Exception as e:
+            logger.warning(f"Shared RunPod status lookup failed for {job_id}: {e}")
+            reported = None
+        
+        with self._lock:
+            if job_id in self._outputs:
+                return 'COMPLETED'
+            if reported:
+                return reported
+            poll = self._polls.get(job_id)
+            if poll is None:
+                # Submitted by another process (or before a restart) - poll now, then back off
+                self._prune()
+                poll = self._polls[job_id] = JobPoll(self.poll_min_interval, self.poll_max_interval, first_poll=0)
+            if poll.status != 'IN_PROGRESS' or time.monotonic() < poll.next_at:
+                return poll.status
+        
+        result = self.fetch_status(job_id)
+        if result is None:
+            with self._lock:
+                poll.polled(poll.status)
+                return poll.status
+        return self.record_result(job_id, result)
+    
+    def get_bulk_status(self, prompt_ids, max_items=None):
+        """
+        get_job_status() for several jobs (the status reconciler's entry point)
+        
+        RunPod has no bulk endpoint, but unlike check_status() these statuses never report a
+        network error as FAILED, so the reconciler may fail rows on them.
+        """
+        return {job_id: self.get_job_status(job_id) for job_id in prompt_ids}
+    
+    def get_job_output(self, job_id):
+        """Result image bytes (cached from /runsync or the last poll, else fetched once), or None"""
+        with self._lock:
+            image_data = self._outputs.pop(job_id, None)
+            self._polls.pop(job_id, None)
+        if image_data:
+            return image_data
+        
+        result = self.fetch_status(job_id)
+        if not result or result.get('status') != 'COMPLETED':
+            return None
+        return decode_output_image(result.get('output'))
+    
+    def forget_job(self, job_id):
+        """Drop a settled job's poll state and cached output"""
+        with self._lock:
+            self._polls.pop(job_id, None)
+            self._outputs.pop(job_id, None)
+    
+    def wait_for_job(self, job_id, timeout=RUNPOD_TIMEOUT):
+        """Poll with backoff until the job settles; returns its final /status response, or None on timeout"""
         start_time = time.time()
+        interval = self.poll_min_interval
         
         while time.time() - start_time < timeout:
-            status, result = self.check_status(job_id)
+            result = self.fetch_status(job_id)
+            if result is not None and normalize_status(result.get('status')) != 'IN_PROGRESS':
+                return result
             
-            if status == 'COMPLETED':
-                return True, result
-            elif status == 'FAILED':
-                return False, result
-            
-            # Wait before next check
-            time.sleep(5)
+            time.sleep(min(interval, max(0, timeout - (time.time() - start_time))))
+            interval = min(interval * POLL_BACKOFF, self.poll_max_interval)
         
         logger.error(f"Job {job_id} timed out after {timeout} seconds")
-        return False, "Generation timed out"
+        return None
+    
+    def wait_for_completion(self, job_id, timeout=RUNPOD_TIMEOUT):
+        """Wait for job completion with timeout (scripts only - the app never blocks on a job)"""
+        result = self.wait_for_job(job_id, timeout)
+        if result is None:
+            return False, "Generation timed out"
+        if result.get('status') != 'COMPLETED':
+            return False, result.get('error', 'Unknown error')
+        
+        output = result.get('output')
+        if output and output.get('images'):
+            return True, output['images'][0]
+        return False, "No images generated"
     
     def base64_to_image(self, base64_string):
         """Convert base64 string to PIL Image"""
@@ -328,11 +553,7 @@ class RunPodClient:
     def test_connection(self):
         """Test connection to RunPod serverless endpoint"""
         try:
-            response = requests.get(
-                f"{self.base_url}/health",
-                headers=self.headers,
-                timeout=10
-            )
+            response = comfyui_request('GET', f"{self.base_url}/health", 'probe', headers=self.headers)
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Connection test failed: {e}")
@@ -363,26 +584,27 @@ def test_simple_workflow():
         return
     
     # Test HTN preset with medium denoise intensity
-    result, error = client.generate_image(test_image_path, 'HTN', 5)
+    job_id, error = client.generate_image(test_image_path, 'HTN', 5)
     
     if error:
         print(f"Error: {error}")
         return
     
-    if isinstance(result, str) and result.startswith('data:'):
-        # Direct base64 result
+    if client.get_job_status(job_id) == 'COMPLETED':
+        # Finished within the /runsync wait
         print("Generation completed immediately!")
-        client.save_result_image(result, "outputs/test_result.png")
+        image_data = client.get_job_output(job_id)
     else:
-        # Job ID - wait for completion
-        print(f"Job submitted: {result}")
-        success, final_result = client.wait_for_completion(result)
-        
-        if success:
-            print("Generation completed!")
-            client.save_result_image(final_result, "outputs/test_result.png")
-        else:
+        print(f"Job submitted: {job_id}")
+        success, final_result = client.wait_for_completion(job_id)
+        if not success:
             print(f"Generation failed: {final_result}")
+            return
+        print("Generation completed!")
+        image_data = decode_output_image({'images': [final_result]})
+    
+    with open("outputs/test_result.png", "wb") as f:
+        f.write(image_data)
 
 if __name__ == "__main__":
     test_simple_workflow()
@@ -1,29 +1,35 @@
 """
 RunPod ComfyUI Client for Morph App
 Handles ComfyUI workflow execution on RunPod serverless GPUs
+
+Workflows go through RunPodClient.submit_payload(): short ones come back from /runsync, longer
+ones are followed up with backoff polling instead of one request held open until timeout.
 """
 
-import requests
 import json
 import base64
 import time
 import os
 from typing import Dict, Any, Optional
+from comfyui_transport import comfyui_request
+from runpod_client import RunPodClient
 
 class RunPodComfyUIClient:
     """Client for running ComfyUI workflows on RunPod serverless"""
     
-    def __init__(self, api_key: str, endpoint_id: str):
+    def __init__(self, api_key: str, endpoint_id: str, **client_options):
         """
         Initialize RunPod ComfyUI client
         
         Args:
             api_key: Your RunPod API key
             endpoint_id: Your RunPod endpoint ID
+            **client_options: RunPodClient settings (api_base, runsync_wait, poll intervals)
         """
         self.api_key = api_key
         self.endpoint_id = endpoint_id
-        self.base_url = f"https://api.runpod.ai/v2/{endpoint_id}"
+        self.client = RunPodClient(api_key, endpoint_id, **client_options)
+        self.base_url = self.client.base_url
         
     def _encode_image(self, image_path: str) -> str:
         """Encode image to base64"""
@@ -82,27 +88,25 @@ class RunPodComfyUIClient:
                 if node_id in workflow:
                     workflow[node_id]["inputs"].update(node_params)
         
-        # Run synchronous request
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            f"{self.base_url}/runsync",
-            json=payload,
-            headers=headers,
-            timeout=timeout
-        )
+        started = time.time()
+        try:
+            result = self.client.submit_payload(payload, wait=min(timeout, self.client.runsync_wait))
+        except Exception as e:
+            return {"status": "error", "message": f"RunPod API error: {e}"}
         
-        if response.status_code != 200:
+        if result is None:
             return {
                 "status": "error",
-                "message": f"RunPod API error: {response.status_code}",
-                "details": response.text
+                "message": "RunPod API error: job submission failed"
             }
         
-        result = response.json()
+        # Still running after the /runsync wait - follow it up with backoff polling
+        if result.get("status") not in ("COMPLETED", "FAILED", "CANCELLED", "TIMED_OUT") and result.get("id"):
+            remaining = max(0, timeout - (time.time() - started))
+            result = self.client.wait_for_job(result["id"], remaining) or {
+                "status": "TIMED_OUT", "id": result["id"], "error": f"No result within {timeout}s"
+            }
+        self.client.forget_job(result.get("id"))
         
         # Check if execution was successful
         if result.get("status") == "COMPLETED":
@@ -164,11 +168,7 @@ class RunPodComfyUIClient:
         }
         
         try:
-            response = requests.get(
-                f"{self.base_url}/health",
-                headers=headers,
-                timeout=10
-            )
+            response = comfyui_request('GET', f"{self.base_url}/health", 'probe', headers=headers)
             
             if response.status_code == 200:
                 return {"status": "healthy", "details": response.json()}
@@ -10,6 +10,7 @@ import base64
 import io
 from PIL import Image
 import logging
+from comfyui_transport import comfyui_get, comfyui_post
 
 logger = logging.getLogger(__name__)
 
@@ -59,7 +60,7 @@ class RunPodPodClient:
         for attempt in range(max_retries):
             try:
                 logger.info(f"Testing connection to {self.comfyui_url} (attempt {attempt + 1}/{max_retries})")
-                response = requests.get(f"{self.comfyui_url}/system_stats", timeout=15)
+                response = comfyui_get(f"{self.comfyui_url}/system_stats", 'probe')
                 
                 if response.status_code == 200:
                     logger.info("Successfully connected to ComfyUI on RunPod pod")
@@ -131,7 +132,7 @@ class RunPodPodClient:
     def get_job_status(self, prompt_id):
         """Get job status from ComfyUI"""
         try:
-            response = requests.get(f"{self.comfyui_url}/history/{prompt_id}", timeout=10)
+            response = comfyui_get(f"{self.comfyui_url}/history/{prompt_id}")
             response.raise_for_status()
             
             history = response.json()
@@ -139,7 +140,7 @@ class RunPodPodClient:
                 return "COMPLETED"
             else:
                 # Check queue
-                queue_response = requests.get(f"{self.comfyui_url}/queue", timeout=10)
+                queue_response = comfyui_get(f"{self.comfyui_url}/queue", 'probe')
                 queue_data = queue_response.json()
                 
                 # Check if in running queue
@@ -162,7 +163,7 @@ class RunPodPodClient:
         """Get job output from ComfyUI"""
         try:
             # Get history
-            response = requests.get(f"{self.comfyui_url}/history/{prompt_id}", timeout=10)
+            response = comfyui_get(f"{self.comfyui_url}/history/{prompt_id}")
             response.raise_for_status()
             
             history = response.json()
@@ -186,7 +187,7 @@ class RunPodPodClient:
                             'type': 'output'
                         }
                         
-                        img_response = requests.get(f"{self.comfyui_url}/view", params=params, timeout=30)
+                        img_response = comfyui_get(f"{self.comfyui_url}/view", 'transfer', params=params)
                         img_response.raise_for_status()
                         
                         return img_response.content
@@ -358,10 +359,9 @@ class RunPodPodClient:
                 "client_id": prompt_id
             }
             
-            response = requests.post(
+            response = comfyui_post(
                 f"{self.comfyui_url}/prompt",
-                json=payload,
-                timeout=self.timeout
+                json=payload
             )
             response.raise_for_status()
             
@@ -383,7 +383,7 @@ class RunPodPodClient:
                     'image': (filename, f, 'image/jpeg'),
                     'overwrite': (None, 'true')
                 }
-                response = requests.post(f"{self.comfyui_url}/upload/image", files=files, timeout=30)
+                response = comfyui_post(f"{self.comfyui_url}/upload/image", 'transfer', files=files)
                 response.raise_for_status()
                 
                 result = response.json()
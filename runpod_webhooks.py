@@ -0,0 +1,127 @@
+"""
+RunPod Webhooks
+Jobs are submitted to RunPod with a per-generation callback URL
+(/runpod/webhook/<generation_id>?token=...) whose token is an HMAC of the generation ID, so
+only RunPod - which got the URL from us - can complete or fail that generation. Without both
+RUNPOD_WEBHOOK_BASE_URL and RUNPOD_WEBHOOK_SECRET no URLs are issued, every callback is
+rejected and jobs are polled.
+
+A completed job's image is saved and the generation marked completed right in the webhook
+request (under the same claim_finalization() guard the finalizer uses). Callbacks that
+arrive before the dispatcher recorded the job ID only publish the status; the finalizer then
+sees it through RunPodClient.get_job_status() without waiting for its next poll.
+"""
+
+import hmac
+import os
+import hashlib
+import logging
+from flask import Blueprint, request, jsonify, current_app
+from models import db, Generation
+from job_queue import claim_finalization, release_finalization, mark_completed, mark_failed
+from result_delivery import save_result
+from runpod_client import decode_output_image, normalize_status, publish_job_status
+from config import RUNPOD_WEBHOOK_BASE_URL, RUNPOD_WEBHOOK_SECRET, OUTPUT_FOLDER
+
+logger = logging.getLogger(__name__)
+
+runpod_bp = Blueprint('runpod', __name__, url_prefix='/runpod')
+
+WEBHOOK_WORKER_ID = 'runpod-webhook'
+
+
+def webhooks_enabled(base_url=RUNPOD_WEBHOOK_BASE_URL, secret=RUNPOD_WEBHOOK_SECRET):
+    """True when callbacks can reach this app and their tokens can be signed"""
+    return bool(base_url and secret)
+
+
+def sign_generation(generation_id, secret=RUNPOD_WEBHOOK_SECRET):
+    """Webhook token for a generation"""
+    return hmac.new(secret.encode(), f"runpod:{generation_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def verify_generation(generation_id, token, secret=RUNPOD_WEBHOOK_SECRET):
+    """True if the token was issued for this generation (never without a secret)"""
+    return bool(secret and token) and hmac.compare_digest(sign_generation(generation_id, secret), token)
+
+
+def webhook_url(generation_id, base_url=RUNPOD_WEBHOOK_BASE_URL, secret=RUNPOD_WEBHOOK_SECRET):
+    """Signed callback URL for a generation, or None when no public base URL or secret is configured"""
+    if not webhooks_enabled(base_url, secret):
+        return None
+    return f"{base_url}/runpod/webhook/{generation_id}?token={sign_generation(generation_id, secret)}"
+
+
+def deliver_result(generation_id, payload, output_folder=OUTPUT_FOLDER, worker_id=WEBHOOK_WORKER_ID):
+    """
+    Apply a RunPod webhook payload to its generation
+
+    Returns:
+        str: 'completed', 'failed', 'published' (status recorded for the finalizer),
+             'ignored' (already settled or not a terminal status) or 'unknown'
+    """
+    job_id = payload.get('id')
+    status = normalize_status(payload.get('status'))
+    if not job_id or status == 'IN_PROGRESS':
+        return 'ignored'
+
+    generation = db.session.get(Generation, generation_id)
+    if generation is None:
+        logger.warning(f"RunPod webhook for unknown generation {generation_id} (job {job_id})")
+        return 'unknown'
+
+    if generation.status != 'processing' or generation.prompt_id != str(job_id):
+        if generation.status in ('dispatching', 'processing'):
+            # The dispatcher has not stored the job ID yet - let the finalizer pick it up
+            publish_job_status(job_id, status)
+            return 'published'
+        return 'ignored'
+
+    if status == 'FAILED':
+        mark_failed(generation, payload.get('error') or f"RunPod job {payload.get('status')}")
+        return 'failed'
+
+    image_data = decode_output_image(payload.get('output'))
+    if not image_data:
+        mark_failed(generation, 'No image in RunPod output')
+        return 'failed'
+
+    if not claim_finalization(generation, worker_id):
+        return 'ignored'
+
+    result_filename = f"result_{job_id}.png"
+    try:
+        save_result(image_data, os.path.join(output_folder, result_filename))
+    except Exception as e:
+        logger.error(f"Failed to save RunPod result for generation {generation.id}: {e}")
+        release_finalization(generation)
+        publish_job_status(job_id, status)
+        return 'published'
+
+    mark_completed(generation, result_filename)
+    logger.info(f"Generation {generation.id} completed by RunPod webhook: {result_filename}")
+    return 'completed'
+
+
+@runpod_bp.route('/webhook/<generation_id>', methods=['POST'])
+def runpod_webhook(generation_id):
+    """RunPod job callback - answers 200 to every signed call so RunPod does not retry"""
+    secret = current_app.config.get('RUNPOD_WEBHOOK_SECRET', RUNPOD_WEBHOOK_SECRET)
+    if not secret:
+        logger.warning(f"Rejected RunPod webhook for generation {generation_id}: RUNPOD_WEBHOOK_SECRET is not set")
+        return jsonify({'error': 'Webhooks are disabled'}), 403
+    if not verify_generation(generation_id, request.args.get('token', ''), secret):
+        logger.warning(f"Rejected RunPod webhook with a bad token for generation {generation_id}")
+        return jsonify({'error': 'Invalid token'}), 403
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Invalid payload'}), 400
+
+    try:
+        outcome = deliver_result(generation_id, payload, current_app.config.get('OUTPUT_FOLDER', OUTPUT_FOLDER))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"RunPod webhook error for generation {generation_id}: {e}")
+        return jsonify({'error': 'Failed to process webhook'}), 500
+    return jsonify({'received': True, 'outcome': outcome})
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations
+db.create_all() only creates missing tables - it never adds columns or indexes to a table that
+already exists. Schema changes to existing tables are listed here as numbered migrations. Each
+one runs once per database and is recorded in the schema_migrations table. init_db() applies
+pending migrations on startup, and `python schema_migrations.py` applies them by hand.
+
+Migrations inspect the live schema before changing it, so they are safe on databases that
+already received a change through create_all() or one of the old one-off fix scripts.
+
+Usage:
+    python schema_migrations.py
+"""
+
+import sys
+import logging
+from datetime import datetime
+import sqlalchemy as sa
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock - serializes gunicorn workers migrating at startup
+MIGRATION_LOCK_ID = 72210418
+
+migrations_table = sa.Table(
+    'schema_migrations', sa.MetaData(),
+    sa.Column('version', sa.String(20), primary_key=True),
+    sa.Column('name', sa.String(200), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False)
+)
+
+
+def add_columns(conn, table_name, columns):
+    """ALTER TABLE ADD COLUMN for each missing column ({name: {dialect: type}})"""
+    if not inspect(conn).has_table(table_name):
+        return  # db.create_all() builds it with every column
+    existing = {column['name'] for column in inspect(conn).get_columns(table_name)}
+    quoted = conn.dialect.identifier_preparer.quote(table_name)
+    for column_name, column_types in columns.items():
+        if column_name in existing:
+            continue
+        column_type = column_types.get(conn.dialect.name, column_types['postgresql'])
+        conn.execute(text(f"ALTER TABLE {quoted} ADD COLUMN {column_name} {column_type}"))
+        logger.info(f"Added {table_name}.{column_name}")
+
+
+def create_indexes(conn, index_names):
+    """Create model-defined indexes (by name) that the database does not have yet"""
+    from models import db
+
+    wanted = set(index_names)
+    for table in db.metadata.tables.values():
+        if not inspect(conn).has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in wanted and index.name not in existing:
+                index.create(conn)
+                logger.info(f"Created index {index.name}")
+            wanted.discard(index.name)
+
+    if wanted:
+        raise RuntimeError(f"Indexes not defined on any model: {', '.join(sorted(wanted))}")
+
+
+def migrate_generation_job_queue(conn):
+    """Job queue, backend pinning, batching and priority columns on generation"""
+    add_columns(conn, 'generation', {
+        'job_params': {'postgresql': 'JSON', 'sqlite': 'JSON'},
+        'attempts': {'postgresql': 'INTEGER DEFAULT 0', 'sqlite': 'INTEGER DEFAULT 0'},
+        'claimed_by': {'postgresql': 'VARCHAR(100)', 'sqlite': 'VARCHAR(100)'},
+        'claimed_at': {'postgresql': 'TIMESTAMP', 'sqlite': 'DATETIME'},
+        'backend_url': {'postgresql': 'VARCHAR(255)', 'sqlite': 'VARCHAR(255)'},
+        'output_node': {'postgresql': 'VARCHAR(20)', 'sqlite': 'VARCHAR(20)'},
+        'priority': {'postgresql': 'INTEGER DEFAULT 1', 'sqlite': 'INTEGER DEFAULT 1'},
+        'scheduled_at': {'postgresql': 'TIMESTAMP', 'sqlite': 'DATETIME'},
+    })
+    # Rows queued before priority scheduling keep their arrival order
+    conn.execute(text("UPDATE generation SET scheduled_at = created_at WHERE scheduled_at IS NULL"))
+
+
+def migrate_verification_token_timestamp(conn):
+    """verification_token_created_at on user (email verification expiry)"""
+    add_columns(conn, 'user', {
+        'verification_token_created_at': {'postgresql': 'TIMESTAMP', 'sqlite': 'DATETIME'},
+    })
+
+
+def migrate_hot_path_indexes(conn):
+    """Indexes for prompt lookups, the job claim, dashboards, admin queues and file management"""
+    create_indexes(conn, [
+        'ix_generation_prompt_id',
+        'ix_generation_status_scheduled_at',
+        'ix_generation_status_completed_at',
+        'ix_generation_user_id_created_at',
+        'ix_facial_evaluation_status_created_at',
+        'ix_facial_evaluation_status_completed_at',
+        'ix_facial_evaluation_user_id_created_at',
+        'ix_facial_evaluation_generation_id',
+        'ix_facial_evaluation_original_image_filename',
+        'ix_facial_evaluation_morphed_image_filename',
+        'ix_facial_evaluation_secondary_image_filename',
+        'ix_ratios_morph_status_created_at',
+        'ix_ratios_morph_status_completed_at',
+        'ix_ratios_morph_user_id_created_at',
+    ])
+
+
+def migrate_credit_ledger(conn):
+    """credit_ledger table, opened with each existing user's current balance"""
+    from models import CreditLedgerEntry
+
+    CreditLedgerEntry.__table__.create(conn, checkfirst=True)
+    conn.execute(text(
+        "INSERT INTO credit_ledger (user_id, delta, balance_after, reason, created_at) "
+        "SELECT id, credits, credits, 'opening_balance', :now FROM \"user\" "
+        "WHERE id NOT IN (SELECT user_id FROM credit_ledger)"
+    ), {'now': datetime.utcnow()})
+
+
+def migrate_generation_gpu_usage(conn):
+    """Provider, GPU time and estimated cost columns on generation (gpu_router.py)"""
+    add_columns(conn, 'generation', {
+        'gpu_backend': {'postgresql': 'VARCHAR(32)', 'sqlite': 'VARCHAR(32)'},
+        'gpu_seconds': {'postgresql': 'DOUBLE PRECISION', 'sqlite': 'FLOAT'},
+        'gpu_cost': {'postgresql': 'DOUBLE PRECISION', 'sqlite': 'FLOAT'},
+    })
+
+
+# (version, name, function(connection)) - append only, never renumber
+MIGRATIONS = [
+    ('0001', 'generation job queue columns', migrate_generation_job_queue),
+    ('0002', 'user verification token timestamp', migrate_verification_token_timestamp),
+    ('0003', 'hot path indexes', migrate_hot_path_indexes),
+    ('0004', 'credit ledger', migrate_credit_ledger),
+    ('0005', 'generation gpu usage columns', migrate_generation_gpu_usage),
+]
+
+
+def get_applied_versions(conn):
+    return {row[0] for row in conn.execute(sa.select(migrations_table.c.version))}
+
+
+def run_migrations(engine, migrations=MIGRATIONS):
+    """
+    Apply pending migrations in order, all in one transaction
+
+    Returns:
+        list of versions applied by this call (empty when the schema is current)
+    """
+    applied = []
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Index builds can outlast the app's statement_timeout (db_engine.py)
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {'id': MIGRATION_LOCK_ID})
+        migrations_table.create(conn, checkfirst=True)
+        done = get_applied_versions(conn)
+
+        for version, name, migrate in migrations:
+            if version in done:
+                continue
+            logger.info(f"Applying schema migration {version}: {name}")
+            migrate(conn)
+            conn.execute(migrations_table.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+            applied.append(version)
+
+    if applied:
+        logger.info(f"Applied schema migrations: {', '.join(applied)}")
+    return applied
+
+
+if __name__ == '__main__':
+    from config import DATABASE_URL
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        versions = run_migrations(sa.create_engine(DATABASE_URL))
+        print(f"🎉 Applied {len(versions)} migration(s)" if versions else "✅ Schema is up to date")
+        sys.exit(0)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
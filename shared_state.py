@@ -0,0 +1,274 @@
+"""
+Shared State Store
+Cooldowns, the backend registry and short-lived job state have to agree across every gunicorn
+worker and replica, so they live behind one small Redis-style interface (string values,
+optional expiry, SET NX, INCR, batched reads and writes) instead of in module globals:
+
+    memory://                 In-process store (tests, single-process development)
+    redis://host:6379/0       Redis (optional dependency)
+    postgresql://... / sqlite:///instance/shared_state.db
+                              SQL table (SQLite runs in WAL mode so readers never block writers)
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from config import SHARED_STATE_URL
+
+logger = logging.getLogger(__name__)
+
+PURGE_PROBABILITY = 0.01  # Fraction of SQL writes that also delete expired rows
+
+
+class MemoryStore:
+    """Dict-backed store with the same semantics as the shared backends"""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at or None)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+        return entry[0] if entry else None
+
+    def get_many(self, keys):
+        """Values of the keys that exist, as {key: value}"""
+        now = time.time()
+        with self._lock:
+            entries = {key: self._live(key, now) for key in keys}
+        return {key: entry[0] for key, entry in entries.items() if entry}
+
+    def set(self, key, value, ex=None, nx=False):
+        """Store value (expiring after ex seconds); with nx, only if the key is absent"""
+        now = time.time()
+        with self._lock:
+            if nx and self._live(key, now) is not None:
+                return False
+            self._data[key] = (str(value), now + ex if ex else None)
+        return True
+
+    def set_many(self, mapping, ex=None):
+        expires_at = time.time() + ex if ex else None
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (str(value), expires_at)
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def incr(self, key, amount=1, ex=None):
+        """Add to an integer counter; a new counter expires after ex seconds"""
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                entry = ('0', now + ex if ex else None)
+            value = int(entry[0]) + amount
+            self._data[key] = (str(value), entry[1])
+        return value
+
+
+class SQLStore:
+    """Key/value table in Postgres or SQLite (created on first use)"""
+
+    def __init__(self, url):
+        import sqlalchemy as sa
+        from sqlalchemy import event
+        from db_engine import get_engine_options, register_engine
+
+        self.sa = sa
+        if url.startswith('sqlite:///'):
+            path = url[len('sqlite:///'):]
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.engine = sa.create_engine(url, **get_engine_options(url))
+        register_engine('shared_state', self.engine)
+
+        if self.engine.dialect.name == 'sqlite':
+            @event.listens_for(self.engine, 'connect')
+            def _sqlite_pragmas(dbapi_connection, _):
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA busy_timeout=5000')
+                cursor.close()
+
+        self.table = sa.Table(
+            'shared_state', sa.MetaData(),
+            sa.Column('key', sa.String(255), primary_key=True),
+            sa.Column('value', sa.Text, nullable=False),
+            sa.Column('expires_at', sa.Float, nullable=True, index=True)
+        )
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    def _begin(self):
+        if not self._created:
+            with self._create_lock:
+                if not self._created:
+                    self.table.create(self.engine, checkfirst=True)
+                    self._created = True
+        return self.engine.begin()
+
+    def _not_expired(self, now):
+        column = self.table.c.expires_at
+        return self.sa.or_(column.is_(None), column > now)
+
+    def _maybe_purge(self, connection, now):
+        if random.random() < PURGE_PROBABILITY:
+            connection.execute(self.table.delete().where(self.table.c.expires_at <= now))
+
+    def _upsert(self, connection, key, value, expires_at):
+        sa = self.sa
+        dialect = self.engine.dialect.name
+        values = {'key': key, 'value': str(value), 'expires_at': expires_at}
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(self.table).values(**values)
+            statement = statement.on_conflict_do_update(
+                index_elements=['key'],
+                set_={'value': statement.excluded.value, 'expires_at': statement.excluded.expires_at}
+            )
+            connection.execute(statement)
+        else:
+            connection.execute(self.table.delete().where(self.table.c.key == key))
+            connection.execute(sa.insert(self.table).values(**values))
+
+    def get(self, key):
+        now = time.time()
+        with self._begin() as connection:
+            row = connection.execute(
+                self.sa.select(self.table.c.value).where(self.table.c.key == key, self._not_expired(now))
+            ).first()
+        return row[0] if row else None
+
+    def get_many(self, keys):
+        """Values of the keys that exist, as {key: value} (one SELECT)"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        with self._begin() as connection:
+            rows = connection.execute(
+                self.sa.select(self.table.c.key, self.table.c.value)
+                .where(self.table.c.key.in_(keys), self._not_expired(now))
+            ).all()
+        return {key: value for key, value in rows}
+
+    def set(self, key, value, ex=None, nx=False):
+        """Store value (expiring after ex seconds); with nx, only if the key is absent"""
+        now = time.time()
+        expires_at = now + ex if ex else None
+        try:
+            with self._begin() as connection:
+                if nx:
+                    connection.execute(self.table.delete().where(self.table.c.key == key, self.table.c.expires_at <= now))
+                    connection.execute(self.sa.insert(self.table).values(key=key, value=str(value), expires_at=expires_at))
+                else:
+                    self._upsert(connection, key, value, expires_at)
+                self._maybe_purge(connection, now)
+            return True
+        except self.sa.exc.IntegrityError:
+            return False  # NX lost the race - another worker holds the key
+
+    def set_many(self, mapping, ex=None):
+        now = time.time()
+        expires_at = now + ex if ex else None
+        with self._begin() as connection:
+            for key, value in mapping.items():
+                self._upsert(connection, key, value, expires_at)
+            self._maybe_purge(connection, now)
+
+    def delete(self, *keys):
+        if not keys:
+            return 0
+        with self._begin() as connection:
+            return connection.execute(self.table.delete().where(self.table.c.key.in_(keys))).rowcount
+
+    def incr(self, key, amount=1, ex=None):
+        """Add to an integer counter atomically; a new counter expires after ex seconds"""
+        sa = self.sa
+        value_column = self.table.c.value
+        for _ in range(3):
+            now = time.time()
+            try:
+                with self._begin() as connection:
+                    row = connection.execute(
+                        self.table.update()
+                        .where(self.table.c.key == key, self._not_expired(now))
+                        .values(value=sa.cast(sa.cast(value_column, sa.Integer) + amount, sa.String))
+                        .returning(value_column)
+                    ).first()
+                    if row:
+                        return int(row[0])
+                    connection.execute(self.table.delete().where(self.table.c.key == key))
+                    connection.execute(sa.insert(self.table).values(key=key, value=str(amount), expires_at=now + ex if ex else None))
+                    return amount
+            except sa.exc.IntegrityError:
+                continue  # Another worker created the counter first - increment theirs
+        raise RuntimeError(f"Could not increment shared counter {key}")
+
+
+class RedisStore:
+    """Thin adapter over redis-py (string responses, set_many via a pipeline)"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        return {key: value for key, value in zip(keys, self.client.mget(keys)) if value is not None}
+
+    def set(self, key, value, ex=None, nx=False):
+        return bool(self.client.set(key, value, ex=int(ex) if ex else None, nx=nx))
+
+    def set_many(self, mapping, ex=None):
+        pipeline = self.client.pipeline()
+        for key, value in mapping.items():
+            pipeline.set(key, value, ex=int(ex) if ex else None)
+        pipeline.execute()
+
+    def delete(self, *keys):
+        return self.client.delete(*keys) if keys else 0
+
+    def incr(self, key, amount=1, ex=None):
+        pipeline = self.client.pipeline()
+        if ex:
+            pipeline.set(key, 0, ex=int(ex), nx=True)
+        pipeline.incrby(key, amount)
+        return pipeline.execute()[-1]
+
+
+def create_store(url=SHARED_STATE_URL):
+    """Store for a shared-state URL (falls back to in-process memory if it can't be opened)"""
+    try:
+        if not url or url.startswith('memory://'):
+            return MemoryStore()
+        if url.startswith(('redis://', 'rediss://')):
+            return RedisStore(url)
+        return SQLStore(url)
+    except Exception as e:
+        logger.error(f"Failed to open shared state store ({url.split('@')[-1]}): {e} - using per-process memory")
+        return MemoryStore()
+
+
+shared_state = create_store()
@@ -0,0 +1,165 @@
+"""
+GPU Status Reconciliation
+Each pass loads every processing Generation in one query, asks each backend once for its
+/queue and recent /history, fails the rows whose prompts failed in a single transaction and
+publishes every status to the shared state store, so /status and /events on any web worker
+answer without calling the GPU. The worker's finalizer uses the same pass to find prompts
+ready to be saved.
+"""
+
+import logging
+import threading
+from config import STATUS_RECONCILE_INTERVAL, STATUS_HISTORY_MAX_ITEMS, STATUS_MAP_MAX_AGE
+from gpu_backends import GpuBackend
+from job_queue import get_in_flight_generations, fail_generations
+from shared_state import MemoryStore, shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class GPUStatusMap:
+    """Last reconciled GPU status per prompt ID, kept in a shared store with a short expiry"""
+
+    KEY_PREFIX = 'gpu_status:'
+
+    def __init__(self, max_age=STATUS_MAP_MAX_AGE, store=None):
+        """
+        Args:
+            max_age: Seconds a published status stays readable
+            store: Shared state store (defaults to a per-process MemoryStore)
+        """
+        self.max_age = max_age
+        self.store = store if store is not None else MemoryStore()
+        self._last_counts = {}
+
+    def publish(self, statuses):
+        """Record a pass's results (one write batch)"""
+        if statuses:
+            self.store.set_many({f"{self.KEY_PREFIX}{prompt_id}": status for prompt_id, status in statuses.items()},
+                                ex=self.max_age)
+        counts = {}
+        for status in statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        self._last_counts = counts
+
+    def get(self, prompt_id):
+        """Reconciled status, or None if unknown or older than max_age"""
+        try:
+            return self.store.get(f"{self.KEY_PREFIX}{prompt_id}")
+        except Exception as e:
+            logger.warning(f"Shared status lookup failed for {prompt_id}: {e}")
+            return None
+
+    def snapshot(self):
+        """Statuses seen by this process's last pass, for /health"""
+        return dict(self._last_counts)
+
+
+gpu_status_map = GPUStatusMap(store=shared_state)
+
+
+def reconcile_statuses(generations, get_client, max_items=STATUS_HISTORY_MAX_ITEMS):
+    """
+    GPU status of every generation's prompt, with one bulk fetch per backend
+
+    Clients without get_bulk_status() (Replicate, Vast.ai, Modal) fall back to one status()
+    per prompt (get_job_status() for clients outside the GpuBackend interface). Backends
+    that could not be read are left out of the result.
+
+    Returns:
+        dict: prompt_id -> COMPLETED / FAILED / IN_PROGRESS
+    """
+    backends = {}  # backend key -> (client, prompt IDs)
+    for generation in generations:
+        client = get_client(generation)
+        if client is None or not generation.prompt_id:
+            continue
+        key = getattr(client, 'base_url', None) or id(client)
+        backends.setdefault(key, (client, set()))[1].add(generation.prompt_id)
+
+    statuses = {}
+    for client, prompt_ids in backends.values():
+        if hasattr(client, 'get_bulk_status'):
+            statuses.update(client.get_bulk_status(prompt_ids, max_items) or {})
+        elif isinstance(client, GpuBackend):
+            for prompt_id in prompt_ids:
+                statuses[prompt_id] = client.status(prompt_id)
+        else:
+            for prompt_id in prompt_ids:
+                statuses[prompt_id] = client.get_job_status(prompt_id)
+    return statuses
+
+
+def reports_failures(client):
+    """True if a FAILED status from this client means the job failed, not that it was unreachable"""
+    return hasattr(client, 'get_bulk_status') or getattr(client, 'authoritative_status', False)
+
+
+class StatusReconciler:
+    """Runs reconciliation passes over in-flight generations, optionally in a background thread"""
+
+    def __init__(self, app, get_client, interval=STATUS_RECONCILE_INTERVAL,
+                 max_items=STATUS_HISTORY_MAX_ITEMS, status_map=gpu_status_map):
+        """
+        Args:
+            app: Flask app (passes run in its app context)
+            get_client: Callable(Generation) -> GPU client its prompt runs on
+            interval: Seconds between background passes
+            max_items: Recent /history entries fetched per backend
+            status_map: Map the results are published to
+        """
+        self.app = app
+        self.get_client = get_client
+        self.interval = interval
+        self.max_items = max_items
+        self.status_map = status_map
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def reconcile(self):
+        """
+        One pass: fetch, publish, and fail rows whose prompts failed on the GPU (in one transaction)
+
+        Must run inside an app context.
+
+        Returns:
+            (generations, statuses): the processing rows and prompt_id -> status
+        """
+        generations = get_in_flight_generations()
+        if not generations:
+            return [], {}
+
+        statuses = reconcile_statuses(generations, self.get_client, self.max_items)
+        self.status_map.publish(statuses)
+
+        # Some per-prompt status calls report network errors as FAILED too - only trust bulk
+        # results and backends whose status() is authoritative
+        failed_ids = [
+            generation.id for generation in generations
+            if statuses.get(generation.prompt_id) == 'FAILED' and reports_failures(self.get_client(generation))
+        ]
+        fail_generations(failed_ids, 'Processing failed on the GPU')
+        return generations, statuses
+
+    def start(self):
+        """Start background passes (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="status-reconciler", daemon=True)
+            self._thread.start()
+        logger.info(f"🔄 GPU status reconciler started (every {self.interval}s)")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    self.reconcile()
+            except Exception as e:
+                logger.error(f"Status reconciliation failed: {e}")
+            self._stop_event.wait(self.interval)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script for /process admission control (offline - in-memory store, SQLite)
+"""
+
+from shared_state import MemoryStore
+from admission_control import AdmissionController, estimate_wait
+from job_queue import claim_next_generation, mark_processing, get_queue_depth
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+
+def make_controller(**kwargs):
+    options = {
+        'store': MemoryStore(),
+        'user_limits': {'free': [(3600, 2, 'hourly')], 'paid': [(3600, 5, 'hourly')]},
+        'global_limits': [(60, 3, 'site-wide')],
+        'max_wait': {'free': 60, 'paid': 300}
+    }
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_user_buckets_by_tier():
+    """Free users run out before paid users; Retry-After points at the window refill"""
+    print("🧪 Testing per-user buckets")
+    controller = make_controller(global_limits=[])
+    now = 7200 + 600  # 10 minutes into an hour window
+
+    assert controller.take_tokens(1, 'free', now=now)[0] is None
+    assert controller.take_tokens(1, 'free', now=now)[0] is None
+    rejection, keys = controller.take_tokens(1, 'free', now=now)
+    assert rejection['reason'] == 'hourly_limit'
+    assert rejection['retry_after'] == 3000
+    assert keys == []
+
+    for _ in range(5):
+        assert controller.take_tokens(2, 'paid', now=now)[0] is None
+    assert controller.take_tokens(2, 'paid', now=now)[0] is not None
+    assert controller.take_tokens(1, 'free', now=now + 3000)[0] is None  # Next window refills
+    print("✅ Per-user buckets work")
+    return True
+
+
+def test_global_bucket_and_refund():
+    """The site-wide bucket spans users; refunded tokens can be drawn again"""
+    print("🧪 Testing site-wide bucket")
+    controller = make_controller()
+    now = 120
+
+    _, keys = controller.take_tokens(1, 'paid', now=now)
+    controller.take_tokens(2, 'paid', now=now)
+    controller.take_tokens(3, 'paid', now=now)
+    rejection, _ = controller.take_tokens(4, 'paid', now=now)
+    assert rejection['reason'] == 'site-wide_limit'
+    assert 'GPU is overloaded' in rejection['message']
+
+    controller.refund(keys)  # User 1's job was never queued (e.g. no credits)
+    assert controller.take_tokens(4, 'paid', now=now)[0] is None
+    print("✅ Site-wide bucket works")
+    return True
+
+
+def test_eta_from_observed_throughput():
+    """Wait estimates use measured execution times, with a default for fresh backends"""
+    print("🧪 Testing wait estimate")
+    eta, rate = estimate_wait(9, {'http://a': {'in_flight': 2, 'avg_seconds': 20.0}}, backend_count=1)
+    assert eta == 200 and rate == 1 / 20
+
+    eta, _ = estimate_wait(9, {'http://a': {'in_flight': 2, 'avg_seconds': 20.0}}, backend_count=2, default_seconds=20)
+    assert eta == 100  # Second backend has no history yet
+
+    eta, _ = estimate_wait(0, {}, default_seconds=30)
+    assert eta == 30
+    print("✅ Wait estimate works")
+    return True
+
+
+def test_queue_admission_by_tier():
+    """A deep queue turns free jobs away first, with an honest Retry-After"""
+    print("🧪 Testing queue admission")
+    app = create_test_app()
+    controller = make_controller()
+    load = {'http://a': {'in_flight': 1, 'avg_seconds': 10.0}}
+
+    with app.app_context():
+        user = create_user()
+        for index in range(8):
+            queue_job(user, f"{index}.png")
+        mark_processing(claim_next_generation('worker-a'), 'prompt-1')
+
+        depth = get_queue_depth()
+        assert depth == {'queued': 7, 'in_flight': 1}
+
+        rejection = controller.check_queue('free', depth, load)
+        assert rejection['reason'] == 'queue_full'
+        assert rejection['eta_seconds'] == 90
+        assert rejection['retry_after'] == 30  # Until the wait drops to the free target of 60s
+        assert controller.check_queue('paid', depth, load) is None
+
+    print("✅ Queue admission works")
+    return True
+
+
+if __name__ == '__main__':
+    test_user_buckets_by_tier()
+    test_global_bucket_and_refund()
+    test_eta_from_observed_throughput()
+    test_queue_admission_by_tier()
+    print("🎉 All admission control tests passed!")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for the cached backend health monitor (offline - uses fake probes)
+"""
+
+from backend_health import BackendHealthMonitor, HEALTHY, DEGRADED, DOWN
+
+
+class FakeProbe:
+    """Probe whose result the test controls; counts how often it runs"""
+
+    def __init__(self):
+        self.calls = 0
+        self.ok = True
+        self.url = 'https://fake-tunnel.trycloudflare.com'
+
+    def __call__(self):
+        self.calls += 1
+        if self.ok is None:
+            raise ConnectionError('tunnel closed')
+        return self.ok, self.url
+
+
+def create_monitor(probe, **kwargs):
+    monitor = BackendHealthMonitor(interval=3600, degraded_latency_ms=1000, down_after_failures=2, **kwargs)
+    monitor.register('comfyui', probe)
+    return monitor
+
+
+def test_reads_are_cached():
+    """Only the first read probes inline; later reads come from the cached state"""
+    print("🧪 Testing cached reads")
+    probe = FakeProbe()
+    monitor = create_monitor(probe)
+    monitor.start = lambda: None  # No background thread in tests
+
+    for _ in range(50):
+        state = monitor.get('comfyui')
+
+    assert probe.calls == 1
+    assert state.status == HEALTHY
+    assert state.url == 'https://fake-tunnel.trycloudflare.com'
+    assert monitor.is_available('comfyui')
+    print("✅ 50 reads, 1 probe")
+    return True
+
+
+def test_state_transitions():
+    """healthy -> degraded on a single failure or slow probe -> down after repeated failures"""
+    print("🧪 Testing health state transitions")
+    probe = FakeProbe()
+    monitor = create_monitor(probe)
+
+    assert monitor.refresh('comfyui').status == HEALTHY
+
+    assert monitor.report('comfyui', True, latency_ms=2500).status == DEGRADED
+
+    probe.ok = None
+    state = monitor.refresh('comfyui')
+    assert state.status == DEGRADED
+    assert state.error == 'tunnel closed'
+    assert state.available
+
+    state = monitor.refresh('comfyui')
+    assert state.status == DOWN
+    assert not state.available
+    assert state.url == 'https://fake-tunnel.trycloudflare.com'  # Last known URL kept
+
+    probe.ok = True
+    probe.url = 'https://new-tunnel.trycloudflare.com/'
+    state = monitor.refresh('comfyui')
+    assert state.status == HEALTHY
+    assert state.url == 'https://new-tunnel.trycloudflare.com'
+    assert state.consecutive_failures == 0
+    print("✅ Transitions correct")
+    return True
+
+
+def test_first_failure_is_down():
+    """A backend never seen healthy goes straight to down"""
+    print("🧪 Testing first failed probe")
+    probe = FakeProbe()
+    probe.ok = False
+    monitor = create_monitor(probe)
+    assert monitor.refresh('comfyui').status == DOWN
+    print("✅ Unknown backend marked down")
+    return True
+
+
+if __name__ == '__main__':
+    test_reads_are_cached()
+    test_state_transitions()
+    test_first_failure_is_down()
+    print("🎉 All backend health tests passed!")
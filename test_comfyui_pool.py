@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Test script for the multi-backend ComfyUI pool (offline - fake probes, temp registry, SQLite)
+"""
+
+import os
+import time
+import tempfile
+import threading
+from datetime import datetime, timedelta
+import tunnel_registry
+from shared_state import MemoryStore
+from backend_health import BackendHealthMonitor, pool_backend_name
+from comfyui_pool import ComfyUIPool
+from models import db, Generation
+from job_queue import get_backend_load
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+HOME_GPU = 'https://home-5090.trycloudflare.com'
+RENTED_POD = 'https://pod-a100.proxy.runpod.net'
+
+
+def use_temp_registry():
+    tunnel_registry.store = MemoryStore()
+    tunnel_registry.REGISTRY_FILE = os.path.join(tempfile.mkdtemp(), 'detected_tunnel.json')
+
+
+class FakePool(ComfyUIPool):
+    """Pool whose /queue probe returns canned queue depths"""
+
+    queue_depths = {}
+    offline = set()
+
+    def _probe(self, backend):
+        if backend.url in self.offline:
+            raise ConnectionError('tunnel closed')
+        backend.queue_running, backend.queue_pending = self.queue_depths.get(backend.url, (0, 0))
+        return True, backend.url
+
+
+def create_pool(static_urls=()):
+    monitor = BackendHealthMonitor(interval=3600, down_after_failures=1)
+    monitor.start = lambda: None  # No background thread in tests
+    FakePool.queue_depths = {}
+    FakePool.offline = set()
+    return FakePool(client_factory=lambda url: f"client:{url}", static_urls=static_urls, monitor=monitor,
+                    default_exec_seconds=30)
+
+
+def test_registry_holds_a_set():
+    """Registered tunnels accumulate; legacy set_tunnel_url still overwrites"""
+    print("🧪 Testing tunnel registry set")
+    use_temp_registry()
+    tunnel_registry.add_tunnel_url(HOME_GPU)
+    tunnel_registry.add_tunnel_url(RENTED_POD)
+    tunnel_registry.add_tunnel_url(HOME_GPU)
+    assert tunnel_registry.get_tunnel_urls() == [RENTED_POD, HOME_GPU]
+    assert tunnel_registry.get_tunnel_url() == HOME_GPU
+
+    assert tunnel_registry.remove_tunnel_url(HOME_GPU)
+    assert tunnel_registry.get_tunnel_urls() == [RENTED_POD]
+    assert tunnel_registry.get_tunnel_url() == RENTED_POD
+
+    tunnel_registry.set_tunnel_url(HOME_GPU)
+    assert tunnel_registry.get_tunnel_urls() == [HOME_GPU]
+    print("✅ Registry stores a set of backends")
+    return True
+
+
+def test_concurrent_registrations_keep_every_url():
+    """Registrations racing on different workers do not drop each other's URLs"""
+    print("🧪 Testing concurrent tunnel registration")
+    use_temp_registry()
+
+    class SlowStore(MemoryStore):
+        """Widens the read-modify-write window so unserialized writers would lose updates"""
+
+        def get(self, key):
+            value = super().get(key)
+            if key == tunnel_registry.REGISTRY_KEY:
+                time.sleep(0.02)
+            return value
+
+    tunnel_registry.store = SlowStore()
+    urls = [f"https://gpu-{i}.trycloudflare.com" for i in range(8)]
+    threads = [threading.Thread(target=tunnel_registry.add_tunnel_url, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(tunnel_registry.get_tunnel_urls()) == sorted(urls)
+    assert tunnel_registry.store.get(tunnel_registry.REGISTRY_LOCK_KEY) is None
+    print("✅ Concurrent registrations are all kept")
+    return True
+
+
+def test_routes_to_lowest_expected_completion():
+    """A deep queue on a fast GPU can still beat an idle slow one; reservations spread bursts"""
+    print("🧪 Testing queue-depth-aware routing")
+    use_temp_registry()
+    tunnel_registry.add_tunnel_url(HOME_GPU)
+    pool = create_pool(static_urls=[RENTED_POD])
+
+    FakePool.queue_depths = {HOME_GPU: (1, 2), RENTED_POD: (0, 0)}
+    load = {
+        HOME_GPU: {'in_flight': 3, 'avg_seconds': 10},   # (3 + 1) * 10 = 40s
+        RENTED_POD: {'in_flight': 0, 'avg_seconds': 60}  # (0 + 1) * 60 = 60s
+    }
+
+    assert pool.choose_backend(load) == HOME_GPU   # 40s vs 60s
+    assert pool.choose_backend(load) == HOME_GPU   # 50s vs 60s (one reserved)
+    assert pool.choose_backend(load) == RENTED_POD  # 60s vs 60s, tie broken by latency/order
+    pool.release(HOME_GPU)
+    pool.release(HOME_GPU)
+    pool.release(RENTED_POD)
+
+    assert pool.get_client(HOME_GPU) == f"client:{HOME_GPU}"
+    print("✅ Routed by expected completion time")
+    return True
+
+
+def test_skips_down_backends_and_prunes_registered_ones():
+    """Down backends get no work; registered ones are dropped after the expiry, static ones kept"""
+    print("🧪 Testing down backends")
+    use_temp_registry()
+    tunnel_registry.add_tunnel_url(HOME_GPU)
+    pool = create_pool(static_urls=[RENTED_POD])
+    pool.expiry = 0
+
+    FakePool.offline = {HOME_GPU, RENTED_POD}
+    assert pool.choose_backend() is None
+    assert pool.monitor.peek(pool_backend_name(HOME_GPU)).status == 'down'
+
+    pool.prune()  # Marks down_since
+    pool.backends()[0].down_since -= 1
+    pool.backends()[1].down_since -= 1
+    pool.prune()
+
+    assert [backend.url for backend in pool.backends()] == [RENTED_POD]
+    assert tunnel_registry.get_tunnel_urls() == []
+
+    FakePool.offline = set()
+    pool.monitor.refresh(pool_backend_name(RENTED_POD))
+    assert pool.choose_backend() == RENTED_POD
+    print("✅ Down backends skipped, expired tunnel pruned")
+    return True
+
+
+def test_backend_load_from_database():
+    """In-flight counts and average execution time come from Generation rows"""
+    print("🧪 Testing backend load query")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        now = datetime.utcnow()
+
+        for seconds in (20, 40):
+            generation = queue_job(user, 'done.png')
+            generation.status = 'completed'
+            generation.backend_url = HOME_GPU
+            generation.started_at = now - timedelta(seconds=seconds)
+            generation.completed_at = now
+
+        running = queue_job(user, 'running.png')
+        running.status = 'processing'
+        running.backend_url = RENTED_POD
+        db.session.commit()
+
+        load = get_backend_load()
+        assert load[HOME_GPU] == {'in_flight': 0, 'avg_seconds': 30}
+        assert load[RENTED_POD] == {'in_flight': 1, 'avg_seconds': None}
+        assert Generation.query.filter_by(backend_url=RENTED_POD).count() == 1
+
+    print("✅ Backend load correct")
+    return True
+
+
+if __name__ == '__main__':
+    test_registry_holds_a_set()
+    test_concurrent_registrations_keep_every_url()
+    test_routes_to_lowest_expected_completion()
+    test_skips_down_backends_and_prunes_registered_ones()
+    test_backend_load_from_database()
+    print("🎉 All ComfyUI pool tests passed!")
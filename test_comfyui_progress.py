@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared ComfyUI progress subscriber (offline - feeds websocket messages directly)
+"""
+
+import json
+from comfyui_progress import ComfyUIProgressSubscriber, to_websocket_url, format_sse
+
+
+def ws_message(msg_type, **data):
+    return json.dumps({'type': msg_type, 'data': data})
+
+
+def drain(listener):
+    events = []
+    while not listener.empty():
+        events.append(listener.get_nowait())
+    return events
+
+
+def test_websocket_url():
+    """http(s) base URLs map to ws(s) /ws URLs"""
+    print("🧪 Testing websocket URL conversion")
+    assert to_websocket_url('https://abc.trycloudflare.com/', 'c1') == 'wss://abc.trycloudflare.com/ws?clientId=c1'
+    assert to_websocket_url('http://127.0.0.1:8188', 'c2') == 'ws://127.0.0.1:8188/ws?clientId=c2'
+    print("✅ Websocket URLs correct")
+    return True
+
+
+def test_progress_fan_out():
+    """Every listener on a prompt receives progress and completion; other prompts are isolated"""
+    print("🧪 Testing progress fan-out")
+    subscriber = ComfyUIProgressSubscriber('http://127.0.0.1:8188')
+
+    first = subscriber.listen('prompt-a')
+    second = subscriber.listen('prompt-a')
+    other = subscriber.listen('prompt-b')
+
+    subscriber.handle_message(ws_message('execution_start', prompt_id='prompt-a'))
+    subscriber.handle_message(ws_message('executing', node='8', prompt_id='prompt-a'))
+    # Older ComfyUI builds omit prompt_id on progress messages
+    subscriber.handle_message(ws_message('progress', value=5, max=20, node='8'))
+    subscriber.handle_message(ws_message('executing', node=None, prompt_id='prompt-a'))
+
+    for listener in (first, second):
+        events = drain(listener)
+        assert [e['type'] for e in events] == ['started', 'executing', 'progress', 'complete']
+        assert events[2]['value'] == 5 and events[2]['max'] == 20
+
+    assert drain(other) == []
+    print("✅ Progress fanned out to all listeners of the prompt")
+    return True
+
+
+def test_late_listener_gets_last_state():
+    """A browser that subscribes after completion still learns the prompt finished"""
+    print("🧪 Testing late subscription")
+    subscriber = ComfyUIProgressSubscriber('http://127.0.0.1:8188')
+
+    subscriber.handle_message(ws_message('execution_error', prompt_id='prompt-c', exception_message='CUDA out of memory'))
+
+    late = subscriber.listen('prompt-c')
+    events = drain(late)
+    assert events == [{'type': 'failed', 'message': 'CUDA out of memory'}]
+
+    subscriber.unlisten('prompt-c', late)
+    assert subscriber.get_prompt_state('prompt-c')['type'] == 'failed'
+    print("✅ Late listener received the final state")
+    return True
+
+
+def test_sse_format():
+    print("🧪 Testing SSE frame format")
+    assert format_sse('progress', {'value': 1}) == 'event: progress\ndata: {"value": 1}\n\n'
+    print("✅ SSE frame format correct")
+    return True
+
+
+if __name__ == '__main__':
+    test_websocket_url()
+    test_progress_fan_out()
+    test_late_listener_gets_last_state()
+    test_sse_format()
+    print("🎉 All ComfyUI progress tests passed!")
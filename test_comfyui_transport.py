@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for the pooled ComfyUI HTTP transport (offline - runs a local keep-alive server)
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from comfyui_transport import ComfyUITransport, get_transport, get_timeout
+
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    hits = {}
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        count = self.hits.get(self.path, 0) + 1
+        self.hits[self.path] = count
+        if self.path == '/flaky' and count == 1:
+            self._reply(503, {'error': 'tunnel warming up'})
+        else:
+            self._reply(200, {'path': self.path})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        self._reply(503, {'error': 'busy'})
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeComfyUIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_connection_reuse():
+    """Repeated calls to one backend share a single keep-alive connection"""
+    print("🧪 Testing connection reuse")
+    server, base_url = start_server()
+    try:
+        transport = ComfyUITransport(base_url, backoff=0)
+        for path in ('/system_stats', '/history/abc', '/history/abc', '/view'):
+            response = transport.request('GET', f"{base_url}{path}")
+            assert response.status_code == 200
+
+        stats = transport.get_stats()
+        assert stats['requests'] == 4
+        assert stats['handshakes'] == 1
+        assert stats['pool_hits'] == 3
+        print(f"✅ 4 requests, 1 handshake: {stats}")
+    finally:
+        server.shutdown()
+    return True
+
+
+def test_retry_policy():
+    """502-504 are retried for GETs but a POST /prompt is never re-sent"""
+    print("🧪 Testing retry policy")
+    server, base_url = start_server()
+    FakeComfyUIHandler.hits = {}
+    try:
+        transport = ComfyUITransport(base_url, backoff=0)
+        assert transport.request('GET', f"{base_url}/flaky").status_code == 200
+        assert FakeComfyUIHandler.hits['/flaky'] == 2
+
+        assert transport.request('POST', f"{base_url}/prompt", json={'prompt': {}}).status_code == 503
+        assert FakeComfyUIHandler.hits['/prompt'] == 1
+        print("✅ GET retried, POST sent once")
+    finally:
+        server.shutdown()
+    return True
+
+
+def test_shared_transport_per_backend():
+    """Clients pointing at the same backend get the same session"""
+    print("🧪 Testing shared transports")
+    first = get_transport('https://abc.trycloudflare.com/system_stats')
+    second = get_transport('https://ABC.trycloudflare.com/history/1')
+    other = get_transport('https://xyz.trycloudflare.com/system_stats')
+    assert first is second
+    assert first is not other
+    assert get_timeout('transfer')[1] > get_timeout('probe')[1]
+    print("✅ One transport per backend")
+    return True
+
+
+if __name__ == '__main__':
+    test_connection_reuse()
+    test_retry_policy()
+    test_shared_transport_per_backend()
+    print("🎉 All transport tests passed!")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for content-addressed ComfyUI upload dedup (offline - runs a local fake ComfyUI)
+"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from comfyui_uploads import UploadCache, ensure_uploaded, content_name, preseed_reference_images
+
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    input_files = set()
+    uploads = []
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        query = parse_qs(urlsplit(self.path).query)
+        self._reply(200 if query.get('filename', [''])[0] in self.input_files else 404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        name = re.search(rb'filename="([^"]+)"', body).group(1).decode()
+        self.input_files.add(name)
+        self.uploads.append(name)
+        self._reply(200, {'name': name, 'subfolder': '', 'type': 'input'})
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    FakeComfyUIHandler.input_files = set()
+    FakeComfyUIHandler.uploads = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeComfyUIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def write_image(folder, filename, data):
+    path = os.path.join(folder, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_same_bytes_uploaded_once():
+    """Re-running the same photo (any filename) skips the upload; new bytes upload"""
+    print("🧪 Testing upload dedup")
+    server, base_url = start_server()
+    folder = tempfile.mkdtemp()
+    cache = UploadCache(verify_interval=3600)
+
+    first = write_image(folder, 'user_1.png', b'same photo bytes')
+    again = write_image(folder, 'user_1_rerun.png', b'same photo bytes')
+    other = write_image(folder, 'user_2.png', b'different photo')
+
+    name = ensure_uploaded(base_url, first, cache)
+    assert name == hashlib.sha256(b'same photo bytes').hexdigest() + '.png'
+    assert ensure_uploaded(base_url, again, cache) == name
+    assert ensure_uploaded(base_url, other, cache) == content_name(other)
+    assert FakeComfyUIHandler.uploads == [name, content_name(other)]
+    assert cache.snapshot()['skipped'] == 1
+
+    server.shutdown()
+    print("✅ Same bytes uploaded once")
+    return True
+
+
+def test_lazy_verification_and_restart():
+    """Stale entries are re-checked with HEAD; a wiped input folder triggers a re-upload"""
+    print("🧪 Testing lazy verification")
+    server, base_url = start_server()
+    folder = tempfile.mkdtemp()
+    cache = UploadCache(verify_interval=0)  # Always re-check
+    path = write_image(folder, 'photo.png', b'photo')
+
+    name = ensure_uploaded(base_url, path, cache)
+    ensure_uploaded(base_url, path, cache)  # HEAD says present
+    assert FakeComfyUIHandler.uploads == [name]
+
+    FakeComfyUIHandler.input_files.clear()  # ComfyUI restarted with a fresh input folder
+    ensure_uploaded(base_url, path, cache)
+    assert FakeComfyUIHandler.uploads == [name, name]
+
+    # Another process already uploaded it - nothing cached locally, HEAD finds it
+    assert ensure_uploaded(base_url, path, UploadCache()) == name
+    assert len(FakeComfyUIHandler.uploads) == 2
+
+    server.shutdown()
+    print("✅ Lazy verification works")
+    return True
+
+
+def test_reference_preseed():
+    """Registering a backend uploads the reference chads once"""
+    print("🧪 Testing reference pre-seed")
+    server, base_url = start_server()
+    folder = tempfile.mkdtemp()
+    for filename in ('pitt.png', 'gandy.png'):
+        shutil.copy(os.path.join('reference_chads', filename), folder)
+    cache = UploadCache(verify_interval=3600)
+
+    preseed_reference_images(base_url, folder=folder, cache=cache).join(timeout=10)
+    assert len(FakeComfyUIHandler.uploads) == 2
+
+    ensure_uploaded(base_url, os.path.join(folder, 'pitt.png'), cache)
+    assert len(FakeComfyUIHandler.uploads) == 2
+
+    server.shutdown()
+    print("✅ Reference chads pre-seeded")
+    return True
+
+
+if __name__ == '__main__':
+    test_same_bytes_uploaded_once()
+    test_lazy_verification_and_restart()
+    test_reference_preseed()
+    print("🎉 All upload dedup tests passed!")
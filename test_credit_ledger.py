@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script for the atomic credit ledger (offline, SQLite)
+"""
+
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from models import db, User, CreditLedgerEntry
+from credit_ledger import debit_credits, credit_credits, adjust_credits, get_ledger_drift, compact_ledger
+from test_generation_job_queue import create_test_app, create_user
+
+
+def ledger(user_id):
+    return [(entry.reason, entry.delta, entry.balance_after) for entry in
+            CreditLedgerEntry.query.filter_by(user_id=user_id).order_by(CreditLedgerEntry.id).all()]
+
+
+def test_debit_and_credit():
+    """Balance changes come back from the UPDATE and are mirrored in the ledger"""
+    print("🧪 Testing debit and credit")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        assert user.credits == 5
+        assert debit_credits(user.id, 2, 'generation') == 3
+        assert user.credits == 3  # Identity map synchronized
+        assert debit_credits(user.id, 20, 'facial_evaluation') is None
+        assert credit_credits(user.id, 10, 'purchase', reference_id='tx-1') == 13
+        assert user.use_paid_credit()
+
+        assert ledger(user.id) == [
+            ('opening_balance', 5, 5), ('generation', -2, 3), ('purchase', 10, 13), ('generation', -1, 12)
+        ]
+        assert get_ledger_drift() == {}
+
+    print("✅ Debit and credit work")
+    return True
+
+
+def test_no_double_spend():
+    """Racing workers cannot spend more credits than the user has"""
+    print("🧪 Testing concurrent debits")
+    app = create_test_app()
+    with app.app_context():
+        user_id = create_user().id
+
+    successes = []
+
+    def spend():
+        with app.app_context():
+            if debit_credits(user_id, 1, 'generation') is not None:
+                successes.append(1)
+
+    threads = [threading.Thread(target=spend) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        assert len(successes) == 5
+        assert db.session.get(User, user_id).credits == 0
+        assert get_ledger_drift() == {}
+
+    print("✅ No double spend")
+    return True
+
+
+def test_debit_joins_caller_transaction():
+    """With commit=False a rolled-back request leaves balance and ledger untouched"""
+    print("🧪 Testing transactional debit")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        assert debit_credits(user.id, 4, 'ratios_morph', commit=False) == 1
+        db.session.rollback()
+        assert db.session.get(User, user.id).credits == 5
+        assert ledger(user.id) == [('opening_balance', 5, 5)]
+
+    print("✅ Transactional debit works")
+    return True
+
+
+def test_admin_adjustments():
+    """Set and subtract run under a row lock and record the difference"""
+    print("🧪 Testing admin adjustments")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        assert adjust_credits(user.id, lambda current: max(0, current - 8), 'admin_subtract') == 0
+        assert adjust_credits(user.id, lambda current: 50, 'admin_set') == 50
+        assert ledger(user.id)[1:] == [('admin_subtract', -5, 0), ('admin_set', 50, 50)]
+        assert adjust_credits('missing', lambda current: 1, 'admin_set') is None
+
+    print("✅ Admin adjustments work")
+    return True
+
+
+def test_compaction():
+    """Drift is reconciled and old entries fold into one carried-forward total"""
+    print("🧪 Testing compaction")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        for _ in range(3):
+            debit_credits(user.id, 1, 'generation')
+        # A maintenance script bypassing the ledger
+        db.session.execute(text("UPDATE user SET credits = credits + 7 WHERE id = :id"), {'id': user.id})
+        db.session.commit()
+        assert get_ledger_drift() == {user.id: (9, 2)}
+
+        CreditLedgerEntry.query.update({'created_at': datetime.utcnow() - timedelta(days=200)})
+        db.session.commit()
+
+        result = compact_ledger(retention_days=90)
+        assert result == {'reconciled': 1, 'folded': 4}
+        entries = ledger(user.id)
+        assert [(reason, delta) for reason, delta, _ in entries] == [('reconcile', 7), ('carried_forward', 2)]
+        assert get_ledger_drift() == {}
+
+        assert compact_ledger(retention_days=90) == {'reconciled': 0, 'folded': 0}
+
+    print("✅ Compaction works")
+    return True
+
+
+if __name__ == '__main__':
+    test_debit_and_credit()
+    test_no_double_spend()
+    test_debit_joins_caller_transaction()
+    test_admin_adjustments()
+    test_compaction()
+    print("🎉 All credit ledger tests passed!")
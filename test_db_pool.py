@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test script for database engine options and pool metrics (offline - temp SQLite files)
+"""
+
+import os
+import time
+import tempfile
+import threading
+import sqlalchemy as sa
+from db_engine import TimedQueuePool, get_engine_options, register_engine, get_pool_stats, dispose_engines
+from config import DB_POOL_SIZE, DB_STATEMENT_TIMEOUT_MS
+
+
+def timed_engine(name, pool_size=1, pool_timeout=0.2):
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pool.db')}"
+    engine = sa.create_engine(url, poolclass=TimedQueuePool, pool_size=pool_size, max_overflow=0, pool_timeout=pool_timeout)
+    register_engine(name, engine)
+    return engine
+
+
+def stats_for(name):
+    return next(stats for stats in get_pool_stats() if stats['name'] == name)
+
+
+def test_engine_options():
+    """Postgres gets the tuned pool and a statement timeout; SQLite keeps its defaults"""
+    print("🧪 Testing engine options")
+    options = get_engine_options('postgresql://user:pass@db/app')
+    assert options['poolclass'] is TimedQueuePool
+    assert options['pool_size'] == DB_POOL_SIZE
+    assert options['pool_pre_ping'] is True
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        assert options['connect_args']['options'] == f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    assert get_engine_options('sqlite:///instance/app.db') == {'pool_pre_ping': True}
+    print("✅ Engine options are correct")
+    return True
+
+
+def test_checkout_metrics():
+    """Checkouts, waits, overflow and timeouts are reported per engine"""
+    print("🧪 Testing checkout metrics")
+    engine = timed_engine('metrics')
+    with engine.connect() as conn:
+        conn.execute(sa.text('SELECT 1'))
+        stats = stats_for('metrics')
+        assert stats['checked_out'] == 1
+        assert stats['size'] == 1
+
+        # The only connection is taken - a second checkout waits and then times out
+        errors = []
+
+        def checkout():
+            try:
+                engine.connect()
+            except sa.exc.TimeoutError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        thread.join()
+        assert len(errors) == 1
+
+    stats = stats_for('metrics')
+    assert stats['checked_out'] == 0
+    assert stats['checkouts'] == 1
+    assert stats['timeouts'] == 1
+    assert stats['wait_ms_max'] < 200
+    print("✅ Checkout metrics are reported")
+    return True
+
+
+def test_wait_time_measured():
+    """A checkout that queues behind a busy connection shows up as a slow wait"""
+    print("🧪 Testing wait time measurement")
+    engine = timed_engine('waits', pool_timeout=5)
+    conn = engine.connect()
+    timer = threading.Timer(0.3, conn.close)
+    timer.start()
+    with engine.connect():
+        pass
+    timer.join()
+
+    stats = stats_for('waits')
+    assert stats['checkouts'] == 2
+    assert stats['wait_ms_max'] >= 250
+    assert stats['slow_checkouts'] == 1
+    print("✅ Wait time is measured")
+    return True
+
+
+def test_dispose_after_fork():
+    """A forked child gets fresh pools and keeps reporting under the same names"""
+    print("🧪 Testing fork-safe disposal")
+    engine = timed_engine('forked', pool_size=2)
+    with engine.connect() as conn:
+        conn.execute(sa.text('SELECT 1'))
+    inherited = engine.pool
+
+    pid = os.fork()
+    if pid == 0:
+        # os.register_at_fork already disposed the engines in this child
+        ok = engine.pool is not inherited and engine.pool.checkedin() == 0 and stats_for('forked')['checkouts'] == 1
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert engine.pool is inherited  # The parent's connections are untouched
+    assert engine.pool.checkedin() == 1
+
+    dispose_engines()
+    assert engine.pool is not inherited
+    with engine.connect() as conn:
+        conn.execute(sa.text('SELECT 1'))
+    assert stats_for('forked')['checkouts'] == 2
+    print("✅ Engines are disposed after fork")
+    return True
+
+
+if __name__ == '__main__':
+    test_engine_options()
+    test_checkout_metrics()
+    test_wait_time_measured()
+    test_dispose_after_fork()
+    print("🎉 All database pool tests passed!")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for micro-batched FaceDetailer prompts (offline - no ComfyUI, SQLite)
+"""
+
+from local_comfyui_client import LocalComfyUIClient
+from models import db, Generation
+from job_queue import claim_next_generation, claim_matching_generations, mark_processing
+from test_generation_job_queue import create_test_app, create_user, queue_job, enqueue_generation
+
+
+def test_batch_workflow_shares_model_nodes():
+    """One graph: shared checkpoint/LoRA/detector nodes, one LoadImage -> FaceDetailer -> SaveImage per job"""
+    print("🧪 Testing batch workflow graph")
+    client = LocalComfyUIClient(base_url='http://127.0.0.1:8188')
+    jobs = [
+        {'image_path': 'uploads/a.png', 'preset_name': '+1_Tier', 'denoise_strength': 0.10},
+        {'image_path': 'uploads/b.png', 'preset_name': '+2_Tier', 'denoise_strength': 0.15},
+        {'image_path': 'uploads/c.png', 'preset_name': 'Chad', 'denoise_strength': 0.25},
+    ]
+
+    workflow, output_nodes = client._prepare_batch_workflow(jobs)
+
+    class_counts = {}
+    for node in workflow.values():
+        class_counts[node['class_type']] = class_counts.get(node['class_type'], 0) + 1
+    assert class_counts['CheckpointLoaderSimple'] == 1
+    assert class_counts['LoraLoader'] == 1
+    assert class_counts['SAMLoader'] == 1
+    assert class_counts['LoadImage'] == 3
+    assert class_counts['FaceDetailer'] == 3
+    assert class_counts['SaveImage'] == 3
+
+    assert output_nodes[0] == '9' and len(set(output_nodes)) == 3
+    seeds = set()
+    for job, save_node in zip(jobs, output_nodes):
+        detailer_id = workflow[save_node]['inputs']['images'][0]
+        detailer = workflow[detailer_id]['inputs']
+        load_image = workflow[detailer['image'][0]]['inputs']
+        assert load_image['image'] == job['image_path'].split('/')[-1]
+        assert detailer['denoise'] == job['denoise_strength']
+        assert detailer['model'] == ['2', 0]  # Shared LoRA-patched model
+        seeds.add(detailer['seed'])
+    assert len(seeds) == 3
+
+    print("✅ Batch graph shares model nodes")
+    return True
+
+
+def test_claim_matching_generations():
+    """Only pending jobs accepted by the matcher join the batch, up to the limit"""
+    print("🧪 Testing batch claiming")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        leader = queue_job(user, 'leader.png')
+        queue_job(user, 'full-1.png')
+        enqueue_generation(user.id, 'custom.png', 'Custom', 'facedetailer',
+                           {'transform_mode': 'custom', 'selected_features': ['nose']})
+        queue_job(user, 'full-2.png')
+        queue_job(user, 'full-3.png')
+
+        assert claim_next_generation('worker-a').id == leader.id
+
+        is_full = lambda generation: generation.job_params.get('transform_mode') == 'full'
+        claimed = claim_matching_generations('worker-a', is_full, 2)
+        assert [generation.input_filename for generation in claimed] == ['full-1.png', 'full-2.png']
+        assert all(generation.status == 'dispatching' for generation in claimed)
+
+        for index, generation in enumerate([leader] + claimed):
+            mark_processing(generation, 'shared-prompt', output_node=str(9 + index))
+        assert Generation.query.filter_by(prompt_id='shared-prompt').count() == 3
+
+        remaining = {generation.input_filename for generation in Generation.query.filter_by(status='pending')}
+        assert remaining == {'custom.png', 'full-3.png'}
+
+    print("✅ Batch claiming correct")
+    return True
+
+
+if __name__ == '__main__':
+    test_batch_workflow_shares_model_nodes()
+    test_claim_matching_generations()
+    print("🎉 All generation batching tests passed!")
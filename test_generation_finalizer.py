@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test script for idempotent result finalization (offline, SQLite)
+"""
+
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from models import db, Generation
+from job_queue import (claim_next_generation, mark_processing, mark_completed, get_in_flight_generations,
+                       claim_finalization, release_finalization, prompt_is_settled, requeue_stale_claims)
+from result_delivery import save_result
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+
+def dispatch(user, filename, prompt_id, output_node=None):
+    queue_job(user, filename)
+    generation = claim_next_generation('worker-a')
+    mark_processing(generation, prompt_id, output_node=output_node)
+    return generation
+
+
+def test_only_one_finalizer_wins():
+    """The conditional claim lets exactly one caller fetch an output"""
+    print("🧪 Testing finalization guard")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        generation = dispatch(user, 'a.png', 'prompt-1')
+        assert [g.id for g in get_in_flight_generations()] == [generation.id]
+
+        assert claim_finalization(generation, 'finalizer-a')
+        assert generation.status == 'finalizing'
+        assert not claim_finalization(generation, 'finalizer-b')
+        assert get_in_flight_generations() == []
+
+        # Transient download failure hands it back; completed rows can never be claimed again
+        release_finalization(generation)
+        assert claim_finalization(generation, 'finalizer-b')
+        mark_completed(generation, 'result_prompt-1.png')
+        assert not claim_finalization(generation, 'finalizer-a')
+
+    print("✅ Only one finalizer wins")
+    return True
+
+
+def test_concurrent_claims():
+    """Racing finalizer threads claim each row exactly once"""
+    print("🧪 Testing concurrent claims")
+    app = create_test_app()
+    with app.app_context():
+        user = create_user()
+        generation_id = dispatch(user, 'race.png', 'prompt-race').id
+
+    wins = []
+
+    def finalize(name):
+        with app.app_context():
+            generation = db.session.get(Generation, generation_id)
+            if claim_finalization(generation, name):
+                wins.append(name)
+
+    threads = [threading.Thread(target=finalize, args=(f"finalizer-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(wins) == 1
+    print("✅ Concurrent claims are exclusive")
+    return True
+
+
+def test_batched_prompt_settles_last():
+    """History is only prunable once every generation sharing the prompt is saved"""
+    print("🧪 Testing prompt settlement")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        first = dispatch(user, 'b1.png', 'prompt-batch', output_node='9')
+        second = dispatch(user, 'b2.png', 'prompt-batch', output_node='12')
+
+        mark_completed(first, 'result_prompt-batch_9.png')
+        assert not prompt_is_settled('prompt-batch')
+        mark_completed(second, 'result_prompt-batch_12.png')
+        assert prompt_is_settled('prompt-batch')
+
+    print("✅ Batched prompts settle after the last save")
+    return True
+
+
+def test_stale_finalization_recovered():
+    """A finalizer that died mid-download leaves the row for the next pass"""
+    print("🧪 Testing stale finalization recovery")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        generation = dispatch(user, 'c.png', 'prompt-2')
+        claim_finalization(generation, 'finalizer-dead')
+        generation.claimed_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        requeue_stale_claims(timeout=60)
+        assert generation.status == 'processing'
+
+    print("✅ Stale finalization recovered")
+    return True
+
+
+def test_save_result_is_atomic():
+    """Buffered outputs replace the destination in one step"""
+    print("🧪 Testing atomic save")
+    folder = tempfile.mkdtemp()
+    dest = os.path.join(folder, 'result_x.png')
+    save_result(b'png bytes', dest)
+    assert open(dest, 'rb').read() == b'png bytes'
+    assert os.listdir(folder) == ['result_x.png']
+    print("✅ Atomic save works")
+    return True
+
+
+if __name__ == '__main__':
+    test_only_one_finalizer_wins()
+    test_concurrent_claims()
+    test_batched_prompt_settles_last()
+    test_stale_finalization_recovered()
+    test_save_result_is_atomic()
+    print("🎉 All finalizer tests passed!")
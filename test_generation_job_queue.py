@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test script for the database-backed generation job queue (offline, SQLite)
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+from flask import Flask
+from models import db, User, Generation
+from job_queue import (enqueue_generation, claim_next_generation, mark_processing, mark_failed,
+                       requeue_stale_claims, touch_claims, get_queue_position, find_generation)
+
+
+def create_test_app():
+    """Create a Flask app bound to a throwaway SQLite database"""
+    app = Flask(__name__)
+    db_path = os.path.join(tempfile.mkdtemp(), 'test_queue.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def create_user(email='queue@gmail.com'):
+    user = User(email=email, is_verified=True)
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def queue_job(user, filename):
+    return enqueue_generation(
+        user_id=user.id,
+        input_filename=filename,
+        preset='+1_Tier',
+        workflow_type='facedetailer',
+        job_params={'transform_mode': 'full', 'denoise': 0.10}
+    )
+
+
+def test_claim_order_and_states():
+    """Jobs are claimed oldest first and move pending -> dispatching -> processing"""
+    print("🧪 Testing job claim order")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        first = queue_job(user, 'first.png')
+        second = queue_job(user, 'second.png')
+        second.created_at = first.created_at + timedelta(seconds=1)
+        db.session.commit()
+
+        assert get_queue_position(first) == 0
+        assert get_queue_position(second) == 1
+
+        claimed = claim_next_generation('worker-a')
+        assert claimed.id == first.id
+        assert claimed.status == 'dispatching'
+        assert claimed.claimed_by == 'worker-a'
+        assert claimed.attempts == 1
+
+        claimed_second = claim_next_generation('worker-b')
+        assert claimed_second.id == second.id
+        assert claim_next_generation('worker-c') is None
+
+        mark_processing(claimed, 'prompt-123')
+        assert find_generation('prompt-123').id == first.id
+        assert find_generation(first.id).status == 'processing'
+
+        mark_failed(claimed_second, 'boom')
+        assert Generation.query.get(second.id).error_message == 'boom'
+
+    print("✅ Claim order and state transitions correct")
+    return True
+
+
+def test_stale_claims_are_recovered():
+    """Claims abandoned by a dead worker are re-queued, then failed after max attempts"""
+    print("🧪 Testing stale claim recovery")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        generation = queue_job(user, 'stale.png')
+
+        claimed = claim_next_generation('dead-worker')
+        claimed.claimed_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        requeued, failed = requeue_stale_claims(timeout=60, max_attempts=2)
+        assert (requeued, failed) == (1, 0)
+        assert Generation.query.get(generation.id).status == 'pending'
+
+        claimed = claim_next_generation('dead-worker')
+        assert claimed.attempts == 2
+        claimed.claimed_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        requeued, failed = requeue_stale_claims(timeout=60, max_attempts=2)
+        assert (requeued, failed) == (0, 1)
+        assert Generation.query.get(generation.id).status == 'failed'
+
+    print("✅ Stale claims recovered correctly")
+    return True
+
+
+def test_heartbeat_keeps_long_dispatches_claimed():
+    """A dispatch that outlives the timeout but keeps heartbeating is never re-queued"""
+    print("🧪 Testing claim heartbeats")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        generation = queue_job(user, 'slow.png')
+
+        claimed = claim_next_generation('busy-worker')
+        claimed.claimed_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        assert touch_claims([generation.id], 'other-worker') == 0
+        assert touch_claims([generation.id], 'busy-worker') == 1
+        assert requeue_stale_claims(timeout=60, max_attempts=2) == (0, 0)
+        assert Generation.query.get(generation.id).status == 'dispatching'
+
+        # Once dispatched, the heartbeat no longer touches the row
+        mark_processing(claimed, 'prompt-1')
+        assert touch_claims([generation.id], 'busy-worker') == 0
+
+    print("✅ Heartbeats keep live dispatches claimed")
+    return True
+
+
+if __name__ == '__main__':
+    test_claim_order_and_states()
+    test_stale_claims_are_recovered()
+    test_heartbeat_keeps_long_dispatches_claimed()
+    print("🎉 All job queue tests passed!")
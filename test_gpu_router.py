@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Test script for the GPU backend interface and router
+(offline - fake backends, SQLite job queue)
+"""
+
+from datetime import datetime, timedelta
+from models import db, Generation
+from config import GPU_COST_PER_SECOND
+from gpu_backends import GpuBackend, GpuJob, Submission, TRANSFORM_MODES, map_denoise_to_preset
+from gpu_router import GpuRouter
+from comfyui_pool import ComfyUIPoolBackend
+from job_queue import claim_next_generation, assign_backend, mark_processing, mark_completed, mark_failed, get_gpu_backend_usage
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+
+class FakeBackend(GpuBackend):
+    """Records submissions; fails with `error` or raises when told to"""
+
+    def __init__(self, name, transform_modes=('full',), error=None, raises=False, synchronous=False):
+        self.backend_name = name
+        self.transform_modes = transform_modes
+        self.error = error
+        self.raises = raises
+        self.synchronous = synchronous
+        self.jobs = []
+
+    def submit(self, job):
+        self.jobs.append(job)
+        if self.raises:
+            raise RuntimeError(f"{self.backend_name} unreachable")
+        if self.error:
+            return Submission(error=self.error)
+        if self.synchronous:
+            return Submission(image_data=b'png')
+        return Submission(job_id=f"{self.backend_name}-job")
+
+
+def names(backends):
+    return [backend.backend_name for backend in backends]
+
+
+def test_presets_and_capabilities():
+    """Preset mapping and submit_preset() are shared by every preset-based client"""
+    print("🧪 Testing preset mapping and capabilities")
+    assert map_denoise_to_preset(0.10) == ('tier1', 4)
+    assert map_denoise_to_preset(0.15, ('HTN', 'Chadlite', 'Chad')) == ('Chadlite', 6)
+    assert map_denoise_to_preset(0.25) == ('chad', 8)
+    assert map_denoise_to_preset(0.40) == ('tier1', 10)
+
+    class PresetClient(GpuBackend):
+        backend_name = 'modal'
+        synchronous = True
+
+        def generate_image(self, image_path, preset_key, denoise_intensity):
+            self.called = (image_path, preset_key, denoise_intensity)
+            return b'png', None
+
+    client = PresetClient()
+    submission = client.submit_preset(GpuJob('in.png', denoise=0.25))
+    assert submission.ok and submission.completed and client.called == ('in.png', 'chad', 8)
+
+    capabilities = client.capabilities()
+    assert capabilities['synchronous'] and capabilities['paid'] and capabilities['transform_modes'] == ['full']
+    assert not FakeBackend('local').capabilities()['paid']
+    assert abs(client.cost(100) - 100 * GPU_COST_PER_SECOND['modal']) < 1e-9
+    print("✅ Presets and capabilities are shared")
+    return True
+
+
+def test_free_first_in_priority_order():
+    """Free backends run jobs first; paid ones keep their configured order behind them"""
+    print("🧪 Testing routing order")
+    runpod, local, modal = FakeBackend('runpod'), FakeBackend('local', TRANSFORM_MODES), FakeBackend('modal')
+    router = GpuRouter([runpod, local, modal], slo_seconds=60)
+
+    eta_calls = []
+    ordered, spill = router.candidates(GpuJob('in.png'), free_eta=lambda: eta_calls.append(1) or 10)
+    assert names(ordered) == ['local', 'runpod', 'modal'] and not spill
+    assert router.dispatch(GpuJob('in.png'))[0] == 'local'
+
+    # Paid-only deployments never need the free queue's ETA
+    paid_only = GpuRouter([modal], slo_seconds=60)
+    paid_only.candidates(GpuJob('in.png'), free_eta=lambda: eta_calls.append(1) or 999)
+    assert len(eta_calls) == 1
+    print("✅ Free backends go first")
+    return True
+
+
+def test_spillover_above_slo():
+    """Paid backends take jobs first only while the free queue's wait is above the SLO"""
+    print("🧪 Testing paid spillover")
+    local, runpod = FakeBackend('local', TRANSFORM_MODES), FakeBackend('runpod')
+    router = GpuRouter([local, runpod], slo_seconds=60)
+
+    name, submission = router.dispatch(GpuJob('in.png', generation_id='g1'), free_eta=lambda: 300)
+    assert name == 'runpod' and submission.job_id == 'runpod-job'
+    assert router.dispatch(GpuJob('in.png'), free_eta=lambda: 30)[0] == 'local'
+    assert router.spillovers == 1
+
+    assert router.should_spill(lambda: 300) and not router.should_spill(lambda: 30)
+    runpod_down = GpuRouter([local, runpod], slo_seconds=60, is_available=lambda backend: backend is local)
+    assert not runpod_down.should_spill(lambda: 300)
+    print("✅ Paid backends only take the overflow")
+    return True
+
+
+def test_failover():
+    """A backend that errors, raises or is down hands the job to the next one"""
+    print("🧪 Testing failover")
+    local = FakeBackend('local', TRANSFORM_MODES, raises=True)
+    modal = FakeBackend('modal', error='Modal.com app not deployed.')
+    runpod = FakeBackend('runpod')
+    attempts = []
+    router = GpuRouter([local, modal, runpod])
+
+    name, submission = router.dispatch(GpuJob('in.png'), on_attempt=attempts.append)
+    assert name == 'runpod' and submission.ok
+    assert attempts == ['local', 'modal', 'runpod']
+    assert router.failovers == 1
+
+    snapshot = {backend['name']: backend for backend in router.snapshot()['backends']}
+    assert snapshot['local']['failed'] == 1 and snapshot['modal']['failed'] == 1 and snapshot['runpod']['submitted'] == 1
+
+    # Everything failing reports the last error
+    broken = GpuRouter([FakeBackend('modal', error='quota exceeded')])
+    assert broken.dispatch(GpuJob('in.png'))[0] is None
+    assert broken.dispatch(GpuJob('in.png'))[1].error == 'quota exceeded'
+
+    # A tunnel the monitor reports down is tried after the healthy paid backend
+    local_ok = FakeBackend('local', TRANSFORM_MODES)
+    router = GpuRouter([local_ok, runpod], is_available=lambda backend: backend is not local_ok)
+    assert names(router.candidates(GpuJob('in.png'))[0]) == ['runpod', 'local']
+    print("✅ Jobs fail over in priority order")
+    return True
+
+
+def test_transform_mode_capabilities():
+    """Reference and custom jobs only go to backends that run those workflows"""
+    print("🧪 Testing transform mode routing")
+    local, modal = FakeBackend('local', TRANSFORM_MODES), FakeBackend('modal')
+    router = GpuRouter([modal, local], is_available=lambda backend: backend is not local)
+
+    assert names(router.candidates(GpuJob('in.png', transform_mode='reference'))[0]) == ['local']
+
+    # No backend supports the mode - run it as a full-face morph, as before routing existed
+    cloud = GpuRouter([modal, FakeBackend('runpod')])
+    assert names(cloud.candidates(GpuJob('in.png', transform_mode='custom'))[0]) == ['modal', 'runpod']
+    print("✅ Transform modes are routed by capability")
+    return True
+
+
+def test_pool_backend_releases_reservation():
+    """ComfyUIPoolBackend pins the job to the chosen pool backend and always releases it"""
+    print("🧪 Testing ComfyUIPoolBackend")
+
+    class FakePool:
+        released = []
+
+        def choose_backend(self, load):
+            return 'http://gpu-a'
+
+        def get_client(self, url):
+            client = FakeBackend('local', TRANSFORM_MODES, raises=self.raise_next)
+            client.url = url
+            client.get_job_status = lambda job_id: f"{url} {job_id}"
+            return client
+
+        def has_backends(self):
+            return True
+
+        def release(self, url):
+            self.released.append(url)
+
+    pool = FakePool()
+    pool.raise_next = False
+    backend = ComfyUIPoolBackend(pool, FakeBackend('local'), get_load=dict)
+    submission = backend.submit(GpuJob('in.png'))
+    assert submission.job_id == 'local-job' and submission.backend_url == 'http://gpu-a'
+
+    pool.raise_next = True
+    try:
+        backend.submit(GpuJob('in.png'))
+        assert False, 'submit should raise'
+    except RuntimeError:
+        pass
+    assert pool.released == ['http://gpu-a', 'http://gpu-a']
+
+    # Follow-ups go to the backend the prompt is pinned to, not the tunnel-following client
+    tunnel = FakeBackend('local')
+    tunnel.get_job_status = lambda job_id: f"tunnel {job_id}"
+    backend = ComfyUIPoolBackend(pool, tunnel, get_load=dict)
+    assert backend.status('p1', backend_url='http://gpu-b') == 'http://gpu-b p1'
+    assert backend.client_for('http://gpu-b').url == 'http://gpu-b'
+    assert backend.status('p1') == 'tunnel p1'
+    assert ComfyUIPoolBackend(None, tunnel, get_load=dict).client_for('http://gpu-b') is tunnel
+    print("✅ Pool reservations are released")
+    return True
+
+
+def test_cost_and_latency_recorded():
+    """mark_completed() records GPU seconds and estimated cost for the provider that ran the job"""
+    print("🧪 Testing per-job cost recording")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        queue_job(user, 'a.png')
+        queue_job(user, 'b.png')
+        queue_job(user, 'c.png')
+
+        synchronous = claim_next_generation('worker-a')
+        assign_backend(synchronous, 'modal')
+        synchronous.started_at = datetime.utcnow() - timedelta(seconds=20)
+        mark_completed(synchronous, 'a_out.png', prompt_id=f"modal_{synchronous.id}")
+
+        asynchronous = claim_next_generation('worker-a')
+        assign_backend(asynchronous, 'local')
+        mark_processing(asynchronous, 'prompt-1')
+        asynchronous.started_at = datetime.utcnow() - timedelta(seconds=5)
+        mark_completed(asynchronous, 'b_out.png')
+
+        failed = claim_next_generation('worker-a')
+        assign_backend(failed, 'modal')
+        mark_failed(failed, 'CUDA out of memory')
+
+        synchronous = db.session.get(Generation, synchronous.id)
+        assert synchronous.gpu_backend == 'modal'
+        assert 19 <= synchronous.gpu_seconds <= 22
+        assert abs(synchronous.gpu_cost - synchronous.gpu_seconds * GPU_COST_PER_SECOND['modal']) < 1e-9
+
+        asynchronous = db.session.get(Generation, asynchronous.id)
+        assert 4 <= asynchronous.gpu_seconds <= 7 and asynchronous.gpu_cost == 0
+
+        usage = get_gpu_backend_usage()
+        assert usage['modal']['jobs'] == 2 and usage['modal']['failed'] == 1
+        assert usage['local']['jobs'] == 1 and usage['local']['cost'] == 0
+        assert usage['modal']['cost'] > 0
+    print("✅ Cost and latency are recorded per job")
+    return True
+
+
+if __name__ == '__main__':
+    test_presets_and_capabilities()
+    test_free_first_in_priority_order()
+    test_spillover_above_slo()
+    test_failover()
+    test_transform_mode_capabilities()
+    test_pool_backend_releases_reservation()
+    test_cost_and_latency_recorded()
+    print("🎉 All GPU router tests passed!")
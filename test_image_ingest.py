@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script for the upload ingest pipeline (offline - synthetic images)
+"""
+
+import os
+import tempfile
+from PIL import Image
+from image_ingest import ingest_upload, normalize_image, IngestStats
+
+EXIF_ORIENTATION = 0x0112
+
+
+def write_photo(folder, filename, size, orientation=None, fmt='JPEG'):
+    """Noisy photo-like image so encoders can't shrink it to nothing"""
+    img = Image.effect_noise(size, 64).convert('RGB')
+    path = os.path.join(folder, filename)
+    if orientation:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        img.save(path, format=fmt, quality=98, exif=exif.tobytes())
+    else:
+        img.save(path, format=fmt)
+    return path
+
+
+def test_orient_downscale_and_strip():
+    """Rotated phone photo comes out upright, within the working size and without EXIF"""
+    print("🧪 Testing normalization")
+    folder = tempfile.mkdtemp()
+    path = write_photo(folder, 'phone.jpg', (2000, 1500), orientation=6)  # Rotate 90 degrees clockwise
+
+    result = ingest_upload(path, keep_original=False, max_dimension=1024, fmt='JPEG')
+    assert result['filename'] == 'phone.jpg'
+    assert (result['width'], result['height']) == (768, 1024)
+    assert result['normalized_bytes'] < result['original_bytes']
+    assert not os.path.exists(os.path.join(folder, 'originals'))
+
+    with Image.open(result['path']) as img:
+        assert img.size == (768, 1024)
+        assert EXIF_ORIENTATION not in img.getexif()
+
+    print("✅ Normalization works")
+    return True
+
+
+def test_size_bound_and_retention():
+    """Quality steps down to fit the byte bound; kept originals move to originals/"""
+    print("🧪 Testing size bound and retention")
+    folder = tempfile.mkdtemp()
+    path = write_photo(folder, 'upload.png', (900, 900), fmt='PNG')
+    original = open(path, 'rb').read()
+
+    result = ingest_upload(path, keep_original=True, fmt='JPEG', quality=95, min_quality=50, max_bytes=400 * 1024)
+    assert result['filename'] == 'upload.jpg'
+    assert result['normalized_bytes'] <= 400 * 1024
+    assert not os.path.exists(path)
+    assert open(os.path.join(folder, 'originals', 'upload.png'), 'rb').read() == original
+
+    print("✅ Size bound and retention work")
+    return True
+
+
+def test_transparency_and_failure():
+    """RGBA is flattened onto white; undecodable files are left for the caller"""
+    print("🧪 Testing transparency and failure fallback")
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'cutout.png')
+    Image.new('RGBA', (400, 400), (0, 0, 0, 0)).save(path)
+
+    dest = os.path.join(folder, 'cutout.webp')
+    info = normalize_image(path, dest, fmt='WEBP')
+    with Image.open(dest) as img:
+        assert img.mode == 'RGB'
+        assert img.getpixel((10, 10)) == (255, 255, 255)
+    assert info['bytes'] == os.path.getsize(dest)
+
+    broken = os.path.join(folder, 'broken.jpg')
+    with open(broken, 'wb') as f:
+        f.write(b'not an image')
+    assert ingest_upload(broken, keep_original=False) is None
+    assert os.path.exists(broken)
+    assert not os.path.exists(broken + '.ingest')
+
+    stats = IngestStats()
+    stats.record(1000, 250)
+    assert stats.snapshot()['saved_percent'] == 75.0
+
+    print("✅ Transparency and failure fallback work")
+    return True
+
+
+if __name__ == '__main__':
+    test_orient_downscale_and_strip()
+    test_size_bound_and_retention()
+    test_transparency_and_failure()
+    print("🎉 All image ingest tests passed!")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test script for the persistent ComfyUI server used by the Modal apps
+(offline - a stand-in ComfyUI main.py served on localhost)
+"""
+
+import os
+import socket
+import tempfile
+import threading
+from modal_comfyui_server import ComfyUIServer, write_extra_model_paths, link_workflows
+
+FAKE_COMFYUI = '''
+import sys, json, uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+PORT = int(sys.argv[sys.argv.index("--port") + 1])
+history = {}
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/system_stats":
+            return self.reply({"system": {}})
+        prompt_id = self.path.rsplit("/", 1)[-1]
+        self.reply({prompt_id: history[prompt_id]} if prompt_id in history else {})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/history":
+            for prompt_id in body.get("delete", []):
+                history.pop(prompt_id, None)
+            return self.reply({})
+        prompt_id = uuid.uuid4().hex
+        if any(node.get("class_type") == "Broken" for node in body["prompt"].values()):
+            error = {"node_type": "Broken", "exception_message": "CUDA out of memory"}
+            history[prompt_id] = {"outputs": {}, "status": {"status_str": "error", "messages": [["execution_error", error]]}}
+        else:
+            history[prompt_id] = {"outputs": {"9": {"images": [{"filename": "out.png"}]}}, "prompt": body["prompt"],
+                                  "status": {"status_str": "success", "messages": []}}
+        self.reply({"prompt_id": prompt_id})
+
+with open("starts.log", "a") as f:
+    f.write("start\\n")
+HTTPServer(("127.0.0.1", PORT), Handler).serve_forever()
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fake_comfyui_dir():
+    comfyui_dir = tempfile.mkdtemp()
+    with open(os.path.join(comfyui_dir, 'main.py'), 'w') as f:
+        f.write(FAKE_COMFYUI)
+    return comfyui_dir
+
+
+def count_starts(comfyui_dir):
+    with open(os.path.join(comfyui_dir, 'starts.log')) as f:
+        return len(f.readlines())
+
+
+def test_models_read_in_place():
+    """Model folders are mapped to the volume and workflows symlinked - nothing is copied"""
+    print("🧪 Testing volume model paths")
+    comfyui_dir = tempfile.mkdtemp()
+    volume = tempfile.mkdtemp()
+    os.makedirs(os.path.join(volume, 'comfyui_workflows'))
+    with open(os.path.join(volume, 'comfyui_workflows', 'workflow_facedetailer.json'), 'w') as f:
+        f.write('{}')
+
+    path = write_extra_model_paths(models_root=volume, comfyui_dir=comfyui_dir)
+    with open(path) as f:
+        config = f.read()
+    assert f"base_path: {volume}" in config
+    assert "checkpoints: base_models" in config and "loras: lora" in config
+
+    workflows = os.path.join(volume, 'comfyui_workflows')
+    assert link_workflows(workflows, comfyui_dir) == 1
+    assert link_workflows(workflows, comfyui_dir) == 0  # Already linked
+    assert os.path.islink(os.path.join(comfyui_dir, 'workflow_facedetailer.json'))
+    assert link_workflows(os.path.join(volume, 'missing'), comfyui_dir) == 0
+    print("✅ Models are read from the volume in place")
+    return True
+
+
+def test_server_started_once_for_many_prompts():
+    """One ComfyUI process serves every prompt; history entries are pruned after reading"""
+    print("🧪 Testing persistent server")
+    comfyui_dir = fake_comfyui_dir()
+    server = ComfyUIServer(comfyui_dir=comfyui_dir, url=f"http://127.0.0.1:{free_port()}")
+    server.start(timeout=30)
+    try:
+        for i in range(3):
+            history = server.run_prompt({"1": {"class_type": "LoadImage", "inputs": {"i": i}}}, client_id=f"c{i}", poll_interval=0.05)
+            assert history["outputs"]["9"]["images"][0]["filename"] == "out.png"
+            assert history["prompt"]["1"]["inputs"]["i"] == i
+        assert count_starts(comfyui_dir) == 1
+    finally:
+        server.stop()
+    print("✅ ComfyUI starts once per container")
+    return True
+
+
+def test_server_restarted_if_it_died():
+    """A ComfyUI crash between prompts is recovered on the next prompt"""
+    print("🧪 Testing restart after crash")
+    comfyui_dir = fake_comfyui_dir()
+    server = ComfyUIServer(comfyui_dir=comfyui_dir, url=f"http://127.0.0.1:{free_port()}")
+    server.start(timeout=30)
+    try:
+        server.process.kill()
+        server.process.wait()
+        histories = []
+        # Concurrent inputs that all find it dead must restart it once, not once each
+        threads = [threading.Thread(target=lambda i=i: histories.append(
+            server.run_prompt({}, client_id=f"after-crash-{i}", poll_interval=0.05))) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(histories) == 4 and all("outputs" in history for history in histories)
+        assert count_starts(comfyui_dir) == 2
+    finally:
+        server.stop()
+    print("✅ Dead servers are restarted")
+    return True
+
+
+def test_failed_prompt_raises():
+    """A prompt ComfyUI reports as errored raises with its message instead of returning no images"""
+    print("🧪 Testing failed prompt")
+    comfyui_dir = fake_comfyui_dir()
+    server = ComfyUIServer(comfyui_dir=comfyui_dir, url=f"http://127.0.0.1:{free_port()}")
+    server.start(timeout=30)
+    try:
+        server.run_prompt({"1": {"class_type": "Broken", "inputs": {}}}, client_id="broken", poll_interval=0.05)
+        assert False, "run_prompt() should fail"
+    except RuntimeError as e:
+        assert "CUDA out of memory" in str(e)
+    finally:
+        server.stop()
+    print("✅ Failed prompts are reported")
+    return True
+
+
+def test_startup_failure_reported():
+    """A ComfyUI that exits during startup raises instead of hanging"""
+    print("🧪 Testing startup failure")
+    comfyui_dir = tempfile.mkdtemp()
+    with open(os.path.join(comfyui_dir, 'main.py'), 'w') as f:
+        f.write('raise SystemExit(3)\n')
+    server = ComfyUIServer(comfyui_dir=comfyui_dir, url=f"http://127.0.0.1:{free_port()}")
+    try:
+        server.start(timeout=30)
+        assert False, "start() should fail"
+    except RuntimeError as e:
+        assert "code 3" in str(e)
+    print("✅ Startup failures are reported")
+    return True
+
+
+if __name__ == '__main__':
+    test_models_read_in_place()
+    test_server_started_once_for_many_prompts()
+    test_server_restarted_if_it_died()
+    test_failed_prompt_raises()
+    test_startup_failure_reported()
+    print("🎉 All Modal ComfyUI server tests passed!")
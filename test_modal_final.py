@@ -15,8 +15,8 @@ def test_modal_face_morph():
     print("=" * 50)
     
     try:
-        # Get the function
-        generate_face_morph = modal.Function.from_name("face-morph-simple", "generate_face_morph")
+        # Get the warm-container class
+        generate_face_morph = modal.Cls.from_name("face-morph-simple", "ComfyUIMorph")().generate
         print("✅ Function found")
         
         # Create a simple test image
@@ -65,9 +65,9 @@ def test_modal_connection():
     print("=" * 50)
     
     try:
-        # Test if we can lookup the specific function
-        generate_face_morph = modal.Function.from_name("face-morph-simple", "generate_face_morph")
-        print(f"✅ Found Modal function: generate_face_morph")
+        # Test if we can lookup the deployed class
+        modal.Cls.from_name("face-morph-simple", "ComfyUIMorph")
+        print(f"✅ Found Modal class: ComfyUIMorph")
         return True
             
     except Exception as e:
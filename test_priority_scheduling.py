@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script for priority scheduling of queued generations (offline, SQLite)
+"""
+
+from datetime import timedelta
+from models import db
+from backend_health import pool_backend_name
+from job_queue import (enqueue_generation, claim_next_generation, mark_processing, get_queue_position,
+                       count_outstanding_prompts)
+from test_generation_job_queue import create_test_app, create_user
+from test_comfyui_pool import create_pool, use_temp_registry, HOME_GPU, RENTED_POD
+
+
+def queue_job(user, filename, priority_class, aging=120):
+    return enqueue_generation(
+        user_id=user.id,
+        input_filename=filename,
+        preset='+1_Tier',
+        workflow_type='facedetailer',
+        job_params={'transform_mode': 'full', 'denoise': 0.10},
+        priority_class=priority_class,
+        aging=aging
+    )
+
+
+def test_paid_jobs_claimed_first():
+    """Paid jobs jump ahead of earlier free and admin jobs"""
+    print("🧪 Testing class order")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        admin_job = queue_job(user, 'admin.png', 'admin')
+        free_job = queue_job(user, 'free.png', 'free')
+        paid_job = queue_job(user, 'paid.png', 'paid')
+
+        assert get_queue_position(paid_job) == 0
+        assert get_queue_position(free_job) == 1
+        assert get_queue_position(admin_job) == 2
+
+        claimed = [claim_next_generation('worker-a').id for _ in range(3)]
+        assert claimed == [paid_job.id, free_job.id, admin_job.id]
+
+    print("✅ Paid jobs go first")
+    return True
+
+
+def test_aging_prevents_starvation():
+    """A free job that waited longer than the aging offset outranks new paid jobs"""
+    print("🧪 Testing aging")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        free_job = queue_job(user, 'free.png', 'free')
+        # Pretend the free job has been waiting for three minutes
+        free_job.created_at -= timedelta(seconds=180)
+        free_job.scheduled_at -= timedelta(seconds=180)
+        db.session.commit()
+
+        queue_job(user, 'paid.png', 'paid')
+        assert claim_next_generation('worker-a').id == free_job.id
+
+    print("✅ Aged jobs are not starved")
+    return True
+
+
+def test_outstanding_prompts_count_batches_once():
+    """A batched prompt occupies one slot, dispatches in progress occupy one each"""
+    print("🧪 Testing outstanding prompts")
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        for index in range(3):
+            queue_job(user, f"{index}.png", 'paid')
+        mark_processing(claim_next_generation('worker-a'), 'batch-1', output_node='9')
+        mark_processing(claim_next_generation('worker-a'), 'batch-1', output_node='12')
+        claim_next_generation('worker-b')  # Still dispatching
+
+        assert count_outstanding_prompts() == 2
+
+    print("✅ Outstanding prompts counted")
+    return True
+
+
+def test_pool_open_slots():
+    """Backends at the outstanding limit offer no slots; an empty pool holds nothing back"""
+    print("🧪 Testing pool slots")
+    use_temp_registry()
+    pool = create_pool(static_urls=[HOME_GPU, RENTED_POD])
+    pool.sync()
+    pool.queue_depths = {HOME_GPU: (1, 1), RENTED_POD: (1, 0)}
+    for backend in pool.backends():
+        pool.monitor.refresh(pool_backend_name(backend.url))
+
+    assert pool.open_slots(2) == 1
+    assert pool.open_slots(2, {RENTED_POD: {'in_flight': 2, 'avg_seconds': None}}) == 0
+
+    pool.offline = {HOME_GPU, RENTED_POD}
+    for backend in pool.backends():
+        pool.monitor.refresh(pool_backend_name(backend.url))
+    assert pool.open_slots(2) is None
+
+    print("✅ Pool slots work")
+    return True
+
+
+if __name__ == '__main__':
+    test_paid_jobs_claimed_first()
+    test_aging_prevents_starvation()
+    test_outstanding_prompts_count_batches_once()
+    test_pool_open_slots()
+    print("🎉 All priority scheduling tests passed!")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming result delivery (offline - runs a local fake ComfyUI)
+"""
+
+import os
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from flask import Flask
+from local_comfyui_client import LocalComfyUIClient
+import result_delivery
+from result_delivery import stream_to_file, send_result_file
+
+RESULT_BYTES = os.urandom(300 * 1024)
+
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    views = 0
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.startswith('/history/'):
+            prompt_id = path.rsplit('/', 1)[1]
+            outputs = {
+                '9': {'images': [{'filename': 'morph_00001_.png', 'subfolder': '', 'type': 'output'}]},
+                '12': {'images': [{'filename': 'morph_00002_.png', 'subfolder': '', 'type': 'output'}]}
+            }
+            body = json.dumps({prompt_id: {'outputs': outputs}}).encode()
+            content_type = 'application/json'
+        else:
+            FakeComfyUIHandler.views += 1
+            body = RESULT_BYTES
+            content_type = 'image/png'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    FakeComfyUIHandler.views = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeComfyUIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_tee_to_browser_and_disk():
+    """One /view fetch feeds both the response body and the saved file"""
+    print("🧪 Testing streamed tee")
+    server, base_url = start_server()
+    client = LocalComfyUIClient(base_url=base_url, pinned=True)
+    dest = os.path.join(tempfile.mkdtemp(), 'result_abc.png')
+
+    upstream = client.open_job_output('abc', output_node='12')
+    assert upstream.headers['Content-Length'] == str(len(RESULT_BYTES))
+    sent = b''.join(stream_to_file(upstream, dest, chunk_size=8192))
+
+    assert sent == RESULT_BYTES
+    assert open(dest, 'rb').read() == RESULT_BYTES
+    assert FakeComfyUIHandler.views == 1
+    assert os.listdir(os.path.dirname(dest)) == ['result_abc.png']  # No .part left behind
+    assert client.get_job_output('abc') == RESULT_BYTES  # Buffered wrapper still works
+
+    server.shutdown()
+    print("✅ Streamed tee works")
+    return True
+
+
+def test_client_disconnect_still_saves():
+    """Closing the response mid-download drains the rest to disk"""
+    print("🧪 Testing client disconnect")
+    server, base_url = start_server()
+    client = LocalComfyUIClient(base_url=base_url, pinned=True)
+    dest = os.path.join(tempfile.mkdtemp(), 'result_def.png')
+
+    body = stream_to_file(client.open_job_output('def'), dest, chunk_size=8192)
+    next(body)
+    body.close()  # What the WSGI server does when the browser goes away
+
+    assert open(dest, 'rb').read() == RESULT_BYTES
+    server.shutdown()
+    print("✅ Disconnect still saves the result")
+    return True
+
+
+def test_broken_upstream_leaves_no_file():
+    """A failed stream never produces a truncated result file"""
+    print("🧪 Testing broken upstream")
+
+    class BrokenUpstream:
+        closed = False
+
+        def iter_content(self, chunk_size):
+            yield b'partial'
+            raise IOError('tunnel reset')
+
+        def close(self):
+            self.closed = True
+
+    upstream = BrokenUpstream()
+    dest = os.path.join(tempfile.mkdtemp(), 'result_ghi.png')
+    try:
+        b''.join(stream_to_file(upstream, dest))
+        assert False, "should raise"
+    except IOError:
+        pass
+    assert upstream.closed
+    assert os.listdir(os.path.dirname(dest)) == []
+
+    print("✅ Broken upstream leaves no file")
+    return True
+
+
+def test_accel_redirect():
+    """x-accel mode hands the saved file to nginx instead of reading it in Python"""
+    print("🧪 Testing X-Accel-Redirect")
+    app = Flask(__name__)
+    result_delivery.RESULT_SENDFILE = 'x-accel'
+    try:
+        with app.test_request_context():
+            response = send_result_file('outputs/result_abc.png', 'morphed.png')
+            assert response.headers['X-Accel-Redirect'] == '/protected-outputs/result_abc.png'
+            assert 'morphed.png' in response.headers['Content-Disposition']
+            assert response.get_data() == b''
+    finally:
+        result_delivery.RESULT_SENDFILE = ''
+
+    print("✅ X-Accel-Redirect works")
+    return True
+
+
+if __name__ == '__main__':
+    test_tee_to_browser_and_disk()
+    test_client_disconnect_still_saves()
+    test_broken_upstream_leaves_no_file()
+    test_accel_redirect()
+    print("🎉 All result delivery tests passed!")
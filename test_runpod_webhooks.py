@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Test script for RunPod async submission, adaptive polling and webhook completion
+(offline - a fake RunPod API served on localhost, SQLite job queue)
+"""
+
+import os
+import json
+import time
+import uuid
+import base64
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from models import db, Generation
+from job_queue import claim_next_generation, mark_processing
+from runpod_client import RunPodClient, decode_output_image
+from runpod_comfyui_client import RunPodComfyUIClient
+from runpod_webhooks import runpod_bp, sign_generation, verify_generation, webhook_url, webhooks_enabled
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+PNG = b'\x89PNG\r\n\x1a\nfake-image'
+
+
+class FakeRunPod(BaseHTTPRequestHandler):
+    """/run, /runsync, /status/<id> and /health of one endpoint; jobs named 'fast' finish in /runsync"""
+
+    jobs = {}  # job_id -> response body
+    calls = []  # (method, path)
+    webhooks = []
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, code=200):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.calls.append(('GET', path))
+        if path.endswith('/health'):
+            return self.reply({'workers': {'idle': 1}})
+        job_id = path.rsplit('/', 1)[-1]
+        if job_id not in self.jobs:
+            return self.reply({'error': 'not found'}, 404)
+        self.reply(self.jobs[job_id])
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        self.calls.append(('POST', parts.path))
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if body.get('webhook'):
+            self.webhooks.append(body['webhook'])
+
+        job_id = uuid.uuid4().hex
+        if parts.path.endswith('/runsync') and body['input'].get('name') == 'fast' and parse_qs(parts.query).get('wait'):
+            self.jobs[job_id] = {'id': job_id, 'status': 'COMPLETED', 'executionTime': 900,
+                                 'output': {'images': [f"data:image/png;base64,{base64.b64encode(PNG).decode()}"]}}
+        else:
+            self.jobs[job_id] = {'id': job_id, 'status': 'IN_QUEUE'}
+        self.reply(self.jobs[job_id])
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRunPod)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Every client targets the fake API with short intervals, whatever config/.env say
+CLIENT_OPTIONS = {
+    'api_base': f"http://127.0.0.1:{server.server_address[1]}/v2",
+    'runsync_wait': 5,
+    'poll_min_interval': 0.2,
+    'poll_max_interval': 0.5,
+    'webhook_poll_interval': 30,
+}
+
+
+SECRET = 'test-webhook-secret'
+
+
+def fake_client():
+    return RunPodClient('key', 'endpoint', **CLIENT_OPTIONS)
+
+
+def status_calls(job_id):
+    return sum(1 for method, path in FakeRunPod.calls if method == 'GET' and path.endswith(f"/status/{job_id}"))
+
+
+def complete_job(job_id):
+    FakeRunPod.jobs[job_id] = {'id': job_id, 'status': 'COMPLETED',
+                               'output': {'images': [base64.b64encode(PNG).decode()]}}
+    return FakeRunPod.jobs[job_id]
+
+
+def submit(client, name, webhook=None):
+    return client.submit_payload({'input': {'name': name}}, webhook_url=webhook)['id']
+
+
+def test_webhook_tokens():
+    """Tokens are bound to one generation and URLs only exist with a public base URL"""
+    print("🧪 Testing webhook tokens")
+    token = sign_generation('gen-1', secret='s3cret')
+    assert verify_generation('gen-1', token, secret='s3cret')
+    assert not verify_generation('gen-2', token, secret='s3cret')
+    assert not verify_generation('gen-1', token, secret='other')
+    assert not verify_generation('gen-1', '', secret='s3cret')
+
+    assert webhook_url('gen-1', base_url='', secret='s3cret') is None
+    assert webhook_url('gen-1', base_url='https://morph.example', secret='') is None
+    assert not webhooks_enabled(base_url='https://morph.example', secret='')
+    assert not verify_generation('gen-1', sign_generation('gen-1', secret=''), secret='')
+    assert webhook_url('gen-1', base_url='https://morph.example', secret='s3cret') == \
+        f"https://morph.example/runpod/webhook/gen-1?token={token}"
+    print("✅ Webhook tokens are verified")
+    return True
+
+
+def test_runsync_fast_path():
+    """Short jobs come back from /runsync with their image - no status poll at all"""
+    print("🧪 Testing /runsync fast path")
+    client = fake_client()
+    job_id = submit(client, 'fast')
+
+    assert client.get_job_status(job_id) == 'COMPLETED'
+    assert client.get_job_output(job_id) == PNG
+    assert status_calls(job_id) == 0
+    assert decode_output_image({'images': [{'data': base64.b64encode(PNG).decode()}]}) == PNG
+    assert decode_output_image({'images': []}) is None
+    print("✅ Short jobs skip polling")
+    return True
+
+
+def test_adaptive_polling():
+    """Long jobs are polled on a backoff schedule and answered from cache in between"""
+    print("🧪 Testing adaptive polling")
+    client = fake_client()
+    job_id = submit(client, 'slow')
+    assert ('POST', '/v2/endpoint/runsync') in FakeRunPod.calls
+
+    # Nothing is due yet - repeated checks do not reach RunPod
+    for _ in range(20):
+        assert client.get_job_status(job_id) == 'IN_PROGRESS'
+    assert status_calls(job_id) == 0
+
+    time.sleep(0.25)
+    assert client.get_job_status(job_id) == 'IN_PROGRESS'
+    assert client.get_job_status(job_id) == 'IN_PROGRESS'
+    assert status_calls(job_id) == 1
+
+    complete_job(job_id)
+    deadline = time.time() + 5
+    while client.get_job_status(job_id) != 'COMPLETED' and time.time() < deadline:
+        time.sleep(0.05)
+    assert client.get_bulk_status([job_id]) == {job_id: 'COMPLETED'}
+    assert 2 <= status_calls(job_id) <= 6
+    assert client.get_job_output(job_id) == PNG
+
+    # An unreachable API keeps the last known status instead of reading as FAILED
+    offline = RunPodClient('key', 'endpoint', **{**CLIENT_OPTIONS, 'api_base': 'http://127.0.0.1:9/v2'})
+    assert offline.get_job_status('lost-job') == 'IN_PROGRESS'
+    print("✅ Polling backs off and never fails a job on network errors")
+    return True
+
+
+def test_webhook_jobs_poll_rarely():
+    """Jobs submitted with a webhook only get safety-net polls"""
+    print("🧪 Testing webhook poll interval")
+    client = fake_client()
+    job_id = submit(client, 'slow', webhook='https://morph.example/runpod/webhook/x?token=t')
+    assert FakeRunPod.webhooks[-1].endswith('token=t')
+
+    time.sleep(0.3)
+    assert client.get_job_status(job_id) == 'IN_PROGRESS'
+    assert status_calls(job_id) == 0
+    print("✅ Webhook jobs are not polled on the short schedule")
+    return True
+
+
+def create_webhook_app(secret=SECRET):
+    app = create_test_app()
+    app.config['OUTPUT_FOLDER'] = tempfile.mkdtemp()
+    app.config['RUNPOD_WEBHOOK_SECRET'] = secret
+    app.register_blueprint(runpod_bp)
+    return app
+
+
+def test_webhook_completes_generation():
+    """A signed COMPLETED callback saves the image and completes the generation exactly once"""
+    print("🧪 Testing webhook completion")
+    app = create_webhook_app()
+    client = fake_client()
+
+    with app.app_context():
+        user = create_user()
+        queue_job(user, 'a.png')
+        generation = claim_next_generation('worker-a')
+        job_id = submit(client, 'slow', webhook=webhook_url(generation.id, base_url='http://app', secret=SECRET))
+        mark_processing(generation, job_id)
+        generation_id = generation.id
+
+    http = app.test_client()
+    payload = complete_job(job_id)
+    response = http.post(f"/runpod/webhook/{generation_id}?token=forged", json=payload)
+    assert response.status_code == 403
+
+    url = f"/runpod/webhook/{generation_id}?token={sign_generation(generation_id, secret=SECRET)}"
+    response = http.post(url, json=payload)
+    assert response.status_code == 200
+    assert response.get_json()['outcome'] == 'completed'
+
+    with app.app_context():
+        generation = db.session.get(Generation, generation_id)
+        assert generation.status == 'completed'
+        with open(os.path.join(app.config['OUTPUT_FOLDER'], generation.output_filename), 'rb') as f:
+            assert f.read() == PNG
+
+    # RunPod retries deliveries - a second one changes nothing
+    assert http.post(url, json=payload).get_json()['outcome'] == 'ignored'
+    print("✅ Webhooks complete generations idempotently")
+    return True
+
+
+def test_early_and_failed_webhooks():
+    """Callbacks racing the dispatcher are published for the finalizer; failures fail the row"""
+    print("🧪 Testing early and failed webhooks")
+    app = create_webhook_app()
+    client = fake_client()
+    http = app.test_client()
+
+    with app.app_context():
+        user = create_user()
+        queue_job(user, 'early.png')
+        generation = claim_next_generation('worker-a')
+        generation_id = generation.id
+        job_id = submit(client, 'slow', webhook='http://app/hook')
+
+    # Still 'dispatching' - the job ID is not stored yet
+    url = f"/runpod/webhook/{generation_id}?token={sign_generation(generation_id, secret=SECRET)}"
+    response = http.post(url, json={'id': job_id, 'status': 'FAILED', 'error': 'CUDA out of memory'})
+    assert response.get_json()['outcome'] == 'published'
+    assert client.get_job_status(job_id) == 'FAILED'
+    assert status_calls(job_id) == 0
+
+    with app.app_context():
+        generation = db.session.get(Generation, generation_id)
+        mark_processing(generation, job_id)
+
+    response = http.post(url, json={'id': job_id, 'status': 'FAILED', 'error': 'CUDA out of memory'})
+    assert response.get_json()['outcome'] == 'failed'
+    with app.app_context():
+        generation = db.session.get(Generation, generation_id)
+        assert generation.status == 'failed'
+        assert generation.error_message == 'CUDA out of memory'
+    print("✅ Early and failed webhooks are handled")
+    return True
+
+
+def test_webhooks_off_without_secret():
+    """With no RUNPOD_WEBHOOK_SECRET nothing is signed and every callback is rejected"""
+    print("🧪 Testing webhooks without a secret")
+    app = create_webhook_app(secret='')
+
+    with app.app_context():
+        user = create_user()
+        queue_job(user, 'unsigned.png')
+        generation = claim_next_generation('worker-a')
+        mark_processing(generation, 'job-1')
+        generation_id = generation.id
+
+    # A token signed with the old hardcoded fallback key (or no key at all) is worthless
+    http = app.test_client()
+    for token in (sign_generation(generation_id, secret=''), sign_generation(generation_id, secret='your-secret-key-change-in-production')):
+        response = http.post(f"/runpod/webhook/{generation_id}?token={token}", json={'id': 'job-1', 'status': 'FAILED'})
+        assert response.status_code == 403
+
+    with app.app_context():
+        assert db.session.get(Generation, generation_id).status == 'processing'
+    print("✅ Webhooks are off without a secret")
+    return True
+
+
+def test_comfyui_client_async_workflow():
+    """run_workflow() follows long jobs up with polling instead of one blocking request"""
+    print("🧪 Testing RunPodComfyUIClient.run_workflow")
+    workflow_path = os.path.join(tempfile.mkdtemp(), 'workflow.json')
+    with open(workflow_path, 'w') as f:
+        json.dump({'1': {'inputs': {}, 'class_type': 'SaveImage'}}, f)
+
+    comfy = RunPodComfyUIClient('key', 'endpoint', **CLIENT_OPTIONS)
+    calls_before = len(FakeRunPod.calls)
+
+    def finish_later():
+        time.sleep(0.5)
+        job_id = next(job_id for job_id, job in FakeRunPod.jobs.items() if job['status'] == 'IN_QUEUE'
+                      and ('GET', f"/v2/endpoint/status/{job_id}") in FakeRunPod.calls[calls_before:])
+        complete_job(job_id)
+
+    threading.Thread(target=finish_later, daemon=True).start()
+    result = comfy.run_workflow(workflow_path, timeout=10)
+    assert result['status'] == 'success'
+    assert decode_output_image(result['output']) == PNG
+    assert comfy.health_check()['status'] == 'healthy'
+    print("✅ Workflows complete asynchronously")
+    return True
+
+
+if __name__ == '__main__':
+    test_webhook_tokens()
+    test_runsync_fast_path()
+    test_adaptive_polling()
+    test_webhook_jobs_poll_rarely()
+    test_webhook_completes_generation()
+    test_early_and_failed_webhooks()
+    test_webhooks_off_without_secret()
+    test_comfyui_client_async_workflow()
+    print("🎉 All RunPod webhook tests passed!")
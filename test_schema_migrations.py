@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for schema migrations and hot-path query plans (offline, SQLite)
+"""
+
+import os
+import tempfile
+from sqlalchemy import create_engine, inspect, text
+from models import db, Generation, FacialEvaluation, RatiosMorph
+from job_queue import claim_order
+from schema_migrations import MIGRATIONS, run_migrations, migrate_generation_job_queue, migrate_hot_path_indexes
+from test_generation_job_queue import create_test_app
+
+
+def query_plan(query):
+    """SQLite EXPLAIN QUERY PLAN for an ORM query, as one string"""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return ' | '.join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def assert_uses(query, index_name, sorted_by_index=True):
+    plan = query_plan(query)
+    assert index_name in plan, plan
+    if sorted_by_index:
+        assert 'TEMP B-TREE' not in plan, plan  # ORDER BY comes straight from the index
+    return plan
+
+
+def test_legacy_generation_table_migrated():
+    """Old generation tables gain the queue columns, with scheduled_at backfilled"""
+    print("🧪 Testing column migration")
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'legacy.db')}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE generation (id VARCHAR(36) PRIMARY KEY, status VARCHAR(20), created_at DATETIME)"))
+        conn.execute(text("INSERT INTO generation VALUES ('g1', 'pending', '2025-01-01 10:00:00')"))
+        migrate_generation_job_queue(conn)
+        migrate_generation_job_queue(conn)  # Safe to repeat
+
+    columns = {column['name'] for column in inspect(engine).get_columns('generation')}
+    assert {'job_params', 'attempts', 'claimed_by', 'backend_url', 'output_node', 'priority', 'scheduled_at'} <= columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT scheduled_at FROM generation")).scalar() == '2025-01-01 10:00:00'
+    print("✅ Column migration works")
+    return True
+
+
+def test_migrations_run_once():
+    """Indexes missing from an existing database are created once, then recorded"""
+    print("🧪 Testing migration runner")
+    app = create_test_app()
+
+    with app.app_context():
+        engine = db.engine
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_generation_prompt_id"))
+            conn.execute(text("DROP INDEX ix_facial_evaluation_status_created_at"))
+
+        assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+        indexes = {index['name'] for index in inspect(engine).get_indexes('generation')}
+        assert 'ix_generation_prompt_id' in indexes
+        indexes = {index['name'] for index in inspect(engine).get_indexes('facial_evaluation')}
+        assert 'ix_facial_evaluation_status_created_at' in indexes
+
+        assert run_migrations(engine) == []
+        with engine.begin() as conn:
+            migrate_hot_path_indexes(conn)  # Nothing left to create
+
+    print("✅ Migrations run once")
+    return True
+
+
+def test_hot_paths_use_indexes():
+    """Query-plan regression: every hot lookup is served by an index"""
+    print("🧪 Testing query plans")
+    app = create_test_app()
+
+    with app.app_context():
+        assert_uses(Generation.query.filter_by(prompt_id='p-1'), 'ix_generation_prompt_id')
+        assert_uses(Generation.query.filter_by(status='pending').order_by(*claim_order()),
+                    'ix_generation_status_scheduled_at')
+        assert_uses(Generation.query.filter_by(user_id='u-1').order_by(Generation.created_at.desc()).limit(5),
+                    'ix_generation_user_id_created_at')
+
+        for model, table in ((FacialEvaluation, 'facial_evaluation'), (RatiosMorph, 'ratios_morph')):
+            assert_uses(model.query.filter_by(status='Pending').order_by(model.created_at.desc()),
+                        f'ix_{table}_status_created_at')
+            assert_uses(model.query.filter_by(status='Completed').order_by(model.completed_at.desc()).limit(20),
+                        f'ix_{table}_status_completed_at')
+            assert_uses(model.query.filter_by(user_id='u-1').order_by(model.created_at.desc()),
+                        f'ix_{table}_user_id_created_at')
+
+        for column in ('original_image_filename', 'morphed_image_filename', 'secondary_image_filename'):
+            assert_uses(FacialEvaluation.query.filter_by(**{column: 'eval_x.jpg'}), f'ix_facial_evaluation_{column}')
+
+        # Orphan check ORs the three filename columns - one index probe per column, no table scan
+        plan = query_plan(FacialEvaluation.query.filter(
+            (FacialEvaluation.original_image_filename == 'eval_x.jpg') |
+            (FacialEvaluation.morphed_image_filename == 'eval_x.jpg') |
+            (FacialEvaluation.secondary_image_filename == 'eval_x.jpg')
+        ))
+        assert 'MULTI-INDEX OR' in plan and 'SCAN' not in plan.replace('MULTI-INDEX', ''), plan
+
+    print("✅ Hot paths use indexes")
+    return True
+
+
+if __name__ == '__main__':
+    test_legacy_generation_table_migrated()
+    test_migrations_run_once()
+    test_hot_paths_use_indexes()
+    print("🎉 All schema migration tests passed!")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared state store (offline - in-process memory and a temp SQLite file)
+"""
+
+import os
+import time
+import tempfile
+import threading
+from shared_state import MemoryStore, SQLStore, create_store
+
+
+def sqlite_store():
+    return SQLStore(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'shared_state.db')}")
+
+
+def check_semantics(store):
+    assert store.get('missing') is None
+
+    assert store.set('cooldown:1', 'x', ex=60, nx=True)
+    assert not store.set('cooldown:1', 'y', ex=60, nx=True)  # Held by the first claim
+    assert store.get('cooldown:1') == 'x'
+
+    assert store.set('short', 'v', ex=0.05, nx=True)
+    time.sleep(0.1)
+    assert store.get('short') is None
+    assert store.set('short', 'w', ex=60, nx=True)  # Expired keys can be claimed again
+
+    store.set_many({'gpu_status:a': 'COMPLETED', 'gpu_status:b': 'IN_PROGRESS'}, ex=60)
+    assert store.get('gpu_status:a') == 'COMPLETED'
+    assert store.get_many(['gpu_status:a', 'gpu_status:b', 'missing', 'short']) == \
+        {'gpu_status:a': 'COMPLETED', 'gpu_status:b': 'IN_PROGRESS', 'short': 'w'}
+    assert store.get_many([]) == {}
+    store.set('gpu_status:a', 'FAILED')
+    assert store.get('gpu_status:a') == 'FAILED'
+
+    assert store.incr('counter', ex=60) == 1
+    assert store.incr('counter', 4) == 5
+    assert store.delete('counter', 'gpu_status:b', 'missing') == 2
+    assert store.get('counter') is None
+
+
+def test_memory_store():
+    """In-process store follows the shared semantics"""
+    print("🧪 Testing memory store")
+    check_semantics(MemoryStore())
+    print("✅ Memory store works")
+    return True
+
+
+def test_sql_store():
+    """SQLite table store follows the same semantics"""
+    print("🧪 Testing SQL store")
+    check_semantics(sqlite_store())
+    print("✅ SQL store works")
+    return True
+
+
+def test_concurrent_nx_claims():
+    """Racing workers on separate connections get exactly one NX claim and consistent counters"""
+    print("🧪 Testing concurrent claims")
+    store = sqlite_store()
+    store.get('warmup')  # Create the table before the race
+    wins = []
+
+    def claim(name):
+        if store.set('cooldown:7', name, ex=60, nx=True):
+            wins.append(name)
+        store.incr('hits', ex=60)
+
+    threads = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(wins) == 1
+    assert store.get('cooldown:7') == wins[0]
+    assert store.get('hits') == '8'
+    print("✅ Concurrent claims are exclusive")
+    return True
+
+
+def test_create_store_urls():
+    """URLs pick the backend; unusable ones fall back to memory"""
+    print("🧪 Testing store selection")
+    assert isinstance(create_store('memory://'), MemoryStore)
+    assert isinstance(create_store('sqlite:///' + os.path.join(tempfile.mkdtemp(), 's.db')), SQLStore)
+    assert isinstance(create_store('nosuchdialect://host/db'), MemoryStore)
+    print("✅ Store selection works")
+    return True
+
+
+if __name__ == '__main__':
+    test_memory_store()
+    test_sql_store()
+    test_concurrent_nx_claims()
+    test_create_store_urls()
+    print("🎉 All shared state tests passed!")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test script for bulk GPU status reconciliation (offline - fake ComfyUI, SQLite)
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from gpu_backends import GpuBackend
+from local_comfyui_client import LocalComfyUIClient
+from models import db, Generation
+from job_queue import claim_next_generation, mark_processing
+from status_reconciler import StatusReconciler, GPUStatusMap
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests_seen = []
+    queue = {'queue_running': [[0, 'running-1', {}, {}, []]], 'queue_pending': [[1, 'pending-1', {}, {}, []]]}
+    history = {
+        'done-1': {'outputs': {'9': {'images': [{'filename': 'a.png'}]}}},
+        'done-2': {'outputs': {'9': {'images': [{'filename': 'b.png'}]}}},
+        'broken-1': {'outputs': {}},
+    }
+    old_history = {'old-1': {'outputs': {'9': {'images': [{'filename': 'old.png'}]}}}}
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.requests_seen.append(path)
+        if path == '/queue':
+            body = self.queue
+        elif path == '/history':
+            body = self.history
+        else:
+            prompt_id = path.rsplit('/', 1)[1]
+            entry = self.old_history.get(prompt_id)
+            body = {prompt_id: entry} if entry else {}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    FakeComfyUIHandler.requests_seen = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeComfyUIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_bulk_status_two_requests():
+    """Many prompts cost one /queue and one /history fetch (plus lookups outside the window)"""
+    print("🧪 Testing bulk status")
+    server, base_url = start_server()
+    client = LocalComfyUIClient(base_url=base_url, pinned=True)
+
+    statuses = client.get_bulk_status(['running-1', 'pending-1', 'done-1', 'done-2', 'broken-1', 'old-1'])
+    assert statuses == {
+        'running-1': 'IN_PROGRESS', 'pending-1': 'IN_PROGRESS',
+        'done-1': 'COMPLETED', 'done-2': 'COMPLETED',
+        'broken-1': 'FAILED', 'old-1': 'COMPLETED'
+    }
+    assert FakeComfyUIHandler.requests_seen == ['/queue', '/history', '/history/old-1']
+
+    server.shutdown()
+    unreachable = LocalComfyUIClient(base_url='http://127.0.0.1:9', pinned=True)
+    assert unreachable.get_bulk_status(['done-1']) is None  # No verdicts from a backend we can't read
+    print("✅ Bulk status works")
+    return True
+
+
+def test_reconcile_updates_rows_and_map():
+    """One pass fails broken prompts in the database and publishes every status"""
+    print("🧪 Testing reconciliation pass")
+    server, base_url = start_server()
+    client = LocalComfyUIClient(base_url=base_url, pinned=True)
+    app = create_test_app()
+    status_map = GPUStatusMap(max_age=60)
+    reconciler = StatusReconciler(app, lambda generation: client, status_map=status_map)
+
+    with app.app_context():
+        user = create_user()
+        ids = {}
+        for prompt_id in ('running-1', 'done-1', 'broken-1'):
+            queue_job(user, f"{prompt_id}.png")
+            generation = claim_next_generation('worker-a')
+            mark_processing(generation, prompt_id)
+            ids[prompt_id] = generation.id
+
+        generations, statuses = reconciler.reconcile()
+        assert len(generations) == 3
+        assert FakeComfyUIHandler.requests_seen == ['/queue', '/history']
+
+        db.session.expire_all()
+        assert db.session.get(Generation, ids['broken-1']).status == 'failed'
+        assert db.session.get(Generation, ids['done-1']).status == 'processing'  # Left for the finalizer
+        assert db.session.get(Generation, ids['running-1']).status == 'processing'
+
+    assert status_map.get('done-1') == 'COMPLETED'
+    assert status_map.get('running-1') == 'IN_PROGRESS'
+    assert status_map.get('unknown') is None
+    assert status_map.snapshot() == {'IN_PROGRESS': 1, 'COMPLETED': 1, 'FAILED': 1}
+
+    server.shutdown()
+    print("✅ Reconciliation pass works")
+    return True
+
+
+class FakeCloudBackend(GpuBackend):
+    """Per-prompt status() only; get_job_status() reads every error as FAILED like the legacy clients"""
+
+    def __init__(self, name, statuses, authoritative):
+        self.backend_name = name
+        self.statuses = statuses
+        self.authoritative_status = authoritative
+
+    def status(self, job_id):
+        return self.statuses[job_id]
+
+    def get_job_status(self, job_id):
+        return 'FAILED'
+
+
+def test_failed_cloud_jobs_fail_rows():
+    """Authoritative backends (Replicate, RunPod) fail rows through status(); others only report"""
+    print("🧪 Testing per-prompt cloud statuses")
+    app = create_test_app()
+    replicate = FakeCloudBackend('replicate', {'canceled-1': 'FAILED', 'running-2': 'IN_PROGRESS'}, authoritative=True)
+    legacy = FakeCloudBackend('legacy', {'flaky-1': 'FAILED'}, authoritative=False)
+    clients = {'canceled-1': replicate, 'running-2': replicate, 'flaky-1': legacy}
+    reconciler = StatusReconciler(app, lambda generation: clients[generation.prompt_id], status_map=GPUStatusMap(max_age=60))
+
+    with app.app_context():
+        user = create_user()
+        ids = {}
+        for prompt_id in clients:
+            queue_job(user, f"{prompt_id}.png")
+            generation = claim_next_generation('worker-a')
+            mark_processing(generation, prompt_id)
+            ids[prompt_id] = generation.id
+
+        _, statuses = reconciler.reconcile()
+        assert statuses == {'canceled-1': 'FAILED', 'running-2': 'IN_PROGRESS', 'flaky-1': 'FAILED'}
+
+        db.session.expire_all()
+        assert db.session.get(Generation, ids['canceled-1']).status == 'failed'
+        assert db.session.get(Generation, ids['running-2']).status == 'processing'
+        assert db.session.get(Generation, ids['flaky-1']).status == 'processing'  # Not trusted
+    print("✅ Failed cloud jobs no longer stay processing")
+    return True
+
+
+def test_stale_map_entries_ignored():
+    """Statuses older than max_age are not served"""
+    print("🧪 Testing status map expiry")
+    status_map = GPUStatusMap(max_age=0.05)
+    status_map.publish({'p': 'IN_PROGRESS'})
+    assert status_map.get('p') == 'IN_PROGRESS'
+    time.sleep(0.1)
+    assert status_map.get('p') is None
+    print("✅ Stale statuses ignored")
+    return True
+
+
+if __name__ == '__main__':
+    test_bulk_status_two_requests()
+    test_reconcile_updates_rows_and_map()
+    test_failed_cloud_jobs_fail_rows()
+    test_stale_map_entries_ignored()
+    print("🎉 All status reconciler tests passed!")
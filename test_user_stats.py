@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test script for aggregated, cached user generation stats (offline - SQLite, in-memory cache)
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import event
+import models
+from models import db, Generation, FacialEvaluation, RatiosMorph
+from shared_state import MemoryStore
+from job_queue import mark_completed
+from test_generation_job_queue import create_test_app, create_user, queue_job
+
+
+class StatementCounter:
+    """Counts SELECT statements sent to the database"""
+
+    def __init__(self, engine):
+        self.selects = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', '(SELECT', 'WITH')):
+            self.selects += 1
+
+
+def seed(user):
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    old = queue_job(user, 'old.png')
+    old.created_at = yesterday
+    old.status = 'completed'
+    old.used_paid_credit = True
+    queue_job(user, 'today.png').status = 'failed'
+    db.session.add_all([
+        FacialEvaluation(user_id=user.id, original_image_filename='a.png', status='pending'),
+        FacialEvaluation(user_id=user.id, original_image_filename='b.png', status='completed'),
+        RatiosMorph(user_id=user.id, original_image_filename='c.png', status='pending')
+    ])
+    db.session.commit()
+
+
+def test_stats_in_one_query():
+    """Every count comes from a single round trip"""
+    print("🧪 Testing aggregated stats")
+    models.shared_state = MemoryStore()
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        seed(user)
+        db.session.refresh(user)  # Reload the row expired by the seed commit before counting
+        counter = StatementCounter(db.engine)
+
+        stats = user.get_generation_stats()
+        assert counter.selects == 1
+        assert stats == {
+            'total_generations': 2,
+            'today_generations': 1,
+            'successful_generations': 1,
+            'credits_used': 1,
+            'credits_remaining': user.credits,
+            'free_generations_remaining': 1,
+            'total_evaluations': 2,
+            'pending_evaluations': 1,
+            'completed_evaluations': 1,
+            'total_ratios_morphs': 1,
+            'pending_ratios_morphs': 1,
+            'completed_ratios_morphs': 0
+        }
+
+        user.get_generation_stats()
+        assert counter.selects == 1  # Served from the cache
+
+    print("✅ Stats aggregated in one query")
+    return True
+
+
+def test_cache_dropped_on_status_change():
+    """Completing or adding a counted row refreshes the stats; unrelated updates keep the cache"""
+    print("🧪 Testing cache invalidation")
+    models.shared_state = MemoryStore()
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        generation = queue_job(user, 'job.png')
+        assert user.get_generation_stats()['successful_generations'] == 0
+
+        generation.claimed_by = 'worker-a'  # Not counted - cache survives
+        db.session.commit()
+        assert models.shared_state.get(models.user_stats_cache_key(user.id)) is not None
+
+        mark_completed(generation, 'result_job.png')
+        assert models.shared_state.get(models.user_stats_cache_key(user.id)) is None
+        assert user.get_generation_stats()['successful_generations'] == 1
+
+        db.session.add(FacialEvaluation(user_id=user.id, original_image_filename='e.png', status='pending'))
+        db.session.commit()
+        assert user.get_generation_stats()['pending_evaluations'] == 1
+
+    print("✅ Cache invalidation works")
+    return True
+
+
+def test_cache_dropped_after_commit():
+    """Counts re-cached between flush and commit (another worker reading) are still dropped"""
+    print("🧪 Testing invalidation on commit")
+    models.shared_state = MemoryStore()
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        generation = queue_job(user, 'job.png')
+        key = models.user_stats_cache_key(user.id)
+        assert user.get_generation_stats()['successful_generations'] == 0
+        stale = models.shared_state.get(key)
+
+        generation.status = 'completed'
+        db.session.flush()
+        models.shared_state.set(key, stale, ex=300)  # A concurrent reader still sees the old row
+        db.session.commit()
+        assert models.shared_state.get(key) is None
+        assert user.get_generation_stats()['successful_generations'] == 1
+
+        # Rolled-back changes never committed - the cache stays
+        generation.status = 'failed'
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert models.shared_state.get(key) is not None
+
+    assert models.seconds_until_midnight(datetime(2026, 1, 1, 23, 59, 30)) == 30
+    assert models.seconds_until_midnight(datetime(2026, 1, 1, 0, 0, 0)) == 86400
+    assert models.seconds_until_midnight(datetime(2026, 1, 1, 23, 59, 59, 999999)) == 1
+    print("✅ Cache dropped once the change commits, and never outlives the day")
+    return True
+
+
+def test_free_credit_check_is_read_only():
+    """Checking the daily free credit on a new day no longer writes the user row"""
+    print("🧪 Testing read-only free credit check")
+    models.shared_state = MemoryStore()
+    app = create_test_app()
+
+    with app.app_context():
+        user = create_user()
+        user.free_generations_used_today = 1
+        user.last_free_generation_date = datetime.utcnow().date() - timedelta(days=1)
+        db.session.commit()
+
+        assert user.can_generate_free()
+        assert user.free_generations_remaining() == 1
+        assert user.free_generations_used_today == 1  # Untouched until a free generation is used
+        assert not db.session.dirty
+
+        user.use_free_generation()
+        assert not user.can_generate_free()
+        assert user.get_generation_stats()['free_generations_remaining'] == 0
+
+    print("✅ Free credit check is read-only")
+    return True
+
+
+if __name__ == '__main__':
+    test_stats_in_one_query()
+    test_cache_dropped_on_status_change()
+    test_cache_dropped_after_commit()
+    test_free_credit_check_is_read_only()
+    print("🎉 All user stats tests passed!")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Test script for the Vast.ai offer catalog and scored selection (offline - canned offers, memory store)
+"""
+
+from shared_state import MemoryStore
+from vast_offers import OfferCatalog, score_offer, MAX_READY_TIMEOUT, MIN_READY_TIMEOUT
+from vast_on_demand_client import VastOnDemandClient
+
+
+def offer(offer_id, machine_id, price, inet_down=500, reliability=0.98, gpu_ram=24):
+    return {'id': offer_id, 'machine_id': machine_id, 'dph_total': price, 'inet_down': inet_down,
+            'reliability2': reliability, 'gpu_ram': gpu_ram, 'gpu_name': 'RTX 3090'}
+
+
+class FakeSearch:
+    def __init__(self, offers):
+        self.offers = offers
+        self.calls = 0
+
+    def __call__(self, min_gpu_ram):
+        self.calls += 1
+        return [dict(o) for o in self.offers]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_catalog(offers, store=None, clock=None):
+    search = FakeSearch(offers)
+    catalog = OfferCatalog(search, store=store or MemoryStore(), ttl=60, min_gpu_ram=8, max_hourly_cost=1.0,
+                           block_seconds=3600, clock=clock or FakeClock())
+    return catalog, search
+
+
+def test_choose_uses_cache():
+    """Offers are searched once per TTL, not once per boot"""
+    print("🧪 Testing offer cache")
+    clock = FakeClock()
+    catalog, search = make_catalog([offer(1, 'a', 0.3), offer(2, 'b', 0.4)], clock=clock)
+
+    assert catalog.choose()['id'] == 1
+    assert catalog.choose()['id'] == 1
+    assert search.calls == 1
+
+    clock.now += 61
+    catalog.choose()
+    assert search.calls == 2
+    print("✅ Offers are served from the cache")
+    return True
+
+
+def test_filters_unsuitable_offers():
+    """Too little GPU memory, low reliability and high prices are skipped"""
+    print("🧪 Testing offer filters")
+    catalog, _ = make_catalog([
+        offer(1, 'a', 0.2, gpu_ram=4),
+        offer(2, 'b', 0.2, reliability=0.5),
+        offer(3, 'c', 1.5),
+        offer(4, 'd', 0.6),
+    ])
+    assert catalog.choose()['id'] == 4
+    assert catalog.snapshot()['offers'] == 1
+    print("✅ Unsuitable offers are filtered")
+    return True
+
+
+def test_scoring_trades_price_for_speed():
+    """A slightly pricier host with fast boots beats the cheapest slow one"""
+    print("🧪 Testing scoring")
+    cheap_slow = offer(1, 'slow', 0.20, inet_down=50)
+    fast = offer(2, 'fast', 0.30, inet_down=2000)
+    assert score_offer(fast) < score_offer(cheap_slow)
+
+    # Measured history overrides the inet estimate
+    assert score_offer(cheap_slow, {'boots': 5, 'failures': 0, 'boot_seconds': 60}) < score_offer(fast)
+    # Failures make a host look slower
+    assert score_offer(fast, {'boots': 4, 'failures': 2, 'boot_seconds': 120}) > \
+        score_offer(fast, {'boots': 4, 'failures': 0, 'boot_seconds': 120})
+
+    catalog, _ = make_catalog([cheap_slow, fast])
+    assert catalog.choose()['id'] == 2
+    print("✅ Scoring weighs boot time against price")
+    return True
+
+
+def test_boot_history_persists_and_reranks():
+    """Recorded boots are saved to the store, rerank the cache and survive a new catalog"""
+    print("🧪 Testing host history")
+    store = MemoryStore()
+    offers = [offer(1, 'a', 0.30), offer(2, 'b', 0.35)]
+    catalog, _ = make_catalog(offers, store=store)
+    assert catalog.choose()['id'] == 1
+
+    catalog.record_boot(offers[1], 40)
+    assert catalog.choose()['id'] == 2  # Known-fast host now ranks first
+    assert catalog.ready_timeout(offers[1]) == MIN_READY_TIMEOUT
+    assert catalog.ready_timeout(offers[0]) == MAX_READY_TIMEOUT  # Unknown hosts get the full wait
+
+    catalog.record_boot(offers[1], 140)
+    stats = catalog.record_boot(offers[1], 140)
+    assert stats['boots'] == 3
+    assert 40 < stats['boot_seconds'] < 140  # Moving average
+
+    fresh, _ = make_catalog(offers, store=store)
+    assert fresh.choose()['id'] == 2
+    print("✅ Host history persists")
+    return True
+
+
+class CountingStore(MemoryStore):
+    """Counts read round trips"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        return super().get(key)
+
+    def get_many(self, keys):
+        self.reads += 1
+        return super().get_many(keys)
+
+
+def test_refresh_loads_hosts_in_one_read():
+    """Host history for every suitable offer is read in a single store round trip"""
+    print("🧪 Testing batched host history")
+    store = CountingStore()
+    offers = [offer(i, f"m{i}", 0.30 + i / 100) for i in range(50)]
+    catalog, _ = make_catalog(offers, store=store)
+    catalog.record_boot(offers[7], 40)
+
+    store.reads = 0
+    fresh, _ = make_catalog(offers, store=store)
+    assert fresh.refresh()
+    assert store.reads == 1
+    assert fresh.choose()['id'] == 7  # History from the batch read still reranks
+    print("✅ Host history loaded in one read")
+    return True
+
+
+def test_failed_hosts_blocked():
+    """A host that never became ready is skipped until its block expires"""
+    print("🧪 Testing blocklist")
+    clock = FakeClock()
+    store = MemoryStore()
+    offers = [offer(1, 'a', 0.30), offer(2, 'b', 0.35)]
+    catalog, _ = make_catalog(offers, store=store, clock=clock)
+
+    catalog.record_failure(offers[0])
+    assert catalog.choose()['id'] == 2
+    assert catalog.snapshot()['blocked_hosts'] == 1
+
+    # Other processes see the block after their next refresh
+    other, _ = make_catalog(offers, store=store, clock=clock)
+    assert other.choose()['id'] == 2
+
+    clock.now += 3601
+    catalog.refresh()
+    assert catalog.choose()['machine_id'] in ('a', 'b')
+    assert catalog.snapshot()['blocked_hosts'] == 0
+    print("✅ Failed hosts are blocked")
+    return True
+
+
+class ScriptedVastClient(VastOnDemandClient):
+    """Real boot_instance() flow over canned Vast.ai responses"""
+
+    def __init__(self, offers, ready=True):
+        super().__init__('test-key')
+        self.offer_catalog = make_catalog(offers)[0]
+        self.ready = ready
+        self.stopped = []
+        self.rented = []
+
+    def start_instance(self, offer_id):
+        self.rented.append(offer_id)
+        return 100 + offer_id
+
+    def wait_for_instance_ready(self, instance_id, timeout=600):
+        return self.ready
+
+    def get_instance_info(self, instance_id):
+        return {'id': instance_id, 'public_ipaddr': '10.0.0.5'}
+
+    def stop_instance(self, instance_id):
+        self.stopped.append(instance_id)
+        return True
+
+
+def test_boot_instance_records_outcome():
+    """boot_instance() rents the best offer, never reuses a rented one and feeds the host history"""
+    print("🧪 Testing boot_instance")
+    client = ScriptedVastClient([offer(1, 'a', 0.30), offer(2, 'b', 0.35)])
+    assert client.boot_instance() == (101, 'http://10.0.0.5:8188')
+    assert client.offer_catalog._hosts['a']['boots'] == 1
+    assert client.boot_instance()[0] == 102  # Offer 1 was consumed
+
+    failing = ScriptedVastClient([offer(1, 'a', 0.30), offer(2, 'b', 0.35)], ready=False)
+    assert failing.boot_instance() is None
+    assert failing.stopped == [101]
+    assert failing.offer_catalog._hosts['a']['failures'] == 1
+    assert failing.offer_catalog.snapshot()['blocked_hosts'] == 1
+    print("✅ Boots update host history")
+    return True
+
+
+if __name__ == '__main__':
+    test_choose_uses_cache()
+    test_filters_unsuitable_offers()
+    test_scoring_trades_price_for_speed()
+    test_boot_history_persists_and_reranks()
+    test_refresh_loads_hosts_in_one_read()
+    test_failed_hosts_blocked()
+    test_boot_instance_records_outcome()
+    print("🎉 All Vast.ai offer catalog tests passed!")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Test script for the Vast.ai warm instance pool (offline - a fake client instead of the Vast.ai API)
+"""
+
+import threading
+from datetime import datetime, timedelta
+from models import db, Generation
+from job_queue import get_hourly_demand
+from vast_warm_pool import VastWarmPool, predict_instances, READY, BUSY
+from test_generation_job_queue import create_test_app, create_user
+
+
+class FakeVastClient:
+    """Boots instantly (or when released) and records destroyed instances"""
+
+    def __init__(self, hold_boots=False):
+        self.booted = 0
+        self.stopped = []
+        self.release_boot = threading.Event()
+        if not hold_boots:
+            self.release_boot.set()
+        self._lock = threading.Lock()
+
+    def boot_instance(self):
+        self.release_boot.wait(5)
+        with self._lock:
+            self.booted += 1
+            instance_id = self.booted
+        return instance_id, f"http://10.0.0.{instance_id}:8188"
+
+    def stop_instance(self, instance_id):
+        self.stopped.append(instance_id)
+        return True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(condition, timeout=5):
+    event = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        event.wait(0.01)
+    return False
+
+
+def test_instances_reused_between_jobs():
+    """The first job boots an instance, the next ones reuse it"""
+    print("🧪 Testing instance reuse")
+    client = FakeVastClient()
+    pool = VastWarmPool(client, max_instances=2, idle_ttl=300)
+
+    first = pool.acquire(timeout=5)
+    assert first is not None and first.state == BUSY
+    pool.release(first)
+    second = pool.acquire(timeout=5)
+    assert second is first
+    pool.release(second)
+
+    assert client.booted == 1
+    assert first.jobs == 2
+    assert client.stopped == []
+    print("✅ Warm instances are reused")
+    return True
+
+
+def test_acquire_bounded_by_max_instances():
+    """Concurrent jobs boot up to max_instances and then wait for a free one"""
+    print("🧪 Testing max instances")
+    client = FakeVastClient()
+    pool = VastWarmPool(client, max_instances=2, idle_ttl=300)
+
+    a = pool.acquire(timeout=5)
+    b = pool.acquire(timeout=5)
+    assert a is not b and client.booted == 2
+    assert pool.acquire(timeout=0.1) is None  # No room for a third
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(pool.acquire(timeout=5)))
+    waiter.start()
+    pool.release(a)
+    waiter.join()
+    assert results == [a]
+    assert client.booted == 2
+
+    pool.release(b, healthy=False)  # Dead instances are destroyed and leave the pool
+    assert client.stopped == [b.instance_id]
+    assert pool.snapshot()['instances'] == {BUSY: 1}
+    print("✅ Pool size is bounded")
+    return True
+
+
+def test_scale_up_and_idle_teardown():
+    """Queue depth boots instances ahead of jobs; idle ones are destroyed after the TTL"""
+    print("🧪 Testing scaling")
+    clock = FakeClock()
+    client = FakeVastClient()
+    pool = VastWarmPool(client, max_instances=3, min_instances=0, idle_ttl=300, jobs_per_instance=2, clock=clock)
+
+    assert pool.scale(queue_depth=3)['booted'] == 2
+    assert wait_until(lambda: pool.snapshot()['instances'] == {READY: 2})
+    assert pool.scale(queue_depth=100)['desired'] == 3  # Capped at max_instances
+
+    assert wait_until(lambda: pool.snapshot()['instances'] == {READY: 3})
+    clock.now += 200
+    assert pool.scale(queue_depth=0)['stopped'] == 0  # Not idle long enough
+
+    clock.now += 200
+    assert pool.scale(queue_depth=2)['stopped'] == 2  # One is still wanted
+    assert pool.scale(queue_depth=0)['stopped'] == 1
+    assert sorted(client.stopped) == [1, 2, 3]
+    print("✅ Pool scales up and tears down")
+    return True
+
+
+def test_busy_instances_survive_scale_down():
+    """Only idle ready instances are destroyed"""
+    print("🧪 Testing busy instances")
+    clock = FakeClock()
+    client = FakeVastClient()
+    pool = VastWarmPool(client, max_instances=1, idle_ttl=10, clock=clock)
+
+    instance = pool.acquire(timeout=5)
+    clock.now += 100
+    assert pool.scale(queue_depth=0)['stopped'] == 0
+    pool.release(instance)
+    assert pool.scale(queue_depth=0)['stopped'] == 0  # Just used
+    clock.now += 100
+    assert pool.scale(queue_depth=0)['stopped'] == 1
+    print("✅ Busy instances are kept")
+    return True
+
+
+def test_shutdown_destroys_everything():
+    """shutdown() destroys ready instances and ones still booting"""
+    print("🧪 Testing shutdown")
+    client = FakeVastClient(hold_boots=True)
+    pool = VastWarmPool(client, max_instances=2, idle_ttl=300)
+
+    pool.scale(queue_depth=4)
+    pool.shutdown()
+    client.release_boot.set()
+    assert wait_until(lambda: sorted(client.stopped) == [1, 2])
+    assert pool.acquire(timeout=0.1) is None
+    print("✅ Shutdown destroys all instances")
+    return True
+
+
+def test_in_process_worker_has_no_pool():
+    """Workers without the scaler (GENERATION_WORKER_IN_PROCESS) never rent instances they cannot reap"""
+    print("🧪 Testing warm pool in in-process workers")
+    import generation_worker
+    from gpu_router import GpuRouter
+
+    class FakeVastBackend:
+        backend_name = 'vast'
+
+        def __init__(self):
+            self.warm_pool = VastWarmPool(FakeVastClient(), max_instances=2, idle_ttl=300)
+
+    router = generation_worker.gpu_router
+    stop_event = threading.Event()
+    stop_event.set()  # Threads exit straight away
+    try:
+        in_process = FakeVastBackend()
+        generation_worker.gpu_router = GpuRouter([in_process])
+        workers, warm_pool = generation_worker.start_worker(stop_event, threads=1, scale_warm_pool=False)
+        assert warm_pool is None and in_process.warm_pool is None
+        assert not any(worker.name == 'vast-warm-pool' for worker in workers)
+
+        dedicated = FakeVastBackend()
+        generation_worker.gpu_router = GpuRouter([dedicated])
+        workers, warm_pool = generation_worker.start_worker(stop_event, threads=1)
+        assert warm_pool is dedicated.warm_pool and warm_pool is not None
+        assert any(worker.name == 'vast-warm-pool' for worker in workers)
+    finally:
+        generation_worker.gpu_router = router
+    print("✅ Only workers that scale the pool keep one")
+    return True
+
+
+def test_prewarm_from_hourly_history():
+    """Hours that are usually busy get instances before the queue fills"""
+    print("🧪 Testing pre-warming")
+    assert predict_instances({}, 12) == 0
+    assert predict_instances({12: 2}, 12, job_seconds=60, min_jobs=4) == 0  # Too quiet to pay for
+    assert predict_instances({13: 10}, 12, job_seconds=60, min_jobs=4) == 1  # Next hour counts
+    assert predict_instances({23: 0, 0: 150}, 23, job_seconds=60, min_jobs=4) == 3
+
+    pool = VastWarmPool(FakeVastClient(), max_instances=2, idle_ttl=300)
+    assert pool.desired_size(0, {9: 300}, hour=9) == 2
+    assert pool.desired_size(0, {9: 300}, hour=15) == 0
+
+    app = create_test_app()
+    with app.app_context():
+        user = create_user()
+        now = datetime.utcnow().replace(minute=30)
+        for days_ago in (1, 2, 3, 40):
+            generation = Generation(user_id=user.id, input_filename='x.png', preset='+1_Tier', workflow_type='facedetailer', status='completed',
+                                    created_at=now - timedelta(days=days_ago))
+            db.session.add(generation)
+        db.session.commit()
+
+        demand = get_hourly_demand(days=7)
+        assert demand == {now.hour: 3 / 7}  # The 40-day-old one is outside the window
+        assert get_hourly_demand(days=0) == {}
+    print("✅ Pre-warming follows hourly history")
+    return True
+
+
+if __name__ == '__main__':
+    test_instances_reused_between_jobs()
+    test_acquire_bounded_by_max_instances()
+    test_scale_up_and_idle_teardown()
+    test_busy_instances_survive_scale_down()
+    test_shutdown_destroys_everything()
+    test_in_process_worker_has_no_pool()
+    test_prewarm_from_hourly_history()
+    print("🎉 All Vast.ai warm pool tests passed!")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for single-graph multi-feature custom mode (offline - no ComfyUI)
+"""
+
+from local_comfyui_client import LocalComfyUIClient
+from workflow_composer import COMPOSED_OUTPUT_NODE
+
+
+def count_classes(workflow):
+    counts = {}
+    for node in workflow.values():
+        counts[node['class_type']] = counts.get(node['class_type'], 0) + 1
+    return counts
+
+
+def composite_chain(workflow):
+    """Walk ImageComposite+ destinations back from the output"""
+    chain = []
+    node_id = workflow[COMPOSED_OUTPUT_NODE]['inputs']['images'][0]
+    while workflow[node_id]['class_type'] == 'ImageComposite+':
+        chain.append(node_id)
+        node_id = workflow[node_id]['inputs']['destination'][0]
+    return chain[::-1], node_id
+
+
+def test_masked_features_share_models():
+    """eyes + nose + mouth: one checkpoint/LoRA/VAEEncode, three chained sampler stages"""
+    print("🧪 Testing eyes + nose + mouth composition")
+    client = LocalComfyUIClient(base_url='http://127.0.0.1:8188')
+    workflow = client._prepare_workflow('uploads/face.png', 0.3, 'Custom_Features', ['eyes', 'nose', 'mouth'])
+
+    counts = count_classes(workflow)
+    assert counts['CheckpointLoaderSimple'] == 1
+    assert counts['LoraLoader'] == 1
+    assert counts['VAEEncode'] == 1
+    assert counts['FaceAnalysisModels'] == 1
+    assert counts['LoadImage'] == 1
+    assert counts['KSampler'] == 3
+    assert counts['ImageComposite+'] == 3
+    assert counts['SaveImage'] == 1
+
+    chain, base = composite_chain(workflow)
+    assert len(chain) == 3
+    assert workflow[base]['class_type'] == 'LoadImage'
+    assert workflow[base]['inputs']['image'] == 'face.png'
+    areas = [workflow[workflow[node_id]['inputs']['mask'][0]]['inputs']['area'] for node_id in chain]
+    assert areas == ['eyes', 'nose', 'mouth']
+
+    print("✅ Features chained in one graph")
+    return True
+
+
+def test_skull_runs_first_and_debug_nodes_dropped():
+    """skull + eyebrows: skull's FaceDetailer pass first, eyebrows' debug outputs removed"""
+    print("🧪 Testing skull + eyebrows composition")
+    client = LocalComfyUIClient(base_url='http://127.0.0.1:8188')
+    workflow = client._prepare_workflow('uploads/face.png', 0.3, 'Custom_Features', ['eyebrows', 'skull'])
+
+    counts = count_classes(workflow)
+    assert counts['CheckpointLoaderSimple'] == 1
+    assert counts['FaceDetailer'] == 1
+    assert counts['KSampler'] == 1
+    assert counts['SaveImage'] == 1
+    assert 'MaskToImage' not in counts
+
+    chain, base = composite_chain(workflow)
+    assert workflow[base]['class_type'] == 'FaceDetailer'
+    assert workflow[chain[-1]]['inputs']['source'][0] != base  # Eyebrows pasted over the skull result
+    assert workflow[COMPOSED_OUTPUT_NODE]['inputs']['filename_prefix'].startswith('morph_eyebrows_skull_')
+
+    print("✅ Skull first, debug nodes dropped")
+    return True
+
+
+if __name__ == '__main__':
+    test_masked_features_share_models()
+    test_skull_runs_first_and_debug_nodes_dropped()
+    print("🎉 All workflow composer tests passed!")
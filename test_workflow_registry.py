@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for the cached workflow registry and slot binding (offline)
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+from workflow_registry import WorkflowRegistry, TEMPLATE_SLOTS, workflow_registry
+
+
+def test_every_declared_template_is_valid():
+    """All templates with declared slots load and validate from comfyui_workflows/"""
+    print("🧪 Testing template validation")
+    registry = WorkflowRegistry()
+    registry.load_all()
+    for name in TEMPLATE_SLOTS:
+        assert name in registry.names(), f"{name} failed validation"
+    assert 'workflow.json' not in registry.names()  # UI-format export
+    print("✅ Declared templates valid")
+    return True
+
+
+def test_bind_copies_only_mutated_nodes():
+    """Bound payloads share untouched nodes with the cached template and never mutate it"""
+    print("🧪 Testing slot binding")
+    template = workflow_registry.get('comfyui_workflows/workflow_facedetailer.json')
+    original_image = template.nodes['5']['inputs']['image']
+
+    payload = template.bind(input_image='face.png', denoise=0.15, seed=1234, save_prefix='morph_test', steps=None)
+    assert payload['5']['inputs']['image'] == 'face.png'
+    assert payload['8']['inputs']['denoise'] == 0.15
+    assert payload['8']['inputs']['seed'] == 1234
+    assert payload['9']['inputs']['filename_prefix'] == 'morph_test'
+
+    assert payload['1'] is template.nodes['1']  # Untouched - shared
+    assert payload['8'] is not template.nodes['8']
+    assert template.nodes['5']['inputs']['image'] == original_image
+
+    for bad_values, error in (({'area': 'eyes'}, ValueError), ({'seed': '42'}, TypeError), ({'denoise': True}, TypeError)):
+        try:
+            template.bind(**bad_values)
+            assert False, f"{bad_values} should raise"
+        except error:
+            pass
+
+    print("✅ Binding copies only mutated nodes")
+    return True
+
+
+def test_hot_reload_on_mtime_change():
+    """Edited templates are picked up; invalid edits keep the last good version"""
+    print("🧪 Testing hot reload")
+    folder = tempfile.mkdtemp()
+    shutil.copy('comfyui_workflows/workflow_facedetailer.json', folder)
+    path = os.path.join(folder, 'workflow_facedetailer.json')
+    registry = WorkflowRegistry(folder=folder, reload_interval=0)
+    assert registry.load_all() == 1
+
+    with open(path) as f:
+        nodes = json.load(f)
+    nodes['8']['inputs']['steps'] = 42
+    with open(path, 'w') as f:
+        json.dump(nodes, f)
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert registry.get('workflow_facedetailer.json').nodes['8']['inputs']['steps'] == 42
+
+    del nodes['9']  # Removes the save_prefix slot
+    with open(path, 'w') as f:
+        json.dump(nodes, f)
+    os.utime(path, (time.time() + 20, time.time() + 20))
+    assert '9' in registry.get('workflow_facedetailer.json').nodes
+
+    print("✅ Hot reload works")
+    return True
+
+
+if __name__ == '__main__':
+    test_every_declared_template_is_valid()
+    test_bind_copies_only_mutated_nodes()
+    test_hot_reload_on_mtime_change()
+    print("🎉 All workflow registry tests passed!")
@@ -1,44 +1,88 @@
 import os
 import json
 import time
+import uuid
 import logging
+from contextlib import contextmanager
+from shared_state import shared_state
 
 logger = logging.getLogger(__name__)
 
-# File to persist the registered tunnel URL
-REGISTRY_FILE = os.path.join("instance", "detected_tunnel.json")
+# Registered URLs live in the shared state store so every gunicorn worker and replica sees them
+REGISTRY_KEY = "tunnel_registry"
+store = shared_state
 
+# Writers (add/remove) read, modify and write the whole registry - an NX key serializes them
+# across workers so concurrent /register-tunnel calls do not drop each other's URLs
+REGISTRY_LOCK_KEY = "lock:tunnel_registry"
+REGISTRY_LOCK_TIMEOUT = 10  # Seconds before a lock left by a crashed writer expires
+REGISTRY_LOCK_WAIT = 5  # Seconds a writer waits for the lock
 
-def _ensure_dir():
-    dirname = os.path.dirname(REGISTRY_FILE)
-    if not os.path.exists(dirname):
-        try:
-            os.makedirs(dirname, exist_ok=True)
-        except Exception:
-            pass
+# File the registry used to be persisted in (read once to migrate)
+REGISTRY_FILE = os.path.join("instance", "detected_tunnel.json")
 
 
-def get_tunnel_url():
-    """Return the stored tunnel URL if present, else None."""
+def _read_legacy_file():
     try:
         if os.path.exists(REGISTRY_FILE):
             with open(REGISTRY_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                url = data.get("url")
-                if url:
-                    return url
+                return json.load(f)
+    except Exception as e:
+        logger.debug(f"Failed to read legacy tunnel registry file: {e}")
+    return {}
+
+
+def _read_registry():
+    try:
+        raw = store.get(REGISTRY_KEY)
+        if raw:
+            return json.loads(raw)
     except Exception as e:
         logger.debug(f"Failed to read tunnel registry: {e}")
-    return None
+        return {}
+    return _read_legacy_file()
+
+
+def _write_registry(data):
+    data["ts"] = int(time.time())
+    store.set(REGISTRY_KEY, json.dumps(data))
+
+
+@contextmanager
+def _registry_lock(wait=REGISTRY_LOCK_WAIT):
+    token = uuid.uuid4().hex
+    deadline = time.time() + wait
+    while not store.set(REGISTRY_LOCK_KEY, token, ex=REGISTRY_LOCK_TIMEOUT, nx=True):
+        if time.time() >= deadline:
+            raise TimeoutError("tunnel registry is locked by another writer")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        if store.get(REGISTRY_LOCK_KEY) == token:
+            store.delete(REGISTRY_LOCK_KEY)
+
+
+def get_tunnel_url():
+    """Return the most recently registered tunnel URL if present, else None."""
+    return _read_registry().get("url") or None
+
+
+def get_tunnel_urls():
+    """Return every registered ComfyUI backend URL (most recent last)."""
+    data = _read_registry()
+    urls = list(data.get("urls") or [])
+    # Registries written before multi-backend support only have "url"
+    if data.get("url") and data["url"] not in urls:
+        urls.append(data["url"])
+    return urls
 
 
 def set_tunnel_url(url: str):
     """Store the current tunnel URL (overwrites previous)."""
     try:
-        _ensure_dir()
-        data = {"url": url, "ts": int(time.time())}
-        with open(REGISTRY_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f)
+        with _registry_lock():
+            _write_registry({"url": url, "urls": [url]})
         logger.info(f"Registered tunnel URL: {url}")
         return True
     except Exception as e:
@@ -46,13 +90,52 @@ def set_tunnel_url(url: str):
         return False
 
 
+def add_tunnel_url(url: str):
+    """Add a backend URL to the registered set (keeps the others)."""
+    try:
+        with _registry_lock():
+            data = _read_registry()
+            urls = [u for u in get_tunnel_urls() if u != url]
+            urls.append(url)
+            data.update({"url": url, "urls": urls})
+            _write_registry(data)
+        logger.info(f"Registered tunnel URL: {url} ({len(urls)} backend(s))")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to write tunnel registry: {e}")
+        return False
+
+
+def remove_tunnel_url(url: str):
+    """Drop a backend URL from the registered set."""
+    try:
+        with _registry_lock():
+            data = _read_registry()
+            existing = get_tunnel_urls()
+            if url not in existing:
+                return False
+            urls = [u for u in existing if u != url]
+            data["urls"] = urls
+            if data.get("url") == url:
+                data["url"] = urls[-1] if urls else None
+            _write_registry(data)
+        logger.info(f"Removed tunnel URL: {url}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to write tunnel registry: {e}")
+        return False
+
+
 def clear_tunnel_url():
     """Remove stored tunnel URL."""
     try:
+        cleared = store.delete(REGISTRY_KEY) > 0
         if os.path.exists(REGISTRY_FILE):
             os.remove(REGISTRY_FILE)
+            cleared = True
+        if cleared:
             logger.info("Cleared registered tunnel URL")
-            return True
+        return cleared
     except Exception as e:
         logger.error(f"Failed to clear tunnel registry: {e}")
     return False
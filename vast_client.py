@@ -13,10 +13,11 @@ from typing import Optional, Dict, Any
 import logging
 from PIL import Image
 import io
+from gpu_backends import GpuBackend, Submission
 
 logger = logging.getLogger(__name__)
 
-class VastMorphClient:
+class VastMorphClient(GpuBackend):
     """
     Simple, reliable GPU client using Vast.ai
     - Upload your exact models once
@@ -24,6 +25,10 @@ class VastMorphClient:
     - 90% cheaper than RunPod
     """
     
+    backend_name = 'vast_instance'
+    preset_keys = ('HTN', 'Chadlite', 'Chad')
+    synchronous = True  # generate_image() waits for the result on the instance
+    
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv('VAST_API_KEY')
         self.base_url = "https://console.vast.ai/api/v0"
@@ -345,6 +350,9 @@ tail -f /dev/null
                 
         return None, "Generation timeout"
     
+    def submit(self, job) -> Submission:
+        return self.submit_preset(job)
+    
     def get_job_status(self, job_id: str) -> str:
         """Get job status (for compatibility)"""
         return 'COMPLETED'
@@ -0,0 +1,224 @@
+"""
+Vast.ai Offer Catalog
+find_cheapest_gpu() queried the offers API on every boot and took the cheapest offer, however
+long its host took to come up. The catalog keeps the last search in memory (refreshed in the
+background), so picking an offer is a lookup, and ranks offers by expected seconds until a
+usable ComfyUI:
+
+    expected = boot estimate / chance the boot succeeds + price * VAST_SECONDS_PER_DOLLAR
+
+Boot time and failure counts per machine_id come from our own boots and persist in the shared
+state store. Hosts we have not used yet are estimated from their inet_down and reliability.
+Hosts that never became ready are skipped for VAST_HOST_BLOCK_SECONDS.
+"""
+
+import json
+import time
+import logging
+import threading
+from config import (VAST_MIN_GPU_RAM, VAST_MAX_HOURLY_COST, VAST_OFFER_CACHE_TTL, VAST_DEFAULT_BOOT_SECONDS,
+                    VAST_SECONDS_PER_DOLLAR, VAST_HOST_BLOCK_SECONDS, VAST_HOST_STATS_DAYS)
+from shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PULL_MEGABITS = 64000  # ~8 GB docker image + ComfyUI install, downloaded on every fresh host
+MIN_RELIABILITY = 0.9
+MAX_READY_TIMEOUT = 600
+MIN_READY_TIMEOUT = 180
+BOOT_SECONDS_ALPHA = 0.3  # Weight of the newest boot in a host's moving average
+
+
+def estimate_boot_seconds(offer, stats=None, default_seconds=VAST_DEFAULT_BOOT_SECONDS):
+    """Seconds from rent to ready: measured on this host before, else setup time plus image download"""
+    if stats and stats.get('boot_seconds'):
+        return stats['boot_seconds']
+    inet_down = max(float(offer.get('inet_down') or 0), 10.0)  # Mbit/s
+    return default_seconds + IMAGE_PULL_MEGABITS / inet_down
+
+
+def score_offer(offer, stats=None, seconds_per_dollar=VAST_SECONDS_PER_DOLLAR, default_seconds=VAST_DEFAULT_BOOT_SECONDS):
+    """
+    Expected seconds until this offer serves jobs, with its price converted to seconds (lower is better)
+
+    The failure chance starts at the host's advertised unreliability (worth two boots) and
+    moves toward what we observed.
+    """
+    stats = stats or {}
+    prior = 1.0 - float(offer.get('reliability2') or MIN_RELIABILITY)
+    failure_rate = (stats.get('failures', 0) + 2 * prior) / (stats.get('boots', 0) + 2)
+    success_rate = max(0.05, 1.0 - failure_rate)
+    return estimate_boot_seconds(offer, stats, default_seconds) / success_rate + \
+        float(offer.get('dph_total') or 0) * seconds_per_dollar
+
+
+class OfferCatalog:
+    """Cached, scored Vast.ai offers plus per-host boot history"""
+
+    KEY_PREFIX = 'vast_host:'
+
+    def __init__(self, search, store=shared_state, ttl=VAST_OFFER_CACHE_TTL, min_gpu_ram=VAST_MIN_GPU_RAM,
+                 max_hourly_cost=VAST_MAX_HOURLY_COST, block_seconds=VAST_HOST_BLOCK_SECONDS, clock=time.time):
+        """
+        Args:
+            search: Callable(min_gpu_ram) -> list of offers, or None if the API call failed
+            store: Shared state store host history is persisted in
+            ttl: Seconds before cached offers are searched again
+            min_gpu_ram: Smallest GPU memory accepted
+            max_hourly_cost: Highest $/hour accepted
+            block_seconds: Seconds a host that failed readiness is skipped
+            clock: Time source (tests)
+        """
+        self.search = search
+        self.store = store
+        self.ttl = ttl
+        self.min_gpu_ram = min_gpu_ram
+        self.max_hourly_cost = max_hourly_cost
+        self.block_seconds = block_seconds
+        self.clock = clock
+
+        self._offers = []  # (score, offer), best first
+        self._hosts = {}  # machine_id -> {'boots', 'failures', 'boot_seconds', 'blocked_until'}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def _load_hosts(self, machine_ids):
+        """History of many hosts in one store round trip ({} for hosts never booted)"""
+        machine_ids = set(machine_ids)
+        try:
+            cached = self.store.get_many([f"{self.KEY_PREFIX}{machine_id}" for machine_id in machine_ids])
+        except Exception as e:
+            logger.warning(f"Failed to load Vast.ai host history: {e}")
+            cached = {}
+        hosts = {}
+        for machine_id in machine_ids:
+            try:
+                value = cached.get(f"{self.KEY_PREFIX}{machine_id}")
+                hosts[machine_id] = json.loads(value) if value else {}
+            except ValueError as e:
+                logger.warning(f"Bad Vast.ai host history for {machine_id}: {e}")
+                hosts[machine_id] = {}
+        return hosts
+
+    def _save_host(self, machine_id, stats):
+        try:
+            self.store.set(f"{self.KEY_PREFIX}{machine_id}", json.dumps(stats), ex=VAST_HOST_STATS_DAYS * 86400)
+        except Exception as e:
+            logger.warning(f"Failed to save Vast.ai host history for {machine_id}: {e}")
+
+    def _blocked(self, machine_id, now):
+        return self._hosts.get(machine_id, {}).get('blocked_until', 0) > now
+
+    def refresh(self):
+        """Search offers once and rescore them (also reloads host history other processes wrote)"""
+        offers = self.search(self.min_gpu_ram)
+        if offers is None:
+            return False
+
+        suitable = [
+            offer for offer in offers
+            if offer.get('gpu_ram', 0) >= self.min_gpu_ram
+            and offer.get('reliability2', 0) >= MIN_RELIABILITY
+            and offer.get('dph_total', 999) < self.max_hourly_cost
+        ]
+        hosts = self._load_hosts(offer.get('machine_id') for offer in suitable)
+        scored = sorted(((score_offer(offer, hosts[offer.get('machine_id')]), offer) for offer in suitable),
+                        key=lambda entry: entry[0])
+
+        with self._lock:
+            self._hosts.update(hosts)
+            self._offers = scored
+            self._fetched_at = self.clock()
+        logger.debug(f"Vast.ai offer catalog refreshed: {len(scored)} of {len(offers)} offers suitable")
+        return True
+
+    def choose(self):
+        """Best offer from a fresh-enough catalog (searches first only when the cache is stale), or None"""
+        if self._fetched_at is None or self.clock() - self._fetched_at >= self.ttl or not self._offers:
+            self.refresh()
+
+        now = self.clock()
+        with self._lock:
+            for score, offer in self._offers:
+                if not self._blocked(offer.get('machine_id'), now):
+                    logger.info(f"Chose Vast.ai offer {offer.get('id')} on machine {offer.get('machine_id')}: "
+                                f"{offer.get('gpu_name', 'Unknown')} ${offer.get('dph_total', 0):.3f}/hour, "
+                                f"score {score:.0f}s")
+                    return offer
+        return None
+
+    def discard(self, offer):
+        """Drop an offer that was rented (or no longer exists) from the cache"""
+        with self._lock:
+            self._offers = [entry for entry in self._offers if entry[1].get('id') != offer.get('id')]
+
+    def ready_timeout(self, offer):
+        """Readiness deadline for a boot on this host - a few times its usual boot, within limits"""
+        stats = self._hosts.get(offer.get('machine_id'))
+        if not stats or not stats.get('boot_seconds'):
+            return MAX_READY_TIMEOUT
+        return int(min(MAX_READY_TIMEOUT, max(MIN_READY_TIMEOUT, 3 * stats['boot_seconds'])))
+
+    def _update_host(self, offer, update):
+        machine_id = offer.get('machine_id')
+        with self._lock:
+            stats = dict(self._hosts.get(machine_id) or {})
+            update(stats)
+            self._hosts[machine_id] = stats
+            self._offers = sorted(
+                ((score_offer(o, self._hosts.get(o.get('machine_id'))) if o.get('machine_id') == machine_id else score, o)
+                 for score, o in self._offers),
+                key=lambda entry: entry[0]
+            )
+        self._save_host(machine_id, stats)
+        return stats
+
+    def record_boot(self, offer, seconds):
+        """A boot on this host reached ready after `seconds`"""
+        def update(stats):
+            stats['boots'] = stats.get('boots', 0) + 1
+            previous = stats.get('boot_seconds')
+            stats['boot_seconds'] = seconds if not previous else \
+                BOOT_SECONDS_ALPHA * seconds + (1 - BOOT_SECONDS_ALPHA) * previous
+        return self._update_host(offer, update)
+
+    def record_failure(self, offer):
+        """A boot on this host never became ready - count it and skip the host for a while"""
+        def update(stats):
+            stats['boots'] = stats.get('boots', 0) + 1
+            stats['failures'] = stats.get('failures', 0) + 1
+            stats['blocked_until'] = self.clock() + self.block_seconds
+        logger.warning(f"Blocking Vast.ai machine {offer.get('machine_id')} for {self.block_seconds}s after a failed boot")
+        return self._update_host(offer, update)
+
+    def start(self):
+        """Refresh in the background every half TTL (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="vast-offer-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Vast.ai offer refresh failed: {e}")
+            self._stop_event.wait(max(1.0, self.ttl / 2))
+
+    def snapshot(self):
+        """Catalog size and age, for logs"""
+        now = self.clock()
+        with self._lock:
+            return {
+                'offers': len(self._offers),
+                'age_seconds': round(now - self._fetched_at, 1) if self._fetched_at else None,
+                'known_hosts': sum(1 for stats in self._hosts.values() if stats.get('boots')),
+                'blocked_hosts': sum(1 for machine_id in self._hosts if self._blocked(machine_id, now))
+            }
@@ -3,18 +3,24 @@ Vast.ai On-Demand Client - Pay only for generation time!
 Automatically starts/stops instances to minimize costs (98-99% savings)
 """
 
-import requests
 import time
 import json
 import os
 import base64
 import logging
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, List, Any
 from datetime import datetime
+from config import COMFYUI_CONNECT_TIMEOUT, VAST_WARM_ACQUIRE_TIMEOUT
+from comfyui_transport import comfyui_get, comfyui_post, comfyui_request
+from vast_offers import OfferCatalog
+from gpu_backends import GpuBackend, GpuJob, Submission
 
 logger = logging.getLogger(__name__)
 
-class VastOnDemandClient:
+class VastOnDemandClient(GpuBackend):
+    backend_name = 'vast'
+    synchronous = True
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://console.vast.ai/api/v0"
@@ -22,17 +28,19 @@ class VastOnDemandClient:
         self.current_instance_id = None
         self.instance_ip = None
         self.instance_port = None
+        self.warm_pool = None  # VastWarmPool - set to keep instances up between images
+        self.offer_catalog = OfferCatalog(lambda min_gpu_ram: self.search_offers(min_gpu_ram))
         
     def test_connection(self) -> bool:
         """Test API connection"""
         try:
-            response = requests.get(f"{self.base_url}/users/current/", headers=self.headers, timeout=10)
+            response = comfyui_request('GET', f"{self.base_url}/users/current/", 'probe', headers=self.headers)
             return response.status_code == 200
         except:
             return False
     
-    def find_cheapest_gpu(self, min_gpu_ram: int = 8, gpu_name: str = None) -> Optional[Dict]:
-        """Find the cheapest available GPU instance"""
+    def search_offers(self, min_gpu_ram: int = 8, gpu_name: str = None, limit: int = 64) -> Optional[List[Dict]]:
+        """Rentable offers meeting the base requirements, cheapest first (None if the API call failed)"""
         try:
             url = f"{self.base_url}/bundles/"
             
@@ -53,36 +61,37 @@ class VastOnDemandClient:
             params = {
                 "q": json.dumps(query),
                 "order": [["dph_total", "asc"]],  # Order by price ascending
-                "limit": 20
+                "limit": limit
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = comfyui_request('GET', url, headers=self.headers, params=params)
             if response.status_code == 200:
-                data = response.json()
-                offers = data.get("offers", [])
-                
-                # Filter for instances with good specs
-                good_offers = []
-                for offer in offers:
-                    if (offer.get("gpu_ram", 0) >= min_gpu_ram and 
-                        offer.get("reliability2", 0) >= 0.9 and
-                        offer.get("dph_total", 999) < 1.0):  # Under $1/hour
-                        good_offers.append(offer)
-                
-                if good_offers:
-                    logger.info(f"Found {len(good_offers)} suitable GPU offers")
-                    return good_offers[0]
-                else:
-                    logger.warning("No suitable GPU offers found")
-                    return None
-            else:
-                logger.error(f"Failed to fetch offers: {response.status_code}")
-                return None
+                return response.json().get("offers", [])
+            logger.error(f"Failed to fetch offers: {response.status_code}")
+            return None
                 
         except Exception as e:
-            logger.error(f"Error finding GPU: {e}")
+            logger.error(f"Error searching offers: {e}")
             return None
     
+    def find_cheapest_gpu(self, min_gpu_ram: int = 8, gpu_name: str = None) -> Optional[Dict]:
+        """Find the cheapest available GPU instance"""
+        offers = self.search_offers(min_gpu_ram, gpu_name, limit=20) or []
+        
+        # Filter for instances with good specs
+        good_offers = []
+        for offer in offers:
+            if (offer.get("gpu_ram", 0) >= min_gpu_ram and 
+                offer.get("reliability2", 0) >= 0.9 and
+                offer.get("dph_total", 999) < 1.0):  # Under $1/hour
+                good_offers.append(offer)
+        
+        if good_offers:
+            logger.info(f"Found {len(good_offers)} suitable GPU offers")
+            return good_offers[0]
+        logger.warning("No suitable GPU offers found")
+        return None
+    
     def start_instance(self, offer_id: int) -> Optional[int]:
         """Start a new instance with ComfyUI"""
         try:
@@ -145,7 +154,7 @@ echo "ComfyUI setup complete!"
                 "image_login": "root"
             }
             
-            response = requests.put(url, headers=self.headers, json=data, timeout=60)
+            response = comfyui_request('PUT', url, headers=self.headers, json=data, timeout=(COMFYUI_CONNECT_TIMEOUT, 60))
             if response.status_code == 200:
                 result = response.json()
                 instance_id = result.get("new_contract")
@@ -210,7 +219,7 @@ echo "ComfyUI setup complete!"
         """Test if ComfyUI API is ready"""
         for attempt in range(max_attempts):
             try:
-                response = requests.get(f"{comfyui_url}/system_stats", timeout=10)
+                response = comfyui_get(f"{comfyui_url}/system_stats", 'probe')
                 if response.status_code == 200:
                     return True
             except:
@@ -222,7 +231,7 @@ echo "ComfyUI setup complete!"
         """Get detailed instance information"""
         try:
             url = f"{self.base_url}/instances/"
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = comfyui_request('GET', url, headers=self.headers)
             if response.status_code == 200:
                 instances = response.json().get("instances", [])
                 for instance in instances:
@@ -237,7 +246,7 @@ echo "ComfyUI setup complete!"
         """Stop and destroy instance"""
         try:
             url = f"{self.base_url}/instances/{instance_id}/"
-            response = requests.delete(url, headers=self.headers, timeout=30)
+            response = comfyui_request('DELETE', url, headers=self.headers)
             success = response.status_code == 200
             if success:
                 logger.info(f"Stopped instance {instance_id}")
@@ -251,36 +260,68 @@ echo "ComfyUI setup complete!"
             logger.error(f"Error stopping instance: {e}")
             return False
     
+    def boot_instance(self) -> Optional[Tuple[int, str]]:
+        """Rent the best-scored GPU offer and wait until ComfyUI answers on it; returns (instance_id, ComfyUI URL)"""
+        offer = self.offer_catalog.choose()
+        if not offer:
+            logger.warning("No suitable GPU offers found")
+            return None
+        
+        started = time.time()
+        instance_id = self.start_instance(offer["id"])
+        self.offer_catalog.discard(offer)  # Rented, or no longer available
+        if not instance_id:
+            return None
+        
+        if not self.wait_for_instance_ready(instance_id, timeout=self.offer_catalog.ready_timeout(offer)):
+            self.offer_catalog.record_failure(offer)
+            self.stop_instance(instance_id)
+            return None
+        self.offer_catalog.record_boot(offer, time.time() - started)
+        
+        # Re-read the address - concurrent boots share self.instance_ip
+        info = self.get_instance_info(instance_id) or {}
+        instance_ip = info.get("public_ipaddr") or self.instance_ip
+        return instance_id, f"http://{instance_ip}:8188"
+    
+    def _generate_on_warm_instance(self, image_path: str, preset_key: str, denoise_intensity: int) -> Tuple[Optional[bytes], Optional[str]]:
+        """Run one image on an instance from the warm pool and hand the instance back"""
+        instance = self.warm_pool.acquire(timeout=VAST_WARM_ACQUIRE_TIMEOUT)
+        if instance is None:
+            return None, "No GPU instance became ready"
+        
+        result_image = None
+        try:
+            result_image = self._process_image_on_comfyui(instance.url, image_path, preset_key, denoise_intensity)
+        except Exception as e:
+            logger.error(f"Generation error on instance {instance.instance_id}: {e}")
+        finally:
+            # A failed workflow does not mean a dead instance - keep it if ComfyUI still answers
+            healthy = result_image is not None or self._test_comfyui_ready(instance.url, max_attempts=1)
+            self.warm_pool.release(instance, healthy=healthy)
+        
+        if not result_image:
+            return None, "Image processing failed"
+        return result_image, None
+    
     def generate_image(self, image_path: str, preset_key: str = "tier1", denoise_intensity: int = 4) -> Tuple[Optional[bytes], Optional[str]]:
         """Generate image with on-demand instance management"""
+        if self.warm_pool is not None:
+            return self._generate_on_warm_instance(image_path, preset_key, denoise_intensity)
+        
         instance_id = None
         try:
             logger.info("Starting on-demand image generation...")
             
-            # 1. Find cheapest GPU
-            logger.info("Finding cheapest GPU...")
-            offer = self.find_cheapest_gpu(min_gpu_ram=8)
-            if not offer:
-                return None, "No available GPU instances found"
-            
-            gpu_info = f"{offer.get('gpu_name', 'Unknown')} ({offer.get('gpu_ram', 0)}GB) - ${offer.get('dph_total', 0):.3f}/hour"
-            logger.info(f"Selected GPU: {gpu_info}")
-            
-            # 2. Start instance
+            # 1. Rent the cheapest GPU and wait for ComfyUI on it
             logger.info("Starting GPU instance...")
-            instance_id = self.start_instance(offer["id"])
-            if not instance_id:
-                return None, "Failed to start GPU instance"
-            
-            # 3. Wait for ready
-            logger.info("Waiting for instance to be ready...")
-            if not self.wait_for_instance_ready(instance_id):
-                self.stop_instance(instance_id)
-                return None, "Instance failed to become ready"
+            booted = self.boot_instance()
+            if not booted:
+                return None, "Failed to start a GPU instance"
+            instance_id, comfyui_url = booted
             
-            # 4. Process image
+            # 2. Process image
             logger.info("Processing image...")
-            comfyui_url = f"http://{self.instance_ip}:8188"
             result_image = self._process_image_on_comfyui(comfyui_url, image_path, preset_key, denoise_intensity)
             
             if not result_image:
@@ -396,7 +437,7 @@ echo "ComfyUI setup complete!"
         try:
             with open(image_path, 'rb') as f:
                 files = {'image': f}
-                response = requests.post(f"{comfyui_url}/upload/image", files=files, timeout=60)
+                response = comfyui_post(f"{comfyui_url}/upload/image", 'transfer', files=files)
                 return response.status_code == 200
         except Exception as e:
             logger.error(f"Image upload error: {e}")
@@ -409,7 +450,7 @@ echo "ComfyUI setup complete!"
                 "prompt": workflow,
                 "client_id": f"vast_client_{int(time.time())}"
             }
-            response = requests.post(f"{comfyui_url}/prompt", json=payload, timeout=60)
+            response = comfyui_post(f"{comfyui_url}/prompt", json=payload)
             if response.status_code == 200:
                 return response.json().get("prompt_id")
             return None
@@ -422,7 +463,7 @@ echo "ComfyUI setup complete!"
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                response = requests.get(f"{comfyui_url}/history/{prompt_id}", timeout=30)
+                response = comfyui_get(f"{comfyui_url}/history/{prompt_id}")
                 if response.status_code == 200:
                     history = response.json()
                     if prompt_id in history:
@@ -435,7 +476,7 @@ echo "ComfyUI setup complete!"
     def _get_result_image(self, comfyui_url: str, prompt_id: str) -> Optional[bytes]:
         """Get result image from ComfyUI"""
         try:
-            response = requests.get(f"{comfyui_url}/history/{prompt_id}", timeout=30)
+            response = comfyui_get(f"{comfyui_url}/history/{prompt_id}")
             if response.status_code == 200:
                 history = response.json()
                 if prompt_id in history:
@@ -452,7 +493,7 @@ echo "ComfyUI setup complete!"
                                     "type": "output"
                                 }
                                 
-                                img_response = requests.get(f"{comfyui_url}/view", params=params, timeout=60)
+                                img_response = comfyui_get(f"{comfyui_url}/view", 'transfer', params=params)
                                 if img_response.status_code == 200:
                                     return img_response.content
             return None
@@ -460,6 +501,10 @@ echo "ComfyUI setup complete!"
             logger.error(f"Result retrieval error: {e}")
             return None
     
+    def submit(self, job: GpuJob) -> Submission:
+        """Run a GpuJob (blocks through the instance boot, or on a warm instance from the pool)"""
+        return self.submit_preset(job)
+    
     def get_job_status(self, job_id: str) -> str:
         """Get job status (compatibility method)"""
         # For on-demand mode, jobs are processed immediately
@@ -0,0 +1,223 @@
+"""
+Vast.ai Warm Instance Pool
+VastOnDemandClient used to rent, boot and destroy an instance for every image, so each one
+paid a cold start of several minutes. The pool keeps 0..max_instances instances alive between jobs:
+
+- Jobs take a ready instance and hand it back afterwards. When none is free and the pool has
+  room, another one boots
+- scale() (run by generation_worker.py) boots instances for the queue depth and for demand
+  predicted from the same hours on previous days, and destroys instances that sat idle longer
+  than the idle TTL and are no longer wanted
+- shutdown() destroys everything when the worker stops
+
+The pool lives in the worker process that dispatches Vast.ai jobs.
+"""
+
+import math
+import time
+import logging
+import threading
+from config import (VAST_WARM_MAX_INSTANCES, VAST_WARM_MIN_INSTANCES, VAST_WARM_JOBS_PER_INSTANCE,
+                    VAST_MAX_INSTANCE_LIFETIME, VAST_PREWARM_MIN_JOBS_PER_HOUR, COMFYUI_DEFAULT_EXEC_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+BOOTING = 'booting'
+READY = 'ready'
+BUSY = 'busy'
+
+
+class WarmInstance:
+    """One rented Vast.ai instance running ComfyUI"""
+
+    def __init__(self, now):
+        self.instance_id = None
+        self.url = None
+        self.state = BOOTING
+        self.started_at = now
+        self.last_used = now
+        self.jobs = 0
+
+
+def predict_instances(hourly_demand, hour, job_seconds=COMFYUI_DEFAULT_EXEC_SECONDS,
+                      min_jobs=VAST_PREWARM_MIN_JOBS_PER_HOUR):
+    """
+    Instances to keep warm for the demand usually seen in this hour and the next
+
+    Boots take minutes, so the coming hour counts as much as the current one.
+
+    Args:
+        hourly_demand: get_hourly_demand() result (hour of day -> average generations)
+        hour: Current hour of day (UTC)
+        job_seconds: GPU time per generation
+        min_jobs: Expected generations per hour below which nothing is pre-warmed
+    """
+    expected = max(hourly_demand.get(hour, 0), hourly_demand.get((hour + 1) % 24, 0))
+    if expected <= 0 or expected < min_jobs:
+        return 0
+    return math.ceil(expected * job_seconds / 3600)
+
+
+class VastWarmPool:
+    """Vast.ai instances kept alive between jobs, scaled on queue depth and hourly history"""
+
+    def __init__(self, client, max_instances=VAST_WARM_MAX_INSTANCES, min_instances=VAST_WARM_MIN_INSTANCES,
+                 idle_ttl=VAST_MAX_INSTANCE_LIFETIME, jobs_per_instance=VAST_WARM_JOBS_PER_INSTANCE, clock=time.time):
+        """
+        Args:
+            client: VastOnDemandClient used to boot (boot_instance) and destroy (stop_instance) instances
+            max_instances: Upper bound on rented instances, booting ones included
+            min_instances: Instances kept up even when idle
+            idle_ttl: Seconds an unneeded instance may sit idle before it is destroyed
+            jobs_per_instance: Queued + running jobs per instance before scale() boots another
+            clock: Time source (tests)
+        """
+        self.client = client
+        self.max_instances = max_instances
+        self.min_instances = min(min_instances, max_instances)
+        self.idle_ttl = idle_ttl
+        self.jobs_per_instance = max(1, jobs_per_instance)
+        self.clock = clock
+
+        self._instances = []
+        self._waiting = 0
+        self._closed = False
+        self._boot_failures = 0
+        self._cond = threading.Condition()
+
+    def _start_boot(self):
+        """Reserve a slot and boot an instance in the background (call with the lock held)"""
+        instance = WarmInstance(self.clock())
+        self._instances.append(instance)
+        threading.Thread(target=self._boot, args=(instance,), name="vast-warm-boot", daemon=True).start()
+        return instance
+
+    def _boot(self, instance):
+        try:
+            booted = self.client.boot_instance()
+        except Exception as e:
+            logger.error(f"Vast.ai instance boot failed: {e}")
+            booted = None
+
+        with self._cond:
+            if booted and not self._closed:
+                instance.instance_id, instance.url = booted
+                instance.state = READY
+                instance.last_used = self.clock()
+                logger.info(f"🔥 Vast.ai instance {instance.instance_id} warm at {instance.url} "
+                            f"({instance.last_used - instance.started_at:.0f}s boot)")
+            else:
+                self._instances.remove(instance)
+                if not booted:
+                    self._boot_failures += 1
+            self._cond.notify_all()
+
+        if booted and self._closed:
+            self.client.stop_instance(booted[0])
+
+    def acquire(self, timeout=600):
+        """
+        A ready instance for one job, booting one if none is free
+
+        Returns:
+            WarmInstance marked busy (hand it back with release()), or None if none became
+            ready within timeout
+        """
+        deadline = self.clock() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._closed:
+                    for instance in self._instances:
+                        if instance.state == READY:
+                            instance.state = BUSY
+                            return instance
+
+                    booting = sum(1 for instance in self._instances if instance.state == BOOTING)
+                    if booting < self._waiting and len(self._instances) < self.max_instances:
+                        self._start_boot()
+
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(min(remaining, 5))
+                return None
+            finally:
+                self._waiting -= 1
+
+    def release(self, instance, healthy=True):
+        """Hand an instance back after a job; unhealthy ones are destroyed"""
+        with self._cond:
+            if healthy and not self._closed:
+                instance.state = READY
+                instance.last_used = self.clock()
+                instance.jobs += 1
+                self._cond.notify_all()
+                return
+            if instance in self._instances:
+                self._instances.remove(instance)
+            self._cond.notify_all()
+        self.client.stop_instance(instance.instance_id)
+
+    def desired_size(self, queue_depth, hourly_demand=None, hour=None):
+        """Instances wanted for the current queue and the predicted demand"""
+        wanted = max(self.min_instances, math.ceil(queue_depth / self.jobs_per_instance))
+        if hourly_demand:
+            hour = time.gmtime(self.clock()).tm_hour if hour is None else hour
+            wanted = max(wanted, predict_instances(hourly_demand, hour))
+        return min(wanted, self.max_instances)
+
+    def scale(self, queue_depth, hourly_demand=None, hour=None):
+        """
+        Boot up to the desired size, destroy idle instances beyond it
+
+        Returns:
+            dict: {'desired', 'booted', 'stopped'}
+        """
+        desired = self.desired_size(queue_depth, hourly_demand, hour)
+        now = self.clock()
+        stop = []
+        booted = 0
+        with self._cond:
+            if self._closed:
+                return {'desired': desired, 'booted': 0, 'stopped': 0}
+
+            while len(self._instances) < desired:
+                self._start_boot()
+                booted += 1
+
+            # Longest-idle first, only while the pool is above what is wanted
+            idle = sorted((instance for instance in self._instances
+                           if instance.state == READY and now - instance.last_used >= self.idle_ttl),
+                          key=lambda instance: instance.last_used)
+            for instance in idle:
+                if len(self._instances) <= desired:
+                    break
+                self._instances.remove(instance)
+                stop.append(instance)
+
+        for instance in stop:
+            logger.info(f"Destroying idle Vast.ai instance {instance.instance_id} "
+                        f"({now - instance.last_used:.0f}s idle, {instance.jobs} jobs served)")
+            self.client.stop_instance(instance.instance_id)
+        return {'desired': desired, 'booted': booted, 'stopped': len(stop)}
+
+    def shutdown(self):
+        """Destroy every instance (booting ones are destroyed as soon as their boot returns)"""
+        with self._cond:
+            self._closed = True
+            instances = [instance for instance in self._instances if instance.state != BOOTING]
+            self._instances = [instance for instance in self._instances if instance.state == BOOTING]
+            self._cond.notify_all()
+        for instance in instances:
+            self.client.stop_instance(instance.instance_id)
+        if instances:
+            logger.info(f"Destroyed {len(instances)} warm Vast.ai instance(s)")
+
+    def snapshot(self):
+        """Instance states and totals, for logs"""
+        with self._cond:
+            states = {}
+            for instance in self._instances:
+                states[instance.state] = states.get(instance.state, 0) + 1
+            return {'instances': states, 'waiting': self._waiting, 'boot_failures': self._boot_failures}
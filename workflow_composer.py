@@ -0,0 +1,134 @@
+"""
+ComfyUI Workflow Composer
+Merges per-feature workflows (workflow_custom_eyes.json, _nose, _mouth, _skull,
+workflow_faceanalysis_eyebrows.json) into one prompt graph, so a multi-feature custom
+morph is a single GPU pass with one model load instead of one prompt per feature.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Loaded once per graph no matter how their inputs are spelled in each template
+SHARED_NODE_CLASSES = ('CheckpointLoaderSimple', 'LoadImage', 'FaceAnalysisModels')
+COMPOSITE_CLASS = 'ImageComposite+'
+COMPOSED_OUTPUT_NODE = "10"  # get_job_output() looks here first
+
+
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+
+
+def _topological_order(workflow):
+    """Node ids with every node after the nodes it links to"""
+    order = []
+    visited = set()
+
+    def visit(node_id):
+        if node_id in visited or node_id not in workflow:
+            return
+        visited.add(node_id)
+        for value in workflow[node_id]['inputs'].values():
+            if _is_link(value):
+                visit(value[0])
+        order.append(node_id)
+
+    for node_id in workflow:
+        visit(node_id)
+    return order
+
+
+def _final_composite(workflow):
+    """The last ImageComposite+ of a feature template (not the destination of another composite)"""
+    composites = [node_id for node_id, node in workflow.items() if node['class_type'] == COMPOSITE_CLASS]
+    destinations = {workflow[node_id]['inputs']['destination'][0] for node_id in composites}
+    tails = [node_id for node_id in composites if node_id not in destinations]
+    if len(tails) != 1:
+        raise ValueError(f"Expected one final {COMPOSITE_CLASS} node, found {len(tails)}")
+    return tails[0]
+
+
+def compose_workflows(workflows, filename_prefix, output_node=COMPOSED_OUTPUT_NODE):
+    """
+    Chain prepared feature workflows into one graph
+
+    Identical nodes (checkpoint, LoRA, prompts, VAEEncode, segmentation models) are shared.
+    Each stage's masked result is composited onto the previous stage's output instead of
+    the original image, so the stages apply one after another in a single prompt.
+    Whole-face stages (skull) restore the original features and must come first.
+
+    Args:
+        workflows: Feature workflows already bound to the image, seed and denoise, in stage order
+        filename_prefix: SaveImage prefix for the composed result
+        output_node: Node id for the final SaveImage
+
+    Returns:
+        dict: ComfyUI prompt graph
+    """
+    merged = {}
+    signatures = {}  # Serialized (class_type, inputs) -> merged node id
+    shared = {}  # class_type -> merged node id for SHARED_NODE_CLASSES
+    previous_result = None
+    next_id = [1]
+
+    def allocate():
+        while str(next_id[0]) in merged or str(next_id[0]) == output_node:
+            next_id[0] += 1
+        return str(next_id[0])
+
+    for stage, workflow in enumerate(workflows):
+        final_id = _final_composite(workflow)
+        mapping = {}
+
+        for node_id in _topological_order(workflow):
+            node = workflow[node_id]
+            class_type = node['class_type']
+            if class_type == 'SaveImage':
+                continue
+
+            inputs = {
+                name: [mapping[value[0]], value[1]] if _is_link(value) else value
+                for name, value in node['inputs'].items()
+            }
+
+            if class_type in shared:
+                mapping[node_id] = shared[class_type]
+                continue
+
+            # Paint this stage over the previous result instead of the original image
+            if stage > 0 and class_type == COMPOSITE_CLASS and inputs['destination'] == [shared.get('LoadImage'), 0]:
+                inputs['destination'] = previous_result
+
+            signature = json.dumps([class_type, inputs], sort_keys=True)
+            if signature in signatures:
+                mapping[node_id] = signatures[signature]
+                continue
+
+            new_id = allocate()
+            merged[new_id] = dict(json.loads(json.dumps(node)), inputs=inputs)
+            signatures[signature] = new_id
+            if class_type in SHARED_NODE_CLASSES:
+                shared[class_type] = new_id
+            mapping[node_id] = new_id
+
+        previous_result = [mapping[final_id], 0]
+
+    merged[output_node] = {
+        'class_type': 'SaveImage',
+        'inputs': {'filename_prefix': filename_prefix, 'images': previous_result}
+    }
+
+    # Drop debug-only nodes (e.g. MaskToImage previews) that do not feed the output
+    needed = set()
+    pending = [output_node]
+    while pending:
+        node_id = pending.pop()
+        if node_id in needed:
+            continue
+        needed.add(node_id)
+        pending.extend(value[0] for value in merged[node_id]['inputs'].values() if _is_link(value))
+
+    composed = {node_id: node for node_id, node in merged.items() if node_id in needed}
+    logger.info(f"Composed {len(workflows)} feature workflows into {len(composed)} nodes")
+    return composed
@@ -0,0 +1,261 @@
+"""
+ComfyUI Workflow Registry
+Every template in comfyui_workflows/ is parsed and validated once, then re-read only when its
+file changes. Templates declare named slots (input_image, denoise, seed, save_prefix, ...) so
+callers bind parameters by name instead of hardcoding node IDs, and a bound payload copies
+only the nodes it changes.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from config import WORKFLOW_FOLDER, WORKFLOW_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Slot name -> accepted value types
+SLOT_TYPES = {
+    'input_image': (str,),
+    'reference_image': (str,),
+    'denoise': (int, float),
+    'seed': (int,),
+    'steps': (int,),
+    'cfg': (int, float),
+    'save_prefix': (str,),
+    'swap_weight': (str,),
+    'area': (str,),
+    'grow': (int,),
+    'blur': (int,),
+    'lora_strength_model': (int, float),
+    'lora_strength_clip': (int, float),
+}
+
+
+def _sampler_slots(load_image, sampler, save_image, lora=None):
+    """Slots of an img2img template: LoadImage -> KSampler / FaceDetailer -> SaveImage"""
+    slots = {
+        'input_image': (load_image, 'image'),
+        'denoise': (sampler, 'denoise'),
+        'seed': (sampler, 'seed'),
+        'steps': (sampler, 'steps'),
+        'cfg': (sampler, 'cfg'),
+        'save_prefix': (save_image, 'filename_prefix'),
+    }
+    if lora:
+        slots['lora_strength_model'] = (lora, 'strength_model')
+        slots['lora_strength_clip'] = (lora, 'strength_clip')
+    return slots
+
+
+def _feature_slots(save_image):
+    """Slots of a masked feature template: FaceSegmentation (6) -> KSampler (8) -> ImageComposite+"""
+    slots = _sampler_slots('5', '8', save_image)
+    slots.update({
+        'area': ('6', 'area'),
+        'grow': ('6', 'grow'),
+        'blur': ('6', 'blur'),
+    })
+    return slots
+
+
+# Template file name -> slot name -> (node_id, input_name)
+TEMPLATE_SLOTS = {
+    'workflow_facedetailer.json': _sampler_slots('5', '8', '9', lora='2'),
+    'workflow_chad_2_0.json': _sampler_slots('5', '8', '9', lora='2'),
+    'workflow_custom_eyes.json': _feature_slots('10'),
+    'workflow_custom_nose.json': _feature_slots('10'),
+    'workflow_custom_mouth.json': _feature_slots('10'),
+    'workflow_faceanalysis_eyebrows.json': _feature_slots('10'),
+    'workflow_custom_skull.json': _sampler_slots('5', '8', '18'),
+    'face_swap_with_intensity_clean.json': {
+        'input_image': ('1', 'image'),
+        'reference_image': ('2', 'image'),
+        'swap_weight': ('3', 'faceswap_weight'),
+        'save_prefix': ('5', 'filename_prefix'),
+    },
+    # app.py WORKFLOW_OPTIONS
+    'workflow_fixed.json': _sampler_slots('5', '7', '10', lora='2'),
+    'workflow_inpaint_face.json': _sampler_slots('5', '7', '9', lora='2'),
+    'workflow_face_mask.json': _sampler_slots('5', '7', '11', lora='2'),
+    'workflow_mask_composite.json': _sampler_slots('5', '7', '13', lora='2'),
+}
+
+
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+
+
+def validate_workflow(nodes, slots=None):
+    """
+    Check that a template is an API-format ComfyUI prompt whose links and slots resolve
+
+    Returns:
+        list of error strings (empty if valid)
+    """
+    if not isinstance(nodes, dict) or not nodes:
+        return ['not an API-format prompt (expected a non-empty object of nodes)']
+
+    errors = []
+    for node_id, node in nodes.items():
+        if not isinstance(node, dict) or not isinstance(node.get('class_type'), str) or not isinstance(node.get('inputs'), dict):
+            errors.append(f"node {node_id}: missing class_type or inputs")
+            continue
+        for name, value in node['inputs'].items():
+            if _is_link(value) and value[0] not in nodes:
+                errors.append(f"node {node_id}.{name}: links to missing node {value[0]}")
+
+    for slot, (node_id, input_name) in (slots or {}).items():
+        if slot not in SLOT_TYPES:
+            errors.append(f"slot {slot}: unknown slot name")
+        elif node_id not in nodes or not isinstance(nodes[node_id], dict):
+            errors.append(f"slot {slot}: missing node {node_id}")
+        elif input_name not in nodes[node_id].get('inputs', {}):
+            errors.append(f"slot {slot}: node {node_id} has no input {input_name}")
+
+    return errors
+
+
+class WorkflowTemplate:
+    """One parsed, validated template (nodes are shared between payloads - never mutate them)"""
+
+    def __init__(self, name, path, nodes, slots, mtime):
+        self.name = name
+        self.path = path
+        self.nodes = nodes
+        self.slots = slots
+        self.mtime = mtime
+        self.checked_at = time.time()
+
+    def has_slot(self, slot):
+        return slot in self.slots
+
+    def slot_nodes(self, *slots):
+        """Node IDs behind the given slots, in slot order"""
+        return tuple(self.slots[slot][0] for slot in slots)
+
+    def bind(self, **values):
+        """
+        Ready-to-send prompt with the given slots filled in
+
+        Only nodes that receive a value are copied; the rest are shared with the template.
+        None values are skipped so optional parameters can be passed through unconditionally.
+
+        Raises:
+            ValueError: Unknown slot for this template
+            TypeError: Value of the wrong type for the slot
+        """
+        payload = dict(self.nodes)
+        copied = set()
+
+        for slot, value in values.items():
+            if value is None:
+                continue
+            if slot not in self.slots:
+                raise ValueError(f"Workflow {self.name} has no slot '{slot}'")
+            if isinstance(value, bool) or not isinstance(value, SLOT_TYPES[slot]):
+                raise TypeError(f"Slot '{slot}' expects {'/'.join(t.__name__ for t in SLOT_TYPES[slot])}, got {type(value).__name__}")
+
+            node_id, input_name = self.slots[slot]
+            if node_id not in copied:
+                node = payload[node_id]
+                payload[node_id] = dict(node, inputs=dict(node['inputs']))
+                copied.add(node_id)
+            payload[node_id]['inputs'][input_name] = value
+
+        return payload
+
+
+class WorkflowRegistry:
+    """Templates from the workflow folder, loaded once and hot-reloaded on file change"""
+
+    def __init__(self, folder=WORKFLOW_FOLDER, slots=TEMPLATE_SLOTS, reload_interval=WORKFLOW_RELOAD_INTERVAL):
+        """
+        Args:
+            folder: Directory scanned by load_all()
+            slots: Template file name -> slot declarations
+            reload_interval: Seconds between file mtime checks per template
+        """
+        self.folder = folder
+        self.slots = slots
+        self.reload_interval = reload_interval
+        self._templates = {}  # file name -> WorkflowTemplate
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        """Load and validate every template in the folder; returns the number loaded"""
+        try:
+            filenames = sorted(name for name in os.listdir(self.folder) if name.endswith('.json'))
+        except OSError as e:
+            logger.error(f"Failed to list workflow folder {self.folder}: {e}")
+            return 0
+
+        loaded = 0
+        for filename in filenames:
+            if self._load(os.path.join(self.folder, filename)):
+                loaded += 1
+        logger.info(f"Loaded {loaded}/{len(filenames)} workflow templates from {self.folder}")
+        return loaded
+
+    def _load(self, path):
+        """Parse and validate one template file; keeps the previous version if the new one is invalid"""
+        name = os.path.basename(path)
+        slots = self.slots.get(name, {})
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'r') as f:
+                nodes = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load workflow template {path}: {e}")
+            return None
+
+        errors = validate_workflow(nodes, slots)
+        if errors:
+            # UI-format exports and drafts live alongside the API-format templates
+            log = logger.error if name in self.slots else logger.debug
+            log(f"Skipping invalid workflow template {name}: {'; '.join(errors[:3])}")
+            return None
+
+        template = WorkflowTemplate(name, path, nodes, slots, mtime)
+        with self._lock:
+            self._templates[name] = template
+        return template
+
+    def get(self, name_or_path):
+        """
+        Template by file name or path (loaded on first use, reloaded when the file changes)
+
+        Raises:
+            KeyError: No valid template with that name
+        """
+        name = os.path.basename(name_or_path)
+        with self._lock:
+            template = self._templates.get(name)
+
+        if template is None:
+            path = name_or_path if os.path.exists(name_or_path) else os.path.join(self.folder, name)
+            template = self._load(path)
+        elif time.time() - template.checked_at >= self.reload_interval:
+            template.checked_at = time.time()
+            try:
+                if os.path.getmtime(template.path) != template.mtime:
+                    logger.info(f"Workflow template changed on disk, reloading: {name}")
+                    template = self._load(template.path) or template
+            except OSError as e:
+                logger.warning(f"Could not stat workflow template {template.path}: {e}")
+
+        if template is None:
+            raise KeyError(f"Workflow template not found or invalid: {name}")
+        return template
+
+    def bind(self, name_or_path, **values):
+        """Shortcut for get(name_or_path).bind(**values)"""
+        return self.get(name_or_path).bind(**values)
+
+    def names(self):
+        with self._lock:
+            return sorted(self._templates)
+
+
+workflow_registry = WorkflowRegistry()